@@ -25,9 +25,14 @@ __license__     = """
 import sys
 import pdb 
 import math 
-from collections import deque
+import heapq
+
+import numpy as np
 
 import dta
+from dta.DtaError import DtaError
+from dta.GraphSnapshot import labelSettingOnCSR
+from dta.ShortestPathTree import ShortestPathTree
 from dta.Utils import isRightTurn, lineSegmentsCross
 from itertools import izip, tee, cycle, ifilter, ifilterfalse
 
@@ -100,28 +105,37 @@ def dfs(net, root=None):
 
 def getMetaGraph(net):
     """
-    Return a network that represents the meta graph of the input network. 
+    Return the meta graph of the input network, whose metanodes are its
+    strongly connected components, as a dictionary mapping each metanode
+    number to the set of the metanodes reached by a link from it.
+    Metanodes are numbered in reverse topological order, see
+    :py:meth:`GraphSnapshot.getStronglyConnectedComponents`.
     At the end of the execution of this algorithm each node points to 
-    its metanode
+    its metanode with its metaNode attribute
     """
-    pass 
+    snapshot = net.toGraphSnapshot()
+    component = snapshot.getStronglyConnectedComponents()
+    for nodeIndex, metaNode in enumerate(component.tolist()):
+        net.getNodeForId(snapshot.getNodeId(nodeIndex)).metaNode = metaNode
+
+    numMetaNodes = int(component.max()) + 1 if len(component) else 0
+    metaGraph = dict((metaNode, set()) for metaNode in xrange(numMetaNodes))
+    for upstream, downstream in izip(component[snapshot.linkStartNode].tolist(),
+                                     component[snapshot.linkEndNode].tolist()):
+        if upstream != downstream:
+            metaGraph[upstream].add(downstream)
+    return metaGraph
 
 
 def hasPath(net, originNode, destNode):
     """
     Return true if the network has a path 
-    from the origin node to the destination node
+    from the origin node to the destination node.
+    Uses the :py:class:`GraphSnapshot` of the network so no attributes are set on the nodes.
     """
-    
-    dfs(net, originNode) 
-
-    node = destNode
-    while node and node != originNode:
-        node = node.pred 
-
-    if node is None:
-        return False
-    return True
+    snapshot = net.toGraphSnapshot()
+    return snapshot.hasPath(snapshot.getNodeIndex(originNode.getId()),
+                            snapshot.getNodeIndex(destNode.getId()))
 
 def predicate(elem1, elem2):
     """
@@ -403,6 +417,28 @@ def getClosestCentroid(net, inputCent):
 
     return closestCent, math.sqrt(minDist) 
 
+def getClosestCentroids(net, centroidIds):
+    """
+    Returns a dictionary mapping each of the *centroidIds* to (closest other centroid, distance),
+    like :py:func:`getClosestCentroid` for each, using one :py:class:`SpatialIndex` of the centroids
+    so each lookup only looks at the centroids around it.
+    """
+    centroids = list(net.iterCentroids())
+    if len(centroids) < 2:
+        raise DtaError("The network needs at least two centroids to find the closest centroid")
+    index = dta.SpatialIndex(dta.SpatialIndex.suggestCellSize(
+        [(centroid.getX(), centroid.getY(), centroid.getX(), centroid.getY()) for centroid in centroids]))
+    for centroid in centroids:
+        index.insert(centroid.getId(), centroid, centroid.getX(), centroid.getY(), centroid.getX(), centroid.getY())
+
+    closest = {}
+    for centroidId in centroidIds:
+        inputCent = net.getNodeForId(centroidId)
+        (dist, closestCent), = index.getNearest(inputCent.getX(), inputCent.getY(), 1,
+                                                filterFunction=lambda centroid: centroid != inputCent)
+        closest[centroidId] = (closestCent, dist)
+    return closest
+
 def getSPPathBetweenLinks(net, pathName, sourceLinkId, destLinkId):
     """
     Return a Path object containing he shortest path between the source link 
@@ -410,11 +446,69 @@ def getSPPathBetweenLinks(net, pathName, sourceLinkId, destLinkId):
     """
     sourceLink = net.getLinkForId(sourceLinkId)
     destinationLink = net.getLinkForId(destLinkId)
-    ShortestPaths.initializeMovementCostsWithLengthInFeet(net)
-    ShortestPaths.labelCorrectingWithLabelsOnLinks(net, sourceLink)
-    path = ShortestPaths.getShortestPathBetweenLinks(sourceLink, destinationLink)
+    path = ShortestPaths.getBidirectionalPathBetweenLinks(net, sourceLink, destinationLink)
     return dta.Path(net, pathName, path)
 
+# state of a skim worker process, set up by :py:func:`_initSkimWorker` from the shared arrays
+_skimWorkerState = {}
+
+def _skimOrigins(linkOutPointer, movementOutgoing, movementCosts, originPointer, originLinks, destLinks, destPositions,
+                 destLinkCosts, originPositions, skim):
+    """
+    Fills in the rows *originPositions* of the centroid to centroid *skim* (a 2-d numpy array).
+
+     * *linkOutPointer*, *movementOutgoing* and *movementCosts* are the CSR link graph and its costs, as python
+       lists or shared ctypes arrays (see :py:func:`GraphSnapshot.labelSettingOnCSR`)
+     * the access links of the centroid in position *o* are ``originLinks[originPointer[o]:originPointer[o+1]]``
+     * *destLinks*, *destPositions* and *destLinkCosts* are parallel arrays of the egress links, the position
+       of the centroid they arrive at, and the cost of traversing them
+    """
+    for origin in originPositions:
+        sources = originLinks[originPointer[origin]:originPointer[origin+1]].tolist()
+        labels, preds = labelSettingOnCSR(linkOutPointer, movementOutgoing, movementCosts, sources, [0.0]*len(sources))
+        row = np.empty(skim.shape[1], dtype=np.float64)
+        row.fill(np.inf)
+        if len(destLinks):
+            np.minimum.at(row, destPositions, np.array(labels)[destLinks] + destLinkCosts)
+        row[origin] = 0.0
+        skim[origin, :] = row
+
+def _sharedArrayView(sharedArray, typecode):
+    """
+    Returns a numpy array using the memory of the :py:func:`multiprocessing.sharedctypes.RawArray` *sharedArray*,
+    which holds C ints (*typecode* 'i') or doubles ('d').
+    """
+    return np.frombuffer(sharedArray, dtype=np.int32 if typecode == 'i' else np.float64)
+
+def _initSkimWorker(sharedArrays, lengths, numCentroids):
+    """
+    Initializer for the skim worker processes: wraps the shared arrays (with their real *lengths*,
+    as empty arrays are shared with a length of one).  The link graph and its costs are walked in the
+    shared memory by :py:func:`GraphSnapshot.labelSettingOnCSR`, so no process has its own copy of them.
+    """
+    linkOutPointer, movementOutgoing, movementCosts = [sharedArray for sharedArray, typecode in sharedArrays[:3]]
+    originPointer, originLinks, destLinks, destPositions, destLinkCosts, skim = \
+        [_sharedArrayView(sharedArray, typecode)[:length] for (sharedArray, typecode), length in zip(sharedArrays[3:], lengths[3:])]
+    _skimWorkerState['linkOutPointer']  = linkOutPointer
+    _skimWorkerState['movementOutgoing']= movementOutgoing
+    _skimWorkerState['movementCosts']   = movementCosts
+    _skimWorkerState['originPointer']   = originPointer
+    _skimWorkerState['originLinks']     = originLinks
+    _skimWorkerState['destLinks']       = destLinks
+    _skimWorkerState['destPositions']   = destPositions
+    _skimWorkerState['destLinkCosts']   = destLinkCosts
+    _skimWorkerState['skim']            = skim.reshape((numCentroids, numCentroids))
+
+def _skimOriginsInWorker(originPositions):
+    """
+    Pool task: fills in the shared skim rows for *originPositions*.  Returns the number of origins done.
+    """
+    state = _skimWorkerState
+    _skimOrigins(state['linkOutPointer'], state['movementOutgoing'], state['movementCosts'],
+                 state['originPointer'], state['originLinks'],
+                 state['destLinks'], state['destPositions'], state['destLinkCosts'], originPositions, state['skim'])
+    return len(originPositions)
+
 class ShortestPaths(object):
     """
     Shortest path algorithms and various utilities
@@ -452,116 +546,80 @@ class ShortestPaths(object):
             edge.cost = edge.getLength()
 
     @classmethod
-    def labelCorrectingWithLabelsOnLinks(cls, graph, sourceLink):
+    def _getMovementCostsFromAttributes(cls, graph, snapshot):
+        """
+        Returns an array of movement costs, by *snapshot* movement index, read from the *cost*
+        attribute of the :py:class:`Movement` instances (see :py:meth:`ShortestPaths.initialiseMovementCostsWithFFTT`).
+        """
+        costs = np.empty(snapshot.getNumMovements(), dtype=np.float64)
+        for edge in graph.iterLinks():
+            if edge.isVirtualLink(): continue
+            for movement in edge.iterOutgoingMovements():
+                costs[snapshot.getMovementIndex(edge.getId(), movement.getOutgoingLink().getId())] = movement.cost
+        return costs
+
+    @classmethod
+    def labelCorrectingWithLabelsOnLinks(cls, graph, sourceLink, movementCosts=None):
         """
-        Implementation of Pape's shortest path
-        using a deque. Links are inserted to the 
-        left of the deque if they have been already 
-        visited. Otherwise they are inserted to the
-        right of the deque.
+        Shortest paths from *sourceLink* to all the links of *graph* (a :py:class:`Network`), going
+        from link to link through movements.  The label of a link is the sum of the costs of the
+        movements used to reach it.
 
-        Movements need to have a cost attribute
+        *movementCosts* is an array of non-negative costs by movement index of the
+        :py:meth:`Network.toGraphSnapshot`; if None, the *cost* attribute of each
+        :py:class:`Movement` is used, so movements need to have a cost attribute
+        (see :py:meth:`ShortestPaths.initialiseMovementCostsWithFFTT`).
 
+        The search runs on the :py:class:`GraphSnapshot` of the network and nothing is set on the
+        links; returns a :py:class:`ShortestPathTree` on links.
         """
-        for edge in graph.iterLinks():
-            edge.label = sys.maxint 
-            edge.alreadyVisited = False
-            edge.predEdge = None
-            
-        sourceLink.label = 0
-
-        edgesToExamine = deque()
-        edgesToExamine.appendleft(sourceLink)
-
-        while edgesToExamine:
-            pivotEdge = edgesToExamine.popleft()
-            pivotEdge.alreadyVisited = True
-            for eMovement in pivotEdge.iterOutgoingMovements():
-                newLabel = pivotEdge.label + eMovement.cost
-                downstreamEdge = eMovement.getOutgoingLink()
-                if newLabel < downstreamEdge.label:
-                    downstreamEdge.label = newLabel
-                    downstreamEdge.predEdge = pivotEdge
-                    if downstreamEdge.alreadyVisited:
-                        edgesToExamine.appendleft(downstreamEdge)
-                    else:
-                        edgesToExamine.append(downstreamEdge)        
+        snapshot = graph.toGraphSnapshot()
+        if movementCosts is None:
+            movementCosts = cls._getMovementCostsFromAttributes(graph, snapshot)
+
+        sourceIndex = snapshot.getLinkIndex(sourceLink.getId())
+        labels, predLinks = snapshot.labelSettingOnLinks(sourceIndex, movementCosts)
+        return ShortestPathTree(graph, snapshot, labels, predLinks, True, [sourceIndex])
 
-                        
     @classmethod
     def labelCorrectingWithLabelsOnNodes(cls, graph, sourceVertex):
         """
-        Implementation of Pape's shortest path
-        using a deque. Vertices are inserted to the 
-        left of the deque if they have been already 
-        visited. Otherwise they are inserted to the
-        right of the deque
-
-        *graph* is an instance of a :py:class:`Network`.
+        Shortest paths from *sourceVertex* to all the nodes of *graph*, a :py:class:`Network`.
         The edge cost used is given by :py:meth:`Link.euclideanLength`.
         :py:class:`VirtualLink` instances and :py:class:`VirtualNode` instances
         are not included in the shortest path.
         
-        :py:class:`Node` instances have the following set:
-        
-        * *label* is set to the cost
-        * *alreadyVisited* is a boolean
-        * *predVertex* references the previous vertex Node
-        
+        The search runs on the :py:class:`GraphSnapshot` of the network and nothing is set on the
+        nodes; returns a :py:class:`ShortestPathTree` on nodes.
         """
-
-        for vertex in graph.iterNodes():
-            vertex.label = sys.maxint
-            vertex.alreadyVisited = False 
-            vertex.predVertex = None
-
-        sourceVertex.label = 0
-        verticesToExamine = deque()
-        verticesToExamine.appendleft(sourceVertex)
-        
-        while verticesToExamine:
-            pivotVertex = verticesToExamine.popleft()
-            pivotVertex.alreadyVisited = True
-
-            for edge in pivotVertex.iterOutgoingLinks():
-
-                # VirtualLink instances are not included in the shortest path.
-                if edge.isVirtualLink(): continue
-                
-                downstreamVertex = edge.getEndNode()
-                
-                # VirtualNode instances are not included in the shortest path.
-                if downstreamVertex.isVirtualNode(): continue
-                
-                # The edge cost used is given by :py:meth:`Link.euclideanLength`.
-                newLabel = pivotVertex.label + edge.euclideanLength()
-                
-                if newLabel < downstreamVertex.label:
-                    downstreamVertex.label = newLabel
-                    downstreamVertex.predVertex = pivotVertex
-                    if downstreamVertex.alreadyVisited:
-                        verticesToExamine.appendleft(downstreamVertex)
-                    else:
-                        verticesToExamine.append(downstreamVertex)
-
-
+        snapshot = graph.toGraphSnapshot()
+        sourceIndex = snapshot.getNodeIndex(sourceVertex.getId())
+        labels, predLinks = snapshot.labelSettingOnNodes(sourceIndex, snapshot.linkEuclideanLength,
+                                                         linkMask=snapshot.getLinkMask(includeVirtual=False))
+        return ShortestPathTree(graph, snapshot, labels, predLinks, False, [sourceIndex])
 
     @classmethod
     def labelSettingWithLabelsOnNodes(cls, graph, sourceVertex, endVertex, includeVirtual=False, sourceLabel=0.0, maxLabel=sys.float_info.max, 
                                           filterRoadLinkEvalStr=None):
         """
-        .. TODO:: document new args
-        
-        Implementation of Pape's shortest path
-        using a deque. Vertices are inserted to the 
-        left of the deque if they have been already 
-        visited. Otherwise they are inserted to the
-        right of the deque
+        Implementation of Dijkstra's label setting shortest path using a binary heap
+        (:py:mod:`heapq`) as the priority queue.  A vertex is pushed onto the heap every
+        time its label decreases; entries that were superseded by a later decrease are
+        discarded when they are popped (lazy deletion), so each vertex is expanded once.
 
         *graph* is an instance of a :py:class:`Network`.
-        The edge cost used is given by :py:meth:`Link.euclideanLength`.
-        :py:class:`VirtualLink` instances and :py:class:`VirtualNode` instances
-        are not included in the shortest path.
+        The edge cost used is given by :py:meth:`RoadLink.euclideanLength` (including the
+        shape points).
+
+         * *sourceVertex* is the :py:class:`Node` the search starts from, with label *sourceLabel*
+         * *endVertex* is a :py:class:`Node`; the search stops as soon as it is permanently
+           labeled.  Pass None to label the whole graph.
+         * If *includeVirtual* is False, :py:class:`VirtualLink` instances and
+           :py:class:`VirtualNode` instances are not included in the shortest path.
+         * The search stops once the smallest permanent label exceeds *maxLabel*.
+         * *filterRoadLinkEvalStr* is an optional python expression evaluated with the
+           :py:class:`RoadLink` bound to ``roadlink``; road links for which it evaluates
+           to True are skipped.  The expression is compiled once per call.
         
         :py:class:`Node` instances have the following set:
         
@@ -569,111 +627,253 @@ class ShortestPaths(object):
         * *alreadySet* is a boolean
         * *predVertex* references the previous vertex Node
         
+        Returns the set of permanently labeled :py:class:`Node` instances.
         """
 
         for vertex in graph.iterNodes():
             vertex.label        = sys.float_info.max
             vertex.alreadySet   = False
             vertex.predVertex   = None
-            mincostVertex       = sourceVertex
 
         sourceVertex.label      = sourceLabel
-        
-        verticesToExamine       = deque()
-        nextPivotVertex         = sourceVertex
+
+        filterCode = None
+        if filterRoadLinkEvalStr:
+            filterCode = compile(filterRoadLinkEvalStr, "<filterRoadLinkEvalStr>", "eval")
+        filterGlobals = globals()
+
+        # heap entries are (label, push count, vertex); the push count breaks ties
+        # so vertices themselves are never compared
+        verticesToExamine       = [(sourceLabel, 0, sourceVertex)]
+        pushCount               = 1
         
         # these are permanently labeled
-        labeledVertices           = set()
+        labeledVertices         = set()
         
-        while True:
+        while verticesToExamine:
+            
+            pivotLabel, tieBreak, pivotVertex = heapq.heappop(verticesToExamine)
+            # stale entry: this vertex was already set via a smaller label
+            if pivotVertex.alreadySet: continue
             
-            pivotVertex = nextPivotVertex
             pivotVertex.alreadySet = True
             labeledVertices.add(pivotVertex)
                         
             # end condition if endVertex is passed
             if endVertex and (pivotVertex == endVertex): break
             # end condition if maxLabel is real
-            if pivotVertex.label > maxLabel: break
+            if pivotLabel > maxLabel: break
             
             for edge in pivotVertex.iterOutgoingLinks():
                 
                 # don't include VirtualLink instances unless specified
                 if not includeVirtual and edge.isVirtualLink(): continue
                 
-                # don't include the RoadLink instance if specified
-                localsdict = {}
-                localsdict['roadlink'] = edge
-                if edge.isRoadLink() and filterRoadLinkEvalStr and eval(filterRoadLinkEvalStr, globals(), localsdict): 
-                    dta.DtaLogger.debug("Skipping edge %10s with ft=%d" % (edge.getId(), edge.getFacilityType()))
-                    continue
-                
                 downstreamVertex = edge.getEndNode()
+                if downstreamVertex.alreadySet: continue
 
                 # don't include VirtualNode instances unless specified
                 if not includeVirtual and downstreamVertex.isVirtualNode(): continue
                 
+                # don't include the RoadLink instance if specified
+                if filterCode and edge.isRoadLink() and eval(filterCode, filterGlobals, {'roadlink':edge}): 
+                    dta.DtaLogger.debug("Skipping edge %10s with ft=%d" % (edge.getId(), edge.getFacilityType()))
+                    continue
+                
                 # The edge cost used is given by :py:meth:`Link.euclideanLength`.
-                newLabel = pivotVertex.label + edge.euclideanLength(includeShape=True)
+                newLabel = pivotLabel + edge.euclideanLength(includeShape=True)
                 
                 if newLabel < downstreamVertex.label:
                     downstreamVertex.label = newLabel
                     downstreamVertex.predVertex = pivotVertex
-                    if not downstreamVertex.alreadySet:
-                        verticesToExamine.appendleft(downstreamVertex)
-
-            mincost = 0
-            if len(verticesToExamine)==0:
-                return labeledVertices
-            for updateVertex in verticesToExamine:
-                if mincost==0:
-                    mincost = updateVertex.label
-                    mincostVertex = updateVertex
-                else:
-                    if updateVertex.label<mincost:
-                        mincost = updateVertex.label
-                        mincostVertex = updateVertex
-            verticesToExamine.remove(mincostVertex)
-            nextPivotVertex = mincostVertex
+                    heapq.heappush(verticesToExamine, (newLabel, pushCount, downstreamVertex))
+                    pushCount += 1
                 
         return labeledVertices
 
     @classmethod
-    def getShortestPathBetweenLinks(cls, graph, sourceLink, destinationLink, runSP=False):
+    def buildCentroidSkim(cls, graph, movementCosts=None, linkCosts=None, numProcesses=1, chunkSize=None):
+        """
+        Computes the shortest path tree on links from every :py:class:`Centroid` in *graph* (a :py:class:`Network`)
+        and returns the origin x destination travel costs as a 2-dimensional :py:class:`MultiArray` whose elements
+        in both dimensions are the centroid ids.  Unreachable pairs are infinity; the diagonal is zero.
+
+        Trips start on the access links of the origin (see :py:meth:`GraphSnapshot.getCentroidAccessLinks`) and end
+        with the traversal of an egress link of the destination.
+
+         * *movementCosts* is an array by movement index of the :py:meth:`Network.toGraphSnapshot`; it defaults to
+           :py:meth:`GraphSnapshot.getMovementFFTTCosts` with prohibited movements excluded
+         * *linkCosts* is an array by link index, the cost of traversing the egress links; it defaults to
+           :py:attr:`GraphSnapshot.linkFFTT`
+         * *numProcesses* is the number of worker processes.  If more than one, the link graph, the costs and the
+           skim itself are put in shared memory, which the workers search in place, and the origins are fanned out
+           to a :py:class:`multiprocessing.Pool` in chunks of *chunkSize* origins.  Pass None to use all the cores.
+        """
+        import multiprocessing
+        from multiprocessing.sharedctypes import RawArray
+
+        snapshot = graph.toGraphSnapshot()
+        if movementCosts is None:
+            movementCosts = snapshot.getMovementFFTTCosts().copy()
+            movementCosts[snapshot.movementProhibited] = np.inf
+        if linkCosts is None:
+            linkCosts = snapshot.linkFFTT
+        movementCosts = np.asarray(movementCosts, dtype=np.float64)
+        linkCosts     = np.asarray(linkCosts, dtype=np.float64)
+
+        centroidIndices = snapshot.getCentroidIndices()
+        numCentroids    = len(centroidIndices)
+        centroidIds     = [snapshot.getNodeId(index) for index in centroidIndices]
+
+        # flatten the access links of all the origins, and the egress links of all the destinations
+        originLinks   = []
+        originPointer = [0]
+        destLinks     = []
+        destPositions = []
+        for position, centroidIndex in enumerate(centroidIndices):
+            originLinks.extend(snapshot.getCentroidAccessLinks(centroidIndex))
+            originPointer.append(len(originLinks))
+            egressLinks = snapshot.getCentroidAccessLinks(centroidIndex, egress=True)
+            destLinks.extend(egressLinks)
+            destPositions.extend([position] * len(egressLinks))
+        originLinks   = np.array(originLinks, dtype=np.int32)
+        originPointer = np.array(originPointer, dtype=np.int32)
+        destLinks     = np.array(destLinks, dtype=np.int32)
+        destPositions = np.array(destPositions, dtype=np.int32)
+        destLinkCosts = linkCosts[destLinks]
+
+        if numProcesses is None:
+            numProcesses = multiprocessing.cpu_count()
+        numProcesses = max(1, min(numProcesses, numCentroids))
+
+        if numProcesses == 1:
+            skim = np.empty((numCentroids, numCentroids), dtype=np.float64)
+            _skimOrigins(snapshot.linkOutPointer.tolist(), snapshot.movementOutgoingLink.tolist(),
+                         movementCosts.tolist(), originPointer, originLinks, destLinks, destPositions, destLinkCosts,
+                         range(numCentroids), skim)
+        else:
+            def share(array, typecode):
+                sharedArray = RawArray(typecode, max(1, len(array)))
+                _sharedArrayView(sharedArray, typecode)[:len(array)] = array
+                return (sharedArray, typecode)
+
+            toShare      = [(snapshot.linkOutPointer, 'i'), (snapshot.movementOutgoingLink, 'i'), (movementCosts, 'd'),
+                            (originPointer, 'i'), (originLinks, 'i'), (destLinks, 'i'), (destPositions, 'i'),
+                            (destLinkCosts, 'd'), (np.zeros(numCentroids * numCentroids), 'd')]
+            sharedArrays = [share(array, typecode) for array, typecode in toShare]
+            lengths      = [len(array) for array, typecode in toShare]
+            if chunkSize is None:
+                chunkSize = max(1, numCentroids // (4 * numProcesses))
+            chunks = [range(start, min(start + chunkSize, numCentroids)) for start in xrange(0, numCentroids, chunkSize)]
+
+            pool = multiprocessing.Pool(numProcesses, initializer=_initSkimWorker,
+                                        initargs=(sharedArrays, lengths, numCentroids))
+            try:
+                numDone = sum(pool.map(_skimOriginsInWorker, chunks))
+            finally:
+                pool.close()
+                pool.join()
+            dta.DtaLogger.debug("buildCentroidSkim: %d origins done by %d processes" % (numDone, numProcesses))
+            skim = _sharedArrayView(sharedArrays[-1][0], 'd')[:lengths[-1]].reshape((numCentroids, numCentroids)).copy()
+
+        return dta.MultiArray('d', [centroidIds, centroidIds], numpyArray=skim)
+
+    @classmethod
+    def getShortestPathBetweenLinks(cls, graph, sourceLink, destinationLink, runSP=False, tree=None):
         """
         Return the path from the sourceLink to the 
         destinationLink as a list of edges. The return list always contains the 
-        destination and the source edge
+        destination and the source edge.
+
+        *tree* is a :py:class:`ShortestPathTree` on links from *sourceLink*, as returned by
+        :py:meth:`ShortestPaths.labelCorrectingWithLabelsOnLinks`.  If it is not passed, it is
+        computed (so *runSP* is no longer needed and is ignored).
         """
         if sourceLink==destinationLink:
             return []
         
-        if runSP:
-            ShortestPaths.labelCorrectingWithLabelsOnLinks(graph, sourceLink)
+        if tree is None:
+            tree = ShortestPaths.labelCorrectingWithLabelsOnLinks(graph, sourceLink)
         
-        edge = destinationLink
-        path = []
-        while edge != sourceLink:
-            path.insert(0, edge)
-            edge = edge.predEdge
-        path.insert(0, edge)
-        return path
+        return tree.getPath(destinationLink.getId())
 
     @classmethod
-    def getShortestPathBetweenNodes(cls, sourceNode, destinationNode):
+    def getAStarPathBetweenNodes(cls, graph, sourceNode, destinationNode, includeShape=False, includeVirtual=False):
+        """
+        Return the shortest path from the sourceNode to the destinationNode
+        of *graph* (a :py:class:`Network`) as a list of nodes, including both, using
+        :py:meth:`GraphSnapshot.aStarOnNodes` so only the area between the two nodes is searched.
+
+        The edge cost used is given by :py:meth:`Link.euclideanLength`, following the shape points
+        if *includeShape*.  If *includeVirtual* is False, :py:class:`VirtualLink` instances and
+        :py:class:`VirtualNode` instances are not included in the shortest path.
+
+        Raises a :py:class:`DtaError` if there is no path.
+        """
+        if sourceNode==destinationNode:
+            return []
+
+        snapshot  = graph.toGraphSnapshot()
+        costName  = "linkShapeLength" if includeShape else "linkEuclideanLength"
+        linkCosts = snapshot.getCachedList(costName, lambda: getattr(snapshot, costName))
+        linkMask  = None if includeVirtual else \
+                    snapshot.getCachedList("linkMask", lambda: snapshot.getLinkMask(includeVirtual=False))
+
+        cost, linkPath = snapshot.aStarOnNodes(snapshot.getNodeIndex(sourceNode.getId()),
+                                               snapshot.getNodeIndex(destinationNode.getId()),
+                                               linkCosts, linkMask)
+        if linkPath is None:
+            raise DtaError("No path found from node %d to node %d" % (sourceNode.getId(), destinationNode.getId()))
+        return [sourceNode] + [graph.getNodeForId(snapshot.getNodeId(snapshot.linkEndNode[linkIndex])) for linkIndex in linkPath]
+
+    @classmethod
+    def getBidirectionalPathBetweenLinks(cls, graph, sourceLink, destinationLink, movementCosts=None):
+        """
+        Return the shortest path from the sourceLink to the destinationLink of *graph*
+        (a :py:class:`Network`) as a list of links, including both, using
+        :py:meth:`GraphSnapshot.bidirectionalOnLinks` so only the area between the two links is searched.
+
+        *movementCosts* is an array of costs by movement index of the :py:class:`GraphSnapshot`;
+        the default is :py:meth:`GraphSnapshot.getMovementLengthCosts`.
+
+        Raises a :py:class:`DtaError` if there is no path.
+        """
+        if sourceLink==destinationLink:
+            return []
+
+        snapshot = graph.toGraphSnapshot()
+        if movementCosts is None:
+            movementCosts = snapshot.getCachedList("movementLengthCosts", snapshot.getMovementLengthCosts)
+
+        cost, linkPath = snapshot.bidirectionalOnLinks(snapshot.getLinkIndex(sourceLink.getId()),
+                                                       snapshot.getLinkIndex(destinationLink.getId()),
+                                                       movementCosts)
+        if linkPath is None:
+            raise DtaError("No path found from link %d to link %d" % (sourceLink.getId(), destinationLink.getId()))
+        return [graph.getLinkForId(snapshot.getLinkId(linkIndex)) for linkIndex in linkPath]
+
+    @classmethod
+    def getShortestPathBetweenNodes(cls, sourceNode, destinationNode, tree=None):
         """
         Return the path from the sourceNode to the 
         destinationNode as a list of nodes. The return list always contains the 
-        destination and the source node
+        destination and the source node.
+
+        If *tree* is passed, it is the :py:class:`ShortestPathTree` on nodes from *sourceNode*,
+        e.g. from :py:meth:`ShortestPaths.labelCorrectingWithLabelsOnNodes`.  Otherwise the
+        *predVertex* attributes set by :py:meth:`ShortestPaths.labelSettingWithLabelsOnNodes` are used.
         """
         if sourceNode==destinationNode:
             return []
+        if tree is not None:
+            return tree.getPath(destinationNode.getId())
+
         vertex = destinationNode
         path = []
         while vertex != sourceNode:
-            path.insert(0, vertex)
+            path.append(vertex)
             vertex = vertex.predVertex
-        path.insert(0, vertex)
+        path.append(vertex)
+        path.reverse()
         return path
 
-     
@@ -0,0 +1,223 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from .DtaError import DtaError
+from .RoadLink import RoadLink
+
+class CountValidation(object):
+    """
+    Compares the observed counts of a :py:class:`Network` with its simulated volumes at every count
+    location -- each :py:class:`RoadLink` and :py:class:`Movement` with :py:meth:`RoadLink.hasCountInfo` --
+    over a set of reporting windows at once.
+
+    The counts and volumes are gathered into aligned (locations x windows) arrays when the
+    instance is built, with NaN where a location has no count for a window; the statistics are then
+    computed over all the observations (location and window pairs with a count) in one pass.
+
+    The volumes come from the :py:class:`SimResultStore` of the network, so the simulation results must
+    be set up first (see :py:meth:`Network.initializeSimResults` and :py:meth:`DynameqNetwork.readSimResults`).
+    """
+
+    #: Location type for links, in :py:meth:`CountValidation.getLocations`
+    LOCATION_LINK       = "link"
+    #: Location type for movements, in :py:meth:`CountValidation.getLocations`
+    LOCATION_MOVEMENT   = "movement"
+
+    #: The GEH below which an observation is considered a match
+    GEH_THRESHOLD       = 5.0
+
+    def __init__(self, net, windows):
+        """
+        Constructor.
+
+         * *net* is the :py:class:`Network` with counts and simulation results
+         * *windows* is a list of (startTimeInMin, endTimeInMin) reporting windows; a count is used if it was
+           set for exactly that window (see :py:meth:`RoadLink.setObsCount`)
+        """
+        if net.getSimResults() is None:
+            raise DtaError("CountValidation: the network has no simulation results")
+        if len(windows) == 0:
+            raise DtaError("CountValidation: no reporting windows")
+
+        self._windows       = [(int(startTimeInMin), int(endTimeInMin)) for startTimeInMin, endTimeInMin in windows]
+        # (location type, id, facility type) by location
+        self._locations     = []
+
+        linkIds, linkRows   = net.getSimResultLinkRows()
+        linkPosition        = dict((linkId, position) for position, linkId in enumerate(linkIds.tolist()))
+        movementRows        = net.getSimResultMovementRows()
+
+        countedLinks        = []
+        countedMovements    = []
+        for link in net.iterLinks():
+            if not isinstance(link, RoadLink): continue
+            if link.hasCountInfo():
+                countedLinks.append(link)
+            for mov in link.iterOutgoingMovements():
+                if mov.hasCountInfo():
+                    countedMovements.append(mov)
+        countedLinks.sort(key=lambda link: link.getId())
+        countedMovements.sort(key=lambda mov: mov.getId())
+
+        counts = np.empty((len(countedLinks) + len(countedMovements), len(self._windows)), dtype=np.float64)
+        counts.fill(np.nan)
+        for position, location in enumerate(countedLinks + countedMovements):
+            if isinstance(location, RoadLink):
+                self._locations.append((CountValidation.LOCATION_LINK, location.getId(), location.getFacilityType()))
+            else:
+                self._locations.append((CountValidation.LOCATION_MOVEMENT, location.getId(),
+                                        location.getIncomingLink().getFacilityType()))
+            for window, (startTimeInMin, endTimeInMin) in enumerate(self._windows):
+                count = location.getObsCount(startTimeInMin, endTimeInMin)
+                if count is not None:
+                    counts[position, window] = count
+
+        for link in countedLinks:
+            if link.getId() not in linkPosition:
+                raise DtaError("CountValidation: counted link %d has no simulation results; it was added after "
+                               "initializeSimResults()" % link.getId())
+        for mov in countedMovements:
+            if (mov.getAtNode().getId(), mov.getStartNodeId(), mov.getEndNodeId()) not in movementRows:
+                raise DtaError("CountValidation: counted movement %s has no simulation results; it was added after "
+                               "initializeSimResults()" % mov.getId())
+        # one vectorized query per window for all the links, then the rows of the counted locations
+        linkPositions = np.array([linkPosition[link.getId()] for link in countedLinks], dtype=np.int64)
+        movementRowArray = np.array([movementRows[(mov.getAtNode().getId(), mov.getStartNodeId(), mov.getEndNodeId())]
+                                     for mov in countedMovements], dtype=np.int64)
+        simResults = net.getSimResults()
+        volumes = np.empty_like(counts)
+        for window, (startTimeInMin, endTimeInMin) in enumerate(self._windows):
+            if len(countedLinks):
+                volumes[:len(countedLinks), window] = net.getLinkSimOutVolumes(startTimeInMin, endTimeInMin)[1][linkPositions]
+            if len(countedMovements):
+                volumes[len(countedLinks):, window] = simResults.getOutVolumes(startTimeInMin, endTimeInMin)[movementRowArray]
+
+        #: (locations x windows) array of the observed counts, NaN where there is none
+        self.counts         = counts
+        #: (locations x windows) array of the simulated volumes
+        self.volumes        = volumes
+        #: array by location of the facility type (of the incoming link, for movements)
+        self.facilityTypes  = np.array([location[2] for location in self._locations], dtype=np.int64)
+
+    def getWindows(self):
+        """
+        Returns the list of the (startTimeInMin, endTimeInMin) reporting windows.
+        """
+        return list(self._windows)
+
+    def getLocations(self):
+        """
+        Returns the list of the count locations as (location type, id, facility type), where the
+        location type is :py:attr:`CountValidation.LOCATION_LINK` or :py:attr:`CountValidation.LOCATION_MOVEMENT`
+        and the id is the :py:meth:`Link.getId` or :py:meth:`Movement.getId`.
+        """
+        return list(self._locations)
+
+    def getNumObservations(self):
+        """
+        Returns the number of location and window pairs with a count.
+        """
+        return int(np.count_nonzero(~np.isnan(self.counts)))
+
+    def getGEH(self):
+        """
+        Returns the (locations x windows) array of the GEH statistic of the hourly flows,
+        ``sqrt(2 (volume - count)^2 / (volume + count))``, NaN where there is no count.
+        The GEH is zero where both the count and the volume are zero.
+        """
+        hours   = np.array([(endTimeInMin - startTimeInMin) / 60.0 for startTimeInMin, endTimeInMin in self._windows])
+        missing = np.isnan(self.counts)
+        counts  = np.where(missing, 0.0, self.counts) / hours
+        volumes = self.volumes / hours
+        total   = counts + volumes
+        squared = 2.0 * (volumes - counts) ** 2
+        geh     = np.zeros_like(counts)
+        np.divide(squared, total, out=geh, where=total > 0)
+        geh     = np.sqrt(geh)
+        geh[missing] = np.nan
+        return geh
+
+    def _getStatistics(self, groups, numGroups):
+        """
+        Returns the statistics of :py:meth:`CountValidation.getStatistics` for each of the *numGroups* groups of
+        observations, where *groups* is the (locations x windows) array of the group of each observation,
+        as a dictionary of statistic name -> array by group.
+        """
+        observed = ~np.isnan(self.counts)
+        groups   = groups[observed]
+        counts   = self.counts[observed]
+        volumes  = self.volumes[observed]
+        matches  = (self.getGEH()[observed] < CountValidation.GEH_THRESHOLD).astype(np.float64)
+
+        def groupSums(values):
+            return np.bincount(groups, weights=values, minlength=numGroups).astype(np.float64)
+
+        num       = groupSums(np.ones(len(counts)))
+        sumCount  = groupSums(counts)
+        sumVolume = groupSums(volumes)
+        sumCount2 = groupSums(counts * counts)
+        sumVolume2 = groupSums(volumes * volumes)
+        sumProduct = groupSums(counts * volumes)
+        sumError2 = groupSums((volumes - counts) ** 2)
+
+        statistics = {}
+        statistics["numObservations"] = num
+        statistics["totalCount"]      = sumCount
+        statistics["totalVolume"]     = sumVolume
+        for name in ["percentGEHUnder5", "percentRMSE", "rSquared"]:
+            statistics[name] = np.empty(numGroups, dtype=np.float64)
+            statistics[name].fill(np.nan)
+
+        hasObservations = num > 0
+        np.divide(100.0 * groupSums(matches), num, out=statistics["percentGEHUnder5"], where=hasObservations)
+        rmse = np.sqrt(np.where(hasObservations, sumError2 / np.maximum(num, 1), 0.0))
+        np.divide(100.0 * rmse * num, sumCount, out=statistics["percentRMSE"], where=hasObservations & (sumCount > 0))
+        # the square of the correlation coefficient of the counts and the volumes
+        covariance = num * sumProduct - sumCount * sumVolume
+        variances  = (num * sumCount2 - sumCount ** 2) * (num * sumVolume2 - sumVolume ** 2)
+        np.divide(covariance ** 2, variances, out=statistics["rSquared"], where=variances > 0)
+        return statistics
+
+    def getStatistics(self):
+        """
+        Returns the statistics over all the observations as a dictionary with the keys:
+
+         * ``numObservations``: the number of location and window pairs with a count
+         * ``totalCount`` and ``totalVolume``: the sums of the counts and of the volumes
+         * ``percentGEHUnder5``: the percentage of observations with a GEH (see :py:meth:`CountValidation.getGEH`)
+           under :py:attr:`CountValidation.GEH_THRESHOLD`
+         * ``percentRMSE``: the root mean square error of the volumes divided by the mean count, in percent
+         * ``rSquared``: the square of the correlation coefficient of the counts and the volumes
+
+        Statistics that are undefined (e.g. without observations) are NaN.
+        """
+        statistics = self._getStatistics(np.zeros(self.counts.shape, dtype=np.int64), 1)
+        return dict((name, float(values[0])) for name, values in statistics.iteritems())
+
+    def getStatisticsByFacilityType(self):
+        """
+        Returns a dictionary mapping each facility type with count locations to a dictionary of its statistics,
+        as :py:meth:`CountValidation.getStatistics`.
+        """
+        facilityTypes, groupOfLocation = np.unique(self.facilityTypes, return_inverse=True)
+        groups = np.repeat(groupOfLocation[:, np.newaxis], len(self._windows), axis=1).astype(np.int64)
+        statistics = self._getStatistics(groups, len(facilityTypes))
+        return dict((int(facilityType), dict((name, float(values[group])) for name, values in statistics.iteritems()))
+                    for group, facilityType in enumerate(facilityTypes))
@@ -456,7 +456,7 @@ ENDRUN
             # a negative one means prohibited
             if turnPen == -1:
                 # DtaLogger.info("Removing movement %d-%d-%d found in turn prohibition file" % (startNodeId, nodeId, endNodeId))
-                mov.prohibitAllVehicleClassGroups()
+                self.prohibitMovement(mov)
                 # mov.prohibitAllVehiclesButTransit()
                 movements_removed += 1
             
@@ -19,24 +19,52 @@ import pdb
 import copy
 import csv
 import datetime
-from itertools import izip 
+from itertools import izip, islice
 
 import numpy as np
 
 import dta
-from dta.Algorithms import hasPath, getClosestCentroid 
+from dta.Algorithms import getClosestCentroids
 from dta.DtaError import DtaError
 from dta.MultiArray import MultiArray
+from dta.SparseDemandTable import SparseDemandTable
 from dta.Utils import Time
 
+def _writeDynameqFile(task):
+    """
+    Task of :py:meth:`Demand.writeDynameqTables`: writes the demand table of *task*, a tuple of
+    (file name, start time, end time, vehicle class name, time periods, centroid ids, demand table), to the file.
+    """
+    fileName, startTime, endTime, vehClassName, timePeriods, centroidIds, demandTable = task
+    outputStream = open(fileName, "w")
+    try:
+        Demand.writeDynameqDemandHeader(outputStream, startTime, endTime, vehClassName)
+        Demand._writeDynameqSlices(outputStream, demandTable, timePeriods, centroidIds)
+    finally:
+        outputStream.close()
+
 class Demand(object):
     """
     Class that represents the demand matrix for a :py:class:`Network`
+
+    The matrix is either a dense :py:class:`MultiArray` or, for large tables with mostly zero
+    cells, a :py:class:`SparseDemandTable`; see :py:meth:`Demand.isSparse` and :py:meth:`Demand.setSparse`.
     """
 
+    #: Tables that are read are kept sparse if they have a smaller share of non-zero cells than this
+    SPARSE_DENSITY      = 0.1
+    #: ... and if they would take at least this many bytes dense
+    SPARSE_MIN_BYTES    = 64 * 1024 * 1024
+    #: Empty tables that would take more than this many bytes dense start sparse
+    MAX_DENSE_BYTES     = 1024 * 1024 * 1024
+    #: The number of rows formatted at once by :py:meth:`Demand.writeDynameqTable`
+    WRITE_BLOCK_ROWS    = 256
+    #: The names of the dimensions of the table, see :py:meth:`Demand.getMultiArray`
+    DIM_NAMES           = ["time", "origin", "destination"]
+
     @classmethod
     def readCubeODTable(cls, fileName, net, vehicleClassName, 
-                        startTime, endTime, timeStep, demandPortion):
+                        startTime, endTime, timeStep, demandPortion, sparse=None):
         """
         Reads the demand (linear format) from the input csv file and returns a demand instance.
         
@@ -52,71 +80,101 @@ class Demand(object):
         :type endTime: a :py:class:`dta.Utils.Time` instance
         :param timeStep: the granularity of time steps at which the demand is represented.
         :type timeStep: a :py:class:`dta.Utils.Time` instance
-        
+        :param demandPortion: the factor applied to the trips of the table.
+        :param sparse: True or False for a sparse or dense demand table, or None to choose by density
+           (see :py:attr:`Demand.SPARSE_DENSITY`).
+
+        The table is read in bulk: the records are parsed into arrays, the zones mapped to the demand
+        table indices at once, and the hourly flows totaled into one origin x destination matrix
+        that is added to every time slice.  Intrazonal trips are split in two halves, from the zone to
+        its closest centroid and back (see :py:func:`dta.Algorithms.getClosestCentroids`).  Trips with a zone
+        that is not a centroid are logged and dropped.
         """
         timeSpan = endTime - startTime
-        demand = Demand(net, vehicleClassName, startTime, endTime, timeStep)
+        demand = Demand(net, vehicleClassName, startTime, endTime, timeStep, sparse=True)
         #demand = Demand(net, vehicleClassName, startTime, endTime, timeSpan)
-        totTrips = 0
-        numIntrazonalTrips = 0
         inputStream = open(fileName, "r")
-        checkSum = 0 
-    
-        for record in csv.DictReader(inputStream):
-            
-            origin = int(record["O"])
-            destination = int(record["D"])
-            trips = demandPortion*float(record[vehicleClassName])
-            totTrips += trips
-            tripsInHourlyFlows = trips * (60.0 / timeSpan.getMinutes())
-            
-            if tripsInHourlyFlows == 0:
-                continue
-            if origin == destination:
-                origCent = net.getNodeForId(origin)
-                destCent, dist = getClosestCentroid(net, origCent)
-                tripsIntrazonal = tripsInHourlyFlows/2
-                tripsBefore = demand.getTotalNumTrips()
-                for i,timeSlice in enumerate(demand._timePeriods):
-                    tripsOD = demand.getValue(timeSlice, origCent.getId(), destCent.getId())
-                    tripsDO = demand.getValue(timeSlice, destCent.getId(), origCent.getId())
-                    tripsOD += tripsIntrazonal
-                    tripsDO += tripsIntrazonal
-                    demand.setValue(timeSlice, origCent.getId(), destCent.getId(), tripsOD)
-                    demand.setValue(timeSlice, destCent.getId(), origCent.getId(), tripsDO)
-                #dist = dist/5280
-                #dta.DtaLogger.debug("Assigning %f intrazonal trips from zone %s to zone %s, %8.4f miles away." % (tripsInHourlyFlows,origCent.getId(),destCent.getId(),dist))
-                numIntrazonalTrips += trips
-                continue
-            if not net.hasCentroidForId(origin):
-                dta.DtaLogger.error("Origin zone %d does not exist" % origin)
-                continue 
-            if not net.hasCentroidForId(destination):
-                dta.DtaLogger.error("Destination zone %s does not exist" % destination)
-                continue
-            for i,timeSlice in enumerate(demand._timePeriods):
-                tripsOD = demand.getValue(timeSlice, origin, destination)
-                tripsOD += tripsInHourlyFlows
-                demand.setValue(timeSlice, origin, destination, tripsOD)
-            #if destination == 7973:
-            #    checkSum += trips
-
-        dta.DtaLogger.info("The cube table has the following fields: %s" % ",".join(record.keys()))
-          
+        fields = [field.strip() for field in csv.reader([inputStream.readline()]).next()]
+        for field in ["O", "D", vehicleClassName]:
+            if field not in fields:
+                raise DtaError("The cube table %s has no %s field" % (fileName, field))
+        dta.DtaLogger.info("The cube table has the following fields: %s" % ",".join(fields))
+
+        # all the values at once, one row of len(fields) values per record
+        values = np.fromstring(inputStream.read().replace(",", " "), dtype=np.float64, sep=" ")
+        inputStream.close()
+        if len(values) % len(fields) != 0:
+            raise DtaError("The cube table %s has records that are not %d numbers" % (fileName, len(fields)))
+        values = values.reshape(-1, len(fields))
+        origins      = values[:, fields.index("O")].astype(np.int64)
+        destinations = values[:, fields.index("D")].astype(np.int64)
+        trips        = demandPortion * values[:, fields.index(vehicleClassName)]
+        totTrips     = trips.sum()
+        tripsInHourlyFlows = trips * (60.0 / timeSpan.getMinutes())
+
+        # the origin and destination indices in the demand table, -1 for zones that are not centroids
+        centroidIds = np.array(demand._centroidIds, dtype=np.int64)
+        def getIndices(zoneIds):
+            if len(centroidIds) == 0: return np.zeros(len(zoneIds), dtype=np.int64) - 1
+            indices = np.minimum(np.searchsorted(centroidIds, zoneIds), len(centroidIds) - 1)
+            return np.where(centroidIds[indices] == zoneIds, indices, -1)
+        originIndices      = getIndices(origins)
+        destinationIndices = getIndices(destinations)
+
+        # the (origin index, destination index, hourly flow) of the trips to add
+        odOrigins, odDestinations, odFlows = [], [], []
+        hasTrips      = tripsInHourlyFlows != 0
+        intrazonal    = hasTrips & (origins == destinations)
+        interzonal    = hasTrips & (origins != destinations)
+
+        # intrazonal trips are split between the centroid and its closest centroid, both ways
+        for zoneId in np.unique(origins[intrazonal & (originIndices < 0)]):
+            dta.DtaLogger.error("Intrazonal zone %d does not exist" % zoneId)
+        intrazonal &= originIndices >= 0
+        if intrazonal.any():
+            zoneIds, zoneOfRecord = np.unique(origins[intrazonal], return_inverse=True)
+            closestCentroids = getClosestCentroids(net, zoneIds.tolist())
+            closestIndices = getIndices(np.array([closestCentroids[zoneId][0].getId() for zoneId in zoneIds.tolist()],
+                                                 dtype=np.int64))[zoneOfRecord]
+            tripsIntrazonal = tripsInHourlyFlows[intrazonal] / 2
+            odOrigins.extend([originIndices[intrazonal], closestIndices])
+            odDestinations.extend([closestIndices, originIndices[intrazonal]])
+            odFlows.extend([tripsIntrazonal, tripsIntrazonal])
+        numIntrazonalTrips = trips[intrazonal].sum()
+
+        for zoneId in np.unique(origins[interzonal & (originIndices < 0)]):
+            dta.DtaLogger.error("Origin zone %d does not exist" % zoneId)
+        for zoneId in np.unique(destinations[interzonal & (originIndices >= 0) & (destinationIndices < 0)]):
+            dta.DtaLogger.error("Destination zone %s does not exist" % zoneId)
+        interzonal &= (originIndices >= 0) & (destinationIndices >= 0)
+        odOrigins.append(originIndices[interzonal])
+        odDestinations.append(destinationIndices[interzonal])
+        odFlows.append(tripsInHourlyFlows[interzonal])
+
+        # every time slice gets the hourly flows
+        odOrigins, odDestinations, odFlows = [np.concatenate(arrays) for arrays in [odOrigins, odDestinations, odFlows]]
+        numPairs = len(np.unique(odOrigins * len(centroidIds) + odDestinations))
+        demand.setSparse(demand._chooseSparse(numPairs * demand.getNumSlices()) if sparse is None else sparse)
+        numSlices = demand.getNumSlices()
+        demand._addEntries(np.repeat(np.arange(numSlices), len(odFlows)), np.tile(odOrigins, numSlices),
+                           np.tile(odDestinations, numSlices), np.tile(odFlows, numSlices))
+
         dta.DtaLogger.info("Read %10.2f %-16s from %s" % (totTrips, "%s TRIPS" % vehicleClassName, fileName))
         if numIntrazonalTrips > 0:
             dta.DtaLogger.info("Reassigned %f intrazonal Trips" % numIntrazonalTrips)
         if totTrips - demand.getTotalNumTrips() > 1:
             dta.DtaLogger.error("The total number of trips in the Cube table = %d not equal to the number of trips transfered to Dynameq = %d." % (totTrips,demand.getTotalNumTrips()))
-        #dta.DtaLogger.info("There are %10.2f trips to zone 7973" % checkSum)
-                    
+
         return demand
        
     @classmethod
-    def readDynameqTable(cls, net, fileName):
+    def readDynameqTable(cls, net, fileName, sparse=None):
         """
         Read the dynameq demand stored in the *fileName* that pertains to *net*, a :py:class:`Network` instance.
         This method reads only rectangular demand tables. 
+
+        *sparse* is True or False for a sparse or dense demand table, or None to choose by density
+        (see :py:attr:`Demand.SPARSE_DENSITY`).
         """
         DYNAMEQ_FORMAT_FULL = "FORMAT:full" 
         
@@ -150,27 +208,39 @@ class Demand(object):
         if timeStep.getMinutes() == 0:
             raise DtaError("The time step defined by the first slice cannot be zero") 
         
-        demand = Demand(net, vehClassName, startTime, endTime, timeStep)
-        _npyArray = demand._demandTable.getNumpyArray()
+        demand = Demand(net, vehClassName, startTime, endTime, timeStep, sparse=True)
 
         timeStepInMin = timeStep.getMinutes()
 
+        # the non-zero cells of each slice, as (slice, origin, destination indices, values); each slice
+        # is parsed in one block of numCentroids rows of the origin followed by a value per destination
+        numCentroids = net.getNumCentroids()
+        cells = []
         for i, timePeriod in enumerate(demand.iterTimePeriods()):
             if timePeriod != demand.startTime + demand.timeStep: 
                 line = input.next().strip()
                 assert line == "SLICE"
                 line = input.next().strip()            
             destinations = map(int, input.next().strip().split())
-            for j, origin in enumerate(range(net.getNumCentroids())):
-                fields = map(float, input.next().strip().split()) 
-                #_npyArray[i,j,:] = np.array(fields[1:]) / ( 60.0 / timeStepInMin)
-                _npyArray[i,j,:] = np.array(fields[1:])
-                
+            block = np.fromstring("".join(islice(input, numCentroids)), dtype=np.float64, sep=" ")
+            if len(block) != numCentroids * (numCentroids + 1):
+                raise DtaError("The slice %s of %s is not %d rows of %d values" %
+                               (timePeriod.strftime("%H:%M"), fileName, numCentroids, numCentroids + 1))
+            block = block.reshape(numCentroids, numCentroids + 1)[:, 1:]
+            #block = block / ( 60.0 / timeStepInMin)
+            originIndices, destinationIndices = np.nonzero(block)
+            cells.append((np.repeat(i, len(originIndices)), originIndices, destinationIndices,
+                          block[originIndices, destinationIndices]))
+        input.close()
+
+        demand.setSparse(demand._chooseSparse(sum(len(slice[3]) for slice in cells)) if sparse is None else sparse)
+        if cells:
+            demand._addEntries(*[np.concatenate(arrays) for arrays in zip(*cells)])
         return demand
 
 
 
-    def __init__(self, net, vehClassName, startTime, endTime, timeStep):
+    def __init__(self, net, vehClassName, startTime, endTime, timeStep, sparse=None):
         """
         Constructor that initializes an empty Demand table that has three dimensions:
         time, origin taz, destination taz. 
@@ -184,6 +254,8 @@ class Demand(object):
         :type endTime: a :py:class:`dta.Utils.Time` instance
         :param timeStep: the granularity of time steps at which the demand is represented.
         :type timeStep: a :py:class:`dta.Utils.Time` instance
+        :param sparse: True or False for a :py:class:`SparseDemandTable` or a dense :py:class:`MultiArray`,
+           or None for a sparse table if the dense one would exceed :py:attr:`Demand.MAX_DENSE_BYTES`.
         """
         self._net = net 
 
@@ -206,7 +278,13 @@ class Demand(object):
 
         self._centroidIds   = sorted([c.getId() for c in net.iterNodes() if c.isCentroid()]) 
 
-        self._demandTable   = MultiArray("d", [self._timeLabels, self._centroidIds, self._centroidIds])
+        if sparse is None:
+            sparse = 8 * len(self._timeLabels) * len(self._centroidIds) ** 2 > Demand.MAX_DENSE_BYTES
+        if sparse:
+            self._demandTable   = SparseDemandTable([self._timeLabels, self._centroidIds, self._centroidIds])
+        else:
+            self._demandTable   = MultiArray("d", [self._timeLabels, self._centroidIds, self._centroidIds],
+                                             dimNames=Demand.DIM_NAMES)
                                              
         #TODO: what are you going to do with vehicle class names? 
         #self._vehicleClassNames = [vehClass.name for vehClass in self._net.getScenario().vehicleClassNames]
@@ -222,6 +300,59 @@ class Demand(object):
         Return the number of time slices the demand has been split
         """
         return len(self._timePeriods)
+
+    def isSparse(self):
+        """
+        Returns True if the demand is stored in a :py:class:`SparseDemandTable`, False if in a dense :py:class:`MultiArray`.
+        """
+        return isinstance(self._demandTable, SparseDemandTable)
+
+    def setSparse(self, sparse):
+        """
+        Converts the demand to a :py:class:`SparseDemandTable` if *sparse* is True, or to a
+        dense :py:class:`MultiArray` if False, keeping the values.
+        """
+        if sparse == self.isSparse(): return
+        entries = self._getEntries()
+        dimElements = [self._timeLabels, self._centroidIds, self._centroidIds]
+        self._demandTable = SparseDemandTable(dimElements) if sparse else \
+                            MultiArray("d", dimElements, dimNames=Demand.DIM_NAMES)
+        self._addEntries(*entries)
+
+    def _chooseSparse(self, numNonzero):
+        """
+        Returns True if a table with *numNonzero* non-zero cells should be sparse, according to
+        :py:attr:`Demand.SPARSE_DENSITY` and :py:attr:`Demand.SPARSE_MIN_BYTES`.
+        """
+        numCells = len(self._timeLabels) * len(self._centroidIds) ** 2
+        return 8 * numCells >= Demand.SPARSE_MIN_BYTES and numNonzero < Demand.SPARSE_DENSITY * numCells
+
+    def getNumBytes(self):
+        """
+        Returns the number of bytes of the demand table.
+        """
+        if self.isSparse():
+            return self._demandTable.getNumBytes()
+        return self._demandTable.getNumpyArray().nbytes
+
+    def _getEntries(self):
+        """
+        Returns (slice indices, origin indices, destination indices, values) arrays of the non-zero cells.
+        """
+        if self.isSparse():
+            return self._demandTable.getEntries()
+        _npyArray = self._demandTable.getNumpyArray()
+        indices = np.nonzero(_npyArray)
+        return indices + (_npyArray[indices],)
+
+    def _addEntries(self, timeIndices, originIndices, destinationIndices, values):
+        """
+        Adds *values* to the cells at the given index arrays, summing the values for the same cell.
+        """
+        if self.isSparse():
+            self._demandTable.addEntries(timeIndices, originIndices, destinationIndices, values)
+        else:
+            np.add.at(self._demandTable.getNumpyArray(), (timeIndices, originIndices, destinationIndices), values)
         
     def _getTimePeriods(self, startTime, endTime, timeStep):
         """
@@ -308,18 +439,60 @@ class Demand(object):
         if format != 'full':
             raise DtaError("Unimplemented Matrix Format specified: %s" % (format))
             
+        Demand._writeDynameqSlices(outputStream, self._demandTable, self._timePeriods, self._centroidIds)
+
+    @classmethod
+    def _writeDynameqSlices(cls, outputStream, demandTable, timePeriods, centroidIds):
+        """
+        Writes the slices of *demandTable* (a :py:class:`MultiArray` or a :py:class:`SparseDemandTable`) in
+        Dynameq full format.  The rows are formatted :py:attr:`Demand.WRITE_BLOCK_ROWS` at a time, with one
+        string formatting operation per block.
+        """
         SLICE_SECTION    = 'SLICE'
-       
-        timeStepInMin = self.timeStep.getMinutes()
 
-        _npyArray = self._demandTable.getNumpyArray()
-        
-        for i, timePeriod in enumerate(self._timePeriods):
+        numCentroids = len(centroidIds)
+        ids          = np.array(centroidIds, dtype=np.float64)
+        for i, timePeriod in enumerate(timePeriods):
             outputStream.write("SLICE\n%s\n" % timePeriod.strftime("%H:%M"))
-            outputStream.write("\t%s\n" % '\t'.join(map(str, self._centroidIds)))
+            outputStream.write("\t%s\n" % '\t'.join(map(str, centroidIds)))
+
+            for first in xrange(0, numCentroids, Demand.WRITE_BLOCK_ROWS):
+                last  = min(first + Demand.WRITE_BLOCK_ROWS, numCentroids)
+                if isinstance(demandTable, SparseDemandTable):
+                    block = demandTable.getBlock(i, first, last)
+                else:
+                    block = demandTable.getNumpyArray()[i, first:last, :]
+                rowFormat = "%d" + "\t%.2f" * numCentroids + "\n"
+                outputStream.write((rowFormat * (last - first)) % tuple(np.column_stack([ids[first:last], block]).ravel()))
 
-            for j, cent in enumerate(self._centroidIds):
-                outputStream.write("%d\t%s\n" % (cent, "\t".join("%.2f" % elem for elem in _npyArray[i, j, :])))                
+    @classmethod
+    def writeDynameqTables(cls, demandsAndFileNames, numProcesses=1):
+        """
+        Writes each demand of *demandsAndFileNames*, a list of (:py:class:`Demand`, file name), e.g. one per vehicle
+        class or time period, to its file in Dynameq full format, with the header of
+        :py:meth:`Demand.writeDynameqDemandHeader`.
+
+        If *numProcesses* is more than one (None for one per CPU), the files are written in parallel
+        by a :py:class:`multiprocessing.Pool`.
+        """
+        import multiprocessing
+
+        tasks = [(fileName, demand.startTime, demand.endTime, demand.vehClassName, demand._timePeriods,
+                  demand._centroidIds, demand._demandTable) for demand, fileName in demandsAndFileNames]
+        if numProcesses is None:
+            numProcesses = multiprocessing.cpu_count()
+        numProcesses = max(1, min(numProcesses, len(tasks)))
+
+        if numProcesses == 1:
+            map(_writeDynameqFile, tasks)
+        else:
+            pool = multiprocessing.Pool(numProcesses)
+            try:
+                pool.map(_writeDynameqFile, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        dta.DtaLogger.info("Wrote %d demand tables with %d processes" % (len(tasks), numProcesses))
                 
 
 
@@ -340,6 +513,11 @@ class Demand(object):
         if self.vehClassName != other.vehClassName:
             return False
 
+        if self.isSparse() != other.isSparse():
+            dense, otherDense = [demand._demandTable.toDense() if demand.isSparse() else
+                                 demand._demandTable.getNumpyArray() for demand in [self, other]]
+            return np.array_equal(dense, otherDense)
+
         if not self._demandTable == other._demandTable:
             return False 
 
@@ -366,36 +544,57 @@ class Demand(object):
         newTimeStepInMin = self.timeStep.getMinutes() / len(factorsInAList)
         newTimeStep = Time.fromMinutes(newTimeStepInMin)
         
-        newDemand = Demand(self._net, self.vehClassName, self.startTime, self.endTime, newTimeStep)
+        newDemand = Demand(self._net, self.vehClassName, self.startTime, self.endTime, newTimeStep,
+                           sparse=self.isSparse())
         #timeSpan = (newDemand.endTime - newDemand.startTime).getMinutes()/60.0
-        oldDemand = 0
-        sliceDemand = []
-        for k, timeSlice in enumerate(newDemand._timePeriods):
-            sliceDemand.append(0)
-        for origin in self._centroidIds:
-            for destination in self._centroidIds:
-                tripsOD_Old = self.getValue(self.endTime, origin, destination)*len(factorsInAList)
-                for k, timeSlice in enumerate(newDemand._timePeriods):
-                    tripsOD = factorsInAList[k]*tripsOD_Old
-                    newDemand.setValue(timeSlice, origin, destination, tripsOD)
+        # the cells of the one slice, scaled by each factor into the new slices
+        timeIndices, originIndices, destinationIndices, values = self._getEntries()
+        tripsOD_Old = values * len(factorsInAList)
+        numSlices = len(factorsInAList)
+        newDemand._addEntries(np.repeat(np.arange(numSlices), len(values)), np.tile(originIndices, numSlices),
+                              np.tile(destinationIndices, numSlices),
+                              (np.array(factorsInAList)[:, np.newaxis] * tripsOD_Old).ravel())
                                
         return newDemand                            
 
     def removeInvalidODPairs(self):
         """
         Examine all the OD interchanges and remove those for which 
-        a path does not exist from origin to destination
+        a path does not exist from origin to destination.
+        The centroid to centroid reachability comes from
+        :py:meth:`GraphSnapshot.getCentroidReachability`, and the
+        invalid interchanges are zeroed for all time slices at once.
         """
-        
-        for originId in self._centroidIds:
-            for destinationId in self._centroidIds:
-                for timeLabel in self._timeLabels:
-                    if self.getValue(timeLabel, originId, destinationId) > 0:
-                        origin = self._net.getNodeForId(originId)
-                        destination = self._net.getNodeForId(destinationId)
-                        if not hasPath(self._net, origin, destination):
-                            self.setValue(timeLabel, originId, destinationId, 0) 
+        snapshot = self._net.toGraphSnapshot()
+        centroidIndices, reachable = snapshot.getCentroidReachability()
+        positionOfId = dict((snapshot.getNodeId(nodeIndex), position)
+                            for position, nodeIndex in enumerate(centroidIndices))
+        try:
+            positions = [positionOfId[centroidId] for centroidId in self._centroidIds]
+        except KeyError, e:
+            raise DtaError("Demand centroid %s is not in the network" % str(e))
+        invalid = ~reachable[np.ix_(positions, positions)]
+
+        if self.isSparse():
+            numRemoved = self._demandTable.zeroPairs(invalid)
+        else:
+            demand = self._demandTable.getNumpyArray()
+            numRemoved = np.count_nonzero((demand > 0) & invalid)
+            demand[:, invalid] = 0
+        if numRemoved:
+            dta.DtaLogger.info("Removed the demand of %d OD interchanges and time slices without a path" % numRemoved)
                         
+    def getMultiArray(self):
+        """
+        Returns the demand table as a :py:class:`MultiArray` with the dimensions :py:attr:`Demand.DIM_NAMES`,
+        e.g. for ``demand.getMultiArray().groupBy("time", timeToPeriod)``.  The dense table is returned
+        itself, a sparse one as a dense copy.
+        """
+        if self.isSparse():
+            return MultiArray("d", [self._timeLabels, self._centroidIds, self._centroidIds],
+                              numpyArray=self._demandTable.toDense(), dimNames=Demand.DIM_NAMES)
+        return self._demandTable
+
     def getTotalNumTrips(self):
         """
         Return the total number of trips for all time periods
@@ -19,8 +19,15 @@ import shapefile
 import pdb
 import math
 from itertools import izip, imap
+import gc
+import hashlib
 import os
+import shutil
 import sys, csv
+import tempfile
+import time
+
+import numpy as np
 
 from itertools import chain 
 from .Centroid import Centroid
@@ -30,6 +37,7 @@ from .Logger import DtaLogger
 from .Movement import Movement
 from .Network import Network
 from .Node import Node
+from .ObsCountStore import ObsCountStore
 from .RoadLink import RoadLink
 from .RoadNode import RoadNode
 from .TimePlan import TimePlan
@@ -83,6 +91,68 @@ class DynameqNetwork(Network):
 * CREATED by DTA Anyway http://code.google.com/p/dta/
 """
 
+    #: the sections of the base file, in the order they appear
+    BASE_SECTIONS       = ["NODES", "CENTROIDS", "LINKS", "LANE_PERMS", "LINK_EVENTS", "LANE_EVENTS",
+                           "VIRTUAL_LINKS", "MOVEMENTS", "MOVEMENT_EVENTS"]
+    #: the sections of the advanced file, in the order they appear
+    ADVANCED_SECTIONS   = ["SHIFTS", "VERTICES"]
+
+    #: Directory of the binary network cache written next to the Dynameq files, see :py:meth:`DynameqNetwork.read`
+    CACHE_DIR           = '%s_netcache'
+    #: Version of the network cache format; caches written with another version are ignored and rewritten
+    CACHE_VERSION       = 1
+    #: Default for the *useCache* argument of :py:meth:`DynameqNetwork.read`
+    USE_CACHE           = True
+    #: The arrays of the network cache, and their dtypes
+    CACHE_ARRAYS        = [("nodeIds",                  np.int64),
+                           ("nodeKinds",                np.int8),
+                           ("nodeX",                    np.float64),
+                           ("nodeY",                    np.float64),
+                           ("nodeGeometryTypes",        np.int32),
+                           ("nodeControls",             np.int32),
+                           ("nodePriorities",           np.int32),
+                           ("nodeLevels",               np.int32),
+                           ("nodeLabels",               np.str_),
+                           ("nodeOutLinkOffsets",       np.int64),
+                           ("nodeOutLinks",             np.int32),
+                           ("nodeInLinkOffsets",        np.int64),
+                           ("nodeInLinks",              np.int32),
+                           ("linkIds",                  np.int64),
+                           ("linkKinds",                np.int8),
+                           ("linkStartNodes",           np.int32),
+                           ("linkEndNodes",             np.int32),
+                           ("linkReverseIds",           np.int64),
+                           ("linkFacilityTypes",        np.int32),
+                           ("linkLengths",              np.float64),
+                           ("linkFreeflowSpeeds",       np.float64),
+                           ("linkEffectiveLengthFactors", np.float64),
+                           ("linkResponseTimeFactors",  np.float64),
+                           ("linkNumLanes",             np.int32),
+                           ("linkRoundAbouts",          np.int32),
+                           ("linkLevels",               np.int32),
+                           ("linkGroups",               np.int64),
+                           ("linkLabels",               np.str_),
+                           ("linkStartShifts",          np.float64),
+                           ("linkEndShifts",            np.float64),
+                           ("linkShapeOffsets",         np.int64),
+                           ("shapeX",                   np.float64),
+                           ("shapeY",                   np.float64),
+                           ("linkInMovementOffsets",    np.int64),
+                           ("linkInMovements",          np.int32),
+                           ("lanePermLinks",            np.int32),
+                           ("lanePermLanes",            np.int32),
+                           ("lanePermGroups",           np.int32),
+                           ("groupNames",               np.str_),
+                           ("movementNodes",            np.int32),
+                           ("movementIncomingLinks",    np.int32),
+                           ("movementOutgoingLinks",    np.int32),
+                           ("movementFreeflowSpeeds",   np.float64),
+                           ("movementGroups",           np.int32),
+                           ("movementNumLanes",         np.int32),
+                           ("movementIncomingLanes",    np.int32),
+                           ("movementOutgoingLanes",    np.int32),
+                           ("movementFollowupTimes",    np.float64)]
+
     MOVEMENT_FLOW_OUT   = 'movement_aflowo.dqt'
     MOVEMENT_FLOW_IN    = 'movement_aflowi.dqt'
     MOVEMENT_TIME_OUT   = 'movement_atime.dqt'
@@ -101,90 +171,40 @@ class DynameqNetwork(Network):
         Network.__init__(self, scenario)
         self._dir = None 
                 
-    def read(self, dir, file_prefix):
+    def read(self, dir, file_prefix, useCache=None):
         """
         Reads the network in the given *dir* with the given *file_prefix*.
 
+        If *useCache* is True (it defaults to :py:attr:`DynameqNetwork.USE_CACHE`), the contents of the
+        base and advanced files (nodes, links, shape points, shifts, lane permissions and movements) are
+        loaded from the binary cache in :py:attr:`DynameqNetwork.CACHE_DIR` when it was written for
+        the current versions of those files, which is much faster than parsing them.  Otherwise
+        they are parsed and the cache is (re)written, if the directory is writable.
+        
+        The control and custom priorities files are always read from the text.
+        The *scenario* passed to the constructor must define the vehicle class groups used by
+        the network whether it's read from the text or from the cache.
         """
+        if useCache is None:
+            useCache = DynameqNetwork.USE_CACHE
+            
         # base file processing
         basefile = os.path.join(dir, DynameqNetwork.BASE_FILE % file_prefix)
         if not os.path.exists(basefile):
             raise DtaError("Base network file %s does not exist" % basefile)
         
         self._dir = dir 
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "NODES", "CENTROIDS"):
-            self.addNode(self._parseNodeFromFields(fields))
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "NODES", basefile))
-
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "CENTROIDS", "LINKS"):
-            self.addNode(self._parseCentroidFromFields(fields))
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "CENTROIDS", basefile))
-        
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "LINKS", "LANE_PERMS"):
-            self.addLink(self._parseLinkFromFields(fields))
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "LINKS", basefile))
-        
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "LANE_PERMS", "LINK_EVENTS"):
-            self._addLanePermissionFromFields(fields)
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "LANE_PERMS", basefile))
-        
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "LINK_EVENTS", "LANE_EVENTS"):
-            #TODO: do LINK_EVENTS have to correspond to scenario events?
-            raise DtaError("LINK_EVENTS not implemented yet")
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "LINK_EVENTS", basefile))
-
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "LANE_EVENTS", "VIRTUAL_LINKS"):
-            #TODO: do LANE_EVENTS have to correspond to scenario events?
-            #raise DtaError("LANE_EVENTS not implemented yet")
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "LANE_EVENTS", basefile))
-            
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "VIRTUAL_LINKS", "MOVEMENTS"):
-            self.addLink(self._parseVirtualLinkFromFields(fields))
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "VIRTUAL_LINKS", basefile))
-            
-        count = 0                        
-        for fields in self._readSectionFromFile(basefile, "MOVEMENTS", "MOVEMENT_EVENTS"):
-            mov = self._parseMovementFromFields(fields)
-            self.addMovement(self._parseMovementFromFields(fields))
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "MOVEMENTS", basefile))
-        
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "MOVEMENT_EVENTS", "ENDOFFILE"):
-            #TODO: MOVEMENT_EVENTS
-            #raise DtaError("MOVEMENT_EVENTS not implemented yet")            
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "MOVEMENT_EVENTS", basefile))
-        
-        # advanced file processing
         advancedfile = os.path.join(dir, DynameqNetwork.ADVANCED_FILE % file_prefix)
-        if os.path.exists(advancedfile):
+        
+        if not (useCache and self._readCache(dir, file_prefix)):
+            self._readSections(basefile, DynameqNetwork.BASE_SECTIONS, *self._getBaseSectionHandlers())
             
-            count = 0
-            for fields in self._readSectionFromFile(advancedfile, "SHIFTS", "VERTICES"):
-                self._addShiftFromFields(fields)
-                count += 1
-            DtaLogger.info("Read  %8d %-16s from %s" % (count, "SHIFTS", advancedfile))
+            # advanced file processing
+            if os.path.exists(advancedfile):
+                self._readSections(advancedfile, DynameqNetwork.ADVANCED_SECTIONS, *self._getAdvancedSectionHandlers())
             
-            count = 0
-            for fields in self._readSectionFromFile(advancedfile, "VERTICES", "ENDOFFILE"):
-                self._addShapePointsToLink(fields)
-                count += 1
-            DtaLogger.info("Read  %8d %-16s from %s" % (count, "VERTICES", advancedfile))
+            if useCache:
+                self._writeCache(dir, file_prefix)
 
         # control file Processing
         controlfile = os.path.join(dir, DynameqNetwork.CONTROL_FILE % file_prefix)
@@ -254,6 +274,460 @@ class DynameqNetwork(Network):
         self._writeTollFile(toll_object)
         toll_object.close() 
 
+    def _getCacheSourceFiles(self, dir, file_prefix):
+        """
+        Returns the list of (name, filename) of the Dynameq files whose contents are in the network cache.
+        """
+        return [("BASE",     os.path.join(dir, DynameqNetwork.BASE_FILE % file_prefix)),
+                ("ADVANCED", os.path.join(dir, DynameqNetwork.ADVANCED_FILE % file_prefix))]
+    
+    @staticmethod
+    def _getFileMD5(filename):
+        """
+        Returns the hex md5 digest of the contents of the given file.
+        """
+        md5 = hashlib.md5()
+        infile = open(filename, "rb")
+        for block in iter(lambda: infile.read(1 << 20), ""):
+            md5.update(block)
+        infile.close()
+        return md5.hexdigest()
+
+    def _readCacheHeader(self, cacheDir):
+        """
+        Returns the contents of the header of the network cache in *cacheDir* as a dictionary:
+        ``version`` -> int, and source file name -> None (if it didn't exist) or (size, mtime, md5).
+        Returns None if there's no readable header.
+        """
+        headerfile = os.path.join(cacheDir, "header.txt")
+        if not os.path.exists(headerfile): return None
+        
+        header = {}
+        try:
+            for line in open(headerfile, "r"):
+                fields = line.split()
+                if len(fields) == 0: continue
+                if fields[0] == "version":
+                    header["version"] = int(fields[1])
+                elif fields[0] == "file" and fields[2] == "missing":
+                    header[fields[1]] = None
+                elif fields[0] == "file":
+                    header[fields[1]] = (int(fields[2]), float(fields[3]), fields[4])
+        except (IOError, ValueError, IndexError):
+            return None
+        return header
+    
+    def _isCacheCurrent(self, dir, file_prefix, header):
+        """
+        Returns True if the network cache described by *header* (see :py:meth:`DynameqNetwork._readCacheHeader`)
+        was written for the current versions of the Dynameq files.
+        
+        A file is current if its size and modification time are unchanged or, failing that, if the md5
+        of its contents is unchanged (e.g. it was copied or checked out again).
+        """
+        if header is None or header.get("version") != DynameqNetwork.CACHE_VERSION: return False
+        
+        for name, filename in self._getCacheSourceFiles(dir, file_prefix):
+            if name not in header: return False
+            if not os.path.exists(filename):
+                if header[name] is not None: return False
+                continue
+            if header[name] is None: return False
+            
+            size, mtime, md5 = header[name]
+            if os.path.getsize(filename) != size: return False
+            if os.path.getmtime(filename) == mtime: continue
+            if DynameqNetwork._getFileMD5(filename) != md5: return False
+        return True
+    
+    def _readCache(self, dir, file_prefix):
+        """
+        Loads the nodes, links, shape points, shifts, lane permissions and movements from the network cache
+        in *dir* written by :py:meth:`DynameqNetwork._writeCache` for the Dynameq files with *file_prefix*,
+        if it is current (see :py:meth:`DynameqNetwork._isCacheCurrent`).  The arrays are memory mapped.
+        
+        Returns True if the network was loaded, False if there is no current cache.
+        """
+        cacheDir = os.path.join(dir, DynameqNetwork.CACHE_DIR % file_prefix)
+        if not self._isCacheCurrent(dir, file_prefix, self._readCacheHeader(cacheDir)):
+            return False
+        
+        startTime = time.time()
+        arrays = {}
+        try:
+            for arrayName, dtype in DynameqNetwork.CACHE_ARRAYS:
+                arrays[arrayName] = np.load(os.path.join(cacheDir, arrayName + ".npy"), mmap_mode='r')
+        except (IOError, ValueError):
+            DtaLogger.warn("DynameqNetwork failed to load the network cache %s: %s" % (cacheDir, str(sys.exc_info()[1])))
+            return False
+        
+        # lists are much faster to iterate than (memory mapped) arrays
+        columns = dict((arrayName, array.tolist()) for arrayName, array in arrays.iteritems())
+        groups  = [self._scenario.getVehicleClassGroup(groupName) for groupName in columns["groupNames"]]
+        
+        # the cyclic garbage collector would otherwise rescan the growing network over and over
+        gcEnabled = gc.isenabled()
+        gc.disable()
+        try:
+            nodes, links, movements = self._buildFromCacheColumns(columns, groups)
+        finally:
+            if gcEnabled: gc.enable()
+        
+        if nodes: self._maxNodeId = max(self._maxNodeId, max(columns["nodeIds"]))
+        if links: self._maxLinkId = max(self._maxLinkId, max(columns["linkIds"]))
+        self._topologyVersion += 1
+        
+        DtaLogger.info("Read  %8d %-16s from %s" % (len(nodes), "NODES", cacheDir))
+        DtaLogger.info("Read  %8d %-16s from %s" % (len(links), "LINKS", cacheDir))
+        DtaLogger.info("Read  %8d %-16s from %s in %.2f seconds" % (len(movements), "MOVEMENTS", cacheDir,
+                                                                    time.time() - startTime))
+        return True
+    
+    def _buildFromCacheColumns(self, columns, groups):
+        """
+        Creates and stores the nodes, links and movements from the network cache *columns*
+        (array name -> list), with the vehicle class group *groups* by group index.  The network must be empty.
+        
+        Returns (list of nodes, list of links, list of movements) by cache index.
+        """
+        nodes = []
+        for (nodeId, kind, x, y, geometryType, control, priority, level, label) in \
+            izip(columns["nodeIds"], columns["nodeKinds"], columns["nodeX"], columns["nodeY"],
+                 columns["nodeGeometryTypes"], columns["nodeControls"], columns["nodePriorities"],
+                 columns["nodeLevels"], columns["nodeLabels"]):
+            if kind == 0:
+                node = RoadNode(nodeId, x, y, geometryType, control, priority, label, level)
+            elif kind == 1:
+                node = Centroid(nodeId, x, y, label=label, level=level)
+            else:
+                node = VirtualNode(nodeId, x, y, label, level)
+            self._nodes[nodeId] = node
+            self._getNodeRegistry(node)[nodeId] = node
+            nodes.append(node)
+        
+        links = []
+        for (linkId, kind, startNode, endNode, reverseId, facilityType, length, freeflowSpeed,
+             lengthFactor, responseFactor, numLanes, roundAbout, level, group, label) in \
+            izip(columns["linkIds"], columns["linkKinds"], columns["linkStartNodes"], columns["linkEndNodes"],
+                 columns["linkReverseIds"], columns["linkFacilityTypes"], columns["linkLengths"],
+                 columns["linkFreeflowSpeeds"], columns["linkEffectiveLengthFactors"],
+                 columns["linkResponseTimeFactors"], columns["linkNumLanes"], columns["linkRoundAbouts"],
+                 columns["linkLevels"], columns["linkGroups"], columns["linkLabels"]):
+            startNode   = nodes[startNode]
+            endNode     = nodes[endNode]
+            if kind == 0:
+                link = RoadLink(linkId, startNode, endNode, reverseAttachedLinkId=reverseId,
+                                facilityType=facilityType, length=length, freeflowSpeed=freeflowSpeed,
+                                effectiveLengthFactor=lengthFactor, responseTimeFactor=responseFactor,
+                                numLanes=numLanes, roundAbout=roundAbout, level=level, label=label, group=group)
+            elif kind == 1:
+                link = Connector(linkId, startNode, endNode, reverseAttachedLinkId=reverseId,
+                                 length=length, freeflowSpeed=freeflowSpeed,
+                                 effectiveLengthFactor=lengthFactor, responseTimeFactor=responseFactor,
+                                 numLanes=numLanes, roundAbout=roundAbout, level=level, label=label, group=group)
+            else:
+                link = VirtualLink(linkId, startNode, endNode, label)
+            self._linksById[linkId] = link
+            self._linksByNodeIdPair[(startNode.getId(), endNode.getId())] = link
+            self._getLinkRegistry(link)[linkId] = link
+            links.append(link)
+        
+        # the links in the order the nodes had them
+        for offsetName, indexName, attrName in [("nodeOutLinkOffsets", "nodeOutLinks", "_outgoingLinks"),
+                                                ("nodeInLinkOffsets",  "nodeInLinks",  "_incomingLinks")]:
+            offsets = columns[offsetName]
+            indices = columns[indexName]
+            for nodeIndex, node in enumerate(nodes):
+                setattr(node, attrName, [links[linkIndex] for linkIndex in indices[offsets[nodeIndex]:offsets[nodeIndex+1]]])
+        
+        offsets = columns["linkShapeOffsets"]
+        shapePoints = zip(columns["shapeX"], columns["shapeY"])
+        for linkIndex, link in enumerate(links):
+            if offsets[linkIndex] < offsets[linkIndex+1]:
+                link._shapePoints = shapePoints[offsets[linkIndex]:offsets[linkIndex+1]]
+            if columns["linkStartShifts"][linkIndex] == columns["linkStartShifts"][linkIndex]:
+                link.addShifts(int(columns["linkStartShifts"][linkIndex]), int(columns["linkEndShifts"][linkIndex]))
+        
+        for linkIndex, laneId, groupIndex in izip(columns["lanePermLinks"], columns["lanePermLanes"], columns["lanePermGroups"]):
+            links[linkIndex].addLanePermission(laneId, groups[groupIndex])
+        
+        # movements are stored in the order of their incoming links' outgoing movements
+        movements = []
+        for (nodeIndex, incomingIndex, outgoingIndex, freeflowSpeed, groupIndex, numLanes, incomingLane,
+             outgoingLane, followupTime) in \
+            izip(columns["movementNodes"], columns["movementIncomingLinks"], columns["movementOutgoingLinks"],
+                 columns["movementFreeflowSpeeds"], columns["movementGroups"], columns["movementNumLanes"],
+                 columns["movementIncomingLanes"], columns["movementOutgoingLanes"], columns["movementFollowupTimes"]):
+            # use an int version if possible, as the text reader does
+            if followupTime == followupTime and followupTime == int(followupTime):
+                followupTime = int(followupTime)
+            movement = Movement(nodes[nodeIndex], links[incomingIndex], links[outgoingIndex],
+                                None if freeflowSpeed != freeflowSpeed else freeflowSpeed,
+                                groups[groupIndex],
+                                None if numLanes == -1 else numLanes,
+                                None if incomingLane == -1 else incomingLane,
+                                None if outgoingLane == -1 else outgoingLane,
+                                followupTime)
+            links[incomingIndex]._outgoingMovements.append(movement)
+            movements.append(movement)
+        
+        offsets = columns["linkInMovementOffsets"]
+        indices = columns["linkInMovements"]
+        for linkIndex, link in enumerate(links):
+            if offsets[linkIndex] < offsets[linkIndex+1]:
+                link._incomingMovements = [movements[movementIndex] for movementIndex in indices[offsets[linkIndex]:offsets[linkIndex+1]]]
+        
+        return nodes, links, movements
+    
+    def _writeCache(self, dir, file_prefix):
+        """
+        Writes the nodes, links, shape points, shifts, lane permissions and movements of this network,
+        just read from the Dynameq files in *dir* with *file_prefix*, to the network cache in *dir*
+        as one ``.npy`` file per array in :py:attr:`DynameqNetwork.CACHE_ARRAYS`, plus a header
+        with the format version and the size, modification time and md5 of the Dynameq files.
+        
+        The cache is written to a temporary directory and then moved into place, so readers never
+        see a partial cache.  Failures are logged and otherwise ignored.
+        """
+        cacheDir = os.path.join(dir, DynameqNetwork.CACHE_DIR % file_prefix)
+        
+        nodes       = [self._nodes[nodeId] for nodeId in sorted(self._nodes.keys())]
+        nodeIndex   = dict((node.getId(), index) for index, node in enumerate(nodes))
+        links       = [self._linksById[linkId] for linkId in sorted(self._linksById.keys())]
+        linkIndex   = dict((link.getId(), index) for index, link in enumerate(links))
+        columns     = dict((arrayName, []) for arrayName, dtype in DynameqNetwork.CACHE_ARRAYS)
+        
+        for node in nodes:
+            columns["nodeIds"].append(node.getId())
+            columns["nodeKinds"].append(0 if isinstance(node, RoadNode) else (1 if isinstance(node, Centroid) else 2))
+            columns["nodeX"].append(node.getX())
+            columns["nodeY"].append(node.getY())
+            columns["nodeGeometryTypes"].append(node._geometryType)
+            columns["nodeControls"].append(node._control if isinstance(node, RoadNode) else 0)
+            columns["nodePriorities"].append(node._priority if isinstance(node, RoadNode) else 0)
+            columns["nodeLevels"].append(node._level)
+            columns["nodeLabels"].append(node._label)
+        
+        for offsetName, indexName, attrName in [("nodeOutLinkOffsets", "nodeOutLinks", "_outgoingLinks"),
+                                                ("nodeInLinkOffsets",  "nodeInLinks",  "_incomingLinks")]:
+            columns[offsetName].append(0)
+            for node in nodes:
+                columns[indexName].extend(linkIndex[link.getId()] for link in getattr(node, attrName))
+                columns[offsetName].append(len(columns[indexName]))
+        
+        groupIndex  = {}
+        def getGroupIndex(vehicleClassGroup):
+            if vehicleClassGroup.name not in groupIndex:
+                groupIndex[vehicleClassGroup.name] = len(columns["groupNames"])
+                columns["groupNames"].append(vehicleClassGroup.name)
+            return groupIndex[vehicleClassGroup.name]
+        
+        movements   = []
+        columns["linkShapeOffsets"].append(0)
+        for index, link in enumerate(links):
+            # connectors are road links too; virtual links have no attributes beyond the label
+            hasAttributes = isinstance(link, RoadLink)
+            columns["linkIds"].append(link.getId())
+            columns["linkKinds"].append(2 if not hasAttributes else (1 if isinstance(link, Connector) else 0))
+            columns["linkStartNodes"].append(nodeIndex[link.getStartNode().getId()])
+            columns["linkEndNodes"].append(nodeIndex[link.getEndNode().getId()])
+            columns["linkReverseIds"].append(link._reverseAttachedLinkId if hasAttributes and link._reverseAttachedLinkId is not None else -1)
+            columns["linkFacilityTypes"].append(link._facilityType if hasAttributes else 0)
+            columns["linkLengths"].append(link._length if hasAttributes else 0.0)
+            columns["linkFreeflowSpeeds"].append(link._freeflowSpeed if hasAttributes else 0.0)
+            columns["linkEffectiveLengthFactors"].append(link._effectiveLengthFactor if hasAttributes else 0.0)
+            columns["linkResponseTimeFactors"].append(link._responseTimeFactor if hasAttributes else 0.0)
+            columns["linkNumLanes"].append(link._numLanes if hasAttributes else 0)
+            columns["linkRoundAbouts"].append(link._roundAbout if hasAttributes else 0)
+            columns["linkLevels"].append(link._level if hasAttributes else 0)
+            columns["linkGroups"].append(link._group if hasAttributes else -1)
+            columns["linkLabels"].append(link._label)
+            
+            startShift, endShift = link.getShifts() if hasAttributes else (None, None)
+            columns["linkStartShifts"].append(np.nan if startShift is None or endShift is None else startShift)
+            columns["linkEndShifts"].append(np.nan if startShift is None or endShift is None else endShift)
+            
+            if hasAttributes:
+                for x, y in link._shapePoints:
+                    columns["shapeX"].append(x)
+                    columns["shapeY"].append(y)
+                for laneId in sorted(link._lanePermissions.keys()):
+                    columns["lanePermLinks"].append(index)
+                    columns["lanePermLanes"].append(laneId)
+                    columns["lanePermGroups"].append(getGroupIndex(link._lanePermissions[laneId]))
+                movements.extend(link._outgoingMovements)
+            columns["linkShapeOffsets"].append(len(columns["shapeX"]))
+        
+        movementIndex = {}
+        for index, movement in enumerate(movements):
+            movementIndex[id(movement)] = index
+            columns["movementNodes"].append(nodeIndex[movement._node.getId()])
+            columns["movementIncomingLinks"].append(linkIndex[movement._incomingLink.getId()])
+            columns["movementOutgoingLinks"].append(linkIndex[movement._outgoingLink.getId()])
+            columns["movementFreeflowSpeeds"].append(np.nan if movement._freeflowSpeed is None else movement._freeflowSpeed)
+            columns["movementGroups"].append(getGroupIndex(movement._permission))
+            columns["movementNumLanes"].append(-1 if movement._numLanes is None else movement._numLanes)
+            columns["movementIncomingLanes"].append(-1 if movement._incomingLane is None else movement._incomingLane)
+            columns["movementOutgoingLanes"].append(-1 if movement._outgoingLane is None else movement._outgoingLane)
+            columns["movementFollowupTimes"].append(movement._followupTime)
+        
+        columns["linkInMovementOffsets"].append(0)
+        for link in links:
+            if isinstance(link, RoadLink):
+                columns["linkInMovements"].extend(movementIndex[id(movement)] for movement in link._incomingMovements)
+            columns["linkInMovementOffsets"].append(len(columns["linkInMovements"]))
+        
+        tempDir = None
+        try:
+            tempDir = tempfile.mkdtemp(prefix=(DynameqNetwork.CACHE_DIR % file_prefix) + ".", dir=dir)
+            for arrayName, dtype in DynameqNetwork.CACHE_ARRAYS:
+                if dtype == np.str_:
+                    # at least one character wide, so empty lists save too
+                    array = np.array(columns[arrayName] + [" "], dtype=np.str_)[:-1]
+                else:
+                    array = np.array(columns[arrayName], dtype=dtype)
+                np.save(os.path.join(tempDir, arrayName + ".npy"), array)
+            
+            header = open(os.path.join(tempDir, "header.txt"), "w")
+            header.write("version %d\n" % DynameqNetwork.CACHE_VERSION)
+            for name, filename in self._getCacheSourceFiles(dir, file_prefix):
+                if os.path.exists(filename):
+                    header.write("file %s %d %r %s\n" % (name, os.path.getsize(filename), os.path.getmtime(filename),
+                                                         DynameqNetwork._getFileMD5(filename)))
+                else:
+                    header.write("file %s missing\n" % name)
+            header.close()
+            
+            if os.path.exists(cacheDir):
+                shutil.rmtree(cacheDir)
+            os.rename(tempDir, cacheDir)
+            tempDir = None
+            DtaLogger.info("Wrote network cache %s" % cacheDir)
+        except (IOError, OSError, ValueError):
+            DtaLogger.warn("DynameqNetwork failed to write the network cache %s: %s" % (cacheDir, str(sys.exc_info()[1])))
+        finally:
+            if tempDir is not None:
+                shutil.rmtree(tempDir, ignore_errors=True)
+
+    def _getBaseSectionHandlers(self):
+        """
+        Returns a dictionary of base file section name -> function processing the fields of one line of it,
+        and a dictionary of section name -> function called at the end of the section.
+        
+        The nodes, links and movements are parsed as their lines are read and stored all at once
+        at the end of their section (with :py:meth:`Network.addNodes`, :py:meth:`Network.addLinks`
+        and :py:meth:`Network.addMovements`), so the id checks and the link ordering at each node
+        are done once per section rather than once per line.
+        """
+        def addLinkEvent(fields):
+            #TODO: do LINK_EVENTS have to correspond to scenario events?
+            raise DtaError("LINK_EVENTS not implemented yet")
+
+        def ignoreFields(fields):
+            #TODO: do LANE_EVENTS have to correspond to scenario events?
+            #TODO: MOVEMENT_EVENTS
+            pass
+
+        # the virtual links don't have ids, so number them past the ones pending
+        def parseVirtualLink(fields):
+            return self._parseVirtualLinkFromFields(fields, self._maxLinkId + 1 + len(pending["VIRTUAL_LINKS"]))
+
+        # the objects of each section are stored in bulk at the end of it, see _readSections()
+        pending = {"NODES":[], "CENTROIDS":[], "LINKS":[], "VIRTUAL_LINKS":[], "MOVEMENTS":[]}
+        def collect(sectionName, parse):
+            return lambda fields: pending[sectionName].append(parse(fields))
+        
+        def store(sectionName, add):
+            def storePending():
+                add(pending[sectionName])
+                pending[sectionName] = []
+            return storePending
+        
+        handlers = {"NODES"          :collect("NODES",         self._parseNodeFromFields),
+                    "CENTROIDS"      :collect("CENTROIDS",     self._parseCentroidFromFields),
+                    "LINKS"          :collect("LINKS",         self._parseLinkFromFields),
+                    "LANE_PERMS"     :self._addLanePermissionFromFields,
+                    "LINK_EVENTS"    :addLinkEvent,
+                    "LANE_EVENTS"    :ignoreFields,
+                    "VIRTUAL_LINKS"  :collect("VIRTUAL_LINKS", parseVirtualLink),
+                    "MOVEMENTS"      :collect("MOVEMENTS",     self._parseMovementFromFields),
+                    "MOVEMENT_EVENTS":ignoreFields}
+        finishers = {"NODES"         :store("NODES",         self.addNodes),
+                     "CENTROIDS"     :store("CENTROIDS",     self.addNodes),
+                     "LINKS"         :store("LINKS",         self.addLinks),
+                     "VIRTUAL_LINKS" :store("VIRTUAL_LINKS", self.addLinks),
+                     "MOVEMENTS"     :store("MOVEMENTS",     self.addMovements)}
+        return handlers, finishers
+
+    def _getAdvancedSectionHandlers(self):
+        """
+        Returns a dictionary of advanced file section name -> function processing the fields of one line of it,
+        and a dictionary of section name -> function called at the end of the section.
+        """
+        return {"SHIFTS"  :self._addShiftFromFields,
+                "VERTICES":self._addShapePointsToLink}, {}
+
+    def _readSections(self, filename, sectionNames, handlers, finishers=None):
+        """
+        Reads all the *sectionNames* sections of the given file in a single pass from top to bottom,
+        calling *handlers[sectionName]* with the fields (array of strings) of each line of the section,
+        and then *finishers[sectionName]*, if there is one, with no arguments.
+        Lines before the first section, blank lines and comments (lines starting with ``*``) are skipped.
+        
+        Logs the number of lines read for each section, and returns a dictionary of
+        section name -> (number of lines, seconds spent reading and processing them).
+        
+        Raises a :py:class:`DtaError` if one of the sections is missing from the file.
+        """
+        if finishers is None: finishers = {}
+        sections    = set(sectionNames)
+        counts      = dict((sectionName, 0) for sectionName in sectionNames)
+        seconds     = dict((sectionName, 0.0) for sectionName in sectionNames)
+        sectionName = None
+        handler     = None
+        count       = 0
+        
+        infile      = open(filename, "r")
+        startTime   = time.time()
+        for line in infile:
+            line = line.strip()
+            if not line or line[0] == "*": continue
+            
+            if line in sections or line == "ENDOFFILE":
+                if sectionName:
+                    if sectionName in finishers: finishers[sectionName]()
+                    counts[sectionName]  += count
+                    seconds[sectionName] += time.time() - startTime
+                if line == "ENDOFFILE":
+                    sectionName = None
+                    break
+                sectionName = line
+                handler     = handlers[line]
+                count       = 0
+                sections.discard(line)
+                startTime   = time.time()
+                continue
+            
+            # header lines before the first section
+            if handler is None: continue
+            
+            handler(line.split())
+            count += 1
+        infile.close()
+        
+        if sectionName:
+            if sectionName in finishers: finishers[sectionName]()
+            counts[sectionName]  += count
+            seconds[sectionName] += time.time() - startTime
+        
+        for sectionName in sectionNames:
+            if sectionName in sections:
+                raise DtaError("DynameqNetwork _readSections failed to find %s in %s" % 
+                               (sectionName,filename))
+            DtaLogger.info("Read  %8d %-16s from %s" % (counts[sectionName], sectionName, filename))
+        
+        return dict((sectionName, (counts[sectionName], seconds[sectionName])) for sectionName in sectionNames)
+
     def _readSectionFromFile(self, filename, sectionName, nextSectionName):
         """
         Generator function, yields fields (array of strings) from the given section of the given file.
@@ -533,9 +1007,9 @@ class DynameqNetwork(Network):
         basefile_object.write("LANE_EVENTS\n")
         basefile_object.write("*    link  id     time                perms\n")
         
-    def _parseVirtualLinkFromFields(self, fields):
+    def _parseVirtualLinkFromFields(self, fields, newId=None):
         """
-        Interprets fields into a VirtualLink
+        Interprets fields into a VirtualLink with id *newId*, which defaults to the next unused link id.
         """
         centroidId  = int(fields[0])
         linkId      = int(fields[1])
@@ -548,7 +1022,7 @@ class DynameqNetwork(Network):
         
         
         # no id -- make one up
-        newId = self._maxLinkId + 1
+        if newId is None: newId = self._maxLinkId + 1
         
         # if the connector is incoming to a virtual node, the the virtual link is incoming:
         # connector to centroid
@@ -834,223 +1308,189 @@ class DynameqNetwork(Network):
         DtaLogger.info("Wrote %8d %-16s to %s" % (count, "CUSTOM PRIOS", customprio_object.name))
     
         
-    def _readMovementOutFlowsAndTTs(self):
+    def _readMovementResultFile(self, fileName, numTimeSteps, numHeaderLines=9):
+        """
+        Reads the Dynameq movement result file *fileName* in one pass and returns (nodes, values), where
+        *nodes* is the (lines x 3) array of the (at node, from node, to node) ids of the movements and
+        *values* the (lines x *numTimeSteps*) array of their results, zero after the last time step in the file.
+        """
+        inputStream = open(fileName, 'r')
+        try:
+            lines = inputStream.read().splitlines()[numHeaderLines:]
+        finally:
+            inputStream.close()
+
+        lines = [line for line in lines if line.strip()]
+        if len(lines) == 0:
+            return np.zeros((0, 3), dtype=np.int64), np.zeros((0, numTimeSteps), dtype=np.float64)
+
+        numFields = len(lines[0].split())
+        block = np.fromstring(" ".join(lines), dtype=np.float64, sep=" ")
+        if numFields < 3 or block.size != len(lines) * numFields:
+            raise DtaError("The file %s does not have the same number of time steps on every line" % fileName)
+        block = block.reshape(len(lines), numFields)
+
+        values = np.zeros((len(lines), numTimeSteps), dtype=np.float64)
+        numColumns = min(numFields - 3, numTimeSteps)
+        values[:, :numColumns] = block[:, 3:3 + numColumns]
+        return block[:, :3].astype(np.int64), values
+
+    def _readMovementOutFlowsAndTTs(self, dir=None):
         """
         Read the movement travel times (in seconds) add assign them 
-        to the corresponding movement
+        to the corresponding movement, from the result files in *dir*
+        (the network directory if None).
+
+        Each of the flow out, travel time and flow in files is parsed into a block of
+        (movements x time steps) and the blocks are stored in the :py:class:`SimResultStore`
+        set up by :py:meth:`Network.initializeSimResults` at once.  The flows, in vehicles
+        per hour, are stored as volumes per time step.  Time steps with a negative
+        travel time (which Dynameq occasionaly reports) are left empty.
         """
-        if not self._dir:
+        if dir is None:
+            dir = self._dir
+        if not dir:
             raise DtaError("The network directory has not been defined")
         
-        movementFlowFileName = os.path.join(self._dir, 
+        movementFlowFileName = os.path.join(dir, 
                                             DynameqNetwork.MOVEMENT_FLOW_OUT)
-        movementTimeFileName = os.path.join(self._dir,
+        movementTimeFileName = os.path.join(dir,
                                             DynameqNetwork.MOVEMENT_TIME_OUT)
 
-        movementFlowInFileName = os.path.join(self._dir,
+        movementFlowInFileName = os.path.join(dir,
                                             DynameqNetwork.MOVEMENT_FLOW_IN)
 
-
-        inputStream1 = open(movementFlowFileName, 'r')
-        inputStream2 = open(movementTimeFileName, 'r')
-        inputStream3 = open(movementFlowInFileName, 'r')        
-
-        for i in range(9):
-            inputStream1.next()
-            inputStream2.next()
-
-        for flowLine, timeLine, flowInLine in izip(inputStream1, inputStream2, inputStream3):
-            
-            flowFields = flowLine.strip().split()
-            timeFields = timeLine.strip().split()
-            flowInFields = flowLine.strip().split()            
-
-            nodeBid, nodeAid, nodeCid = map(int, flowFields[:3])
-
-            if [nodeBid, nodeAid, nodeCid] != map(int, timeFields[:3]):
-                raise DtaError('The files %s and %s are not in sync. '
+        simResults   = self.getSimResults()
+        numTimeSteps = simResults.getNumTimeSteps()
+        flowNodes, simFlows     = self._readMovementResultFile(movementFlowFileName, numTimeSteps)
+        timeNodes, simTTs       = self._readMovementResultFile(movementTimeFileName, numTimeSteps)
+        flowInNodes, simInFlows = self._readMovementResultFile(movementFlowInFileName, numTimeSteps)
+
+        for fileName, nodes in [(movementTimeFileName, timeNodes), (movementFlowInFileName, flowInNodes)]:
+            if nodes.shape == flowNodes.shape and (nodes == flowNodes).all(): continue
+            numLines   = min(len(nodes), len(flowNodes))
+            mismatched = np.flatnonzero((nodes[:numLines] != flowNodes[:numLines]).any(axis=1))
+            line       = int(mismatched[0]) if len(mismatched) else numLines
+            nodeBid, nodeAid, nodeCid = (flowNodes if line < len(flowNodes) else nodes)[line].tolist()
+            raise DtaError('The files %s and %s are not in sync. '
                                       'Movement through %s from %s to %s in the first file is not '
                                       'in the same line position in the second '
                                       'file' % (movementFlowFileName,
-                                                movementTimeFileName,
+                                                fileName,
                                                 nodeBid, nodeAid, nodeCid))
 
-            try:
-                link = self.getLinkForNodeIdPair(nodeAid, nodeBid)
-                movement = link.getOutgoingMovement(nodeCid)
-            except DtaError, e:
-                #if the movement does not exist. It could be a prohibited movement
-                #perhaps you need to do more error checking there 
-                if nodeAid == nodeCid:
-                    continue
-                continue
-
-            simFlows = imap(int, flowFields[3:])
-            simTTs = imap(float, timeFields[3:])
-            simInFlows = imap(int, flowInFields[3:])
-            
-            timePeriodStart = self._simStartTimeInMin
-                    
-            for simFlow, simTT, simInFlow in izip(simFlows, simTTs, simInFlows):
-
-                #TODO:Dynameq occasionaly reports negative times.
-                if simTT < 0:
-                    continue
-
-                if simFlow == 0 and simTT > 0:
-                    raise DtaError('Movement %s has zero flow in the '
-                                   'time period begining %d and a '
-                                   'positive travel time' % 
-                                   (movement.getId(), timePeriodStart))
-                elif simFlow > 0 and simTT == 0:
-                    raise DtaError('Movement %s has positive flow in '
-                                   'the time period begining %d and a '
-                                   'zero travel time' % 
-                                   (movement.getId(), timePeriodStart))
-                
-                elif simFlow == 0 and simTT == 0:
-                    #simTT = movement.getFreeFlowTTInMin()
-                    timePeriodStart += self._simTimeStepInMin
-                    if timePeriodStart >= self._simEndTimeInMin:
-                        break
-                else:
-                    movement.setSimOutVolume(timePeriodStart, timePeriodStart + 
-                                        self._simTimeStepInMin, simFlow / (60 / self._simTimeStepInMin))
-                    movement.setSimInVolume(timePeriodStart, timePeriodStart + 
-                                        self._simTimeStepInMin, simInFlow / (60 / self._simTimeStepInMin))
-
-                    movement.setSimTTInMin(timePeriodStart, timePeriodStart + 
-                                          self._simTimeStepInMin, simTT / 60.0)
-
-                                      
-                    timePeriodStart += self._simTimeStepInMin
-                    if timePeriodStart >= self._simEndTimeInMin:
-                        break
-
-        inputStream1.close()
-        inputStream2.close()
+        #if the movement does not exist. It could be a prohibited movement
+        movementRows = self.getSimResultMovementRows()
+        rows  = np.array([movementRows.get(key, -1) for key in imap(tuple, flowNodes.tolist())], dtype=np.int64)
+        found = rows >= 0
+        rows, flowNodes = rows[found], flowNodes[found]
+        simFlows, simTTs, simInFlows = simFlows[found], simTTs[found], simInFlows[found]
+
+        #TODO:Dynameq occasionaly reports negative times.
+        negative = simTTs < 0
+        simFlows[negative]   = 0
+        simTTs[negative]     = 0
+        simInFlows[negative] = 0
+
+        for invalid, message in [((simFlows == 0) & (simTTs > 0), 'zero flow in the time period begining %d and a positive travel time'),
+                                 ((simFlows > 0) & (simTTs == 0), 'positive flow in the time period begining %d and a zero travel time')]:
+            if not invalid.any(): continue
+            line, step = [int(index[0]) for index in np.nonzero(invalid)]
+            nodeBid, nodeAid, nodeCid = flowNodes[line].tolist()
+            movement = self.getLinkForNodeIdPair(nodeAid, nodeBid).getOutgoingMovement(nodeCid)
+            raise DtaError(('Movement %s has ' + message) %
+                           (movement.getId(), self._simStartTimeInMin + step * self._simTimeStepInMin))
+
+        volumePerFlow = self._simTimeStepInMin / 60.0
+        simResults.setBlock(rows, 0, outVolumes=simFlows * volumePerFlow, inVolumes=simInFlows * volumePerFlow,
+                            meanTTs=simTTs / 60.0)
+        DtaLogger.info("Read the simulated flows and travel times of %d movements for %d time steps" % (len(rows), numTimeSteps))
 
                                
-    def readSimResults(self, simStartTimeInMin, simEndTimeInMin, simTimeStepInMin):
+    def readSimResults(self, simStartTimeInMin, simEndTimeInMin, simTimeStepInMin, dir=None):
         """
-        Read the movement and link travel times and flows
+        Read the movement and link travel times and flows from the result files in *dir*,
+        the directory the network was read from by default
         """
         self._simStartTimeInMin = simStartTimeInMin
         self._simEndTimeInMin = simEndTimeInMin
         self._simTimeStepInMin = simTimeStepInMin
 
-        for link in self.iterLinks():
-            if link.isVirtualLink():
-                continue
-            link.simTimeStepInMin = simTimeStepInMin
-            link.simStartTimeInMin = simStartTimeInMin
-            link.simEndTimeInMin = simEndTimeInMin
-            for mov in link.iterOutgoingMovements():
-                mov.simTimeStepInMin = simTimeStepInMin
-                mov.simStartTimeInMin = simStartTimeInMin
-                mov.simEndTimeInMin = simEndTimeInMin
-
-        self._readMovementOutFlowsAndTTs()
+        self.initializeSimResults(simStartTimeInMin, simEndTimeInMin, simTimeStepInMin)
+        self._readMovementOutFlowsAndTTs(dir)
 
-    def readObsMovementCounts(self, countFileNameInDynameqDatFormat):
+    def _readCountFile(self, fileName, headerKeyword, timesPosition, numKeyFields):
         """
-        Assign the movement counts
+        Reads the Dynameq count file *fileName* and returns a list with (startTimeInMin, timeStepInMin, keys, counts)
+        for each of its sections.  A section starts with a comment line containing *headerKeyword*, whose fields
+        from *timesPosition* on are the start times of the bins.  *keys* is the (lines x *numKeyFields*) array of
+        the node ids starting the data lines, and *counts* the (lines x bins) array of the counts that follow,
+        -1 (missing) for the bins a line doesn't have.
         """
-
-        startTimeInMin = 0
-        endTimeInMin = 0
-        timeStepInMin = 0
-        for line in open(countFileNameInDynameqDatFormat, "r"):
+        sections = []
+        for line in open(fileName, "r"):
             if "*" in line:
-                # parse the times from this line
-                if " at " in line:
-                    times = line.strip().split()[4:]
+                # parse the times from this line; don't care about other comments
+                if headerKeyword in line:
+                    times = line.strip().split()[timesPosition:]
                     startTimeInMin = Time.readFromString(times[0]).getMinutes()
                     endTimeInMin = Time.readFromString(times[-1]).getMinutes()
                     timeStepInMin = Time.readFromString(times[1]).getMinutes() - \
                                     startTimeInMin
-                    continue
-
-                # don't care about other comments
+                    sections.append((startTimeInMin, timeStepInMin,
+                                     (endTimeInMin - startTimeInMin) // timeStepInMin + 1, []))
                 continue
-            
-            # this is a data line -- all comment lines have been taken care of already
-            fields = map(int, map(float, line.strip().split()))
-            
-            link1 = self.getLinkForNodeIdPair(fields[1],fields[0])
-            link2 = self.getLinkForNodeIdPair(fields[0],fields[2])
-
-            mov = link1.getOutgoingMovement(link2.getEndNodeId())
-        
+            if not line.strip():
+                continue
+            if len(sections) == 0:
+                raise DtaError("The count file %s has counts before the times of the bins" % fileName)
+            sections[-1][3].append(line)
+
+        countSections = []
+        for startTimeInMin, timeStepInMin, numBins, lines in sections:
+            numFields = numKeyFields + numBins
+            block = np.fromstring(" ".join(lines), dtype=np.float64, sep=" ")
+            if block.size == len(lines) * numFields:
+                block = block.reshape(len(lines), numFields)
+            else:
+                # lines with fewer (or more) bins than the header
+                rows = []
+                for line in lines:
+                    values = map(float, line.split())[:numFields]
+                    rows.append(values + [-1.0] * (numFields - len(values)))
+                block = np.array(rows, dtype=np.float64).reshape(len(lines), numFields)
+            countSections.append((startTimeInMin, timeStepInMin,
+                                  block[:, :numKeyFields].astype(np.int64), block[:, numKeyFields:]))
+        return countSections
 
-            for s, count in izip(range(startTimeInMin, endTimeInMin + 1, timeStepInMin), fields[3:]):
-                if count < 0:
-                    continue
-                mov.setObsCount(s,s+timeStepInMin, count) 
-            
-            # next, aggregate to 15-minute and 60-minute bins if needed
-            for aggregateTimeStep in [15, 60]: 
-                if timeStepInMin<aggregateTimeStep: 
-                    for s, count in izip(range(startTimeInMin, endTimeInMin + 1, timeStepInMin), fields[3:]):
-                        if s == startTimeInMin: 
-                            aggregateCount = 0            		
-                        elif s % aggregateTimeStep == 0: 
-        				    mov.setObsCount(s-aggregateTimeStep, s, aggregateCount)
-        				    aggregateCount = 0
-                        if count<0: continue
-                        aggregateCount = aggregateCount + count
+    def readObsMovementCounts(self, countFileNameInDynameqDatFormat):
+        """
+        Assign the movement counts.  The counts of each section of the file are held
+        in an :py:class:`ObsCountStore`, so the count of any window made of whole bins of
+        the file (e.g. 15 or 60 minutes, or a peak period) is available from
+        :py:meth:`Movement.getObsCount`; a window with a missing count (negative in the file)
+        in any of its bins has no count.
+        """
+        for startTimeInMin, timeStepInMin, keys, counts in \
+            self._readCountFile(countFileNameInDynameqDatFormat, " at ", 4, 3):
             
-                        
+            obsCounts = ObsCountStore(startTimeInMin, timeStepInMin, counts)
+            for row, (atNodeId, fromNodeId, toNodeId) in enumerate(keys.tolist()):
+                link1 = self.getLinkForNodeIdPair(fromNodeId, atNodeId)
+                link2 = self.getLinkForNodeIdPair(atNodeId, toNodeId)
+                mov = link1.getOutgoingMovement(link2.getEndNodeId())
+                mov.addObsCountRow(obsCounts, row)
 
     def readObsLinkCounts(self, countFileNameInDynameqDatFormat):
         """
-        Assign the link counts
-        """
-
-        startTimeInMin = 0
-        endTimeInMin = 0
-        timeStepInMin = 0
-        #lineNum = 0
-        for line in open(countFileNameInDynameqDatFormat, "r"):
-            #lineNum += 1
-            #if lineNum == 0:
-            if "*" in line:                    
-                if "from" in line:
-                    times = line.strip().split()[3:]
-                    #startTimeInMin = Time.readFromStringWithoutColon(times[0]).getMinutes()
-                    #endTimeInMin = Time.readFromStringWithoutColon(times[-1]).getMinutes()
-                    #timeStepInMin = Time.readFromStringWithoutColon(times[1]).getMinutes() - \
-                    #                startTimeInMin
-                    startTimeInMin = Time.readFromString(times[0]).getMinutes()
-                    endTimeInMin = Time.readFromString(times[-1]).getMinutes()
-                    timeStepInMin = Time.readFromString(times[1]).getMinutes() - \
-                                startTimeInMin
-                    #lineNum += 1
-                    continue
-                else:
-                    continue
-                
-            else:
-                fields = map(int, map(float, line.strip().split()))
-                
-                #link = self.getLinkForId(fields[0])
-                link = self.getLinkForNodeIdPair(fields[0],fields[1])
-            
-                for s, count in izip(range(startTimeInMin, endTimeInMin + 1, timeStepInMin), fields[2:]):
-                    if count < 0:
-                        continue
-                    link.setObsCount(s,s+timeStepInMin, count) 
+        Assign the link counts.  As for :py:meth:`DynameqNetwork.readObsMovementCounts`,
+        the count of any window made of whole bins of the file is available from
+        :py:meth:`RoadLink.getObsCount`.
+        """
+        for startTimeInMin, timeStepInMin, keys, counts in \
+            self._readCountFile(countFileNameInDynameqDatFormat, "from", 3, 2):
             
-                # next, aggregate to 15-minute and 60-minute bins if needed
-                for aggregateTimeStep in [15, 60]: 
-                    if timeStepInMin<aggregateTimeStep: 
-                        for s, count in izip(range(startTimeInMin, endTimeInMin + 1, timeStepInMin), fields[3:]):
-                            if s == startTimeInMin: 
-            				aggregateCount = 0            		
-                            elif s % aggregateTimeStep == 0: 
-                                link.setObsCount(s-aggregateTimeStep, s, aggregateCount)
-                                aggregateCount = 0
-                            if count<0: 
-            				continue
-                            aggregateCount = aggregateCount + count
-            		
+            obsCounts = ObsCountStore(startTimeInMin, timeStepInMin, counts)
+            for row, (startNodeId, endNodeId) in enumerate(keys.tolist()):
+                link = self.getLinkForNodeIdPair(startNodeId, endNodeId)
+                link.addObsCountRow(obsCounts, row)
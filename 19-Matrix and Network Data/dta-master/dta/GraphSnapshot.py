@@ -0,0 +1,753 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import binascii
+import heapq
+import math
+from collections import deque
+from itertools import izip
+
+import numpy as np
+
+from .DtaError import DtaError
+
+def adjacencyLists(pointer, edges, heads):
+    """
+    Returns a CSR graph as python lists, which are faster than numpy arrays to walk one element
+    at a time: a list by vertex index of lists of (edge index, head vertex index).
+
+     * the edges out of vertex *v* are ``edges[pointer[v]:pointer[v+1]]``; if *edges* is None they are
+       the edge indices ``pointer[v]`` to ``pointer[v+1]-1``
+     * *heads* is by edge index, the vertex index at the head of each edge
+    """
+    pointer = np.asarray(pointer).tolist()
+    heads   = np.asarray(heads).tolist()
+    if edges is None:
+        return [[(edge, heads[edge]) for edge in xrange(pointer[v], pointer[v+1])]
+                for v in xrange(len(pointer)-1)]
+    edges   = np.asarray(edges).tolist()
+    return [[(edge, heads[edge]) for edge in edges[pointer[v]:pointer[v+1]]]
+            for v in xrange(len(pointer)-1)]
+
+def labelSetting(adjacency, edgeCosts, sourceIndices, sourceLabels, endIndex=None, edgeMask=None,
+                 maxLabel=float('inf'), predIsEdge=True):
+    """
+    Dijkstra's label setting shortest path using a binary heap, over a graph given by *adjacency*
+    (see :py:func:`adjacencyLists`), used by :py:class:`GraphSnapshot` and by the skim worker processes.
+
+     * *edgeCosts* is a list (or array) of non-negative costs by edge index
+     * *sourceIndices* and *sourceLabels* are the starting vertices and their labels
+     * the search stops once *endIndex* is set, or once the smallest label exceeds *maxLabel*
+     * if passed, *edgeMask* is a list by edge index; edges for which it is False are not used
+     * if *predIsEdge*, the predecessor recorded for a vertex is the edge index used to reach it,
+       otherwise it is the previous vertex index
+
+    Returns (labels, preds) as python lists by vertex index, with infinity and -1 for unreached vertices.
+    """
+    numVertices = len(adjacency)
+    labels      = [float('inf')] * numVertices
+    preds       = [-1] * numVertices
+    isSet       = [False] * numVertices
+
+    heap = []
+    for sourceIndex, sourceLabel in zip(sourceIndices, sourceLabels):
+        if sourceLabel < labels[sourceIndex]:
+            labels[sourceIndex] = sourceLabel
+            heap.append((sourceLabel, sourceIndex))
+    heapq.heapify(heap)
+
+    while heap:
+        label, pivot = heapq.heappop(heap)
+        if isSet[pivot]: continue
+        isSet[pivot] = True
+        if pivot == endIndex or label > maxLabel: break
+
+        for edge, downstream in adjacency[pivot]:
+            if isSet[downstream]: continue
+            if edgeMask is not None and not edgeMask[edge]: continue
+            newLabel = label + edgeCosts[edge]
+            if newLabel < labels[downstream]:
+                labels[downstream] = newLabel
+                preds[downstream]  = edge if predIsEdge else pivot
+                heapq.heappush(heap, (newLabel, downstream))
+
+    return labels, preds
+
+def labelSettingOnCSR(pointer, heads, edgeCosts, sourceIndices, sourceLabels):
+    """
+    Dijkstra's label setting shortest path like :py:func:`labelSetting`, but walking a CSR graph directly
+    instead of the lists of :py:func:`adjacencyLists`: the edges out of vertex *v* are the edge indices
+    ``pointer[v]`` to ``pointer[v+1]-1`` and *heads* is by edge index, the vertex at the head of each edge.
+
+    *pointer*, *heads* and *edgeCosts* can be python lists or ctypes arrays, such as the
+    :py:func:`multiprocessing.sharedctypes.RawArray` instances shared by the skim worker processes,
+    which are read in place (a slice of a ctypes array is a python list of its elements).
+
+    Returns (labels, preds) as python lists by vertex index, the predecessor being the previous vertex index,
+    with infinity and -1 for unreached vertices.
+    """
+    numVertices = len(pointer) - 1
+    labels      = [float('inf')] * numVertices
+    preds       = [-1] * numVertices
+    isSet       = [False] * numVertices
+
+    heap = []
+    for sourceIndex, sourceLabel in zip(sourceIndices, sourceLabels):
+        if sourceLabel < labels[sourceIndex]:
+            labels[sourceIndex] = sourceLabel
+            heap.append((sourceLabel, sourceIndex))
+    heapq.heapify(heap)
+
+    while heap:
+        label, pivot = heapq.heappop(heap)
+        if isSet[pivot]: continue
+        isSet[pivot] = True
+
+        first = pointer[pivot]
+        last  = pointer[pivot+1]
+        for downstream, cost in izip(heads[first:last], edgeCosts[first:last]):
+            if isSet[downstream]: continue
+            newLabel = label + cost
+            if newLabel < labels[downstream]:
+                labels[downstream] = newLabel
+                preds[downstream]  = pivot
+                heapq.heappush(heap, (newLabel, downstream))
+
+    return labels, preds
+
+class GraphSnapshot(object):
+    """
+    A frozen copy of the topology of a :py:class:`Network` stored in contiguous numpy arrays,
+    for use by path algorithms that shouldn't walk (or write attributes onto) the network objects.
+
+    Nodes, links and movements are each given a dense index (in order of increasing id; movements
+    in order of incoming link index, then outgoing link index).  The node graph and the link graph
+    are stored in compressed sparse row (CSR) form:
+
+     * the outgoing links of node index *n* are ``nodeOutLinks[nodeOutPointer[n]:nodeOutPointer[n+1]]``
+     * the movements out of link index *l* are the indices ``linkOutPointer[l]`` to ``linkOutPointer[l+1]-1``
+       into the movement arrays.
+
+    Get one with :py:meth:`Network.toGraphSnapshot`, which caches it until the network topology changes.
+    The snapshot reflects the network at the time it was built; changes made afterwards are not seen.
+    """
+    #: Node type code for :py:class:`RoadNode` instances, in :py:attr:`GraphSnapshot.nodeType`
+    NODE_TYPE_ROAD          = 0
+    #: Node type code for :py:class:`Centroid` instances, in :py:attr:`GraphSnapshot.nodeType`
+    NODE_TYPE_CENTROID      = 1
+    #: Node type code for :py:class:`VirtualNode` instances, in :py:attr:`GraphSnapshot.nodeType`
+    NODE_TYPE_VIRTUAL       = 2
+
+    #: Link type code for :py:class:`RoadLink` instances, in :py:attr:`GraphSnapshot.linkType`
+    LINK_TYPE_ROAD          = 0
+    #: Link type code for :py:class:`Connector` instances, in :py:attr:`GraphSnapshot.linkType`
+    LINK_TYPE_CONNECTOR     = 1
+    #: Link type code for :py:class:`VirtualLink` instances, in :py:attr:`GraphSnapshot.linkType`
+    LINK_TYPE_VIRTUAL       = 2
+
+    def __init__(self, network):
+        """
+        Constructor.  Builds the arrays from the nodes, links and movements in *network*,
+        a :py:class:`Network` instance.
+        """
+        #: the :py:meth:`Network.getTopologyVersion` of the network at the time the snapshot was taken
+        self.topologyVersion = network.getTopologyVersion()
+
+        nodes = sorted(network.iterNodes(), key=lambda node: node.getId())
+        links = sorted(network.iterLinks(), key=lambda link: link.getId())
+
+        #: node index -> node id
+        self.nodeIds        = np.array([node.getId() for node in nodes], dtype=np.int64)
+        #: node index -> x coordinate, in :py:attr:`Node.COORDINATE_UNITS`
+        self.nodeX          = np.array([node.getX() for node in nodes], dtype=np.float64)
+        #: node index -> y coordinate, in :py:attr:`Node.COORDINATE_UNITS`
+        self.nodeY          = np.array([node.getY() for node in nodes], dtype=np.float64)
+        #: node index -> one of the ``NODE_TYPE_*`` codes
+        self.nodeType       = np.array([GraphSnapshot.NODE_TYPE_CENTROID if node.isCentroid() else
+                                        (GraphSnapshot.NODE_TYPE_VIRTUAL if node.isVirtualNode() else
+                                         GraphSnapshot.NODE_TYPE_ROAD) for node in nodes], dtype=np.int8)
+        self._nodeIndex     = dict((nodeId, index) for index, nodeId in enumerate(self.nodeIds.tolist()))
+
+        #: link index -> link id
+        self.linkIds        = np.array([link.getId() for link in links], dtype=np.int64)
+        #: link index -> start node index
+        self.linkStartNode  = np.array([self._nodeIndex[link.getStartNode().getId()] for link in links], dtype=np.int32)
+        #: link index -> end node index
+        self.linkEndNode    = np.array([self._nodeIndex[link.getEndNode().getId()] for link in links], dtype=np.int32)
+        #: link index -> one of the ``LINK_TYPE_*`` codes
+        self.linkType       = np.array([GraphSnapshot.LINK_TYPE_VIRTUAL if link.isVirtualLink() else
+                                        (GraphSnapshot.LINK_TYPE_CONNECTOR if link.isConnector() else
+                                         GraphSnapshot.LINK_TYPE_ROAD) for link in links], dtype=np.int8)
+        self._linkIndex     = dict((linkId, index) for index, linkId in enumerate(self.linkIds.tolist()))
+
+        roadLinks = [not link.isVirtualLink() for link in links]
+        #: link index -> straight line length, in :py:attr:`Node.COORDINATE_UNITS`
+        self.linkEuclideanLength = np.array([link.euclideanLength() for link in links], dtype=np.float64)
+        #: link index -> length following the shape points, in :py:attr:`Node.COORDINATE_UNITS`
+        self.linkShapeLength     = np.array([link.euclideanLength(includeShape=True) for link in links], dtype=np.float64)
+        #: link index -> :py:meth:`RoadLink.getLength`, in :py:attr:`RoadLink.LENGTH_UNITS`; zero for virtual links
+        self.linkLength          = np.array([link.getLength() if isRoad else 0.0
+                                             for link, isRoad in zip(links, roadLinks)], dtype=np.float64)
+        #: link index -> :py:meth:`RoadLink.getFreeFlowTTInMin`; zero for virtual links, infinity for links with no free flow speed
+        self.linkFFTT            = np.array([(link.getFreeFlowTTInMin() if link.getFreeFlowSpeedInMPH() > 0 else float('inf'))
+                                             if isRoad else 0.0 for link, isRoad in zip(links, roadLinks)], dtype=np.float64)
+
+        # node graph: outgoing links grouped by start node, and incoming links grouped by end node
+        self.nodeOutLinks, self.nodeOutPointer = GraphSnapshot._toCSR(self.linkStartNode, len(nodes))
+        self.nodeInLinks,  self.nodeInPointer  = GraphSnapshot._toCSR(self.linkEndNode, len(nodes))
+
+        # link graph: movements grouped by incoming link
+        movementIncoming   = []
+        movementOutgoing   = []
+        movementProhibited = []
+        for linkIndex, link in enumerate(links):
+            if not roadLinks[linkIndex]: continue
+            for movement in link.iterOutgoingMovements():
+                movementIncoming.append(linkIndex)
+                movementOutgoing.append(self._linkIndex[movement.getOutgoingLink().getId()])
+                movementProhibited.append(movement.isProhibitedToAllVehicleClassGroups())
+
+        order = np.lexsort((np.array(movementOutgoing, dtype=np.int32), np.array(movementIncoming, dtype=np.int32)))
+        #: movement index -> incoming link index
+        self.movementIncomingLink = np.array(movementIncoming, dtype=np.int32)[order]
+        #: movement index -> outgoing link index
+        self.movementOutgoingLink = np.array(movementOutgoing, dtype=np.int32)[order]
+        #: movement index -> True if the movement is prohibited to all vehicle class groups
+        self.movementProhibited   = np.array(movementProhibited, dtype=np.bool_)[order]
+
+        counts = np.bincount(self.movementIncomingLink, minlength=len(links)) if len(order) else np.zeros(len(links), dtype=np.int64)
+        #: CSR pointer into the movement arrays, by incoming link index
+        self.linkOutPointer = np.concatenate(([0], np.cumsum(counts))).astype(np.int32)
+
+        self._movementIndex = None
+        # python list versions of the CSR arrays, for the search loops
+        self._nodeAdjacency = None
+        self._linkAdjacency = None
+        self._reverseLinkAdjacency = None
+        # python list versions of arrays used by the point to point searches, by key
+        self._listCache     = {}
+
+    @staticmethod
+    def _toCSR(rowOfItem, numRows):
+        """
+        Groups the item indices by *rowOfItem* (keeping them in increasing order within each row)
+        and returns (items, pointer) where the items of row *r* are ``items[pointer[r]:pointer[r+1]]``.
+        """
+        items   = np.argsort(rowOfItem, kind='mergesort').astype(np.int32)
+        counts  = np.bincount(rowOfItem, minlength=numRows) if len(rowOfItem) else np.zeros(numRows, dtype=np.int64)
+        pointer = np.concatenate(([0], np.cumsum(counts))).astype(np.int32)
+        return items, pointer
+
+    def getNumNodes(self):
+        """
+        Returns the number of nodes in the snapshot
+        """
+        return len(self.nodeIds)
+
+    def getNumLinks(self):
+        """
+        Returns the number of links in the snapshot
+        """
+        return len(self.linkIds)
+
+    def getNumMovements(self):
+        """
+        Returns the number of movements in the snapshot
+        """
+        return len(self.movementIncomingLink)
+
+    def getNodeIndex(self, nodeId):
+        """
+        Returns the index of the node with id *nodeId*; raises a :py:class:`DtaError` if it's not in the snapshot.
+        """
+        if nodeId in self._nodeIndex:
+            return self._nodeIndex[nodeId]
+        raise DtaError("GraphSnapshot getNodeIndex: no node with id %s" % str(nodeId))
+
+    def getLinkIndex(self, linkId):
+        """
+        Returns the index of the link with id *linkId*; raises a :py:class:`DtaError` if it's not in the snapshot.
+        """
+        if linkId in self._linkIndex:
+            return self._linkIndex[linkId]
+        raise DtaError("GraphSnapshot getLinkIndex: no link with id %s" % str(linkId))
+
+    def getMovementIndex(self, incomingLinkId, outgoingLinkId):
+        """
+        Returns the index of the movement from the link with id *incomingLinkId* to the link with
+        id *outgoingLinkId*; raises a :py:class:`DtaError` if there is no such movement.
+        """
+        if self._movementIndex is None:
+            self._movementIndex = dict(((incoming, outgoing), index) for index, (incoming, outgoing) in
+                                       enumerate(zip(self.movementIncomingLink.tolist(), self.movementOutgoingLink.tolist())))
+        key = (self.getLinkIndex(incomingLinkId), self.getLinkIndex(outgoingLinkId))
+        if key in self._movementIndex:
+            return self._movementIndex[key]
+        raise DtaError("GraphSnapshot getMovementIndex: no movement from link %s to link %s" %
+                       (str(incomingLinkId), str(outgoingLinkId)))
+
+    def getNodeId(self, nodeIndex):
+        """
+        Returns the id of the node with index *nodeIndex*
+        """
+        return int(self.nodeIds[nodeIndex])
+
+    def getLinkId(self, linkIndex):
+        """
+        Returns the id of the link with index *linkIndex*
+        """
+        return int(self.linkIds[linkIndex])
+
+    def getLinkMask(self, includeVirtual=False):
+        """
+        Returns a boolean array over link indices that is False for :py:class:`VirtualLink` instances
+        and for links ending at a :py:class:`VirtualNode` unless *includeVirtual*, True otherwise.
+        This matches the links traversed by :py:meth:`ShortestPaths.labelSettingWithLabelsOnNodes`.
+        """
+        if includeVirtual:
+            return np.ones(self.getNumLinks(), dtype=np.bool_)
+        return ((self.linkType != GraphSnapshot.LINK_TYPE_VIRTUAL) &
+                (self.nodeType[self.linkEndNode] != GraphSnapshot.NODE_TYPE_VIRTUAL))
+
+    def getMovementFFTTCosts(self):
+        """
+        Returns the default movement cost vector: the free flow travel time of the incoming link, in minutes,
+        as set by :py:meth:`ShortestPaths.initialiseMovementCostsWithFFTT`.
+        """
+        return self.linkFFTT[self.movementIncomingLink]
+
+    def getMovementLengthCosts(self):
+        """
+        Returns the movement cost vector based on the length of the incoming link, in :py:attr:`RoadLink.LENGTH_UNITS`,
+        as set by :py:meth:`ShortestPaths.initializeMovementCostsWithLength`.
+        """
+        return self.linkLength[self.movementIncomingLink]
+
+    def getCentroidIndices(self):
+        """
+        Returns the array of the node indices of the :py:class:`Centroid` instances, in order of increasing id.
+        """
+        return np.flatnonzero(self.nodeType == GraphSnapshot.NODE_TYPE_CENTROID)
+
+    def getCentroidAccessLinks(self, centroidIndex, egress=False):
+        """
+        Returns the list of the indices of the first non-virtual links (typically :py:class:`Connector` instances)
+        used to leave the centroid with node index *centroidIndex*, either directly or through a
+        :py:class:`VirtualLink` to a :py:class:`VirtualNode`.  These are the links a trip from the
+        centroid starts on in the link graph.
+
+        If *egress*, returns instead the last non-virtual links used to arrive at the centroid.
+        """
+        pointer, links   = (self.nodeInPointer, self.nodeInLinks) if egress else (self.nodeOutPointer, self.nodeOutLinks)
+        farNode          = self.linkStartNode if egress else self.linkEndNode
+
+        accessLinks = []
+        for linkIndex in links[pointer[centroidIndex]:pointer[centroidIndex+1]]:
+            if self.linkType[linkIndex] != GraphSnapshot.LINK_TYPE_VIRTUAL:
+                accessLinks.append(int(linkIndex))
+                continue
+            node = farNode[linkIndex]
+            for nextLinkIndex in links[pointer[node]:pointer[node+1]]:
+                if self.linkType[nextLinkIndex] != GraphSnapshot.LINK_TYPE_VIRTUAL:
+                    accessLinks.append(int(nextLinkIndex))
+        return sorted(set(accessLinks))
+
+    def _getNodeAdjacency(self):
+        """
+        Returns (and caches) the node graph as a list, by node index, of lists of (link index, end node index).
+        """
+        if self._nodeAdjacency is None:
+            self._nodeAdjacency = adjacencyLists(self.nodeOutPointer, self.nodeOutLinks, self.linkEndNode)
+        return self._nodeAdjacency
+
+    def _getLinkAdjacency(self):
+        """
+        Returns (and caches) the link graph as a list, by link index, of lists of (movement index, outgoing link index).
+        """
+        if self._linkAdjacency is None:
+            self._linkAdjacency = adjacencyLists(self.linkOutPointer, None, self.movementOutgoingLink)
+        return self._linkAdjacency
+
+    def _getReverseLinkAdjacency(self):
+        """
+        Returns (and caches) the reversed link graph as a list, by link index, of lists of (movement index, incoming link index).
+        """
+        if self._reverseLinkAdjacency is None:
+            movementsIn, movementInPointer = GraphSnapshot._toCSR(self.movementOutgoingLink, self.getNumLinks())
+            self._reverseLinkAdjacency = adjacencyLists(movementInPointer, movementsIn, self.movementIncomingLink)
+        return self._reverseLinkAdjacency
+
+    def getCachedList(self, key, makeArray):
+        """
+        Returns the python list version of the array returned by *makeArray* (a function taking no arguments),
+        computed the first time *key* is asked for and cached afterwards.  The point to point searches take their
+        costs and masks as lists so that each query doesn't pay for converting arrays the size of the network.
+        """
+        if key not in self._listCache:
+            self._listCache[key] = np.asarray(makeArray()).tolist()
+        return self._listCache[key]
+
+    def aStarOnNodes(self, sourceNodeIndex, destNodeIndex, linkCosts, linkMask=None, heuristicScale=1.0):
+        """
+        A* point to point shortest path over the node graph, guided by the straight line distance
+        from each node to the destination node (from :py:attr:`GraphSnapshot.nodeX` and
+        :py:attr:`GraphSnapshot.nodeY`) times *heuristicScale*.
+
+         * *linkCosts* is a list (or array) of costs by link index.  The path is shortest as long as
+           no link costs less than *heuristicScale* times the straight line distance between its end nodes,
+           which holds for :py:attr:`GraphSnapshot.linkEuclideanLength` and :py:attr:`GraphSnapshot.linkShapeLength`
+           with the default scale of one.
+         * if passed, *linkMask* is a list (or boolean array) by link index; links for which it is False are not used
+
+        Only the part of the network between the two nodes is searched.  Returns (cost, link indices of the path);
+        the path is None (and the cost infinity) if the destination can't be reached.
+        """
+        if not isinstance(linkCosts, list): linkCosts = np.asarray(linkCosts, dtype=np.float64).tolist()
+        if linkMask is not None and not isinstance(linkMask, list): linkMask = np.asarray(linkMask, dtype=np.bool_).tolist()
+        if sourceNodeIndex == destNodeIndex: return (0.0, [])
+
+        adjacency = self._getNodeAdjacency()
+        nodeX     = self.getCachedList("nodeX", lambda: self.nodeX)
+        nodeY     = self.getCachedList("nodeY", lambda: self.nodeY)
+        destX     = nodeX[destNodeIndex]
+        destY     = nodeY[destNodeIndex]
+        hypot     = math.hypot
+
+        labels    = {sourceNodeIndex:0.0}
+        predLinks = {sourceNodeIndex:-1}
+        isSet     = set()
+        heap      = [(heuristicScale*hypot(nodeX[sourceNodeIndex]-destX, nodeY[sourceNodeIndex]-destY), sourceNodeIndex)]
+
+        while heap:
+            estimate, pivot = heapq.heappop(heap)
+            if pivot in isSet: continue
+            isSet.add(pivot)
+            if pivot == destNodeIndex: break
+
+            label = labels[pivot]
+            for linkIndex, downstream in adjacency[pivot]:
+                if downstream in isSet: continue
+                if linkMask is not None and not linkMask[linkIndex]: continue
+                newLabel = label + linkCosts[linkIndex]
+                if newLabel < labels.get(downstream, float('inf')):
+                    labels[downstream]    = newLabel
+                    predLinks[downstream] = linkIndex
+                    heapq.heappush(heap, (newLabel + heuristicScale*hypot(nodeX[downstream]-destX, nodeY[downstream]-destY),
+                                          downstream))
+
+        if destNodeIndex not in isSet:
+            return (float('inf'), None)
+
+        linkStartNode = self.getCachedList("linkStartNode", lambda: self.linkStartNode)
+        path = []
+        nodeIndex = destNodeIndex
+        while predLinks[nodeIndex] >= 0:
+            path.append(predLinks[nodeIndex])
+            nodeIndex = linkStartNode[predLinks[nodeIndex]]
+        path.reverse()
+        return (labels[destNodeIndex], path)
+
+    def bidirectionalOnLinks(self, sourceLinkIndex, destLinkIndex, movementCosts, movementMask=None):
+        """
+        Bidirectional Dijkstra point to point shortest path over the link graph: a search forward
+        from the source link and one backward from the destination link (over the movements grouped by
+        outgoing link) take turns until the smallest labels of the two add up to at least the cost of the best
+        path found where they meet.
+
+         * *movementCosts* is a list (or array) of non-negative costs by movement index, with the
+           convention of :py:meth:`GraphSnapshot.labelSettingOnLinks`
+         * if passed, *movementMask* is a list (or boolean array) by movement index; movements for which it is False are not used
+
+        Returns (cost, link indices of the path, including the source and destination links); the path is
+        None (and the cost infinity) if the destination can't be reached.
+        """
+        if not isinstance(movementCosts, list): movementCosts = np.asarray(movementCosts, dtype=np.float64).tolist()
+        if movementMask is not None and not isinstance(movementMask, list): movementMask = np.asarray(movementMask, dtype=np.bool_).tolist()
+        if sourceLinkIndex == destLinkIndex: return (0.0, [sourceLinkIndex])
+
+        adjacency   = [self._getLinkAdjacency(), self._getReverseLinkAdjacency()]
+        labels      = [{sourceLinkIndex:0.0}, {destLinkIndex:0.0}]
+        # predecessor link for the forward search, successor link for the backward one
+        preds       = [{sourceLinkIndex:-1}, {destLinkIndex:-1}]
+        isSet       = [set(), set()]
+        heaps       = [[(0.0, sourceLinkIndex)], [(0.0, destLinkIndex)]]
+        bestCost    = float('inf')
+        meetLink    = -1
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= bestCost: break
+            # expand the side with the smaller frontier label
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            label, pivot = heapq.heappop(heaps[side])
+            if pivot in isSet[side]: continue
+            isSet[side].add(pivot)
+
+            sideLabels  = labels[side]
+            otherLabels = labels[1-side]
+            for movementIndex, neighbor in adjacency[side][pivot]:
+                if neighbor in isSet[side]: continue
+                if movementMask is not None and not movementMask[movementIndex]: continue
+                newLabel = label + movementCosts[movementIndex]
+                if newLabel < sideLabels.get(neighbor, float('inf')):
+                    sideLabels[neighbor] = newLabel
+                    preds[side][neighbor] = pivot
+                    heapq.heappush(heaps[side], (newLabel, neighbor))
+                    if neighbor in otherLabels and newLabel + otherLabels[neighbor] < bestCost:
+                        bestCost = newLabel + otherLabels[neighbor]
+                        meetLink = neighbor
+
+        if meetLink < 0:
+            return (float('inf'), None)
+
+        path = []
+        linkIndex = meetLink
+        while linkIndex >= 0:
+            path.append(linkIndex)
+            linkIndex = preds[0][linkIndex]
+        path.reverse()
+        linkIndex = preds[1][meetLink]
+        while linkIndex >= 0:
+            path.append(linkIndex)
+            linkIndex = preds[1][linkIndex]
+        return (bestCost, path)
+
+    def labelSettingOnNodes(self, sourceNodeIndex, linkCosts, endNodeIndex=None, linkMask=None,
+                            sourceLabel=0.0, maxLabel=float('inf')):
+        """
+        Dijkstra's label setting shortest path over the node graph, from the node with index *sourceNodeIndex*.
+
+         * *linkCosts* is an array of non-negative costs by link index, e.g. :py:attr:`GraphSnapshot.linkShapeLength`
+         * the search stops once the node with index *endNodeIndex* is set, or once the smallest label
+           exceeds *maxLabel*
+         * if passed, *linkMask* is a boolean array by link index; links for which it is False are not used
+
+        Returns (labels, predLinks), arrays by node index of the cost (infinity if not labeled) and of the index
+        of the link used to reach the node (-1 if none).  Only labels of set nodes are final.
+        """
+        labels, predLinks = labelSetting(self._getNodeAdjacency(),
+                                         np.asarray(linkCosts, dtype=np.float64).tolist(),
+                                         [sourceNodeIndex], [sourceLabel], endIndex=endNodeIndex,
+                                         edgeMask=np.asarray(linkMask, dtype=np.bool_).tolist() if linkMask is not None else None,
+                                         maxLabel=maxLabel, predIsEdge=True)
+        return np.array(labels, dtype=np.float64), np.array(predLinks, dtype=np.int32)
+
+    def labelSettingOnLinks(self, sourceLinkIndices, movementCosts, endLinkIndex=None, movementMask=None,
+                            sourceLabels=None, maxLabel=float('inf')):
+        """
+        Dijkstra's label setting shortest path over the link graph (links connected by movements).
+
+         * *sourceLinkIndices* is a link index or a list of them
+         * *movementCosts* is an array of non-negative costs by movement index, e.g.
+           :py:meth:`GraphSnapshot.getMovementFFTTCosts`.  Following the convention of
+           :py:meth:`ShortestPaths.labelCorrectingWithLabelsOnLinks`, the label of a link is the cost of
+           the movements used to reach it, so a link's own traversal cost belongs in the costs of its
+           outgoing movements.
+         * the search stops once the link with index *endLinkIndex* is set, or once the smallest label
+           exceeds *maxLabel*
+         * if passed, *movementMask* is a boolean array by movement index; movements for which it is False are not used
+         * *sourceLabels*, if passed, are the starting labels for the source links (default zero)
+
+        Returns (labels, predLinks), arrays by link index of the cost (infinity if not labeled) and of the index
+        of the previous link in the path (-1 if none).
+        """
+        if isinstance(sourceLinkIndices, (int, long, np.integer)):
+            sourceLinkIndices = [sourceLinkIndices]
+        if sourceLabels is None:
+            sourceLabels = [0.0] * len(sourceLinkIndices)
+
+        labels, predLinks = labelSetting(self._getLinkAdjacency(),
+                                         np.asarray(movementCosts, dtype=np.float64).tolist(),
+                                         list(sourceLinkIndices), list(sourceLabels), endIndex=endLinkIndex,
+                                         edgeMask=np.asarray(movementMask, dtype=np.bool_).tolist() if movementMask is not None else None,
+                                         maxLabel=maxLabel, predIsEdge=False)
+        return np.array(labels, dtype=np.float64), np.array(predLinks, dtype=np.int32)
+
+    def getReachableNodes(self, sourceNodeIndex, linkMask=None):
+        """
+        Returns a boolean array by node index that is True for the nodes that can be reached from
+        the node with index *sourceNodeIndex* (including itself), using the links allowed by *linkMask*
+        (all links if None).
+        """
+        adjacency = self._getNodeAdjacency()
+        allowed   = np.asarray(linkMask, dtype=np.bool_).tolist() if linkMask is not None else None
+        reached   = [False] * self.getNumNodes()
+        reached[sourceNodeIndex] = True
+
+        nodesToExamine = deque([sourceNodeIndex])
+        while nodesToExamine:
+            pivot = nodesToExamine.popleft()
+            for linkIndex, downstream in adjacency[pivot]:
+                if reached[downstream]: continue
+                if allowed is not None and not allowed[linkIndex]: continue
+                reached[downstream] = True
+                nodesToExamine.append(downstream)
+        return np.array(reached, dtype=np.bool_)
+
+    def hasPath(self, originNodeIndex, destNodeIndex, linkMask=None):
+        """
+        Returns True if there is a path from the node with index *originNodeIndex* to the node
+        with index *destNodeIndex*, using the links allowed by *linkMask* (all links if None).
+        """
+        if originNodeIndex == destNodeIndex: return True
+
+        adjacency = self._getNodeAdjacency()
+        allowed   = np.asarray(linkMask, dtype=np.bool_).tolist() if linkMask is not None else None
+        reached   = set([originNodeIndex])
+        nodesToExamine = [originNodeIndex]
+        while nodesToExamine:
+            pivot = nodesToExamine.pop()
+            for linkIndex, downstream in adjacency[pivot]:
+                if downstream in reached: continue
+                if allowed is not None and not allowed[linkIndex]: continue
+                if downstream == destNodeIndex: return True
+                reached.add(downstream)
+                nodesToExamine.append(downstream)
+        return False
+
+    def getWeaklyConnectedComponents(self):
+        """
+        Returns an array by node index of component numbers, where two nodes have the same number
+        if they are connected when link directions are ignored.  Components are numbered from 0 in
+        order of their smallest node index.
+        """
+        numNodes  = self.getNumNodes()
+        neighbors = [[] for n in xrange(numNodes)]
+        for start, end in zip(self.linkStartNode.tolist(), self.linkEndNode.tolist()):
+            neighbors[start].append(end)
+            neighbors[end].append(start)
+
+        component    = [-1] * numNodes
+        numComponent = 0
+        for root in xrange(numNodes):
+            if component[root] >= 0: continue
+            component[root] = numComponent
+            nodesToExamine  = [root]
+            while nodesToExamine:
+                pivot = nodesToExamine.pop()
+                for neighbor in neighbors[pivot]:
+                    if component[neighbor] < 0:
+                        component[neighbor] = numComponent
+                        nodesToExamine.append(neighbor)
+            numComponent += 1
+        return np.array(component, dtype=np.int32)
+
+    def getStronglyConnectedComponents(self, linkMask=None):
+        """
+        Returns an array by node index of component numbers, where two nodes have the same number if
+        each can be reached from the other, using the links allowed by *linkMask* (all links if None).
+
+        Uses an iterative version of Tarjan's algorithm, which numbers the components in reverse topological
+        order: a link between two different components always goes from a higher number to a lower one.
+        """
+        numNodes   = self.getNumNodes()
+        adjacency  = self._getNodeAdjacency()
+        allowed    = np.asarray(linkMask, dtype=np.bool_).tolist() if linkMask is not None else None
+
+        order      = [-1] * numNodes
+        lowLink    = [0] * numNodes
+        onStack    = [False] * numNodes
+        component  = [-1] * numNodes
+        stack      = []
+        numVisited = 0
+        numComponent = 0
+        for root in xrange(numNodes):
+            if order[root] >= 0: continue
+            order[root] = lowLink[root] = numVisited
+            numVisited += 1
+            stack.append(root)
+            onStack[root] = True
+            # the nodes being explored, with the position of the next of their links to look at
+            nodesToExamine = [(root, 0)]
+            while nodesToExamine:
+                pivot, position = nodesToExamine[-1]
+                links = adjacency[pivot]
+                while position < len(links):
+                    linkIndex, downstream = links[position]
+                    position += 1
+                    if allowed is not None and not allowed[linkIndex]: continue
+                    if order[downstream] < 0: break
+                    if onStack[downstream] and order[downstream] < lowLink[pivot]:
+                        lowLink[pivot] = order[downstream]
+                else:
+                    # done with the pivot's links
+                    nodesToExamine.pop()
+                    if lowLink[pivot] == order[pivot]:
+                        while True:
+                            node = stack.pop()
+                            onStack[node]   = False
+                            component[node] = numComponent
+                            if node == pivot: break
+                        numComponent += 1
+                    if nodesToExamine:
+                        parent = nodesToExamine[-1][0]
+                        if lowLink[pivot] < lowLink[parent]: lowLink[parent] = lowLink[pivot]
+                    continue
+
+                # descend to the downstream node
+                nodesToExamine[-1] = (pivot, position)
+                order[downstream] = lowLink[downstream] = numVisited
+                numVisited += 1
+                stack.append(downstream)
+                onStack[downstream] = True
+                nodesToExamine.append((downstream, 0))
+
+        return np.array(component, dtype=np.int32)
+
+    def getCentroidReachability(self, linkMask=None):
+        """
+        Returns (centroid node indices, reachable) where *reachable* is a square boolean array over the
+        positions in :py:meth:`GraphSnapshot.getCentroidIndices`, with ``reachable[o, d]`` True if there is a path
+        from centroid *o* to centroid *d* using the links allowed by *linkMask* (all links if None), as
+        :py:meth:`GraphSnapshot.hasPath` would say.
+
+        The strongly connected components are found once, and the set of centroids reachable from each of them
+        is built up over the condensation graph in reverse topological order, as bits of a python integer.
+        """
+        centroidIndices = self.getCentroidIndices()
+        numCentroids    = len(centroidIndices)
+        reachable       = np.zeros((numCentroids, numCentroids), dtype=np.bool_)
+        if numCentroids == 0:
+            return centroidIndices, reachable
+
+        component     = self.getStronglyConnectedComponents(linkMask)
+        numComponents = int(component.max()) + 1
+
+        # the links of the condensation graph, without duplicates, grouped by upstream component
+        links = np.arange(self.getNumLinks()) if linkMask is None else np.flatnonzero(linkMask)
+        upstream   = component[self.linkStartNode[links]].astype(np.int64)
+        downstream = component[self.linkEndNode[links]].astype(np.int64)
+        metaLinks  = np.unique((upstream * numComponents + downstream)[upstream != downstream])
+        metaDownstream, metaPointer = GraphSnapshot._toCSR(metaLinks // numComponents, numComponents)
+        metaDownstream = (metaLinks % numComponents)[metaDownstream].tolist()
+        metaPointer    = metaPointer.tolist()
+
+        # downstream components have lower numbers, so they're complete when they're used
+        reach = [0] * numComponents
+        for position, nodeIndex in enumerate(centroidIndices.tolist()):
+            reach[component[nodeIndex]] |= 1 << position
+        for metaNode in xrange(numComponents):
+            bits = reach[metaNode]
+            for downstreamMetaNode in metaDownstream[metaPointer[metaNode]:metaPointer[metaNode+1]]:
+                bits |= reach[downstreamMetaNode]
+            reach[metaNode] = bits
+
+        numHexDigits = 2 * ((numCentroids + 7) // 8)
+        for position, nodeIndex in enumerate(centroidIndices.tolist()):
+            packed = np.frombuffer(binascii.unhexlify('%0*x' % (numHexDigits, reach[component[nodeIndex]])), dtype=np.uint8)
+            reachable[position] = np.unpackbits(packed)[::-1][:numCentroids]
+        return centroidIndices, reachable
@@ -20,15 +20,14 @@ import pdb
 import copy
 import math
 from itertools import izip
-from collections import defaultdict
 
 from .DtaError import DtaError
 from .Logger import DtaLogger
 from .Node import Node
 from .RoadNode import RoadNode
 from .VehicleClassGroup import VehicleClassGroup
+from .SimResultStore import SimResultStore
 from .Utils import getMidPoint, lineSegmentsCross, polylinesCross
-from .Algorithms import pairwise
 
 class Movement(object):
     """
@@ -119,13 +118,11 @@ class Movement(object):
         self._followupTime  = followupTime
         self._overrideTurnType = None
         
-        self._centerline    = self.getCenterLine()
-        
         self._higherPriorityMovements = [] # list of (Movement, CriticalGapTime(sec), CriticalWaitTime(sec)
         
-        self._simOutVolume  = defaultdict(int)      # indexed by timeperiod
-        self._simInVolume   = defaultdict(int)      # indexed by timeperiod
-        self._simMeanTT     = defaultdict(float)    # indexed by timeperiod
+        # simulated volumes and travel times: a SimResultStore and the row of this movement in it
+        self._simResults    = None
+        self._simRow        = None
         
         # TODO: what is this used for?!      
         self._penalty   = 0
@@ -137,6 +134,8 @@ class Movement(object):
         self.simEndTimeInMin = None
 
         self._obsCount = {}
+        # counts read from count files: list of (ObsCountStore, row)
+        self._obsCountRows = []
         
     def __repr__(self):
         return "Movement node:%d inlink:%d outlink:%d" % (self._node.getId(), self._incomingLink.getId(), self._outgoingLink.getId())
@@ -438,6 +437,24 @@ class Movement(object):
             raise DtaError('Time period from %d to %d is out of '
                                    'simulation time' % (startTimeInMin, endTimeInMin))
         
+    def setSimResultRow(self, simResults, row):
+        """
+        Stores the simulated volumes and travel times of this movement in row *row* of the
+        :py:class:`SimResultStore` *simResults*; see :py:meth:`Network.initializeSimResults`.
+        """
+        self._simResults    = simResults
+        self._simRow        = row
+
+    def _getSimResultRow(self):
+        """
+        Returns (:py:class:`SimResultStore`, row) for this movement, creating a store of its own if it
+        wasn't given a row in a network-wide one.
+        """
+        if self._simResults is None:
+            self.setSimResultRow(SimResultStore(self.simStartTimeInMin, self.simEndTimeInMin, self.simTimeStepInMin), 0)
+            self._simResults.addRow()
+        return self._simResults, self._simRow
+
     def getSimOutVolume(self, startTimeInMin, endTimeInMin):
         """
         Return the outgoing flow from the start to end
@@ -446,11 +463,8 @@ class Movement(object):
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkOutputTimeStep(startTimeInMin, endTimeInMin)
 
-        result = 0
-        for stTime, enTime in pairwise(range(startTimeInMin, endTimeInMin + 1, 
-                                             self.simTimeStepInMin)):
-            result += self._simOutVolume[stTime, enTime]
-        return result
+        if self._simResults is None: return 0
+        return self._simResults.getOutVolume(self._simRow, startTimeInMin, endTimeInMin)
 
     def getSimOutFlow(self, startTimeInMin, endTimeInMin):
         """
@@ -467,11 +481,8 @@ class Movement(object):
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkOutputTimeStep(startTimeInMin, endTimeInMin)
 
-        result = 0
-        for stTime, enTime in pairwise(range(startTimeInMin, endTimeInMin + 1, 
-                                             self.simTimeStepInMin)):
-            result += self._simInVolume[stTime, enTime]
-        return result
+        if self._simResults is None: return 0
+        return self._simResults.getInVolume(self._simRow, startTimeInMin, endTimeInMin)
 
     def getSimInFlow(self, startTimeInMin, endTimeInMin):
         """Get the simulated flow for the specified time period 
@@ -487,29 +498,17 @@ class Movement(object):
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkOutputTimeStep(startTimeInMin, endTimeInMin)
 
-        totalFlow = 0
-        totalTime = 0
-        
-        if (startTimeInMin, endTimeInMin) in self._simMeanTT:
-            return self._simMeanTT[startTimeInMin, endTimeInMin]
-
-        for (stTime, enTime), flow in self._simOutVolume.iteritems():
-            if stTime >= startTimeInMin and enTime <= endTimeInMin:
-                binTT = self._simMeanTT[(stTime, enTime)]
-
-                if binTT > 0 and flow > 0:
-                    totalFlow += flow
-                    totalTime += self._simMeanTT[(stTime, enTime)] * flow
-                elif binTT == 0 and flow == 0:
-                    continue
-                else:
-                    raise DtaError("Movement %s has flow:%f and TT:%f "
-                                           "for time period from %d to %d"  % 
-                                           (self.getId(), flow, binTT, 
-                                            startTimeInMin, endTimeInMin))
-
-        if totalFlow > 0:
-            return totalTime / float(totalFlow) + self._penalty
+        meanTT = None
+        if self._simResults is not None:
+            # the travel time set for exactly this time step
+            if endTimeInMin - startTimeInMin == self.simTimeStepInMin:
+                stepTT = self._simResults.getMeanTTOfStep(self._simRow, startTimeInMin, endTimeInMin)
+                if stepTT > 0: return stepTT
+            
+            totalFlow, meanTT = self._simResults.getMeanTT(self._simRow, startTimeInMin, endTimeInMin,
+                                                           "Movement %s" % self.getId())
+        if meanTT is not None:
+            return meanTT + self._penalty
         else:
             return (self._incomingLink.getLength() / 
                 float(self._incomingLink.getFreeFlowSpeedInMPH()) * 60 + self._penalty)
@@ -546,6 +545,13 @@ class Movement(object):
         period = int((timeInMin - self.simStartTimeInMin) // self._timeStep)
         return self._timeVaryingCosts[period]
 
+    def getTimeVaryingCosts(self):
+        """
+        Return the list of costs (in min) by time period, as set by
+        :py:meth:`Movement.setTimeVaryingCosts`; empty if none were set
+        """
+        return self._timeVaryingCosts
+
     def getTimeVaryingCostTimeStep(self):
         """
         Return the time step that is used for the time varying costs
@@ -559,7 +565,8 @@ class Movement(object):
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkInputTimeStep(startTimeInMin, endTimeInMin)
 
-        self._simOutVolume[startTimeInMin, endTimeInMin] = flow
+        simResults, row = self._getSimResultRow()
+        simResults.setOutVolume(row, startTimeInMin, endTimeInMin, flow)
 
     def setSimInVolume(self, startTimeInMin, endTimeInMin, flow):
         """
@@ -568,7 +575,8 @@ class Movement(object):
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkInputTimeStep(startTimeInMin, endTimeInMin)
 
-        self._simInVolume[startTimeInMin, endTimeInMin] = flow
+        simResults, row = self._getSimResultRow()
+        simResults.setInVolume(row, startTimeInMin, endTimeInMin, flow)
 
     def setSimTTInMin(self, startTimeInMin, endTimeInMin, averageTTInMin):
         """
@@ -593,7 +601,8 @@ class Movement(object):
         if self.getSimOutFlow(startTimeInMin, endTimeInMin) == 0:
             raise DtaError('Cannot set the travel time on a movement with zero flow')
 
-        self._simMeanTT[startTimeInMin, endTimeInMin] = averageTTInMin
+        simResults, row = self._getSimResultRow()
+        simResults.setMeanTT(row, startTimeInMin, endTimeInMin, averageTTInMin)
 
     def setTimeVaryingCosts(self, timeVaryingCosts, timeStep):
         """
@@ -668,14 +677,26 @@ class Movement(object):
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkOutputTimeStep(startTimeInMin, endTimeInMin)
 
-        try:
-            return self._obsCount[startTimeInMin, endTimeInMin]            
-        except KeyError:
-            return None
+        if (startTimeInMin, endTimeInMin) in self._obsCount:
+            return self._obsCount[startTimeInMin, endTimeInMin]
+        # the count files read last take precedence
+        for obsCounts, row in reversed(self._obsCountRows):
+            count = obsCounts.getObsCount(row, startTimeInMin, endTimeInMin)
+            if count is not None:
+                return count
+        return None
+
+    def addObsCountRow(self, obsCounts, row):
+        """
+        Adds the counts of the movement by time bin in *row* of *obsCounts*, an :py:class:`ObsCountStore`.
+        The count of any window made of whole bins is then available from :py:meth:`Movement.getObsCount`;
+        counts set with :py:meth:`Movement.setObsCount` take precedence.
+        """
+        self._obsCountRows.append((obsCounts, row))
 
     def hasCountInfo(self):
         """Return True if the movement contains count information else false"""
-        return True if len(self._obsCount) else False
+        return True if len(self._obsCount) or len(self._obsCountRows) else False
 
     def hasObsCount(self, startTimeInMin, endTimeInMin):
         """Return True if there is a count for the input time period  
@@ -65,7 +65,47 @@ class CrossProduct(object):
 
 class MultiArray(object):
     """Multidimentinal array of custom numpy data types supporting
-    string indices, arbitrary slicing and aggregation"""
+    string indices, arbitrary slicing and aggregation.
+
+    The data is either in memory or memory mapped from a file written by
+    :py:meth:`MultiArray.writeMapped` (see :py:meth:`MultiArray.openMapped`),
+    in which case slices are views of the file and the reductions
+    (:py:meth:`MultiArray.getSum`, :py:meth:`MultiArray.eliminateDimention`)
+    read it in chunks of about :py:attr:`MultiArray.CHUNK_BYTES`."""
+
+    #: The number of bytes of the chunks of data read by the reductions and written by
+    #: :py:meth:`MultiArray.writeMapped`
+    CHUNK_BYTES = 64 * 1024 * 1024
+
+    #: The modes of :py:meth:`MultiArray.openMapped`: read-only, copy-on-write and read-write
+    MAPPED_MODES = ["r", "c", "r+"]
+
+    #: The reductions of :py:meth:`MultiArray.groupBy`, by name
+    REDUCTIONS = {"sum":np.add, "mean":np.add, "max":np.maximum, "min":np.minimum}
+
+    # (file name, mode) of the arrays opened with openMapped
+    _mapping = None
+
+    @classmethod
+    def _getLabelsFileName(cls, fileName):
+        """Return the name of the file with the dimention elements of the mapped array *fileName*"""
+        return fileName + ".labels"
+
+    @classmethod
+    def openMapped(cls, fileName, mode="r"):
+        """Open the array written with :py:meth:`MultiArray.writeMapped` in *fileName*
+        without reading its data: *mode* is "r" for read-only, "c" for copy-on-write
+        (changes stay in memory) or "r+" to write the changes to the file"""
+        if mode not in MultiArray.MAPPED_MODES:
+            raise ValueError("Invalid mode %s for a mapped MultiArray; use one of %s" %
+                             (mode, str(MultiArray.MAPPED_MODES)))
+        inputStream = open(MultiArray._getLabelsFileName(fileName), 'rb')
+        labels = pickle.load(inputStream)
+        inputStream.close()
+        data = np.load(fileName, mmap_mode=mode)
+        ma = MultiArray(data.dtype, labels["dimElements"], numpyArray=data, dimNames=labels["dimNames"])
+        ma._mapping = (fileName, mode)
+        return ma
 
     @classmethod
     def unpickle(cls, fileName):
@@ -87,8 +127,11 @@ class MultiArray(object):
         ma = MultiArray('d', dimElements, numpyArray=numpyArray)
         return ma
         
-    def __init__(self, dtype, dimElements, numpyArray=None, isBase=True):
-        
+    def __init__(self, dtype, dimElements, numpyArray=None, isBase=True, dimNames=None):
+        """*dimNames* is the optional list of the names of the dimentions, e.g.
+        ["time", "origin", "destination"], by which the methods taking a dimention
+        index (:py:meth:`MultiArray.getDimIndex`) can also address them"""
+
         #TODO: you should check that all the elelmets of a dimention 
         # have the same type
         self._shape = tuple(map(len, dimElements))        
@@ -96,7 +139,7 @@ class MultiArray(object):
             # you instantiate a numpy array 
             self._data = np.zeros(self._shape, dtype=dtype)
         elif len(dimElements) > 0 and numpyArray is not None:
-            if type(numpyArray) != np.ndarray:
+            if not isinstance(numpyArray, np.ndarray):
                 raise ValueError("A numpy array is expected")
             if numpyArray.shape != self._shape:
                 raise ValueError("The shape of the numpy array provided: %s is not "
@@ -110,13 +153,98 @@ class MultiArray(object):
         # the translation is a list dict of pairs dimElements found in the *args and 
         # their index. Example HBW:0, HBO:1....
         self._translation = [dict(izip(element, count())) for element in dimElements]
+        # by dimention, the (sorted labels, their indices) arrays used to translate label arrays
+        self._lookups = [None] * len(dimElements)
+        if dimNames is None:
+            dimNames = [None] * len(dimElements)
+        names = [name for name in dimNames if name is not None]
+        if len(dimNames) != len(dimElements) or len(set(names)) != len(names):
+            raise ValueError("The dimention names %s are not one distinct name by dimention" % str(dimNames))
+        self._dimNames = list(dimNames)
         self._base = isBase
         self._elementsOfAllDimentions = self.getElementsOfAllDimentions()
 
+    def __getstate__(self):
+        """A mapped array is pickled as its file name and mode instead of its data,
+        except a copy-on-write one, whose changes are only in memory: it is pickled
+        with its data and unpickled as an array in memory"""
+        state = self.__dict__.copy()
+        state["_lookups"] = [None] * len(self._translation)
+        if self._mapping is not None:
+            fileName, mode = self._mapping
+            if mode == "c":
+                state["_data"] = np.array(self._data)
+                state["_mapping"] = None
+            else:
+                if mode == "r+":
+                    self._data.flush()
+                del state["_data"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("_lookups", [None] * len(self._translation))
+        self.__dict__.setdefault("_dimNames", [None] * len(self._translation))
+        if self._mapping is not None:
+            fileName, mode = self._mapping
+            self._data = np.load(fileName, mmap_mode=mode)
+
+    def isMapped(self):
+        """Return True if the data is memory mapped from a file"""
+        return isinstance(self._data, np.memmap)
+
+    def writeMapped(self, fileName):
+        """Write the array to *fileName* in the numpy .npy format, and its dimention
+        elements next to it, to be opened with :py:meth:`MultiArray.openMapped`. The
+        data is copied in chunks, so a mapped array is written in bounded memory"""
+        outputStream = open(MultiArray._getLabelsFileName(fileName), 'wb')
+        pickle.dump({"dimElements":[list(elements) for elements in self.getElementsOfAllDimentions()],
+                     "dimNames":self.getDimNames()}, outputStream)
+        outputStream.close()
+        if self._data.size == 0:
+            outputStream = open(fileName, 'wb')
+            np.save(outputStream, self._data)
+            outputStream.close()
+            return
+        output = np.lib.format.open_memmap(fileName, mode="w+", dtype=self._data.dtype, shape=self._shape)
+        for start, stop in self._iterChunkBounds():
+            output[start:stop] = self._data[start:stop]
+        output.flush()
+        del output
+
+    def _iterChunkBounds(self):
+        """Yield the (start, stop) bounds along the first dimention of the chunks of
+        about :py:attr:`MultiArray.CHUNK_BYTES` bytes that make up the data"""
+        rowBytes = self._data.itemsize * int(np.prod(self._shape[1:]))
+        rowsPerChunk = max(1, MultiArray.CHUNK_BYTES // max(1, rowBytes))
+        for start in xrange(0, self._shape[0], rowsPerChunk):
+            yield start, min(start + rowsPerChunk, self._shape[0])
+
     def getNumDim(self):
         """Return the number of dimentions"""
         return len(self._shape)
 
+    def getDimNames(self):
+        """Return the list of the names of the dimentions (None for the unnamed ones)"""
+        return list(self._dimNames)
+
+    def setDimNames(self, dimNames):
+        """Set the names of the dimentions"""
+        names = [name for name in dimNames if name is not None]
+        if len(dimNames) != self.getNumDim() or len(set(names)) != len(names):
+            raise ValueError("The dimention names %s are not one distinct name by dimention" % str(dimNames))
+        self._dimNames = list(dimNames)
+
+    def getDimIndex(self, dim):
+        """Return the index of the dimention *dim*, given by its name or index"""
+        if isinstance(dim, (int, long, np.integer)):
+            if dim < 0 or dim >= self.getNumDim():
+                raise ValueError("Dim Index %d out of range (0, %d)" % (dim, self.getNumDim() - 1))
+            return int(dim)
+        if dim not in self._dimNames:
+            raise ValueError("The MultiArray has no dimention named %s" % str(dim))
+        return self._dimNames.index(dim)
+
     def getShape(self):
         """Return a tupble of integers indicating the size of the array in 
         each dimention"""
@@ -162,6 +290,7 @@ class MultiArray(object):
             newElement = oldElementsToNew[oldElement]
             newMapping[newElement] = internalIndex
         self._translation[dimIndex] = newMapping
+        self._lookups[dimIndex] = None
         
     def __str__(self):
         """Convert the array into its string numpy representation"""
@@ -218,29 +347,133 @@ class MultiArray(object):
         return tuple([self._translateElement(dimIndex, elem) \
                     for dimIndex, elem in enumerate(args)])
 
+    def _getLookup(self, dimIndex):
+        """Return the (sorted labels, indices) arrays of the dimention or None
+        if its labels cannot be sorted as a one dimentional numpy array"""
+        if self._lookups[dimIndex] is None:
+            labels, indices = zip(*self._translation[dimIndex].iteritems())
+            labels = np.array(labels)
+            if labels.ndim != 1 or labels.dtype == np.object_:
+                self._lookups[dimIndex] = (None, None)
+            else:
+                order = np.argsort(labels, kind="mergesort")
+                self._lookups[dimIndex] = (labels[order], np.array(indices, dtype=np.int64)[order])
+        return self._lookups[dimIndex]
+
+    def _translateLabels(self, dimIndex, labels):
+        """Return the array of the indices of the array of *labels* of the
+        dimention; a boolean array of the length of the dimention is a mask
+        of the indices to return"""
+        labels = np.asarray(labels)
+        if labels.dtype == np.bool_ and labels.shape == (self._shape[dimIndex],):
+            return np.flatnonzero(labels)
+        sortedLabels, indices = self._getLookup(dimIndex)
+        if sortedLabels is None or labels.dtype == np.object_ or \
+                (labels.dtype.kind in "SU") != (sortedLabels.dtype.kind in "SU"):
+            return np.array([self._translateElement(dimIndex, label) for label in labels.flat],
+                            dtype=np.int64).reshape(labels.shape)
+        positions = np.minimum(np.searchsorted(sortedLabels, labels), len(sortedLabels) - 1)
+        found = sortedLabels[positions] == labels
+        if not np.all(found):
+            raise IndexError("Dim %d does not have element %s" %
+                             (dimIndex, str(labels[~found].flat[0])))
+        return indices[positions]
+
+    def _translateLabelArrays(self, labels):
+        """Return the tuple of the index arrays of the parallel label arrays, one by dimention"""
+        if len(labels) != self.getNumDim():
+            raise IndexError("Invalid Index dimentions")
+        return tuple(self._translateLabels(dimIndex, dimLabels) for dimIndex, dimLabels in enumerate(labels))
+
+    def _translateListView(self, viewElements):
+        """Translate a view with label lists or boolean masks (and possibly
+        single elements and slices) to (index arrays for numpy.ix_, new dimention
+        elements). Single elements are kept as one element dimentions whose new
+        elements are None"""
+        indexArrays = []
+        newDimElements = []
+        for dimIndex, viewElement in enumerate(viewElements):
+            elements = self.getElementsOfDimention(dimIndex)
+            if isinstance(viewElement, slice):
+                if viewElement.step is not None:
+                    raise IndexError("Strides are not supported (yet)")
+                baseStart = None if viewElement.start is None else self._translateElement(dimIndex, viewElement.start)
+                baseStop = None if viewElement.stop is None else self._translateElement(dimIndex, viewElement.stop)
+                indices = np.arange(self._shape[dimIndex])[baseStart:baseStop]
+            elif isinstance(viewElement, (list, tuple, np.ndarray)):
+                indices = self._translateLabels(dimIndex, viewElement)
+            else:
+                indices = np.array([self._translateElement(dimIndex, viewElement)], dtype=np.int64)
+                newDimElements.append(None)
+                indexArrays.append(indices)
+                continue
+            indexArrays.append(indices)
+            newDimElements.append([elements[index] for index in indices])
+        return indexArrays, newDimElements
+
     def __getitem__(self, viewElements):
 
+        #the fast path of an individual element: return its python value
+        if isinstance(viewElements, tuple) and len(viewElements) == len(self._translation):
+            try:
+                return self._data.item(*[translation[element] for translation, element
+                                         in izip(self._translation, viewElements)])
+            except (KeyError, TypeError):
+                pass
+
         #if you have a one dimentional array
         if isinstance(viewElements, str) or isinstance(viewElements, int):
             if self.getNumDim() != 1:
                 raise IndexError("Invalid Index")
-            return deepcopy(self._data.item(self._translateElement(0, viewElements)))
+            return self._data.item(self._translateElement(0, viewElements))
         
         if len(viewElements) != self.getNumDim():
             raise IndexError("Invalid Index")
         
-        #if instead of a slice a list is entered raise an error
-        if any(viewElements, pred=lambda elem: isinstance(elem, list)):
-            raise ValueError("Not implemented yet")
+        #if label lists or masks are entered return a new MultiArray with a copy of
+        #the cross product of the selected elements
+        if any(viewElements, pred=lambda elem: isinstance(elem, (list, np.ndarray))):
+            indexArrays, newDimElements = self._translateListView(viewElements)
+            data = self._data[np.ix_(*indexArrays)]
+            keptDims = [dim for dim, elements in enumerate(newDimElements) if elements is not None]
+            data = data.reshape([data.shape[dim] for dim in keptDims])
+            if not keptDims:
+                return data.item()
+            return MultiArray("d", [newDimElements[dim] for dim in keptDims], numpyArray=data,
+                              dimNames=[self._dimNames[dim] for dim in keptDims])
         #if any of the indices entered is a slice then translate the slice and return a new MultiArray
         #with a referece to the data
         elif any(viewElements, pred=lambda elem: isinstance(elem, slice)):
             viewObj, newDimElements = self._translateViewObject(viewElements)
-            return MultiArray("d", newDimElements, numpyArray=self._data[viewObj], isBase=False)
-        #if no slice object is ented => the user has asked for an individual element. So,
-        #return a deepcopy of the element
+            dimNames = [name for name, elem in izip(self._dimNames, viewObj) if isinstance(elem, slice)]
+            return MultiArray("d", newDimElements, numpyArray=self._data[viewObj], isBase=False,
+                              dimNames=dimNames)
+        #if no slice object is ented => the user has asked for an individual element
         else:
-            return deepcopy(self._data.item(*self._translateElements(*viewElements)))
+            return self._data.item(*self._translateElements(*viewElements))
+
+    def getMany(self, labels):
+        """Return the array of the values of the cells given by *labels*, a
+        sequence of parallel label arrays, one by dimention"""
+        return self._data[self._translateLabelArrays(labels)]
+
+    def setMany(self, labels, values):
+        """Set the cells given by *labels*, a sequence of parallel label arrays
+        one by dimention, to *values* (an array of the same length or a scalar).
+        If a cell is given more than once, its last value is kept"""
+        self._data[self._translateLabelArrays(labels)] = values
+
+    def addMany(self, labels, values):
+        """Add *values* to the cells given by *labels*, a sequence of parallel
+        label arrays one by dimention; the values of a cell given more than once
+        are summed"""
+        indices = self._translateLabelArrays(labels)
+        flatIndices = np.ravel_multi_index(indices, self._shape)
+        values = np.broadcast_to(np.asarray(values, dtype=np.float64), flatIndices.shape)
+        cells, inverse = np.unique(flatIndices, return_inverse=True)
+        sums = np.bincount(inverse.ravel(), weights=values.ravel(), minlength=len(cells))
+        cellIndices = np.unravel_index(cells, self._shape)
+        self._data[cellIndices] += sums.astype(self._data.dtype)
 
     def _translateViewObject(self, eViewObject):
         """Translate the external view object to the internal one"""
@@ -267,15 +500,29 @@ class MultiArray(object):
                 newDimElements.append(elements)
             else:
                 translatedViewObj.append(self._translateElement(dimIndex, viewElement))
-        return translatedViewObj, newDimElements
+        return tuple(translatedViewObj), newDimElements
 
     def __setitem__(self, viewElements, value):
 
+        #the fast path of an individual element
+        if isinstance(viewElements, tuple) and len(viewElements) == len(self._translation):
+            try:
+                self._data.itemset(*([translation[element] for translation, element
+                                      in izip(self._translation, viewElements)] + [value]))
+                return
+            except (KeyError, TypeError):
+                pass
+
         if len(viewElements) != self.getNumDim():
             raise IndexError("Invalid Index dimentions")
 
-        if any(viewElements, pred=lambda elem: isinstance(elem, list)):
-            raise ValueError("Not implemented yet")
+        if any(viewElements, pred=lambda elem: isinstance(elem, (list, np.ndarray))):
+            indexArrays, newDimElements = self._translateListView(viewElements)
+            if isinstance(value, MultiArray):
+                value = value.getNumpyArray()
+            view = np.ix_(*indexArrays)
+            selectedShape = tuple(len(indices) for indices in indexArrays)
+            self._data[view] = np.reshape(value, selectedShape) if np.ndim(value) else value
         elif any(viewElements, pred=lambda elem: isinstance(elem, slice)):
             viewObj, newDimElements = self._translateViewObject(viewElements)
             if isinstance(value, MultiArray):
@@ -351,13 +598,134 @@ class MultiArray(object):
         for element in CrossProduct(elems):
             yield element, self[element]
 
+    def _withoutDimention(self, dimIndex, data):
+        """Return the MultiArray of *data*, the array without the dimention *dimIndex*,
+        or its value if it has no dimentions left"""
+        if self.getNumDim() == 1:
+            return np.asarray(data).item()
+        newDimElements = list(self.getElementsOfAllDimentions())
+        newDimElements.pop(dimIndex)
+        dimNames = list(self._dimNames)
+        dimNames.pop(dimIndex)
+        return MultiArray(data.dtype, newDimElements, numpyArray=np.asarray(data), dimNames=dimNames)
+
+    def _reduceDimention(self, dim, ufunc):
+        """Return the reduction of the dimention *dim* with the numpy *ufunc*, by
+        chunks along the first dimention"""
+        dimIndex = self.getDimIndex(dim)
+        if self._shape[0] == 0:
+            # no chunks, the empty data is reduced at once
+            reduced = ufunc.reduce(self._data, axis=dimIndex)
+        elif dimIndex == 0:
+            reduced = reduce(ufunc, (ufunc.reduce(self._data[start:stop], axis=0)
+                                     for start, stop in self._iterChunkBounds()))
+        else:
+            reduced = np.concatenate([ufunc.reduce(self._data[start:stop], axis=dimIndex)
+                                      for start, stop in self._iterChunkBounds()])
+        return self._withoutDimention(dimIndex, reduced)
+
     def eliminateDimention(self, dimIndex):
         """Return the sum accross dimention dimIndex"""
-        dimElements = self.getElementsOfDimention(dimIndex)
-        marginals = self._data.sum(dimIndex)
+        return self.sumOver(dimIndex)
+
+    def sumOver(self, dim):
+        """Return the sum over the dimention *dim* (a name or an index), a MultiArray
+        with the other dimentions"""
+        return self._reduceDimention(dim, np.add)
+
+    def meanOver(self, dim):
+        """Return the mean over the dimention *dim* (a name or an index)"""
+        return self._reduceDimention(dim, np.add) / float(self._shape[self.getDimIndex(dim)])
+
+    def maxOver(self, dim):
+        """Return the maximum over the dimention *dim* (a name or an index)"""
+        return self._reduceDimention(dim, np.maximum)
+
+    def minOver(self, dim):
+        """Return the minimum over the dimention *dim* (a name or an index)"""
+        return self._reduceDimention(dim, np.minimum)
+
+    def groupBy(self, dim, elementToGroup, how="sum"):
+        """Return the MultiArray whose dimention *dim* (a name or an index) has the
+        groups of its elements instead of the elements, e.g. districts instead of
+        zones or peak periods instead of time slices.
+
+        *elementToGroup* is a dictionary from element to group; the elements that
+        are not in it are left out. *how* is the reduction of the elements of a
+        group, one of :py:attr:`MultiArray.REDUCTIONS`. The groups are sorted.
+        The data is read in chunks along the first dimention, as by the other
+        reductions, and each run of consecutive elements of the same group is
+        reduced in place in its chunk before the runs are combined by group, so
+        the data is not copied even when the elements of a group are scattered."""
+        if how not in MultiArray.REDUCTIONS:
+            raise ValueError("Unknown reduction %s; use one of %s" % (how, str(sorted(MultiArray.REDUCTIONS))))
+        ufunc = MultiArray.REDUCTIONS[how]
+        dimIndex = self.getDimIndex(dim)
+
+        elements = self.getElementsOfDimention(dimIndex)
+        positions = np.array([position for position, element in enumerate(elements)
+                              if element in elementToGroup], dtype=np.int64)
+        if len(positions) == 0:
+            raise ValueError("None of the elements of dimention %s has a group" % str(dim))
+        groups = sorted(set(elementToGroup[elements[position]] for position in positions))
+        groupIndex = dict(izip(groups, count()))
+        codes = np.array([groupIndex[elementToGroup[elements[position]]] for position in positions], dtype=np.int64)
+
+        # the runs [runStarts, runStops) of consecutive elements of the same group, in order
+        breaks = np.flatnonzero((np.diff(positions) != 1) | (np.diff(codes) != 0)) + 1
+        firsts = np.concatenate([[0], breaks])
+        runStarts = positions[firsts]
+        runStops = positions[np.concatenate([breaks, [len(positions)]]) - 1] + 1
+        runCodes = codes[firsts]
+
+        def reduceRuns(data, starts, stops):
+            # reduceat reduces between consecutive boundaries, which include the ends of the runs
+            boundaries = np.union1d(starts, stops[stops < data.shape[dimIndex]])
+            segments = ufunc.reduceat(data, boundaries, axis=dimIndex)
+            return np.take(segments, np.searchsorted(boundaries, starts), axis=dimIndex)
+
+        if dimIndex == 0:
+            # the runs are cut by the chunks, and their parts combined by group
+            reduced = None
+            reducedGroups = np.zeros(len(groups), dtype=np.bool_)
+            for start, stop in self._iterChunkBounds():
+                inChunk = (runStarts < stop) & (runStops > start)
+                if not inChunk.any(): continue
+                partials = reduceRuns(self._data[start:stop], np.maximum(runStarts[inChunk], start) - start,
+                                      np.minimum(runStops[inChunk], stop) - start)
+                if reduced is None:
+                    reduced = np.empty((len(groups),) + partials.shape[1:], dtype=partials.dtype)
+                for partial, code in izip(partials, runCodes[inChunk].tolist()):
+                    if reducedGroups[code]:
+                        reduced[code] = ufunc(reduced[code], partial)
+                    else:
+                        reduced[code] = partial
+                        reducedGroups[code] = True
+        else:
+            # the runs of a group are combined in the order of the groups, unless they already are
+            order = np.argsort(runCodes, kind="mergesort")
+            inGroupOrder = (np.diff(runCodes) >= 0).all()
+            groupStarts = np.flatnonzero(np.concatenate([[True], np.diff(runCodes[order]) != 0]))
+            def reduceGroups(data):
+                runs = reduceRuns(data, runStarts, runStops)
+                if not inGroupOrder:
+                    runs = np.take(runs, order, axis=dimIndex)
+                if len(runCodes) == len(groups):
+                    return runs
+                return ufunc.reduceat(runs, groupStarts, axis=dimIndex)
+
+            reduced = np.concatenate([reduceGroups(self._data[start:stop])
+                                      for start, stop in (list(self._iterChunkBounds()) or [(0, 0)])])
+        reduced = np.asarray(reduced)
+        if how == "mean":
+            sizes = np.bincount(codes, minlength=len(groups)).astype(np.float64)
+            shape = [1] * self.getNumDim()
+            shape[dimIndex] = len(groups)
+            reduced = reduced / sizes.reshape(shape)
+
         newDimElements = list(self.getElementsOfAllDimentions())
-        newDimElements.pop(dimIndex)
-        return MultiArray(self._data.dtype, newDimElements, numpyArray=marginals )
+        newDimElements[dimIndex] = groups
+        return MultiArray(reduced.dtype, newDimElements, numpyArray=reduced, dimNames=self._dimNames)
     
     def __mul__(self, scalarValue):
         """Return a new multiArray with its values multiplied by the 
@@ -367,7 +735,7 @@ class MultiArray(object):
         #same size? Well if it does not how are you going to name the new dimentions?
         
         newData = self._data * scalarValue
-        return MultiArray("d", self._elementsOfAllDimentions, newData)
+        return MultiArray("d", self._elementsOfAllDimentions, newData, dimNames=self._dimNames)
 
     def __div__(self, scalarValue):
         """Return a new multiArray with its values divided by the proded
@@ -391,7 +759,7 @@ class MultiArray(object):
             newData = self._data + value._data
         else:
             raise ValueError("I cannot add %s and a MultiArray" % str(type(value)))
-        return MultiArray("d", self._elementsOfAllDimentions, newData)
+        return MultiArray("d", self._elementsOfAllDimentions, newData, dimNames=self._dimNames)
 
     def __sub__(self, value):
         """Add a scalar or a MultiArray to this array and 
@@ -407,7 +775,7 @@ class MultiArray(object):
             newData = self._data - value._data
         else:
             raise ValueError("I cannot add %s and a MultiArray" % str(type(value)))
-        return MultiArray("d", self._elementsOfAllDimentions, newData)
+        return MultiArray("d", self._elementsOfAllDimentions, newData, dimNames=self._dimNames)
 
     def multiplyInPlace(self, value):
         """Multiply all the items of the array with the provided value"""
@@ -419,7 +787,9 @@ class MultiArray(object):
 
     def getSum(self):
         """return the sum of all the items in the array"""
-        return np.sum(self._data)
+        if self._shape[0] == 0:
+            return np.sum(self._data)
+        return sum(np.sum(self._data[start:stop]) for start, stop in self._iterChunkBounds())
 
 #        if self._base == True:
 #            return np.sum(self._data)
@@ -434,65 +804,109 @@ class MultiArray(object):
         
         raise ValueError("not implemented yet")
         copyData = self._data.copy()
-        return MultiArray("d", self._elementsOfAllDimentions, copyData)
-
-    def expand(self, alphaToBeta):
-        """Expands the current dimentions of multiArray.
+        return MultiArray("d", self._elementsOfAllDimentions, copyData, dimNames=self._dimNames)
 
-        Input a numpy array with the following fields "alpha", "beta", "percentage"
-        Output: a new Multi Array 
+    @classmethod
+    def _getCorrespondence(cls, alphaToBeta):
+        """Return (alpha labels, beta labels, alpha index, beta index, percentages)
+        for the rows of the *alphaToBeta* numpy array with the fields "alpha", "beta"
+        and "percentage", the coordinate form of the sparse alpha x beta share matrix.
+        The labels are in the order of their first row."""
+        if len(alphaToBeta) == 0:
+            raise ValueError("The alpha to beta correspondence is empty")
+
+        def labelsAndIndices(column):
+            labels, first, inverse = np.unique(column, return_index=True, return_inverse=True)
+            order = np.argsort(first, kind="mergesort")
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            return labels[order].tolist(), rank[inverse]
+
+        alphas, alphaIndex = labelsAndIndices(alphaToBeta["alpha"])
+        betas, betaIndex = labelsAndIndices(alphaToBeta["beta"])
+        percentages = np.asarray(alphaToBeta["percentage"], dtype=np.float64)
+        return alphas, betas, alphaIndex, betaIndex, percentages
+
+    def _getCorrespondenceDims(self, labels, dims, action):
+        """Return the dimentions in *dims* (by default all the dimentions
+        whose elements are *labels*) checking that their elements are *labels*"""
+        labelSet = set(labels)
+        if dims is None:
+            dims = [dim for dim in range(self.getNumDim())
+                    if set(self.getElementsOfDimention(dim)) == labelSet]
+            if not dims:
+                raise ValueError("No dimention of the MultiArray has the elements "
+                                 "needed to %s it" % action)
+        for dim in dims:
+            if dim < 0 or dim >= self.getNumDim():
+                raise ValueError("Dim Index %d out of range (0, %d)" % (dim, self.getNumDim() - 1))
+            if set(self.getElementsOfDimention(dim)) != labelSet:
+                raise ValueError("The elements of dimention %d are not the same with "
+                                 "the ones needed to %s it" % (dim, action))
+        return dims
+
+    def _applyCorrespondence(self, dims, fromLabels, fromIndex, toLabels, toIndex, shares):
+        """Return a new MultiArray whose dimentions *dims* have the elements *toLabels*.
+        Each row i of the correspondence adds shares[i] times the slice of
+        fromLabels[fromIndex[i]] to the slice of toLabels[toIndex[i]], i.e. each
+        dimention is multiplied with the sparse (to x from) share matrix"""
+        # the rows grouped by target slice, so that each target slice is one reduceat sum
+        order = np.argsort(toIndex, kind="mergesort")
+        sortedTo = toIndex[order]
+        sortedShares = shares[order]
+        starts = np.flatnonzero(np.concatenate([[True], sortedTo[1:] != sortedTo[:-1]]))
+
+        data = self._data.astype(np.float64)
+        dimElements = list(self.getElementsOfAllDimentions())
+        for dim in dims:
+            translation = self._translation[dim]
+            sources = np.array([translation[label] for label in fromLabels], dtype=np.int64)[fromIndex[order]]
+            moved = np.rollaxis(data, dim, 0)
+            contributions = moved[sources] * sortedShares.reshape((-1,) + (1,) * (data.ndim - 1))
+            result = np.zeros((len(toLabels),) + moved.shape[1:], dtype=np.float64)
+            result[sortedTo[starts]] = np.add.reduceat(contributions, starts, axis=0)
+            data = np.ascontiguousarray(np.rollaxis(result, 0, dim + 1))
+            dimElements[dim] = toLabels
+        return MultiArray("d", dimElements, data, dimNames=self._dimNames)
+
+    def expand(self, alphaToBeta, dims=None):
+        """Disaggregates the dimentions *dims* of the multiArray from the beta
+        elements to the alpha ones.
+
+        *alphaToBeta* is a numpy array with the fields "alpha", "beta" and
+        "percentage", the share of the beta that goes to the alpha. *dims* is
+        the list of the dimentions to expand, by default all the dimentions whose
+        elements are the betas, e.g. the origins and destinations of a time x
+        origin x destination demand. An expanded cell is the product of the beta
+        cell with the percentages of its alphas, e.g. for a 2D array
+        new[a1, a2] = percentage[a1] * percentage[a2] * old[b1, b2].
+
+        Output: a new Multi Array
         """
-        if self.getNumDim() != 2:
-            raise ValueError("I can only expand a 2D array")
-        if self.getShape()[0] != self.getShape()[1]:
-            raise ValueError("I can only expand a square 2D array")
-        if set(self.getElementsOfDimention(0)) != set(self.getElementsOfDimention(1)):
-            raise ValueError("The elements of the two dimentions of the array are not the same"
-                             "and as a consequence the array cannot be expanded")
-        if set(alphaToBeta["beta"]) != set(self.getElementsOfDimention(0)):
-            raise ValueError("The beta values are not the same with the elements of the"
-                             "MultiArray")
-
-        numAlphas = len(alphaToBeta)
-        percentages = np.zeros((numAlphas, 1))
-        for i in xrange(numAlphas):
-            percentages[i, 0] = alphaToBeta[i]["percentage"]
-        newData = np.dot(percentages, percentages.transpose())
-
-        betas = list(self.getElementsOfDimention(0))
-        betaIndex = [0] * numAlphas
-        for i, beta in enumerate(alphaToBeta["beta"]):
-            betaIndex[i] = betas.index(beta)
-
-        
-        for i in xrange(numAlphas):
-            betaI = betaIndex[i]
-            for j in xrange(numAlphas):
-                newData[i, j] *= self._data[betaI, betaIndex[j]]
-
-        result = MultiArray("d", [alphaToBeta["alpha"], alphaToBeta["alpha"]], newData)            
-        return result
+        alphas, betas, alphaIndex, betaIndex, percentages = MultiArray._getCorrespondence(alphaToBeta)
+        dims = self._getCorrespondenceDims(betas, dims, "expand")
+        return self._applyCorrespondence(dims, betas, betaIndex, alphas, alphaIndex, percentages)
+
+    def collapse(self, alphaToBeta, dims=None):
+        """Aggregates the dimentions *dims* of the multiArray from the alpha
+        elements to the beta ones, summing the alphas of each beta.
+
+        *alphaToBeta* is a numpy array with the fields "alpha", "beta" and
+        "percentage" as for :py:meth:`MultiArray.expand`; the current elements are
+        in the "alpha" fields, the new ones in the "beta" fields. An alpha listed
+        under several betas is split between them in proportion to its percentages.
+        *dims* is the list of the dimentions to collapse, by default all the
+        dimentions whose elements are the alphas.
+
+        Output: a new Multi Array
+        """
+        alphas, betas, alphaIndex, betaIndex, percentages = MultiArray._getCorrespondence(alphaToBeta)
+        dims = self._getCorrespondenceDims(alphas, dims, "collapse")
 
-    def collapse(self, alphaToBeta):
-        """Collapses the current array into fewer dimensions
-        input: a numpy array with the following fields "alpha", "beta", 
-        "percentage". The current zoneIds are in the "alpha" fields, the 
-        new ones in the "beta" fields."""
-        
-        #check that you have all the alphas
-        #check that you have a 2D array
-
-        newDimention = len(set(alphaToBeta["beta"]))
-        result = numpy.zeros(newDimention **2, "d")
-        a2b = dict(izip(alphaToBeta["alpha"], alphaToBeta["beta"]))
-
-        for alphaOrigin in self.getDimIndices(0):
-            for alphaDestination in self.getDimIndices(1):
-                betaOrigin = a2b[alphaOrigin]
-                betaDestination = a2b[alphaDestination]
-                value = self.getValue(alphaOrigin, alphaDestination)
-                result.addInPlace(betaOrigin, betaDestination, value)
-        return result
+        totals = np.bincount(alphaIndex, weights=percentages, minlength=len(alphas))[alphaIndex]
+        numBetas = np.bincount(alphaIndex, minlength=len(alphas))[alphaIndex].astype(np.float64)
+        shares = np.where(totals > 0, percentages / np.where(totals > 0, totals, 1.0), 1.0 / numBetas)
+        return self._applyCorrespondence(dims, alphas, alphaIndex, betas, betaIndex, shares)
     
     def writeToCSV(self, fileName):
         """Save the multiarry as a comma delimited text file"""
@@ -24,9 +24,14 @@ import operator
 import shapefile
 import sys 
 
+from itertools import izip
+
+import numpy as np
+
 from .Centroid import Centroid
 from .Connector import Connector
 from .DtaError import DtaError
+from .GraphSnapshot import GraphSnapshot
 from .Link import Link
 from .RoadLink import RoadLink
 from .Logger import DtaLogger
@@ -34,6 +39,8 @@ from .Node import Node
 from .RoadNode import RoadNode
 from .TimePlan import PlanCollectionInfo
 from .Scenario import Scenario
+from .SimResultStore import SimResultStore
+from .SpatialIndex import SpatialIndex
 from .VirtualLink import VirtualLink
 from .VirtualNode import VirtualNode
 from .VehicleType import VehicleType
@@ -68,6 +75,17 @@ class Network(object):
         self._linksById     = {}
         # (nodeA id, nodeB id) -> :py:class:`Link` (these are :py:class:`RoadLink`s and :py:class:`Connector`s)
         self._linksByNodeIdPair = {}
+        # registries by type, id -> node or link, kept current by addNode/addLink/removeNode/removeLink/
+        # renameNode/renameLink for the counts and the iterators by type
+        self._roadNodes     = {}
+        self._centroids     = {}
+        self._virtualNodes  = {}
+        # :py:class:`RoadLink`s that are not :py:class:`Connector`s
+        self._roadLinks     = {}
+        self._connectors    = {}
+        self._virtualLinks  = {}
+        # links of none of these types, e.g. the plain :py:class:`Link`s of :py:func:`getReverseNetwork`
+        self._otherLinks    = {}
         
         # maximum link id
         self._maxLinkId     = 0
@@ -85,6 +103,20 @@ class Network(object):
         self._nodeType = random.randint(0, 100000)
         self._linkType = random.randint(0, 100000)
         
+        # incremented whenever nodes, links or movements are added, removed or renamed
+        self._topologyVersion = 0
+        # cached :py:class:`GraphSnapshot`, see :py:meth:`Network.toGraphSnapshot`
+        self._graphSnapshot   = None
+        # :py:class:`SpatialIndex` of the road nodes and road links, built on first use and
+        # then kept current by addNode/addLink/removeLink/removeNode
+        self._nodeSpatialIndex = None
+        self._linkSpatialIndex = None
+        # :py:class:`SimResultStore` of the simulated volumes and travel times, see :py:meth:`Network.initializeSimResults`
+        self._simResults        = None
+        # the links with a row in it, and their rows
+        self._simResultLinks    = []
+        self._simResultLinkRows = None
+        
     def __del__(self):
         pass
     
@@ -122,7 +154,7 @@ class Network(object):
                     cMov._incomingLink = self.getLinkForId(mov._incomingLink.getId())
                     cMov._outgoingLink = self.getLinkForId(mov._outgoingLink.getId())
 
-                    cLink.addOutgoingMovement(cMov)
+                    self.addMovement(cMov)
 
     def addPlanCollectionInfo(self, startTime, endTime, name, description):
         """
@@ -189,8 +221,61 @@ class Network(object):
             raise DtaError("Network.addNode called on node with id %d already in the network (for a node)" % newNode.getId())
 
         self._nodes[newNode.getId()] = newNode
+        self._getNodeRegistry(newNode)[newNode.getId()] = newNode
         
         if newNode.getId() > self._maxNodeId: self._maxNodeId = newNode.getId()
+        self._topologyVersion += 1
+
+        if self._nodeSpatialIndex is not None and newNode.isRoadNode():
+            self._nodeSpatialIndex.insert(newNode.getId(), newNode, newNode.getX(), newNode.getY(), newNode.getX(), newNode.getY())
+
+    def addNodes(self, newNodes):
+        """
+        Stores all of the *newNodes* in one pass, with the same checks as :py:meth:`Network.addNode`
+        but a single update of the id bookkeeping.  Use this when reading whole networks.
+        """
+        newNodes = list(newNodes)
+        newIds   = set()
+        for newNode in newNodes:
+            if (not isinstance(newNode, RoadNode) and 
+                not isinstance(newNode, VirtualNode) and 
+                not isinstance(newNode, Centroid)):
+                raise DtaError("Network.addNodes called on non-RoadNode/VirtualNode/Centroid: %s" % str(newNode))
+            if newNode.getId() in self._nodes or newNode.getId() in newIds:
+                raise DtaError("Network.addNodes called on node with id %d already in the network (for a node)" % newNode.getId())
+            newIds.add(newNode.getId())
+        
+        for newNode in newNodes:
+            self._nodes[newNode.getId()] = newNode
+            self._getNodeRegistry(newNode)[newNode.getId()] = newNode
+            
+            if self._nodeSpatialIndex is not None and newNode.isRoadNode():
+                self._nodeSpatialIndex.insert(newNode.getId(), newNode, newNode.getX(), newNode.getY(), newNode.getX(), newNode.getY())
+        
+        if newIds: self._maxNodeId = max(self._maxNodeId, max(newIds))
+        self._topologyVersion += 1
+
+    def _getNodeRegistry(self, node):
+        """
+        Returns the registry (node id -> node) of the type of *node*.
+        """
+        if isinstance(node, Centroid):
+            return self._centroids
+        if isinstance(node, VirtualNode):
+            return self._virtualNodes
+        return self._roadNodes
+
+    def _getLinkRegistry(self, link):
+        """
+        Returns the registry (link id -> link) of the type of *link*.
+        """
+        if isinstance(link, Connector):
+            return self._connectors
+        if isinstance(link, VirtualLink):
+            return self._virtualLinks
+        if isinstance(link, RoadLink):
+            return self._roadLinks
+        return self._otherLinks
 
     def getNumNodes(self):
         """
@@ -202,19 +287,19 @@ class Network(object):
         """
         Returns the number of roadnodes in the network
         """
-        return sum(1 for node in self.iterNodes() if isinstance(node, RoadNode))
+        return len(self._roadNodes)
 
     def getNumCentroids(self):
         """
         Returns the number of centroids in the network
         """
-        return sum(1 for node in self.iterNodes() if isinstance(node, Centroid))
+        return len(self._centroids)
 
     def getNumVirtualNodes(self):
         """
         Returns the number of virtual nodes in the network
         """
-        return sum(1 for node in self.iterNodes() if isinstance(node, VirtualNode))
+        return len(self._virtualNodes)
         
     def getNumLinks(self):
         """
@@ -284,7 +369,7 @@ class Network(object):
                     if mov.isUTurn() and not includeUTurns:
                         mov.prohibitAllVehicleClassGroups()
                 
-                    incomingLink.addOutgoingMovement(mov)
+                    self.addMovement(mov)
                     movements_added += 1
         
         DtaLogger.info("addAllMovements() added %d movements" % movements_added)
@@ -366,6 +451,8 @@ class Network(object):
                                                                                   movement.getOutgoingLink().getDirection()))
                 lanes_applied += 1        
         DtaLogger.info("Network.setMovementTurnTypeOverrides successfully applied %d out of %d turn type overrides" % (overrides_applied, len(overrides)))
+        # the permissions decide which movements are prohibited
+        if permissions_applied: self._topologyVersion += 1
         DtaLogger.info("Network.setMovementTurnTypeOverrides successfully applied %d vehicle class group permissions" % permissions_applied)
         DtaLogger.info("Network.setMovementTurnTypeOverrides successfully applied %d lane overrides" % lanes_applied)
 
@@ -392,13 +479,18 @@ class Network(object):
         
         self._linksById[newLink.getId()] = newLink
         self._linksByNodeIdPair[(newLink.getStartNode().getId(), newLink.getEndNode().getId())] = newLink
+        self._getLinkRegistry(newLink)[newLink.getId()] = newLink
         
         if newLink.getId() > self._maxLinkId:
             self._maxLinkId = newLink.getId()
+        self._topologyVersion += 1
         
         newLink.getStartNode()._addOutgoingLink(newLink)
         newLink.getEndNode()._addIncomingLink(newLink)
 
+        if self._linkSpatialIndex is not None and newLink.isRoadLink():
+            self._linkSpatialIndex.insert(newLink.getId(), newLink, *Network._getRoadLinkBox(newLink))
+
     
     def getLinkForId(self, linkId):
         """
@@ -425,6 +517,78 @@ class Network(object):
         Adds the movement by adding it to the movement's incomingLink
         """
         newMovement.getIncomingLink().addOutgoingMovement(newMovement)
+        self._topologyVersion += 1
+
+    def prohibitMovement(self, movement):
+        """
+        Prohibits the *movement* to all vehicle class groups (see :py:meth:`RoadLink.prohibitOutgoingMovement`),
+        which changes the topology seen by :py:meth:`Network.toGraphSnapshot`.
+        """
+        movement.getIncomingLink().prohibitOutgoingMovement(movement)
+        self._topologyVersion += 1
+
+    def addLinks(self, newLinks):
+        """
+        Stores all of the *newLinks* in one pass, with the same checks as :py:meth:`Network.addLink`.
+        Each node's links are sorted by reference angle once, rather than once per link.
+        """
+        newLinks     = list(newLinks)
+        newIds       = set()
+        newNodePairs = set()
+        for newLink in newLinks:
+            if not isinstance(newLink, Link):
+                raise DtaError("Network.addLinks called on a non-Link: %s" % str(newLink))
+            if newLink.getId() in self._linksById or newLink.getId() in newIds:
+                raise DtaError("Link with id %s already exists in the network" % newLink.getId())
+            nodePair = (newLink.getStartNode().getId(), newLink.getEndNode().getId())
+            if nodePair in self._linksByNodeIdPair or nodePair in newNodePairs:
+                raise DtaError("Link for nodes (%d,%d) already exists in the network" % nodePair)
+            newIds.add(newLink.getId())
+            newNodePairs.add(nodePair)
+        
+        changedNodes = {}
+        for newLink in newLinks:
+            self._linksById[newLink.getId()] = newLink
+            self._linksByNodeIdPair[(newLink.getStartNode().getId(), newLink.getEndNode().getId())] = newLink
+            self._getLinkRegistry(newLink)[newLink.getId()] = newLink
+            
+            newLink.getStartNode()._outgoingLinks.append(newLink)
+            newLink.getEndNode()._incomingLinks.append(newLink)
+            changedNodes[id(newLink.getStartNode())] = newLink.getStartNode()
+            changedNodes[id(newLink.getEndNode())]   = newLink.getEndNode()
+            
+            if self._linkSpatialIndex is not None and newLink.isRoadLink():
+                self._linkSpatialIndex.insert(newLink.getId(), newLink, *Network._getRoadLinkBox(newLink))
+        
+        # a stable sort keeps the order addLink's insertions would give ties
+        for node in changedNodes.itervalues():
+            node._outgoingLinks.sort(key=lambda link: link.getReferenceAngle())
+            node._incomingLinks.sort(key=lambda link: link.getReferenceAngle())
+        
+        if newIds: self._maxLinkId = max(self._maxLinkId, max(newIds))
+        self._topologyVersion += 1
+
+    def addMovements(self, newMovements):
+        """
+        Adds all of the *newMovements* to their incoming links in one pass, with the same checks
+        as :py:meth:`RoadLink.addOutgoingMovement`.
+        """
+        newMovements = list(newMovements)
+        turns        = set()
+        for newMovement in newMovements:
+            if not isinstance(newMovement, Movement):
+                raise DtaError("Network.addMovements called with invalid movement %s" % str(newMovement))
+            incomingLink = newMovement.getIncomingLink()
+            turn = (incomingLink.getId(), newMovement.getEndNode().getId())
+            if turn in turns or incomingLink.hasOutgoingMovement(turn[1]):
+                raise DtaError("RoadLink %s addOutgoingMovement() called to add already "
+                               "existing movement" % str(newMovement))
+            turns.add(turn)
+        
+        for newMovement in newMovements:
+            newMovement.getIncomingLink()._outgoingMovements.append(newMovement)
+            newMovement.getOutgoingLink()._incomingMovements.append(newMovement)
+        self._topologyVersion += 1
         
     def _switchConnectorNode(self, connector, switchStart, newNode):
         """
@@ -451,6 +615,8 @@ class Network(object):
             # fix _linksByNodeIdPair
             del self._linksByNodeIdPair[(connector.getStartNode().getId(), oldEndNode.getId())]
             self._linksByNodeIdPair[(connector.getStartNode().getId(), newNode.getId())] = connector
+        
+        self._topologyVersion += 1
 
     def _removeDuplicateConnectors(self):
         """
@@ -564,12 +730,12 @@ class Network(object):
                     if ilink.isConnector() and olink.isConnector():
                         if ilink.hasOutgoingMovement(olink.getEndNodeId()):
                             mov = ilink.getOutgoingMovement(olink.getEndNodeId())
-                            ilink.prohibitOutgoingMovement(mov)
+                            self.prohibitMovement(mov)
                             #ilink.removeOutgoingMovement(mov)
                         else:
                             prohibitedMovement = Movement.simpleMovementFactory(ilink, olink,
                                  self.getScenario().getVehicleClassGroup(VehicleClassGroup.CLASSDEFINITION_PROHIBITED))
-                            ilink.addOutgoingMovement(prohibitedMovement)
+                            self.addMovement(prohibitedMovement)
                         continue
                     
                     # movement already exists, continue
@@ -592,7 +758,7 @@ class Network(object):
                         vcg = olink._lanePermissions[0]
                     
                     allowedMovement = Movement.simpleMovementFactory(ilink, olink,vcg)
-                    ilink.addOutgoingMovement(allowedMovement)
+                    self.addMovement(allowedMovement)
 
             # why iterate through movements?  why not just iterate through connectors?
             # also why is this in this method and not in its own method?  for non-boundary connectors,
@@ -612,8 +778,10 @@ class Network(object):
                         mov.getOutgoingLink().setNumLanes(sum([link.getNumLanes() for link in node.iterIncomingLinks() if link.isRoadLink()]))
                     else:
                         mov.getOutgoingLink().setNumLanes(mov.getIncomingLink().getNumLanes())
-                            
 
+        # the number of lanes moves the link center lines, and the movements changed
+        self.invalidateSpatialIndex()
+        self.invalidateGraphSnapshot()
                     
     def moveCentroidConnectorFromIntersectionToMidblock(self, roadNode, connector, splitReverseLink=False, 
                                                                moveVirtualNodeDist=None, disallowConnectorEvalStr=None):
@@ -885,37 +1053,23 @@ class Network(object):
         """
         return self._nodes.itervalues()
 
-    def iterCentroids(self):
-        """
-        Return an iterator to the road node collection
-        """
-        for node in self.iterNodes():
-            if node.isCentroid():
-                yield node
-
     def iterRoadNodes(self):
         """
         Return an iterator to the :py:class:`RoadNode` instances in the network.
         """
-        for node in self.iterNodes():
-            if node.isRoadNode():
-                yield node
+        return self._roadNodes.itervalues()
 
     def iterVirtualNodes(self):
         """
         Return an iterator to the :py:class:`VirtualNode` instances in the network.
         """
-        for node in self.iterNodes():
-            if isinstance(node, VirtualNode):
-                yield node
+        return self._virtualNodes.itervalues()
 
     def iterCentroids(self):
         """
         Return an iterator to the :py:class:`Centroid` instances in the network.
         """
-        for node in self.iterNodes():
-            if isinstance(node, Centroid):
-                yield node
+        return self._centroids.itervalues()
 
     def iterLinks(self):
         """
@@ -928,25 +1082,19 @@ class Network(object):
         Return an iterator for to the :py:class:`RoadLink` instances in the network that are
         not instances of :py:class:`Connector`.
         """
-        for link in self.iterLinks():
-            if link.isRoadLink():
-                yield link
+        return self._roadLinks.itervalues()
 
     def iterConnectors(self):
         """
         Return an iterator to the :py:class:`Connector` instances in the network.
         """
-        for link in self.iterLinks():
-            if link.isConnector():
-                yield link
+        return self._connectors.itervalues()
 
     def iterVirtualLinks(self):
         """
         Return an iterator to the :py:class:`VirtualLink` instances in the network.
         """
-        for link in self.iterLinks():
-            if isinstance(link, VirtualLink):
-                yield link
+        return self._virtualLinks.itervalues()
     
     def iterMovements(self):
         """
@@ -1016,30 +1164,42 @@ class Network(object):
 
     def findNodeNearestCoords(self, x, y, quick_dist=None):
         """
-        Iterates though :py:class:`RoadNode` instances and returns 
-        the node closest to (*x*, *y*), as well as the distance.
+        Uses the :py:meth:`Network.getNodeSpatialIndex` to return
+        the :py:class:`RoadNode` closest to (*x*, *y*), as well as the distance.
         
-        Uses *quick_dist* (if passed) to skip skip distance calcs and ignore anything
+        Uses *quick_dist* (if passed) to ignore anything
         greater than *quick_dist* difference in either coordinate.
         
-        So the return is a tuple: (distance, RoadNode)
+        So the return is a tuple: (distance, RoadNode), or (sys.float_info.max, None) if none is found.
         
         *x*,*y* and *quick_dist* are  in :py:attr:`Node.COORDINATE_UNITS`
         """
-        min_dist     = sys.float_info.max
-        closest_node = None
+        for (dist, roadnode) in self.getNodeSpatialIndex().iterNearest(x, y):
+            if not quick_dist: return (dist, roadnode)
+            # nodes further than this can't be within quick_dist in both coordinates
+            if dist > quick_dist*math.sqrt(2.0): break
+            if abs(roadnode.getX()-x) <= quick_dist and abs(roadnode.getY()-y) <= quick_dist:
+                return (dist, roadnode)
         
-        for roadnode in self.iterRoadNodes():
-            
-            if quick_dist and abs(roadnode.getX()-x) > quick_dist: continue
-            if quick_dist and abs(roadnode.getY()-y) > quick_dist: continue
-            
-            dist = math.sqrt( (roadnode.getX()-x)**2 + (roadnode.getY()-y)**2 )
-            if dist < min_dist:
-                min_dist = dist
-                closest_node = roadnode
+        return (sys.float_info.max, None)
+
+    def findNNodesNearestCoords(self, x, y, n):
+        """
+        Returns a list of (distance, :py:class:`RoadNode`) for the *n* road nodes closest to (*x*, *y*),
+        sorted by distance.
         
-        return (min_dist, closest_node)
+        *x*,*y* are in :py:attr:`Node.COORDINATE_UNITS`
+        """
+        return self.getNodeSpatialIndex().getNearest(x, y, n)
+
+    def findNodesWithinRadius(self, x, y, radius):
+        """
+        Returns a list of (distance, :py:class:`RoadNode`) for the road nodes within *radius*
+        of (*x*, *y*), sorted by distance.
+        
+        *x*,*y* and *radius* are in :py:attr:`Node.COORDINATE_UNITS`
+        """
+        return self.getNodeSpatialIndex().getWithinRadius(x, y, radius)
 
     def findNodeForRoadLabels(self, road_label_list, CUTOFF):
         """ 
@@ -1199,7 +1359,7 @@ class Network(object):
 
     def findNRoadLinksNearestCoords(self, x, y, n=1, quick_dist = None):
         """
-        Iterates though :py:class:`RoadLink` instances and returns the *n* closest
+        Uses the :py:meth:`Network.getLinkSpatialIndex` to return the *n* closest
         road links to the given (*x*, *y*) coordinates.
         
         If *n* = 1, returns a 3-tuple (*roadlink*, *distance*, *t*).  
@@ -1211,38 +1371,30 @@ class Network(object):
         If *n* > 1: returns a list of 3-tuples as described above, sorted by the *distance*
         values.
         
-        Uses *quick_dist* (if passed) to skip skip distance calcs and ignore anything
+        Uses *quick_dist* (if passed) to ignore anything
         greater than *quick_dist* difference in either coordinate.
         Returns (None, None, None) if none found and *n* = 1, or an empty list for *n* > 1
                 
         *x*,*y* and *quick_dist* are  in :py:attr:`Node.COORDINATE_UNITS`
         """
-        min_dist            = sys.float_info.max
-        return_tuples       = []
-        
-        for roadlink in self.iterRoadLinks():
-            # quickly rule out if a quick_dist is specified
-            if quick_dist:
-                # real dist threshhold - it could be a long link and the (x,y) is in the center
-                dthres = max(quick_dist, 1.25*roadlink.getLengthInCoordinateUnits())
-                     
-                if x + dthres < min(roadlink.getStartNode().getX(), roadlink.getEndNode().getX()): continue
-                if x - dthres > max(roadlink.getStartNode().getX(), roadlink.getEndNode().getX()): continue
-                if y + dthres < min(roadlink.getStartNode().getY(), roadlink.getEndNode().getY()): continue
-                if y - dthres > max(roadlink.getStartNode().getY(), roadlink.getEndNode().getY()): continue
-
-            (dist, t) = roadlink.getDistanceFromPoint(x,y)
-            if dist < min_dist:
-                return_tuples.append( (roadlink, dist, t))
-                
-                # sort
-                return_tuples = sorted(return_tuples, key=operator.itemgetter(1))
-                
-                # kick out extras
-                if len(return_tuples) > n:
-                    return_tuples.pop()
-                    
-                min_dist            = return_tuples[-1][1]
+        def withinQuickDist(roadlink):
+            # real dist threshhold - it could be a long link and the (x,y) is in the center
+            dthres = max(quick_dist, 1.25*roadlink.getLengthInCoordinateUnits())
+            if x + dthres < min(roadlink.getStartNode().getX(), roadlink.getEndNode().getX()): return False
+            if x - dthres > max(roadlink.getStartNode().getX(), roadlink.getEndNode().getX()): return False
+            if y + dthres < min(roadlink.getStartNode().getY(), roadlink.getEndNode().getY()): return False
+            if y - dthres > max(roadlink.getStartNode().getY(), roadlink.getEndNode().getY()): return False
+            return True
+
+        # roadlink -> (dist, t), so t isn't computed twice
+        projections = {}
+        def distanceFromPoint(roadlink):
+            projections[roadlink] = roadlink.getDistanceFromPoint(x, y)
+            return projections[roadlink][0]
+
+        nearest = self.getLinkSpatialIndex().getNearest(x, y, n, distanceFunction=distanceFromPoint,
+                                                        filterFunction=withinQuickDist if quick_dist else None)
+        return_tuples = [(roadlink, dist, projections[roadlink][1]) for (dist, roadlink) in nearest]
         
         if n==1:
             if len(return_tuples) == 0: 
@@ -1251,6 +1403,22 @@ class Network(object):
 
         return return_tuples
                             
+    def findRoadLinksWithinRadius(self, x, y, radius):
+        """
+        Returns a list of 3-tuples (*roadlink*, *distance*, *t*), as described for
+        :py:meth:`Network.findNRoadLinksNearestCoords`, for the road links within *radius* of
+        (*x*, *y*), sorted by the *distance* values.
+        
+        *x*,*y* and *radius* are in :py:attr:`Node.COORDINATE_UNITS`
+        """
+        projections = {}
+        def distanceFromPoint(roadlink):
+            projections[roadlink] = roadlink.getDistanceFromPoint(x, y)
+            return projections[roadlink][0]
+
+        return [(roadlink, dist, projections[roadlink][1]) for (dist, roadlink) in
+                self.getLinkSpatialIndex().getWithinRadius(x, y, radius, distanceFunction=distanceFromPoint)]
+
     def findLinksForRoadLabels(self, on_street_label, on_direction,
                                        from_street_label, to_street_label,
                                        remove_label_spaces=False):
@@ -1541,8 +1709,13 @@ class Network(object):
         linkToRemove.getEndNode()._removeIncomingLink(linkToRemove)
 
         del self._linksById[linkToRemove.getId()]
+        del self._getLinkRegistry(linkToRemove)[linkToRemove.getId()]
         del self._linksByNodeIdPair[linkToRemove.getStartNode().getId(),
                                 linkToRemove.getEndNode().getId()]
+        self._topologyVersion += 1
+
+        if self._linkSpatialIndex is not None and linkToRemove.getId() in self._linkSpatialIndex:
+            self._linkSpatialIndex.remove(linkToRemove.getId())
         #TODO: do you want to update the maxIds?
 
     def removeNode(self, nodeToRemove):
@@ -1560,6 +1733,11 @@ class Network(object):
             self.removeLink(link) 
         
         del self._nodes[nodeToRemove.getId()] 
+        del self._getNodeRegistry(nodeToRemove)[nodeToRemove.getId()]
+        self._topologyVersion += 1
+
+        if self._nodeSpatialIndex is not None and nodeToRemove.getId() in self._nodeSpatialIndex:
+            self._nodeSpatialIndex.remove(nodeToRemove.getId())
         
         #TODO: do you want to update the maxIds? 
 
@@ -1627,7 +1805,7 @@ class Network(object):
                                    inMov._followupTime)
 
 
-            inMov.getIncomingLink().addOutgoingMovement(newMovement)
+            self.addMovement(newMovement)
 
         for outMov in linkToSplit.iterOutgoingMovements():
 
@@ -1641,7 +1819,7 @@ class Network(object):
                                    outMov._outgoingLane,
                                    outMov._followupTime)
 
-            newLink2.addOutgoingMovement(newMovement)
+            self.addMovement(newMovement)
 
         # if one of incoming or outgoing link doesn't allow all
         vcg = self.getScenario().getVehicleClassGroup(VehicleClassGroup.CLASSDEFINITION_ALL)
@@ -1666,7 +1844,7 @@ class Network(object):
                                newLink1._numLanes,
                                incomingLane=0,
                                outgoingLane=newLink1._numLanes)
-        newLink1.addOutgoingMovement(newMovement)
+        self.addMovement(newMovement)
 
     def splitLink(self, linkToSplit, splitReverseLink=False, fraction=0.5):
         """
@@ -1720,14 +1898,14 @@ class Network(object):
                 
                 prohibitedMovement = Movement.simpleMovementFactory(link1, link2,
                      self.getScenario().getVehicleClassGroup(VehicleClassGroup.CLASSDEFINITION_PROHIBITED))
-                link1.addOutgoingMovement(prohibitedMovement)
+                self.addMovement(prohibitedMovement)
 
                 link1 = self.getLinkForNodeIdPair(linkToSplit.getEndNode().getId(), midNode.getId())
                 link2 = self.getLinkForNodeIdPair(midNode.getId(), linkToSplit.getEndNode().getId())
                 
                 prohibitedMovement = Movement.simpleMovementFactory(link1, link2,
                      self.getScenario().getVehicleClassGroup(VehicleClassGroup.CLASSDEFINITION_PROHIBITED))
-                link1.addOutgoingMovement(prohibitedMovement)
+                self.addMovement(prohibitedMovement)
 
         self.removeLink(linkToSplit)
                       
@@ -1735,21 +1913,21 @@ class Network(object):
 
     def getNumVirtualLinks(self):
         """
-        Return the number of connectors in the Network
+        Return the number of virtual links in the Network
         """
-        return sum([1 for link in self.iterLinks() if link.isVirtualLink()])
+        return len(self._virtualLinks)
 
     def getNumConnectors(self):
         """
         Return the number of connectors in the Network
         """
-        return sum([1 for link in self.iterLinks() if link.isConnector()])
+        return len(self._connectors)
 
     def getNumRoadLinks(self):
         """
         Return the number of RoadLinks in the Network(excluding connectors)
         """
-        return sum([1 for link in self.iterLinks() if link.isRoadLink()])
+        return len(self._roadLinks)
 
     def getNumTimePlans(self):
         """
@@ -1867,7 +2045,7 @@ class Network(object):
                     try: 
                         cMov._incomingLink = self.getLinkForId(mov._incomingLink.getId())                    
                         cMov._outgoingLink = self.getLinkForId(mov._outgoingLink.getId())
-                        cLink.addOutgoingMovement(cMov) 
+                        self.addMovement(cMov) 
                     except DtaError, e:
                         DtaLogger.error(str(e))
 
@@ -1979,7 +2157,7 @@ class Network(object):
                     try: 
                         cMov._incomingLink = self.getLinkForId(mov._incomingLink.getId())                    
                         cMov._outgoingLink = self.getLinkForId(mov._outgoingLink.getId())
-                        cLink.addOutgoingMovement(cMov) 
+                        self.addMovement(cMov) 
                     except DtaError, e:
                         DtaLogger.error(str(e))
 
@@ -2360,7 +2538,7 @@ class Network(object):
                                    inMov._followupTime)
 
 
-            inMov.getIncomingLink().addOutgoingMovement(newMovement)
+            self.addMovement(newMovement)
 
         for outMov in link2.iterOutgoingMovements():
 
@@ -2374,7 +2552,7 @@ class Network(object):
                                    outMov._outgoingLane,
                                    outMov._followupTime)
 
-            newLink.addOutgoingMovement(newMovement)
+            self.addMovement(newMovement)
 
         
         self.removeLink(link1)
@@ -2465,6 +2643,7 @@ class Network(object):
                     links_done[(startNodeId, endNodeId)] = True
 
         DtaLogger.info("Read %d shape points for %d links from %s" % (shapepoints_added, links_found, linkShapefile))            
+        self.invalidateSpatialIndex()
                 
     def removeShapePoints(self):
         """
@@ -2537,9 +2716,18 @@ class Network(object):
         linkToRename._id = newLinkId 
         del self._linksById[oldLinkId]
         self._linksById[newLinkId] = linkToRename 
+        registry = self._getLinkRegistry(linkToRename)
+        del registry[oldLinkId]
+        registry[newLinkId] = linkToRename
 
         if newLinkId > self._maxLinkId:
             self._maxLinkId = newLinkId 
+        self._topologyVersion += 1
+
+        if self._linkSpatialIndex is not None and oldLinkId in self._linkSpatialIndex:
+            box = self._linkSpatialIndex.getBox(oldLinkId)
+            self._linkSpatialIndex.remove(oldLinkId)
+            self._linkSpatialIndex.insert(newLinkId, linkToRename, *box)
 
     def renameNode(self, oldNodeId, newNodeId):
         """
@@ -2560,6 +2748,9 @@ class Network(object):
         del self._nodes[oldNodeId] 
 
         self._nodes[newNodeId] = nodeToRename 
+        registry = self._getNodeRegistry(nodeToRename)
+        del registry[oldNodeId]
+        registry[newNodeId] = nodeToRename
 
         for oLink in nodeToRename.iterOutgoingLinks():
             del self._linksByNodeIdPair[oldNodeId, oLink.getEndNode().getId()]
@@ -2569,6 +2760,12 @@ class Network(object):
             del self._linksByNodeIdPair[iLink.getStartNode().getId(), oldNodeId]
             self._linksByNodeIdPair[(iLink.getStartNode().getId(), iLink.getEndNode().getId())] = iLink
 
+        self._topologyVersion += 1
+
+        if self._nodeSpatialIndex is not None and oldNodeId in self._nodeSpatialIndex:
+            self._nodeSpatialIndex.remove(oldNodeId)
+            self._nodeSpatialIndex.insert(newNodeId, nodeToRename, nodeToRename.getX(), nodeToRename.getY(),
+                                          nodeToRename.getX(), nodeToRename.getY())
 
     def getMaxLinkId(self):
         """
@@ -2747,3 +2944,222 @@ class Network(object):
     
 
                 
+
+    def getTopologyVersion(self):
+        """
+        Returns an integer that changes whenever nodes, links or movements are added to, removed from
+        or renamed in this network through the :py:class:`Network` methods.
+        """
+        return self._topologyVersion
+
+    def invalidateGraphSnapshot(self):
+        """
+        Marks the topology as changed, so the next :py:meth:`Network.toGraphSnapshot` rebuilds the snapshot.
+        Call this after modifying the network without going through the :py:class:`Network` methods, e.g. after
+        calling :py:meth:`RoadLink.addOutgoingMovement` directly.
+        """
+        self._topologyVersion += 1
+
+    def toGraphSnapshot(self):
+        """
+        Returns a :py:class:`GraphSnapshot` of the nodes, links and movements in this network.
+        
+        The snapshot is cached and only rebuilt when :py:meth:`Network.getTopologyVersion` has changed
+        since it was built, so callers can ask for it freely.  It reflects the network attributes (coordinates,
+        lengths, free flow speeds, prohibited movements) at the time it was built.
+        """
+        if self._graphSnapshot is None or self._graphSnapshot.topologyVersion != self._topologyVersion:
+            self._graphSnapshot = GraphSnapshot(self)
+        return self._graphSnapshot
+
+    @staticmethod
+    def _getRoadLinkBox(roadlink):
+        """
+        Returns the bounding box (minX, minY, maxX, maxY) of the *roadlink* nodes, shape points and
+        the center line used by :py:meth:`RoadLink.getDistanceFromPoint`.
+        """
+        points = [(roadlink.getStartNode().getX(), roadlink.getStartNode().getY()),
+                  (roadlink.getEndNode().getX(), roadlink.getEndNode().getY())]
+        points.extend(roadlink.getShapePoints())
+        points.extend(roadlink.getCenterLine(wholeLineShapePoints=True))
+        return (min(point[0] for point in points), min(point[1] for point in points),
+                max(point[0] for point in points), max(point[1] for point in points))
+
+    def getNodeSpatialIndex(self):
+        """
+        Returns the :py:class:`SpatialIndex` of the :py:class:`RoadNode` instances, keyed by node id.
+        
+        It is built on first use and kept current as nodes are added and removed through the
+        :py:class:`Network` methods.  Call :py:meth:`Network.invalidateSpatialIndex` after moving nodes directly.
+        """
+        if self._nodeSpatialIndex is None:
+            boxes = [(node.getX(), node.getY(), node.getX(), node.getY()) for node in self.iterRoadNodes()]
+            self._nodeSpatialIndex = SpatialIndex(SpatialIndex.suggestCellSize(boxes))
+            for node in self.iterRoadNodes():
+                self._nodeSpatialIndex.insert(node.getId(), node, node.getX(), node.getY(), node.getX(), node.getY())
+        return self._nodeSpatialIndex
+
+    def getLinkSpatialIndex(self):
+        """
+        Returns the :py:class:`SpatialIndex` of the :py:class:`RoadLink` instances (over their bounding
+        boxes, including the shape points), keyed by link id.
+        
+        It is built on first use and kept current as links are added, removed and split through the
+        :py:class:`Network` methods.  Call :py:meth:`Network.invalidateSpatialIndex` after changing the
+        geometry of links directly, e.g. with :py:meth:`RoadLink.addShapePoint`.
+        """
+        if self._linkSpatialIndex is None:
+            roadlinks = list(self.iterRoadLinks())
+            boxes     = [Network._getRoadLinkBox(roadlink) for roadlink in roadlinks]
+            self._linkSpatialIndex = SpatialIndex(SpatialIndex.suggestCellSize(boxes))
+            for roadlink, box in zip(roadlinks, boxes):
+                self._linkSpatialIndex.insert(roadlink.getId(), roadlink, *box)
+        return self._linkSpatialIndex
+
+    def invalidateSpatialIndex(self):
+        """
+        Discards the spatial indices, so they are rebuilt on next use.  See :py:meth:`Network.getNodeSpatialIndex`
+        and :py:meth:`Network.getLinkSpatialIndex`.
+        """
+        self._nodeSpatialIndex = None
+        self._linkSpatialIndex = None
+
+    def initializeSimResults(self, simStartTimeInMin, simEndTimeInMin, simTimeStepInMin):
+        """
+        Sets the simulation times of the road links, connectors and their movements, and gives each of
+        them a row in a new :py:class:`SimResultStore` for their simulated volumes and travel times
+        from *simStartTimeInMin* to *simEndTimeInMin* by *simTimeStepInMin*.  The parent row of
+        a movement's row is the row of its incoming link.  Results stored before are dropped.
+        
+        Returns the :py:class:`SimResultStore`.
+        """
+        simResults  = SimResultStore(simStartTimeInMin, simEndTimeInMin, simTimeStepInMin)
+        links       = [self._linksById[linkId] for linkId in sorted(self._linksById.keys())
+                       if isinstance(self._linksById[linkId], RoadLink)]
+        
+        linkRows    = []
+        parentRows  = []
+        for link in links:
+            linkRows.append(len(parentRows))
+            parentRows.append(-1)
+            parentRows.extend([linkRows[-1]] * link.getNumOutgoingMovements())
+        simResults.addRows(parentRows)
+        
+        for link, linkRow in izip(links, linkRows):
+            link.simTimeStepInMin   = simTimeStepInMin
+            link.simStartTimeInMin  = simStartTimeInMin
+            link.simEndTimeInMin    = simEndTimeInMin
+            link.setSimResultRow(simResults, linkRow)
+            for row, mov in enumerate(link.iterOutgoingMovements(), linkRow + 1):
+                mov.simTimeStepInMin    = simTimeStepInMin
+                mov.simStartTimeInMin   = simStartTimeInMin
+                mov.simEndTimeInMin     = simEndTimeInMin
+                mov.setSimResultRow(simResults, row)
+        
+        self._simResults        = simResults
+        self._simResultLinks    = links
+        self._simResultLinkRows = np.array(linkRows, dtype=np.int32)
+        return simResults
+
+    def getSimResults(self):
+        """
+        Returns the :py:class:`SimResultStore` set up by :py:meth:`Network.initializeSimResults`, or None.
+        """
+        return self._simResults
+
+    def getSimResultLinkRows(self):
+        """
+        Returns (array of link ids, array of :py:class:`SimResultStore` rows) for the road links and connectors
+        set up by :py:meth:`Network.initializeSimResults`.
+        """
+        self._checkSimResults()
+        linkIds = np.array([link.getId() for link in self._simResultLinks], dtype=np.int64)
+        return linkIds, self._simResultLinkRows.copy()
+
+    def getSimResultMovementRows(self):
+        """
+        Returns a dictionary mapping (at node id, from node id, to node id) to the :py:class:`SimResultStore` row
+        of the movement, for the movements set up by :py:meth:`Network.initializeSimResults`.  If a link
+        has more than one movement to the same node, the first one is used.
+        """
+        self._checkSimResults()
+        movementRows = {}
+        for link in self._simResultLinks:
+            atNodeId   = link.getEndNode().getId()
+            fromNodeId = link.getStartNode().getId()
+            for mov in link.iterOutgoingMovements():
+                # movements added since then have no row in this store
+                if mov._simResults is not self._simResults: continue
+                movementRows.setdefault((atNodeId, fromNodeId, mov.getOutgoingLink().getEndNode().getId()), mov._simRow)
+        return movementRows
+
+    def _checkSimResults(self):
+        """
+        Raises a :py:class:`DtaError` if the simulation results haven't been set up.
+        """
+        if self._simResults is None:
+            raise DtaError("Network has no simulation results; call initializeSimResults() or readSimResults() first")
+
+    def _getLinkSimTotals(self, values):
+        """
+        Returns the array of *values* (an array by :py:class:`SimResultStore` row) totaled for each link
+        with a row, over the link's own row and the rows of its outgoing movements.
+        """
+        self._checkSimResults()
+        return self._simResults.getLinkTotals(values, self._simResultLinkRows)
+
+    def _getSimResultFreeflowTTs(self):
+        """
+        Returns the array of the free flow travel times in minutes of the links set up by
+        :py:meth:`Network.initializeSimResults`.
+        """
+        return np.array([link.getFreeFlowTTInMin() for link in self._simResultLinks], dtype=np.float64)
+
+    def getLinkSimOutVolumes(self, startTimeInMin, endTimeInMin):
+        """
+        Returns (array of link ids, array of outgoing volumes) for all the road links and connectors from
+        *startTimeInMin* to *endTimeInMin*; the same as :py:meth:`RoadLink.getSimOutVolume` for each link,
+        in a single vectorized pass over the :py:class:`SimResultStore`.
+        """
+        self._checkSimResults()
+        linkIds = np.array([link.getId() for link in self._simResultLinks], dtype=np.int64)
+        return linkIds, self._getLinkSimTotals(self._simResults.getOutVolumes(startTimeInMin, endTimeInMin))
+
+    def getLinkSimInVolumes(self, startTimeInMin, endTimeInMin):
+        """
+        Returns (array of link ids, array of incoming volumes) for all the road links and connectors from
+        *startTimeInMin* to *endTimeInMin*, like :py:meth:`Network.getLinkSimOutVolumes`.
+        """
+        self._checkSimResults()
+        linkIds = np.array([link.getId() for link in self._simResultLinks], dtype=np.int64)
+        return linkIds, self._getLinkSimTotals(self._simResults.getInVolumes(startTimeInMin, endTimeInMin))
+
+    def getLinkSimTTsInMin(self, startTimeInMin, endTimeInMin):
+        """
+        Returns (array of link ids, array of mean travel times in minutes) for all the road links and connectors
+        from *startTimeInMin* to *endTimeInMin*: the volume weighted mean of the travel times of the link's
+        movements (or of the link itself, if it has none), or the free flow travel time if there's no volume.
+        Unlike :py:meth:`RoadLink.getSimTTInMin`, movement penalties are not included.
+        """
+        self._checkSimResults()
+        volumes, meanTTs = self._simResults.getMeanTTs(startTimeInMin, endTimeInMin)
+        linkVolumes, linkTTs = self._simResults.getLinkMeanTTs(volumes, meanTTs, self._simResultLinkRows,
+                                                               self._getSimResultFreeflowTTs())
+        linkIds     = np.array([link.getId() for link in self._simResultLinks], dtype=np.int64)
+        return linkIds, linkTTs
+
+    def getLinkSimResultsByWindow(self, windows):
+        """
+        Returns (array of link ids, outgoing volumes, incoming volumes, mean travel times in minutes) for all the
+        road links and connectors, where the last three are (links x windows) arrays of the results for each of
+        the *windows*, a list of (startTimeInMin, endTimeInMin).  The results are those of
+        :py:meth:`Network.getLinkSimOutVolumes`, :py:meth:`Network.getLinkSimInVolumes` and
+        :py:meth:`Network.getLinkSimTTsInMin` for each window, from the prefix sums of the
+        :py:class:`SimResultStore` (see :py:meth:`SimResultStore.getWindowResults`).
+        """
+        self._checkSimResults()
+        outVolumes, inVolumes, meanTTs = self._simResults.getWindowResults(windows)
+        linkVolumes, linkTTs = self._simResults.getLinkMeanTTs(outVolumes, meanTTs, self._simResultLinkRows,
+                                                               self._getSimResultFreeflowTTs())
+        linkIds     = np.array([link.getId() for link in self._simResultLinks], dtype=np.int64)
+        return linkIds, linkVolumes, self._getLinkSimTotals(inVolumes), linkTTs
@@ -0,0 +1,150 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from .DtaError import DtaError
+
+class ObsCountStore(object):
+    """
+    Observed counts by time bin for a number of rows, each of which is a :py:class:`RoadLink` or
+    a :py:class:`Movement` (see :py:meth:`RoadLink.addObsCountRow`), e.g. all the counts of a count file
+    (see :py:meth:`DynameqNetwork.readObsMovementCounts`).
+
+    The counts are kept as prefix sums by row, together with prefix sums of the number of missing bins,
+    so the count of any window made of whole bins is a subtraction, and is missing if any of its bins is.
+    Counts at other time steps (e.g. 15 or 60 minutes, or a peak period) come from the same arrays;
+    see also :py:meth:`ObsCountStore.aggregate`.
+    """
+
+    def __init__(self, startTimeInMin, timeStepInMin, counts, missing=None):
+        """
+        Constructor.  *counts* is the (rows x time bins) array of counts, the first bin starting at *startTimeInMin*,
+        each lasting *timeStepInMin*.  *missing* is the boolean array of the same shape that is True for the
+        bins without a count; by default the negative counts are missing.
+        """
+        if timeStepInMin <= 0:
+            raise DtaError("ObsCountStore: invalid time step %s" % str(timeStepInMin))
+        counts = np.asarray(counts, dtype=np.float64)
+        if counts.ndim != 2:
+            raise DtaError("ObsCountStore: counts of shape %s instead of (rows, time bins)" % str(counts.shape))
+        missing = counts < 0 if missing is None else np.asarray(missing, dtype=np.bool_)
+
+        self._startTimeInMin = startTimeInMin
+        self._timeStepInMin  = timeStepInMin
+        self._numTimeSteps   = counts.shape[1]
+
+        self._cumCounts      = np.zeros((counts.shape[0], self._numTimeSteps + 1), dtype=np.float64)
+        np.cumsum(np.where(missing, 0.0, counts), axis=1, out=self._cumCounts[:, 1:])
+        self._cumMissing     = np.zeros((counts.shape[0], self._numTimeSteps + 1), dtype=np.int32)
+        np.cumsum(missing, axis=1, out=self._cumMissing[:, 1:])
+
+    def getStartTimeInMin(self):
+        """
+        Returns the start of the first time bin, in minutes.
+        """
+        return self._startTimeInMin
+
+    def getEndTimeInMin(self):
+        """
+        Returns the end of the last time bin, in minutes.
+        """
+        return self._startTimeInMin + self._numTimeSteps * self._timeStepInMin
+
+    def getTimeStepInMin(self):
+        """
+        Returns the length of the time bins, in minutes.
+        """
+        return self._timeStepInMin
+
+    def getNumTimeSteps(self):
+        """
+        Returns the number of time bins.
+        """
+        return self._numTimeSteps
+
+    def getNumRows(self):
+        """
+        Returns the number of rows.
+        """
+        return len(self._cumCounts)
+
+    def getStepRange(self, startTimeInMin, endTimeInMin):
+        """
+        Returns (first, last) such that the time bins first to last-1 make up the window from *startTimeInMin*
+        to *endTimeInMin*, or None if the window is not made of whole bins of the store.
+        """
+        if startTimeInMin >= endTimeInMin or startTimeInMin < self._startTimeInMin or \
+           endTimeInMin > self.getEndTimeInMin():
+            return None
+        if (startTimeInMin - self._startTimeInMin) % self._timeStepInMin != 0 or \
+           (endTimeInMin - startTimeInMin) % self._timeStepInMin != 0:
+            return None
+        return (int((startTimeInMin - self._startTimeInMin) // self._timeStepInMin),
+                int((endTimeInMin - self._startTimeInMin) // self._timeStepInMin))
+
+    def getObsCount(self, row, startTimeInMin, endTimeInMin):
+        """
+        Returns the count of *row* from *startTimeInMin* to *endTimeInMin*, or None if the window is not
+        made of whole bins of the store or any of its bins has no count.
+        """
+        stepRange = self.getStepRange(startTimeInMin, endTimeInMin)
+        if stepRange is None: return None
+        first, last = stepRange
+        if self._cumMissing[row, last] != self._cumMissing[row, first]: return None
+        return float(self._cumCounts[row, last] - self._cumCounts[row, first])
+
+    def getObsCounts(self, startTimeInMin, endTimeInMin):
+        """
+        Returns the array by row of the counts from *startTimeInMin* to *endTimeInMin*, NaN where
+        :py:meth:`ObsCountStore.getObsCount` would return None.
+        """
+        counts = np.empty(self.getNumRows(), dtype=np.float64)
+        counts.fill(np.nan)
+        stepRange = self.getStepRange(startTimeInMin, endTimeInMin)
+        if stepRange is None: return counts
+        first, last = stepRange
+        complete = self._cumMissing[:, last] == self._cumMissing[:, first]
+        counts[complete] = (self._cumCounts[:, last] - self._cumCounts[:, first])[complete]
+        return counts
+
+    def aggregate(self, timeStepInMin, startTimeInMin=None):
+        """
+        Returns (list of bin start times, counts) for bins of *timeStepInMin* (a multiple of the time step of
+        the store) starting at *startTimeInMin* (by default the start of the store), as many as fit.  *counts* is
+        the (rows x bins) array of the counts, NaN for the bins with a missing count.
+        """
+        if startTimeInMin is None:
+            startTimeInMin = self._startTimeInMin
+        if timeStepInMin % self._timeStepInMin != 0 or startTimeInMin < self._startTimeInMin or \
+           (startTimeInMin - self._startTimeInMin) % self._timeStepInMin != 0:
+            raise DtaError("ObsCountStore: cannot aggregate %d minute bins to %d minute bins starting at %d" %
+                           (self._timeStepInMin, timeStepInMin, startTimeInMin))
+
+        factor  = int(timeStepInMin // self._timeStepInMin)
+        offset  = int((startTimeInMin - self._startTimeInMin) // self._timeStepInMin)
+        numBins = max(0, (self._numTimeSteps - offset) // factor)
+        bounds  = offset + factor * np.arange(numBins + 1)
+
+        # the bins of the store, then summed by groups of factor bins
+        binCounts  = np.diff(self._cumCounts[:, offset:bounds[-1] + 1], axis=1)
+        binMissing = np.diff(self._cumMissing[:, offset:bounds[-1] + 1], axis=1)
+        counts     = binCounts.reshape(len(binCounts), numBins, factor).sum(axis=2)
+        missing    = binMissing.reshape(len(binMissing), numBins, factor).sum(axis=2) > 0
+        counts[missing] = np.nan
+        return [startTimeInMin + index * timeStepInMin for index in range(numBins)], counts
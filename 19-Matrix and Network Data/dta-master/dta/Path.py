@@ -60,9 +60,7 @@ class Path(object):
                     links_to_add_to_list = [net.getLinkForNodeIdPair(prevNode.getId(), node.getId())]
                 else:
                     #print "Repairing path"
-                    ShortestPaths.initializeMovementCostsWithLength(net)
-                    ShortestPaths.labelCorrectingWithLabelsOnNodes(net, prevNode) 
-                    intermediate_path_of_nodes = ShortestPaths.getShortestPathBetweenNodes(prevNode, node)
+                    intermediate_path_of_nodes = ShortestPaths.getAStarPathBetweenNodes(net, prevNode, node)
                     #print "Intermediate path of nodes: ", [n.getId() for n in intermediate_path_of_nodes]
                     for nodeA, nodeB in izip(intermediate_path_of_nodes, intermediate_path_of_nodes[1:]):
                         if nodeA.hasOutgoingLinkForNodeId(nodeB.getId()):
@@ -19,16 +19,15 @@ import copy
 import pdb 
 import math
 import sys
-from collections import defaultdict 
 
 from .DtaError import DtaError
 from .Link import Link
 from .Logger import DtaLogger
 from .Movement import Movement
 from .Node import Node
+from .SimResultStore import SimResultStore
 from .VehicleClassGroup import VehicleClassGroup
 from .Utils import polylinesCross, lineSegmentsCross
-from .Algorithms import pairwise
 
 class RoadLink(Link):
     """
@@ -115,9 +114,13 @@ class RoadLink(Link):
         self._endShift                  = None
         self._shapePoints               = []  # sequenceNum -> (x,y)
 
-        self._simOutVolume = defaultdict(int)
-        self._simMeanTT = defaultdict(float)
+        # simulated volumes and travel times, for links without movements:
+        # a SimResultStore and the row of this link in it
+        self._simResults = None
+        self._simRow = None
         self._obsCount = {}
+        # counts read from count files: list of (ObsCountStore, row)
+        self._obsCountRows = []
         self._tollLink = 0
     
     def __repr__(self):
@@ -162,17 +165,36 @@ class RoadLink(Link):
                                    'time steps %d' % (startTimeInMin, endTimeInMin,
                                                     self.simTimeStepInMin))
 
+    def setSimResultRow(self, simResults, row):
+        """
+        Stores the simulated volumes and travel times of this link in row *row* of the
+        :py:class:`SimResultStore` *simResults*; see :py:meth:`Network.initializeSimResults`.
+        Only used if the link has no outgoing movements, otherwise the results are those of the movements.
+        """
+        self._simResults    = simResults
+        self._simRow        = row
+
+    def _getSimResultRow(self):
+        """
+        Returns (:py:class:`SimResultStore`, row) for this link, creating a store of its own if it
+        wasn't given a row in a network-wide one.
+        """
+        if self._simResults is None:
+            self.setSimResultRow(SimResultStore(self.simStartTimeInMin, self.simEndTimeInMin, self.simTimeStepInMin), 0)
+            self._simResults.addRow()
+        return self._simResults, self._simRow
+
     def _hasMovementVolumes(self, startTimeInMin, endTimeInMin):
         """Return True if at least one movement has a volume 
         greater than 0"""
         for mov in self.iterOutgoingMovements():
-            if mov.getSimVolume(startTimeInMin, endTimeInMin) > 0:
+            if mov.getSimOutVolume(startTimeInMin, endTimeInMin) > 0:
                 return True
         return False
 
     def getSimOutFlow(self, startTimeInMin, endTimeInMin):
         """Get the simulated flow in vph"""
-        volume = self.getSimVolume(startTimeInMin, endTimeInMin)        
+        volume = self.getSimOutVolume(startTimeInMin, endTimeInMin)        
         return int(float(volume) / (endTimeInMin - startTimeInMin) * 60)
 
     def getSimOutVolume(self, startTimeInMin, endTimeInMin):
@@ -184,12 +206,10 @@ class RoadLink(Link):
         if self.getNumOutgoingMovements() > 0:
             return sum([mov.getSimOutVolume(startTimeInMin, endTimeInMin) 
                         for mov in self.iterOutgoingMovements()])
+        elif self._simResults is None:
+            return 0
         else:
-            result = 0
-            for stTime, enTime in pairwise(range(startTimeInMin, endTimeInMin + 1, 
-                                                 self.simTimeStepInMin)):
-                result += self._simOutVolume[stTime, enTime]
-            return result
+            return self._simResults.getOutVolume(self._simRow, startTimeInMin, endTimeInMin)
 
     def getSimInFlow(self, startTimeInMin, endTimeInMin):
         """
@@ -209,12 +229,10 @@ class RoadLink(Link):
         if self.getNumOutgoingMovements() > 0:
             return sum([mov.getSimInVolume(startTimeInMin, endTimeInMin) 
                         for mov in self.iterOutgoingMovements()])
+        elif self._simResults is None:
+            return 0
         else:
-            result = 0
-            for stTime, enTime in pairwise(range(startTimeInMin, endTimeInMin + 1, 
-                                                 self.simTimeStepInMin)):
-                result += self._simInVolume[stTime, enTime]
-            return result
+            return self._simResults.getInVolume(self._simRow, startTimeInMin, endTimeInMin)
 
     def getSimTTInMin(self, startTimeInMin, endTimeInMin):
         """Get the average travel time of the vehicles traversing the link"""
@@ -229,37 +247,13 @@ class RoadLink(Link):
         if totalFlow == 0:
             return self.getFreeFlowTTInMin()
 
-        if not self._simMeanTT and not self._simOutVolume:
+        if self.getNumOutgoingMovements() > 0:
             totalTime = sum([ mov.getSimTTInMin(start, end) * mov.getSimOutVolume(start, end)
                           for mov in self.iterOutgoingMovements()])
             return totalTime / float(totalFlow)
-        elif self._simMeanTT and self._simOutVolume:
-            totalTime = 0
-            totalFlow = 0
-            for (stTime, enTime), flow in self._simOutVolume.iteritems():
-                if stTime >= startTimeInMin and enTime <= endTimeInMin:
-
-                    binTT = self._simMeanTT[(stTime, enTime)]
-
-                    if flow == 0 and binTT == 0:
-                        continue
-                    elif flow > 0 and binTT > 0:
-                        totalFlow += flow
-                        totalTime += binTT * flow
-                    else:                        
-                        raise SimMovementError("Movement %s has flow: %f and TT: %f "
-                                               "for time period from %d to %d"  % 
-                                               (self.iid, flow, binTT, 
-                                                startTimeInMin, endTimeInMin))
-
-            return totalTime / float(totalFlow)
-            
-            if endTimeInMin - startTimeInMin != self.simTimeStepInMin:
-                raise DtaError("Not implemeted yet")
 
-            return self._simMeanTT[start, end]
-        else:
-            return self.lengthInMiles / float(self._freeflowSpeed) * 60
+        totalFlow, meanTT = self._simResults.getMeanTT(self._simRow, start, end, "Link %s" % self.getId())
+        return meanTT
 
     def getSimSpeedInMPH(self, startTimeInMin, endTimeInMin):
 
@@ -302,9 +296,10 @@ class RoadLink(Link):
                                ' set the volume of the movements' % str(self.iid))
         elif self.getNumOutgoingMovements() == 1:
             for emanatingMovement in self.iterOutgoingMovements():
-                emanatingMovement.setSimVolume(startTimeInMin, endTimeInMin, volume)
+                emanatingMovement.setSimOutVolume(startTimeInMin, endTimeInMin, volume)
         else:
-            self._simOutVolume[startTimeInMin, endTimeInMin] = volume
+            simResults, row = self._getSimResultRow()
+            simResults.setOutVolume(row, startTimeInMin, endTimeInMin, volume)
         
     def setSimTTInMin(self, startTimeInMin, endTimeInMin, averageTTInMin):
         """
@@ -335,10 +330,11 @@ class RoadLink(Link):
         else:
             if averageTTInMin == 0:
                 return
-            if self.getSimVolume(startTimeInMin, endTimeInMin) == 0:
-                raise DtaError('Cannot set the travel time on edge %s because it has zero flow' % self.iid_)
+            if self.getSimOutVolume(startTimeInMin, endTimeInMin) == 0:
+                raise DtaError('Cannot set the travel time on edge %s because it has zero flow' % self.getId())
 
-            self._simMeanTT[startTimeInMin, endTimeInMin] = averageTTInMin
+            simResults, row = self._getSimResultRow()
+            simResults.setMeanTT(row, startTimeInMin, endTimeInMin, averageTTInMin)
                         
     def addLanePermission(self, laneId, vehicleClassGroup):
         """
@@ -1099,10 +1095,22 @@ class RoadLink(Link):
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkOutputTimeStep(startTimeInMin, endTimeInMin)
 
-        try:
-            return self._obsCount[startTimeInMin, endTimeInMin]            
-        except KeyError:
-            return None
+        if (startTimeInMin, endTimeInMin) in self._obsCount:
+            return self._obsCount[startTimeInMin, endTimeInMin]
+        # the count files read last take precedence
+        for obsCounts, row in reversed(self._obsCountRows):
+            count = obsCounts.getObsCount(row, startTimeInMin, endTimeInMin)
+            if count is not None:
+                return count
+        return None
+
+    def addObsCountRow(self, obsCounts, row):
+        """
+        Adds the counts of the link by time bin in *row* of *obsCounts*, an :py:class:`ObsCountStore`.
+        The count of any window made of whole bins is then available from :py:meth:`RoadLink.getObsCount`;
+        counts set with :py:meth:`RoadLink.setObsCount` take precedence.
+        """
+        self._obsCountRows.append((obsCounts, row))
 
     def getSumOfAllMovementCounts(self, startTimeInMin, endTimeInMin):
         """Return the sum of all outgoing movement counts"""
@@ -1116,7 +1124,7 @@ class RoadLink(Link):
     
     def hasCountInfo(self):
         """Return True if the link contains count information else false"""
-        return True if len(self._obsCount) else False
+        return True if len(self._obsCount) or len(self._obsCountRows) else False
         
     def hasMovementCountInfo(self):
         """Return True if any outgoing movement on the link
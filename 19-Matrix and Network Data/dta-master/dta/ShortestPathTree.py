@@ -0,0 +1,151 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from .DtaError import DtaError
+
+class ShortestPathTree(object):
+    """
+    The result of a one-to-all shortest path search, as returned by
+    :py:meth:`ShortestPaths.labelCorrectingWithLabelsOnLinks` and
+    :py:meth:`ShortestPaths.labelCorrectingWithLabelsOnNodes`.
+
+    The labels and predecessors are held in arrays indexed by the node or link index of the
+    :py:class:`GraphSnapshot` the search ran on, so nothing is stored on the :py:class:`Node` or
+    :py:class:`Link` instances and any number of trees can be computed at once against the same
+    :py:class:`Network`.
+    """
+
+    def __init__(self, network, snapshot, labels, predLinks, onLinks, sourceIndices):
+        """
+        Constructor.
+
+         * *network* is the :py:class:`Network` searched, used to return path elements
+         * *snapshot* is the :py:class:`GraphSnapshot` of *network* the search ran on
+         * *labels* is an array of costs by node index (or link index if *onLinks*), infinity if unreached
+         * *predLinks* is an array by node index (or link index) of the index of the link the
+           element was reached from, -1 for the source(s) and unreached elements
+         * *onLinks* is True if the tree is over the links (movement graph), False if over the nodes
+         * *sourceIndices* is the list of node (or link) indices the search started from
+        """
+        self._network       = network
+        self._snapshot      = snapshot
+        self._labels        = labels
+        self._predLinks     = predLinks
+        self._onLinks       = onLinks
+        self._sourceIndices = list(sourceIndices)
+        # python list of the predecessors, for path extraction
+        self._predLinkList  = None
+
+    def isOnLinks(self):
+        """
+        Returns True if this is a tree over the links, False if over the nodes.
+        """
+        return self._onLinks
+
+    def getSnapshot(self):
+        """
+        Returns the :py:class:`GraphSnapshot` the tree refers to.
+        """
+        return self._snapshot
+
+    def getLabels(self):
+        """
+        Returns the array of labels, by node index (or link index for trees on links).
+        """
+        return self._labels
+
+    def getPredecessorLinks(self):
+        """
+        Returns the array of predecessor link indices, by node index (or link index for trees on links).
+        """
+        return self._predLinks
+
+    def _getIndex(self, elementId):
+        """
+        Returns the snapshot index for the node id (or link id, for trees on links) *elementId*.
+        """
+        if self._onLinks:
+            return self._snapshot.getLinkIndex(elementId)
+        return self._snapshot.getNodeIndex(elementId)
+
+    def getLabel(self, elementId):
+        """
+        Returns the label of the node with id *elementId* (or the link, for trees on links).
+        This is infinity if it was not reached.
+        """
+        return float(self._labels[self._getIndex(elementId)])
+
+    def isReachable(self, elementId):
+        """
+        Returns True if the node with id *elementId* (or the link, for trees on links) was reached.
+        """
+        return bool(np.isfinite(self._labels[self._getIndex(elementId)]))
+
+    def getPathIndices(self, index):
+        """
+        Returns the list of node indices (or link indices, for trees on links) from the source to the
+        element with index *index*, both included.  Raises a :py:class:`DtaError` if it was not reached.
+        """
+        if not np.isfinite(self._labels[index]):
+            raise DtaError("ShortestPathTree: %s %d was not reached" %
+                           ("link" if self._onLinks else "node",
+                            self._snapshot.getLinkId(index) if self._onLinks else self._snapshot.getNodeId(index)))
+
+        if self._predLinkList is None:
+            self._predLinkList = self._predLinks.tolist()
+        predLinks = self._predLinkList
+        startNode = None if self._onLinks else self._snapshot.linkStartNode
+
+        path = [index]
+        while predLinks[index] >= 0:
+            index = predLinks[index] if self._onLinks else int(startNode[predLinks[index]])
+            path.append(index)
+        path.reverse()
+        return path
+
+    def getPathIds(self, elementId):
+        """
+        Returns the list of node ids (or link ids, for trees on links) from the source to the node
+        (or link) with id *elementId*, both included.
+        """
+        ids = self._snapshot.linkIds if self._onLinks else self._snapshot.nodeIds
+        return [int(ids[index]) for index in self.getPathIndices(self._getIndex(elementId))]
+
+    def getPath(self, elementId):
+        """
+        Returns the list of :py:class:`Node` instances (or :py:class:`Link` instances, for trees on links)
+        from the source to the node (or link) with id *elementId*, both included.
+        """
+        if self._onLinks:
+            return [self._network.getLinkForId(linkId) for linkId in self.getPathIds(elementId)]
+        return [self._network.getNodeForId(nodeId) for nodeId in self.getPathIds(elementId)]
+
+    def getLinkPath(self, nodeId):
+        """
+        For trees on nodes, returns the list of :py:class:`Link` instances traversed from the source
+        to the node with id *nodeId*.
+        """
+        if self._onLinks:
+            return self.getPath(nodeId)
+
+        index = self._snapshot.getNodeIndex(nodeId)
+        nodePath = self.getPathIndices(index)
+        return [self._network.getLinkForId(self._snapshot.getLinkId(self._predLinks[nodeIndex]))
+                for nodeIndex in nodePath[1:]]
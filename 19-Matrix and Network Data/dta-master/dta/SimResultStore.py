@@ -0,0 +1,468 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from .DtaError import DtaError
+
+class SimResultStore(object):
+    """
+    Dense storage of simulation results by time step: the outgoing volume, the incoming volume
+    and the mean travel time of a number of rows, each of which is a :py:class:`Movement` or
+    a :py:class:`RoadLink`.
+
+    The results are held in (rows x time steps) float32 arrays, so a :py:class:`Movement` or :py:class:`RoadLink`
+    only keeps its row index (see :py:meth:`Network.initializeSimResults`), a query over a time interval
+    is a slice sum (accumulated in float64), and the same query over every row is a single array operation.
+
+    Each row may have a parent row, e.g. the row of the incoming link of a movement, so the values of
+    the rows can be totaled by parent with :py:meth:`SimResultStore.sumByParent`.
+
+    The queries of a single row (e.g. :py:meth:`SimResultStore.getOutVolume`) and of many windows
+    (:py:meth:`SimResultStore.getWindowResults`) use prefix sums by row of the volumes and of the volume
+    times the travel time, so any window made of whole time steps is a subtraction.  The prefix sums are float64
+    with one more column than the float32 results, so each kind of them takes a bit more than twice the memory
+    of the array it sums.  The single row queries build only the kind they need, for the block of
+    :py:attr:`SimResultStore.PREFIX_SUM_BLOCK_ROWS` rows they ask for, and keep it, updating the rows set afterwards;
+    :py:meth:`SimResultStore.getWindowResults` goes through the rows block by block without keeping them.
+    """
+
+    #: the number of rows of a block of prefix sums
+    PREFIX_SUM_BLOCK_ROWS   = 4096
+    #: the kinds of prefix sums: outgoing volume, incoming volume and outgoing volume x mean travel time,
+    #: and the boolean array by row that's True for the rows with inconsistent results
+    PREFIX_SUM_KINDS        = ["outVolume", "inVolume", "time", "inconsistent"]
+
+    def __init__(self, startTimeInMin, endTimeInMin, timeStepInMin):
+        """
+        Constructor.  The results are stored from *startTimeInMin* to *endTimeInMin*, by *timeStepInMin*.
+        """
+        if timeStepInMin is None or timeStepInMin <= 0 or endTimeInMin <= startTimeInMin or \
+           (endTimeInMin - startTimeInMin) % timeStepInMin != 0:
+            raise DtaError("SimResultStore: invalid simulation times %s-%s step %s" %
+                           (str(startTimeInMin), str(endTimeInMin), str(timeStepInMin)))
+
+        self._startTimeInMin    = startTimeInMin
+        self._endTimeInMin      = endTimeInMin
+        self._timeStepInMin     = timeStepInMin
+        self._numTimeSteps      = int((endTimeInMin - startTimeInMin) // timeStepInMin)
+        self._numRows           = 0
+
+        self._outVolume         = np.zeros((0, self._numTimeSteps), dtype=np.float32)
+        self._inVolume          = np.zeros((0, self._numTimeSteps), dtype=np.float32)
+        self._meanTT            = np.zeros((0, self._numTimeSteps), dtype=np.float32)
+        self._parentRows        = np.zeros(0, dtype=np.int32)
+
+        # block index -> {kind -> prefix sums of the rows of the block}, see _getPrefixSums
+        self._prefixSums        = {}
+        # block index -> set of the rows of the block set since its prefix sums were built
+        self._dirtyRows         = {}
+
+    @classmethod
+    def fromArrays(cls, startTimeInMin, endTimeInMin, timeStepInMin, outVolume, inVolume, meanTT, parentRows):
+        """
+        Returns a :py:class:`SimResultStore` over the given (rows x time steps) arrays and array of parent rows,
+        which are used as they are (e.g. read-only memory mapped arrays, see :py:class:`SimResultWarehouse`).
+        """
+        simResults = cls(startTimeInMin, endTimeInMin, timeStepInMin)
+        for values in [outVolume, inVolume, meanTT]:
+            if values.shape != (len(parentRows), simResults._numTimeSteps):
+                raise DtaError("SimResultStore: array of shape %s instead of %s" %
+                               (str(values.shape), str((len(parentRows), simResults._numTimeSteps))))
+        simResults._outVolume  = outVolume
+        simResults._inVolume   = inVolume
+        simResults._meanTT     = meanTT
+        simResults._parentRows = parentRows
+        simResults._numRows    = len(parentRows)
+        return simResults
+
+    def getStartTimeInMin(self):
+        """
+        Returns the start of the first time step, in minutes.
+        """
+        return self._startTimeInMin
+
+    def getEndTimeInMin(self):
+        """
+        Returns the end of the last time step, in minutes.
+        """
+        return self._endTimeInMin
+
+    def getTimeStepInMin(self):
+        """
+        Returns the length of the time steps, in minutes.
+        """
+        return self._timeStepInMin
+
+    def getNumTimeSteps(self):
+        """
+        Returns the number of time steps.
+        """
+        return self._numTimeSteps
+
+    def getNumRows(self):
+        """
+        Returns the number of rows.
+        """
+        return self._numRows
+
+    def addRow(self, parentRow=-1):
+        """
+        Adds a row of zeros, with the given *parentRow* (-1 for none), and returns its index.
+        """
+        return self.addRows([parentRow])
+
+    def addRows(self, parentRows):
+        """
+        Adds a row of zeros for each of the *parentRows* (-1 for none), and returns the index of the first one.
+        """
+        numRows = self._numRows + len(parentRows)
+        if numRows > len(self._parentRows):
+            capacity = max(16, numRows, 2 * self._numRows)
+            for attrName in ["_outVolume", "_inVolume", "_meanTT"]:
+                grown = np.zeros((capacity, self._numTimeSteps), dtype=np.float32)
+                grown[:self._numRows] = getattr(self, attrName)[:self._numRows]
+                setattr(self, attrName, grown)
+            grown = np.empty(capacity, dtype=np.int32)
+            grown[:self._numRows] = self._parentRows[:self._numRows]
+            self._parentRows = grown
+
+        firstRow = self._numRows
+        self._parentRows[firstRow:numRows] = parentRows
+        # the last block grows
+        self._dropPrefixSums(firstRow // SimResultStore.PREFIX_SUM_BLOCK_ROWS)
+        self._numRows = numRows
+        return firstRow
+
+    def getParentRows(self):
+        """
+        Returns the array of the parent row of each row, -1 for none.
+        """
+        return self._parentRows[:self._numRows]
+
+    def getStepRange(self, startTimeInMin, endTimeInMin):
+        """
+        Returns (first, last) such that the time steps first to last-1 make up the interval from
+        *startTimeInMin* to *endTimeInMin*.  Raises a :py:class:`DtaError` if the interval is empty,
+        outside the simulation time or not made of whole time steps.
+        """
+        if startTimeInMin >= endTimeInMin:
+            raise DtaError("Invalid time bin (%d %s). The end time cannot be equal or less "
+                           "than the end time" % (startTimeInMin, endTimeInMin))
+        if startTimeInMin < self._startTimeInMin or endTimeInMin > self._endTimeInMin:
+            raise DtaError('Time period from %d to %d is out of '
+                           'simulation time' % (startTimeInMin, endTimeInMin))
+        if (startTimeInMin - self._startTimeInMin) % self._timeStepInMin != 0 or \
+           (endTimeInMin - startTimeInMin) % self._timeStepInMin != 0:
+            raise DtaError('Time period from %d to %d is not '
+                           'in multiple simulation time steps %d' %
+                           (startTimeInMin, endTimeInMin, self._timeStepInMin))
+
+        first = int((startTimeInMin - self._startTimeInMin) // self._timeStepInMin)
+        last  = int((endTimeInMin - self._startTimeInMin) // self._timeStepInMin)
+        return first, last
+
+    def _getStep(self, startTimeInMin, endTimeInMin):
+        """
+        Returns the index of the time step from *startTimeInMin* to *endTimeInMin*; raises a
+        :py:class:`DtaError` if that isn't exactly one time step.
+        """
+        first, last = self.getStepRange(startTimeInMin, endTimeInMin)
+        if last - first != 1:
+            raise DtaError('Time period from %d to %d is not '
+                           'equal to the simulation time step %d' %
+                           (startTimeInMin, endTimeInMin, self._timeStepInMin))
+        return first
+
+    def setOutVolume(self, row, startTimeInMin, endTimeInMin, volume):
+        """
+        Sets the outgoing volume of *row* for the time step from *startTimeInMin* to *endTimeInMin*.
+        """
+        self._outVolume[row, self._getStep(startTimeInMin, endTimeInMin)] = volume
+        self._setDirty([row])
+
+    def setInVolume(self, row, startTimeInMin, endTimeInMin, volume):
+        """
+        Sets the incoming volume of *row* for the time step from *startTimeInMin* to *endTimeInMin*.
+        """
+        self._inVolume[row, self._getStep(startTimeInMin, endTimeInMin)] = volume
+        self._setDirty([row])
+
+    def setMeanTT(self, row, startTimeInMin, endTimeInMin, meanTTInMin):
+        """
+        Sets the mean travel time in minutes of *row* for the time step from *startTimeInMin* to *endTimeInMin*.
+        """
+        self._meanTT[row, self._getStep(startTimeInMin, endTimeInMin)] = meanTTInMin
+        self._setDirty([row])
+
+    def setBlock(self, rows, firstStep, outVolumes=None, inVolumes=None, meanTTs=None):
+        """
+        Sets the results of the *rows* (an array of row indices) for the time steps starting at *firstStep*
+        from the given (rows x steps) arrays; the results not given are left as they are.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        for attrName, values in [("_outVolume", outVolumes), ("_inVolume", inVolumes), ("_meanTT", meanTTs)]:
+            if values is None: continue
+            values = np.asarray(values)
+            if values.shape[0] != len(rows) or firstStep < 0 or firstStep + values.shape[1] > self._numTimeSteps:
+                raise DtaError("SimResultStore: block of shape %s starting at time step %d does not fit %d rows and %d time steps" %
+                               (str(values.shape), firstStep, len(rows), self._numTimeSteps))
+            getattr(self, attrName)[rows, firstStep:firstStep + values.shape[1]] = values
+        self._setDirty(rows.tolist())
+
+    def getMeanTTOfStep(self, row, startTimeInMin, endTimeInMin):
+        """
+        Returns the mean travel time of *row* stored for the time step from *startTimeInMin* to *endTimeInMin*.
+        """
+        return float(self._meanTT[row, self._getStep(startTimeInMin, endTimeInMin)])
+
+    def getOutVolume(self, row, startTimeInMin, endTimeInMin):
+        """
+        Returns the outgoing volume of *row* from *startTimeInMin* to *endTimeInMin*.
+        """
+        first, last = self.getStepRange(startTimeInMin, endTimeInMin)
+        block, offset = divmod(row, SimResultStore.PREFIX_SUM_BLOCK_ROWS)
+        cumOutVolume = self._getPrefixSums("outVolume", block)
+        return float(cumOutVolume[offset, last] - cumOutVolume[offset, first])
+
+    def getInVolume(self, row, startTimeInMin, endTimeInMin):
+        """
+        Returns the incoming volume of *row* from *startTimeInMin* to *endTimeInMin*.
+        """
+        first, last = self.getStepRange(startTimeInMin, endTimeInMin)
+        block, offset = divmod(row, SimResultStore.PREFIX_SUM_BLOCK_ROWS)
+        cumInVolume = self._getPrefixSums("inVolume", block)
+        return float(cumInVolume[offset, last] - cumInVolume[offset, first])
+
+    def getOutVolumes(self, startTimeInMin, endTimeInMin):
+        """
+        Returns the array of the outgoing volume of every row from *startTimeInMin* to *endTimeInMin*.
+        """
+        first, last = self.getStepRange(startTimeInMin, endTimeInMin)
+        return self._outVolume[:self._numRows, first:last].sum(axis=1, dtype=np.float64)
+
+    def getInVolumes(self, startTimeInMin, endTimeInMin):
+        """
+        Returns the array of the incoming volume of every row from *startTimeInMin* to *endTimeInMin*.
+        """
+        first, last = self.getStepRange(startTimeInMin, endTimeInMin)
+        return self._inVolume[:self._numRows, first:last].sum(axis=1, dtype=np.float64)
+
+    def _checkConsistent(self, volumes, times, rows, first, names=None):
+        """
+        Raises a :py:class:`DtaError` for the first time step that has a volume but no travel time,
+        or the reverse (or a negative value).  *volumes* and *times* are (rows x steps) blocks starting
+        at time step *first*; *names*, if given, are used for the rows in the message.
+        """
+        valid = ((volumes > 0) & (times > 0)) | ((volumes == 0) & (times == 0))
+        if valid.all(): return
+
+        badRow, badStep = [int(index[0]) for index in np.nonzero(~valid)]
+        startTimeInMin = self._startTimeInMin + (first + badStep) * self._timeStepInMin
+        raise DtaError("%s has flow: %f and TT: %f for time period from %d to %d" %
+                       (names[badRow] if names else "Row %d" % rows[badRow],
+                        volumes[badRow, badStep], times[badRow, badStep],
+                        startTimeInMin, startTimeInMin + self._timeStepInMin))
+
+    def getMeanTT(self, row, startTimeInMin, endTimeInMin, name=None):
+        """
+        Returns (outgoing volume, volume weighted mean travel time in minutes) of *row* from *startTimeInMin*
+        to *endTimeInMin*.  The mean travel time is None if there's no volume.
+
+        Raises a :py:class:`DtaError` if a time step has a volume and no travel time or the reverse;
+        *name* is used for the row in the message.
+        """
+        first, last = self.getStepRange(startTimeInMin, endTimeInMin)
+        block, offset = divmod(row, SimResultStore.PREFIX_SUM_BLOCK_ROWS)
+        if self._getPrefixSums("inconsistent", block)[offset]:
+            self._checkConsistent(self._outVolume[row:row+1, first:last], self._meanTT[row:row+1, first:last],
+                                  [row], first, [name] if name else None)
+
+        cumOutVolume = self._getPrefixSums("outVolume", block)
+        totalVolume = float(cumOutVolume[offset, last] - cumOutVolume[offset, first])
+        if totalVolume <= 0:
+            return totalVolume, None
+        cumTime = self._getPrefixSums("time", block)
+        return totalVolume, float(cumTime[offset, last] - cumTime[offset, first]) / totalVolume
+
+    def getMeanTTs(self, startTimeInMin, endTimeInMin):
+        """
+        Returns (volumes, mean travel times) arrays of every row from *startTimeInMin* to *endTimeInMin*,
+        as :py:meth:`SimResultStore.getMeanTT`; the mean travel time is NaN for the rows without volume.
+        """
+        first, last = self.getStepRange(startTimeInMin, endTimeInMin)
+        volumes = self._outVolume[:self._numRows, first:last].astype(np.float64)
+        times   = self._meanTT[:self._numRows, first:last].astype(np.float64)
+        self._checkConsistent(volumes, times, np.arange(self._numRows), first)
+
+        totalVolumes = volumes.sum(axis=1)
+        totalTimes   = (volumes * times).sum(axis=1)
+        meanTTs      = np.empty(self._numRows, dtype=np.float64)
+        meanTTs.fill(np.nan)
+        np.divide(totalTimes, totalVolumes, out=meanTTs, where=totalVolumes > 0)
+        return totalVolumes, meanTTs
+
+    def _computePrefixSums(self, kind, rows):
+        """
+        Returns the *kind* (one of :py:attr:`SimResultStore.PREFIX_SUM_KINDS`) prefix sums of the *rows*
+        (an array of rows or a slice), see :py:meth:`SimResultStore._getPrefixSums`.
+        """
+        if kind == "inconsistent":
+            outVolume = self._outVolume[rows]
+            meanTT    = self._meanTT[rows]
+            valid = ((outVolume > 0) & (meanTT > 0)) | ((outVolume == 0) & (meanTT == 0))
+            return ~valid.all(axis=1)
+
+        if kind == "time":
+            values = self._outVolume[rows].astype(np.float64)
+            values *= self._meanTT[rows]
+        else:
+            values = getattr(self, "_" + kind)[rows]
+        cumValues = np.zeros((len(values), self._numTimeSteps + 1), dtype=np.float64)
+        np.cumsum(values, axis=1, dtype=np.float64, out=cumValues[:, 1:])
+        return cumValues
+
+    def _getPrefixSums(self, kind, block, keep=True):
+        """
+        Returns the *kind* prefix sums of the rows of the *block* (i.e. from *block* x
+        :py:attr:`SimResultStore.PREFIX_SUM_BLOCK_ROWS`), a (block rows x time steps + 1) array whose column *i*
+        is the sum over the time steps before *i* of the outgoing volume, the incoming volume or the outgoing
+        volume x mean travel time.  For the kind ``inconsistent``, returns instead the boolean array by row
+        of the block that's True for the rows with a time step with a volume and no travel time or the reverse.
+
+        They are built the first time and kept if *keep*, and updated for the rows set since.
+        """
+        blockSums = self._prefixSums.get(block)
+        if blockSums is None:
+            blockSums = {}
+            if keep: self._prefixSums[block] = blockSums
+
+        firstRow  = block * SimResultStore.PREFIX_SUM_BLOCK_ROWS
+        dirtyRows = self._dirtyRows.pop(block, None)
+        if dirtyRows:
+            rows = np.array(sorted(dirtyRows), dtype=np.int64)
+            for blockKind, prefixSums in blockSums.iteritems():
+                prefixSums[rows - firstRow] = self._computePrefixSums(blockKind, rows)
+
+        if kind in blockSums:
+            return blockSums[kind]
+        prefixSums = self._computePrefixSums(kind, slice(firstRow, min(firstRow + SimResultStore.PREFIX_SUM_BLOCK_ROWS,
+                                                                       self._numRows)))
+        if keep: blockSums[kind] = prefixSums
+        return prefixSums
+
+    def _setDirty(self, rows):
+        """
+        Notes that the *rows* were set, for the prefix sums kept for their blocks.
+        """
+        if not self._prefixSums: return
+        for row in rows:
+            block = row // SimResultStore.PREFIX_SUM_BLOCK_ROWS
+            if block in self._prefixSums:
+                self._dirtyRows.setdefault(block, set()).add(row)
+
+    def _dropPrefixSums(self, firstBlock):
+        """
+        Drops the prefix sums kept for the blocks from *firstBlock* on.
+        """
+        for block in [block for block in self._prefixSums if block >= firstBlock]:
+            del self._prefixSums[block]
+            self._dirtyRows.pop(block, None)
+
+    def getWindowResults(self, windows):
+        """
+        Returns (outgoing volumes, incoming volumes, mean travel times), each a (rows x windows) array of the
+        results of every row for each of the *windows*, a list of (startTimeInMin, endTimeInMin).  The mean
+        travel time is volume weighted, and NaN without volume.
+
+        Raises a :py:class:`DtaError` as :py:meth:`SimResultStore.getMeanTTs` for inconsistent results.
+        """
+        stepRanges = [self.getStepRange(startTimeInMin, endTimeInMin) for startTimeInMin, endTimeInMin in windows]
+        firsts = np.array([first for first, last in stepRanges], dtype=np.int64)
+        lasts  = np.array([last for first, last in stepRanges], dtype=np.int64)
+
+        blocks = range((self._numRows + SimResultStore.PREFIX_SUM_BLOCK_ROWS - 1) // SimResultStore.PREFIX_SUM_BLOCK_ROWS)
+        inconsistentRows = np.flatnonzero(np.concatenate([np.zeros(0, dtype=np.bool_)] +
+                                                         [self._getPrefixSums("inconsistent", block, keep=False)
+                                                          for block in blocks]))
+        if len(inconsistentRows):
+            for first, last in stepRanges:
+                self._checkConsistent(self._outVolume[inconsistentRows, first:last],
+                                      self._meanTT[inconsistentRows, first:last], inconsistentRows, first)
+
+        outVolumes = np.empty((self._numRows, len(windows)), dtype=np.float64)
+        inVolumes  = np.empty_like(outVolumes)
+        totalTimes = np.empty_like(outVolumes)
+        for block in blocks:
+            rows = slice(block * SimResultStore.PREFIX_SUM_BLOCK_ROWS, (block + 1) * SimResultStore.PREFIX_SUM_BLOCK_ROWS)
+            for results, kind in [(outVolumes, "outVolume"), (inVolumes, "inVolume"), (totalTimes, "time")]:
+                prefixSums = self._getPrefixSums(kind, block, keep=False)
+                results[rows] = prefixSums[:, lasts] - prefixSums[:, firsts]
+        meanTTs    = np.empty_like(outVolumes)
+        meanTTs.fill(np.nan)
+        np.divide(totalTimes, outVolumes, out=meanTTs, where=outVolumes > 0)
+        return outVolumes, inVolumes, meanTTs
+
+    def sumByParent(self, values):
+        """
+        Returns the array, by row, of the sum of *values* (an array by row, or a 2-dimensional array
+        with a column of values by row in each column) over the children of each row.
+        """
+        parentRows = self.getParentRows()
+        hasParent  = parentRows >= 0
+        values     = np.asarray(values)
+        if values.ndim == 2:
+            return np.column_stack([self.sumByParent(values[:, column]) for column in range(values.shape[1])]) \
+                if values.shape[1] else np.zeros((self._numRows, 0), dtype=np.float64)
+        return np.bincount(parentRows[hasParent], weights=values[hasParent],
+                           minlength=self._numRows)[:self._numRows]
+
+    def getLinkTotals(self, values, linkRows):
+        """
+        Returns the array of *values* (an array by row, or a 2-dimensional array with a column of values by row
+        in each column) totaled for each of the *linkRows*, over the link's own row and the rows of its children,
+        i.e. its outgoing movements (see :py:meth:`Network.initializeSimResults`).
+        """
+        totals = values + self.sumByParent(values)
+        return totals[linkRows]
+
+    def getLinkMeanTTs(self, volumes, meanTTs, linkRows, freeflowTTs):
+        """
+        Returns (volumes, mean travel times) arrays for each of the *linkRows* from the *volumes* and *meanTTs*
+        by row (arrays, or 2-dimensional arrays with a column by row in each column, as returned by
+        :py:meth:`SimResultStore.getMeanTTs` or :py:meth:`SimResultStore.getWindowResults`): the volumes totaled
+        as :py:meth:`SimResultStore.getLinkTotals`, and the volume weighted mean travel time of the link's rows,
+        or the link's *freeflowTTs* if there's no volume.
+        """
+        totalTimes  = np.where(volumes > 0, volumes * np.nan_to_num(meanTTs), 0.0)
+        linkVolumes = self.getLinkTotals(volumes, linkRows)
+        linkTimes   = self.getLinkTotals(totalTimes, linkRows)
+
+        freeflowTTs = np.asarray(freeflowTTs, dtype=np.float64)
+        if linkVolumes.ndim == 2:
+            linkTTs = np.repeat(freeflowTTs[:, np.newaxis], linkVolumes.shape[1], axis=1)
+        else:
+            linkTTs = freeflowTTs.copy()
+        np.divide(linkTimes, linkVolumes, out=linkTTs, where=linkVolumes > 0)
+        return linkVolumes, linkTTs
+
+    def getNumBytes(self):
+        """
+        Returns the number of bytes used by the arrays of results.
+        """
+        return self._outVolume.nbytes + self._inVolume.nbytes + self._meanTT.nbytes + self._parentRows.nbytes
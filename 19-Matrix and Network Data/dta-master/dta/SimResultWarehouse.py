@@ -0,0 +1,304 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+
+from .DtaError import DtaError
+from .Logger import DtaLogger
+from .SimResultStore import SimResultStore
+
+class SimResultWarehouse(object):
+    """
+    An on-disk store of the simulation results of many runs of the same network (e.g. the iterations
+    of a calibration, or scenarios), for comparing them without reading the result files again.
+
+    The warehouse is a directory holding the layout shared by the runs, i.e. the :py:class:`SimResultStore`
+    rows of the links and movements set up by :py:meth:`Network.initializeSimResults`, and for each run
+    its outgoing volumes, incoming volumes and mean travel times as (rows x time steps) float32 ``.npy`` files.
+    A run is ingested once; afterwards its arrays are memory mapped, so a query over many runs only
+    reads the time steps it asks for.
+
+    The simulation start, end and time step of the runs are kept in the header of the warehouse.  They are
+    given to the constructor of a new warehouse, or taken from the first run added to it.
+
+    The link queries return an array by run and link, in the order of :py:meth:`SimResultWarehouse.getLinkIds`.
+    """
+    #: the version of the warehouse format
+    VERSION             = 1
+
+    #: measure for the link queries: the outgoing volume
+    MEASURE_VOLUME      = "volume"
+    #: measure for the link queries: the incoming volume
+    MEASURE_IN_VOLUME   = "inVolume"
+    #: measure for the link queries: the mean travel time in minutes, see :py:meth:`Network.getLinkSimTTsInMin`
+    MEASURE_TT          = "travelTime"
+
+    #: the arrays shared by the runs
+    LAYOUT_ARRAYS       = ["parentRows", "linkIds", "linkRows", "linkFreeflowTTs"]
+    #: the arrays of each run, by :py:class:`SimResultStore` attribute
+    RUN_ARRAYS          = [("outVolume", "_outVolume"), ("inVolume", "_inVolume"), ("meanTT", "_meanTT")]
+
+    def __init__(self, dir, simStartTimeInMin=None, simEndTimeInMin=None, simTimeStepInMin=None):
+        """
+        Constructor.  Opens the warehouse in the directory *dir*, which is created if it doesn't exist.
+
+        If the simulation times *simStartTimeInMin*, *simEndTimeInMin* and *simTimeStepInMin* are given,
+        they are stored in the header of a new warehouse, or must be those of an existing one.
+        """
+        self._dir       = dir
+        if not os.path.isdir(dir):
+            os.makedirs(dir)
+
+        # (start, end, time step) in minutes
+        self._times     = None
+        self._runNames  = []
+        # layout array name -> array
+        self._layout    = None
+        # run name -> memory mapped SimResultStore
+        self._runs      = {}
+        self._readHeader()
+
+        if simStartTimeInMin is not None or simEndTimeInMin is not None or simTimeStepInMin is not None:
+            times = (simStartTimeInMin, simEndTimeInMin, simTimeStepInMin)
+            if None in times:
+                raise DtaError("SimResultWarehouse needs all of the simulation start, end and time step, got %s" % str(times))
+            if self._times is None:
+                self._times = times
+                self._writeHeader()
+            elif times != self._times:
+                raise DtaError("SimResultWarehouse %s has the simulation times %s, not %s" % (self._dir, str(self._times), str(times)))
+
+    def _readHeader(self):
+        """
+        Reads the simulation times and the names of the runs from the header of the warehouse, if there is one.
+        """
+        headerfile = os.path.join(self._dir, "header.txt")
+        if not os.path.exists(headerfile): return
+
+        for line in open(headerfile, "r"):
+            fields = line.split()
+            if len(fields) == 0: continue
+            if fields[0] == "version" and int(fields[1]) != SimResultWarehouse.VERSION:
+                raise DtaError("SimResultWarehouse %s has version %s instead of %d" %
+                               (self._dir, fields[1], SimResultWarehouse.VERSION))
+            elif fields[0] == "times":
+                self._times = tuple(int(field) for field in fields[1:4])
+            elif fields[0] == "run":
+                self._runNames.append(fields[1])
+
+    def _writeHeader(self):
+        """
+        Writes the header of the warehouse, replacing the previous one at once.
+        """
+        handle, tempfilename = tempfile.mkstemp(dir=self._dir)
+        headerfile = os.fdopen(handle, "w")
+        headerfile.write("version %d\n" % SimResultWarehouse.VERSION)
+        headerfile.write("times %d %d %d\n" % self._times)
+        for runName in self._runNames:
+            headerfile.write("run %s\n" % runName)
+        headerfile.close()
+        os.rename(tempfilename, os.path.join(self._dir, "header.txt"))
+
+    def _getLayout(self):
+        """
+        Returns the dictionary of the layout arrays, memory mapped; None if no run was added yet.
+        """
+        if self._layout is None and all(os.path.exists(os.path.join(self._dir, arrayName + ".npy"))
+                                        for arrayName in SimResultWarehouse.LAYOUT_ARRAYS):
+            self._layout = dict((arrayName, np.load(os.path.join(self._dir, arrayName + ".npy"), mmap_mode='r'))
+                                for arrayName in SimResultWarehouse.LAYOUT_ARRAYS)
+        return self._layout
+
+    def _getRunDir(self, runName):
+        """
+        Returns the directory of the arrays of the run *runName*.
+        """
+        return os.path.join(self._dir, "run_%s" % runName)
+
+    def getRunNames(self):
+        """
+        Returns the list of the names of the runs, in the order they were added.
+        """
+        return list(self._runNames)
+
+    def hasRun(self, runName):
+        """
+        Returns True if the warehouse has a run named *runName*.
+        """
+        return runName in self._runNames
+
+    def getLinkIds(self):
+        """
+        Returns the array of the ids of the links, in the order used by the link queries.
+        """
+        layout = self._getLayout()
+        if layout is None:
+            raise DtaError("SimResultWarehouse %s has no runs" % self._dir)
+        return np.array(layout["linkIds"])
+
+    def addRun(self, runName, network, overwrite=False):
+        """
+        Adds the simulation results of *network*, a :py:class:`Network` with its :py:meth:`Network.getSimResults`
+        set up (e.g. by :py:meth:`DynameqNetwork.readSimResults`), as the run *runName*.  All the runs must have
+        the same simulation times, links and movements.
+
+        Returns False, without storing anything, if there is already a run with that name and not *overwrite*.
+        """
+        if not re.match(r"^[\w.-]+$", runName):
+            raise DtaError("SimResultWarehouse run name %s must be made of letters, digits, '_', '.' and '-'" % runName)
+        if runName in self._runNames and not overwrite:
+            DtaLogger.info("SimResultWarehouse %s already has run %s" % (self._dir, runName))
+            return False
+
+        simResults = network.getSimResults()
+        if simResults is None:
+            raise DtaError("SimResultWarehouse addRun: the network has no simulation results")
+        times = (simResults.getStartTimeInMin(), simResults.getEndTimeInMin(), simResults.getTimeStepInMin())
+        linkIds, linkRows = network.getSimResultLinkRows()
+        parentRows = simResults.getParentRows()
+
+        layout = self._getLayout()
+        if self._times is not None and times != self._times:
+            raise DtaError("SimResultWarehouse %s: run %s has the simulation times %s instead of %s" %
+                           (self._dir, runName, str(times), str(self._times)))
+        if layout is None:
+            layout = {"parentRows"      : np.array(parentRows, dtype=np.int32),
+                      "linkIds"         : linkIds,
+                      "linkRows"        : linkRows.astype(np.int32),
+                      "linkFreeflowTTs" : np.array([network.getLinkForId(linkId).getFreeFlowTTInMin()
+                                                    for linkId in linkIds.tolist()], dtype=np.float64)}
+            for arrayName in SimResultWarehouse.LAYOUT_ARRAYS:
+                np.save(os.path.join(self._dir, arrayName + ".npy"), layout[arrayName])
+            self._times = times
+        elif not np.array_equal(parentRows, layout["parentRows"]) or not np.array_equal(linkIds, layout["linkIds"]):
+            raise DtaError("SimResultWarehouse %s: run %s does not have the links and movements "
+                           "of the runs already stored" % (self._dir, runName))
+
+        # write to a temporary directory first so an interrupted run never looks complete
+        tempDir = tempfile.mkdtemp(dir=self._dir)
+        try:
+            for arrayName, attrName in SimResultWarehouse.RUN_ARRAYS:
+                np.save(os.path.join(tempDir, arrayName + ".npy"),
+                        getattr(simResults, attrName)[:simResults.getNumRows()].astype(np.float32))
+            runDir = self._getRunDir(runName)
+            if os.path.exists(runDir):
+                shutil.rmtree(runDir)
+            os.rename(tempDir, runDir)
+        except:
+            shutil.rmtree(tempDir, ignore_errors=True)
+            raise
+
+        self._runs.pop(runName, None)
+        if runName not in self._runNames:
+            self._runNames.append(runName)
+        self._writeHeader()
+        DtaLogger.info("SimResultWarehouse %s stored run %s" % (self._dir, runName))
+        return True
+
+    def ingestDynameqRun(self, runName, network, runDir, overwrite=False):
+        """
+        Reads the Dynameq movement results in *runDir* into *network*, a :py:class:`DynameqNetwork`, using
+        the simulation times of the warehouse, and adds them as the run *runName* (see :py:meth:`SimResultWarehouse.addRun`).
+        Nothing is read if the run is already stored and not *overwrite*.
+
+        Returns True if the run was ingested.
+        """
+        if runName in self._runNames and not overwrite:
+            return False
+        if self._times is None:
+            raise DtaError("SimResultWarehouse %s: the simulation times are not known; pass them to the constructor "
+                           "or add a first run" % self._dir)
+        network.readSimResults(self._times[0], self._times[1], self._times[2], dir=runDir)
+        return self.addRun(runName, network, overwrite)
+
+    def getRun(self, runName):
+        """
+        Returns the :py:class:`SimResultStore` of the run *runName*, over memory mapped arrays.
+        """
+        if runName not in self._runNames:
+            raise DtaError("SimResultWarehouse %s has no run %s" % (self._dir, runName))
+        if runName not in self._runs:
+            runDir = self._getRunDir(runName)
+            arrays = [np.load(os.path.join(runDir, arrayName + ".npy"), mmap_mode='r')
+                      for arrayName, attrName in SimResultWarehouse.RUN_ARRAYS]
+            self._runs[runName] = SimResultStore.fromArrays(self._times[0], self._times[1], self._times[2],
+                                                            *(arrays + [self._getLayout()["parentRows"]]))
+        return self._runs[runName]
+
+    def _getLinkValues(self, simResults, startTimeInMin, endTimeInMin, measure):
+        """
+        Returns the array by link of the *measure* in *simResults* from *startTimeInMin* to *endTimeInMin*.
+        """
+        layout = self._getLayout()
+        if measure == SimResultWarehouse.MEASURE_VOLUME:
+            return simResults.getLinkTotals(simResults.getOutVolumes(startTimeInMin, endTimeInMin), layout["linkRows"])
+        if measure == SimResultWarehouse.MEASURE_IN_VOLUME:
+            return simResults.getLinkTotals(simResults.getInVolumes(startTimeInMin, endTimeInMin), layout["linkRows"])
+        if measure == SimResultWarehouse.MEASURE_TT:
+            volumes, meanTTs = simResults.getMeanTTs(startTimeInMin, endTimeInMin)
+            return simResults.getLinkMeanTTs(volumes, meanTTs, layout["linkRows"], layout["linkFreeflowTTs"])[1]
+        raise DtaError("SimResultWarehouse: unknown measure %s" % str(measure))
+
+    def getLinkResults(self, startTimeInMin, endTimeInMin, measure=MEASURE_VOLUME, runNames=None):
+        """
+        Returns the (runs x links) array of the *measure* (one of the ``MEASURE_*`` constants) of each link
+        from *startTimeInMin* to *endTimeInMin*, for the *runNames* (all the runs by default) in that order.
+        """
+        if runNames is None:
+            runNames = self._runNames
+        results = np.empty((len(runNames), len(self.getLinkIds())), dtype=np.float64)
+        for index, runName in enumerate(runNames):
+            results[index] = self._getLinkValues(self.getRun(runName), startTimeInMin, endTimeInMin, measure)
+        return results
+
+    def getLinkDifferences(self, baseRunName, runName, startTimeInMin, endTimeInMin, measure=MEASURE_VOLUME):
+        """
+        Returns the array by link of the *measure* in the run *runName* minus that in the run *baseRunName*,
+        from *startTimeInMin* to *endTimeInMin*.
+        """
+        results = self.getLinkResults(startTimeInMin, endTimeInMin, measure, [baseRunName, runName])
+        return results[1] - results[0]
+
+    def getLinkPercentiles(self, startTimeInMin, endTimeInMin, percentiles=(5, 50, 95), measure=MEASURE_VOLUME, runNames=None):
+        """
+        Returns the (percentiles x links) array of the given *percentiles* (from 0 to 100) of the *measure* of each link
+        over the *runNames* (all the runs by default), from *startTimeInMin* to *endTimeInMin*.
+        """
+        results = self.getLinkResults(startTimeInMin, endTimeInMin, measure, runNames)
+        if len(results) == 0:
+            raise DtaError("SimResultWarehouse getLinkPercentiles: no runs")
+        return np.percentile(results, list(percentiles), axis=0)
+
+    def getConvergenceGaps(self, startTimeInMin, endTimeInMin, measure=MEASURE_VOLUME, runNames=None):
+        """
+        Returns the array of the relative gaps between each of the *runNames* (all the runs by default, e.g. the
+        iterations of an assignment in order) and the one before: the sum over the links of the absolute change
+        of the *measure* from *startTimeInMin* to *endTimeInMin*, divided by the sum of the absolute values in
+        the run before (zero if that's zero).
+        """
+        results = self.getLinkResults(startTimeInMin, endTimeInMin, measure, runNames)
+        changes = np.abs(np.diff(results, axis=0)).sum(axis=1)
+        totals  = np.abs(results[:-1]).sum(axis=1)
+        gaps    = np.zeros(len(changes), dtype=np.float64)
+        np.divide(changes, totals, out=gaps, where=totals > 0)
+        return gaps
@@ -0,0 +1,222 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from itertools import izip, count
+
+import numpy as np
+
+from .DtaError import DtaError
+
+class SparseDemandTable(object):
+    """
+    A (time slices x origins x destinations) table of values that only stores the non-zero cells, as
+    the sparse alternative to the :py:class:`MultiArray` of a :py:class:`Demand`.
+
+    The cells are kept as one sorted array of keys, ``(slice * origins + origin) * destinations + destination``,
+    and one array of values (coordinate format with a time index), so a cell costs 16 bytes instead
+    of 8 bytes for every cell of the dense table.  Cells are read and written by label like a
+    :py:class:`MultiArray`, e.g. ``table[timeLabel, originId, destinationId]``; new cells written that way
+    are buffered and merged into the arrays by the next bulk operation.
+    """
+
+    def __init__(self, dimElements):
+        """
+        Constructor.  *dimElements* is the list of the labels of the time slices, origins and destinations,
+        as for a :py:class:`MultiArray`.
+        """
+        if len(dimElements) != 3:
+            raise DtaError("SparseDemandTable needs three dimensions instead of %d" % len(dimElements))
+
+        self._dimElements   = [list(elements) for elements in dimElements]
+        self._shape         = tuple(len(elements) for elements in dimElements)
+        self._translation   = [dict(izip(elements, count())) for elements in dimElements]
+
+        # sorted unique keys of the cells and their values
+        self._keys          = np.zeros(0, dtype=np.int64)
+        self._values        = np.zeros(0, dtype=np.float64)
+        # key -> value of the cells set by label that are not in self._keys yet
+        self._pending       = {}
+
+    def getShape(self):
+        """
+        Returns the (time slices, origins, destinations) shape of the table.
+        """
+        return self._shape
+
+    def getElementsOfAllDimentions(self):
+        """
+        Returns the list of the labels of each dimension, like :py:meth:`MultiArray.getElementsOfAllDimentions`.
+        """
+        return [list(elements) for elements in self._dimElements]
+
+    def _getKey(self, viewElements):
+        """
+        Returns the key of the cell of the (time label, origin, destination) *viewElements*.
+        """
+        if len(viewElements) != 3:
+            raise IndexError("Invalid Index")
+        indices = []
+        for dimIndex, element in enumerate(viewElements):
+            try:
+                indices.append(self._translation[dimIndex][element])
+            except KeyError:
+                raise IndexError("Dim %d does not have element %s" % (dimIndex, str(element)))
+        return (indices[0] * self._shape[1] + indices[1]) * self._shape[2] + indices[2]
+
+    def _getKeys(self, timeIndices, originIndices, destinationIndices):
+        """
+        Returns the array of the keys of the cells at the given index arrays.
+        """
+        return (np.asarray(timeIndices, dtype=np.int64) * self._shape[1] +
+                np.asarray(originIndices, dtype=np.int64)) * self._shape[2] + \
+                np.asarray(destinationIndices, dtype=np.int64)
+
+    def _consolidate(self):
+        """
+        Merges the cells set by label into the sorted arrays.
+        """
+        if not self._pending: return
+        keys   = np.fromiter(self._pending.iterkeys(), dtype=np.int64, count=len(self._pending))
+        values = np.fromiter(self._pending.itervalues(), dtype=np.float64, count=len(self._pending))
+        self._pending = {}
+        order  = np.argsort(np.concatenate([self._keys, keys]), kind="mergesort")
+        self._keys   = np.concatenate([self._keys, keys])[order]
+        self._values = np.concatenate([self._values, values])[order]
+
+    def __getitem__(self, viewElements):
+        key = self._getKey(viewElements)
+        if key in self._pending:
+            return self._pending[key]
+        position = np.searchsorted(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            return float(self._values[position])
+        return 0.0
+
+    def __setitem__(self, viewElements, value):
+        key = self._getKey(viewElements)
+        position = np.searchsorted(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            self._values[position] = value
+        elif value != 0 or key in self._pending:
+            self._pending[key] = float(value)
+
+    def __eq__(self, other):
+        """
+        Returns True if *other* is a :py:class:`SparseDemandTable` with the same labels and values.
+        """
+        if not isinstance(other, SparseDemandTable):
+            raise ValueError("I cannot compare a SparseDemandTable with an object of type: %s" % type(other))
+        if self._dimElements != other._dimElements:
+            return False
+        keys, values = self._getNonzero()
+        otherKeys, otherValues = other._getNonzero()
+        return np.array_equal(keys, otherKeys) and np.array_equal(values, otherValues)
+
+    def _getNonzero(self):
+        """
+        Returns the (keys, values) arrays of the non-zero cells.
+        """
+        self._consolidate()
+        nonzero = self._values != 0
+        return self._keys[nonzero], self._values[nonzero]
+
+    def getNumNonzero(self):
+        """
+        Returns the number of non-zero cells.
+        """
+        return len(self._getNonzero()[0])
+
+    def getNumBytes(self):
+        """
+        Returns the number of bytes of the arrays of the table.
+        """
+        self._consolidate()
+        return self._keys.nbytes + self._values.nbytes
+
+    def getSum(self):
+        """
+        Returns the sum of all the cells.
+        """
+        self._consolidate()
+        return float(self._values.sum())
+
+    def addEntries(self, timeIndices, originIndices, destinationIndices, values):
+        """
+        Adds *values* to the cells at *timeIndices*, *originIndices* and *destinationIndices* (arrays of
+        indices, not labels); values for the same cell are summed, like :py:func:`numpy.add.at`.
+        """
+        self._consolidate()
+        keys, inverse = np.unique(np.concatenate([self._keys, self._getKeys(timeIndices, originIndices,
+                                                                            destinationIndices)]),
+                                  return_inverse=True)
+        values = np.bincount(inverse, weights=np.concatenate([self._values, np.asarray(values, dtype=np.float64)]),
+                             minlength=len(keys))
+        nonzero = values != 0
+        self._keys   = keys[nonzero]
+        self._values = values[nonzero]
+
+    def getEntries(self):
+        """
+        Returns (time indices, origin indices, destination indices, values) arrays of the non-zero cells,
+        sorted by time slice, origin and destination.
+        """
+        keys, values = self._getNonzero()
+        odKeys, destinationIndices = np.divmod(keys, self._shape[2])
+        timeIndices, originIndices = np.divmod(odKeys, self._shape[1])
+        return timeIndices, originIndices, destinationIndices, values
+
+    def getRow(self, timeIndex, originIndex):
+        """
+        Returns the dense array by destination of the values of the *originIndex* row of the *timeIndex* slice.
+        """
+        return self.getBlock(timeIndex, originIndex, originIndex + 1)[0]
+
+    def getBlock(self, timeIndex, firstOrigin, lastOrigin):
+        """
+        Returns the dense (origins x destinations) array of the values of the rows *firstOrigin* to
+        *lastOrigin* - 1 of the *timeIndex* slice.
+        """
+        self._consolidate()
+        firstKey = (timeIndex * self._shape[1] + firstOrigin) * self._shape[2]
+        lastKey  = (timeIndex * self._shape[1] + lastOrigin) * self._shape[2]
+        first, last = np.searchsorted(self._keys, [firstKey, lastKey])
+        block = np.zeros(lastKey - firstKey, dtype=np.float64)
+        block[self._keys[first:last] - firstKey] = self._values[first:last]
+        return block.reshape(lastOrigin - firstOrigin, self._shape[2])
+
+    def zeroPairs(self, mask):
+        """
+        Removes the cells of every time slice whose (origin, destination) is True in *mask*,
+        an (origins x destinations) boolean array.  Returns the number of non-zero cells removed.
+        """
+        self._consolidate()
+        removed = np.asarray(mask, dtype=np.bool_).ravel()[self._keys % (self._shape[1] * self._shape[2])]
+        numRemoved = int(np.count_nonzero(removed & (self._values != 0)))
+        self._keys   = self._keys[~removed]
+        self._values = self._values[~removed]
+        return numRemoved
+
+    def toDense(self):
+        """
+        Returns a dense (time slices x origins x destinations) numpy array of the table.  It is a copy,
+        unlike :py:meth:`MultiArray.getNumpyArray`.
+        """
+        keys, values = self._getNonzero()
+        dense = np.zeros(self._shape, dtype=np.float64)
+        dense.ravel()[keys] = values
+        return dense
@@ -0,0 +1,261 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import heapq
+import math
+
+from .DtaError import DtaError
+
+class SpatialIndex(object):
+    """
+    A uniform grid over items with bounding boxes (e.g. :py:class:`RoadNode` or :py:class:`RoadLink`
+    instances), for nearest neighbor and within-radius queries that only look at the items close to
+    the query point.
+
+    Each item is stored under a key (e.g. the node or link id) in every grid cell its bounding box overlaps.
+    Items can be inserted and removed at any time; :py:class:`Network` keeps its indices current this way
+    (see :py:meth:`Network.getNodeSpatialIndex` and :py:meth:`Network.getLinkSpatialIndex`).
+
+    Coordinates are in :py:attr:`Node.COORDINATE_UNITS`.
+    """
+
+    def __init__(self, cellSize):
+        """
+        Constructor.  *cellSize* is the width and height of the grid cells; about the spacing
+        of the items works well.
+        """
+        if cellSize <= 0:
+            raise DtaError("SpatialIndex cell size must be positive: %s" % str(cellSize))
+
+        self._cellSize  = float(cellSize)
+        # (column, row) -> set of keys
+        self._cells     = {}
+        # key -> (item, (minX, minY, maxX, maxY), list of cells)
+        self._items     = {}
+        # extent of the cells ever used, as [minColumn, minRow, maxColumn, maxRow]
+        self._extent    = None
+
+    @classmethod
+    def suggestCellSize(cls, boxes):
+        """
+        Returns a cell size for a grid over the bounding boxes in *boxes*, a list of (minX, minY, maxX, maxY):
+        the square root of the area covered per box, so there is about one box per cell.
+        """
+        if len(boxes) == 0: return 1.0
+        minX = min(box[0] for box in boxes)
+        minY = min(box[1] for box in boxes)
+        maxX = max(box[2] for box in boxes)
+        maxY = max(box[3] for box in boxes)
+        cellSize = math.sqrt((maxX - minX) * (maxY - minY) / float(len(boxes)))
+        if cellSize > 0: return cellSize
+        return max(maxX - minX, maxY - minY, 1.0)
+
+    def getCellSize(self):
+        """
+        Returns the width and height of the grid cells.
+        """
+        return self._cellSize
+
+    def __len__(self):
+        """
+        Returns the number of items in the index.
+        """
+        return len(self._items)
+
+    def __contains__(self, key):
+        """
+        Returns True if an item with *key* is in the index.
+        """
+        return key in self._items
+
+    def _cellRange(self, minX, minY, maxX, maxY):
+        """
+        Returns (minColumn, minRow, maxColumn, maxRow) of the cells overlapping the given box.
+        """
+        return (int(math.floor(minX / self._cellSize)), int(math.floor(minY / self._cellSize)),
+                int(math.floor(maxX / self._cellSize)), int(math.floor(maxY / self._cellSize)))
+
+    def insert(self, key, item, minX, minY, maxX, maxY):
+        """
+        Adds *item* with the given bounding box under *key*, replacing any item already stored under it.
+        """
+        if key in self._items:
+            self.remove(key)
+
+        minCol, minRow, maxCol, maxRow = self._cellRange(minX, minY, maxX, maxY)
+        cells = [(col, row) for col in xrange(minCol, maxCol+1) for row in xrange(minRow, maxRow+1)]
+        for cell in cells:
+            if cell in self._cells:
+                self._cells[cell].add(key)
+            else:
+                self._cells[cell] = set([key])
+        self._items[key] = (item, (minX, minY, maxX, maxY), cells)
+
+        if self._extent is None:
+            self._extent = [minCol, minRow, maxCol, maxRow]
+        else:
+            self._extent = [min(self._extent[0], minCol), min(self._extent[1], minRow),
+                            max(self._extent[2], maxCol), max(self._extent[3], maxRow)]
+
+    def remove(self, key):
+        """
+        Removes the item stored under *key*; raises a :py:class:`DtaError` if there is none.
+        """
+        if key not in self._items:
+            raise DtaError("SpatialIndex has no item with key %s" % str(key))
+
+        item, box, cells = self._items.pop(key)
+        for cell in cells:
+            self._cells[cell].discard(key)
+            if len(self._cells[cell]) == 0: del self._cells[cell]
+
+    def getBox(self, key):
+        """
+        Returns the bounding box (minX, minY, maxX, maxY) of the item stored under *key*.
+        """
+        return self._items[key][1]
+
+    def iterWithinBox(self, minX, minY, maxX, maxY):
+        """
+        Iterates through the items whose bounding boxes overlap the given box, each once.
+        """
+        for key in self._iterKeysWithinBox(minX, minY, maxX, maxY):
+            yield self._items[key][0]
+
+    def _iterKeysWithinBox(self, minX, minY, maxX, maxY):
+        """
+        Iterates through the keys of the items whose bounding boxes overlap the given box, each once.
+        """
+        minCol, minRow, maxCol, maxRow = self._cellRange(minX, minY, maxX, maxY)
+        if self._extent is not None:
+            minCol = max(minCol, self._extent[0])
+            minRow = max(minRow, self._extent[1])
+            maxCol = min(maxCol, self._extent[2])
+            maxRow = min(maxRow, self._extent[3])
+
+        seen = set()
+        for col in xrange(minCol, maxCol+1):
+            for row in xrange(minRow, maxRow+1):
+                if (col, row) not in self._cells: continue
+                for key in self._cells[(col, row)]:
+                    if key in seen: continue
+                    seen.add(key)
+                    box = self._items[key][1]
+                    if box[0] <= maxX and box[2] >= minX and box[1] <= maxY and box[3] >= minY:
+                        yield key
+
+    def _boxDistance(self, x, y, box):
+        """
+        Returns the distance from (*x*, *y*) to the bounding box *box*, zero if it's inside.
+        """
+        dx = max(box[0] - x, 0.0, x - box[2])
+        dy = max(box[1] - y, 0.0, y - box[3])
+        return math.sqrt(dx*dx + dy*dy)
+
+    def getWithinRadius(self, x, y, radius, distanceFunction=None):
+        """
+        Returns a list of (distance, item) for the items within *radius* of (*x*, *y*), sorted by distance.
+
+        *distanceFunction*, if passed, is called with an item and returns its distance from (*x*, *y*);
+        it must not be less than the distance to the item's bounding box.  By default the distance
+        to the bounding box is used, which is the exact distance for points.
+        """
+        results = []
+        for key in self._iterKeysWithinBox(x - radius, y - radius, x + radius, y + radius):
+            item, box, cells = self._items[key]
+            dist = self._boxDistance(x, y, box) if distanceFunction is None else distanceFunction(item)
+            if dist <= radius:
+                results.append((dist, item))
+        results.sort(key=lambda result: result[0])
+        return results
+
+    def iterNearest(self, x, y, distanceFunction=None):
+        """
+        Iterates through (distance, item) for all the items, in order of increasing distance from (*x*, *y*).
+        See :py:meth:`SpatialIndex.getWithinRadius` for *distanceFunction*.
+
+        The grid is searched in rings of cells around the cell containing the point, and an item is only
+        returned once no item in a ring not yet searched could be closer, so stopping early (e.g. after
+        the first *n* items) only looks at the cells near the point.
+        """
+        if len(self._items) == 0: return
+
+        cellSize = self._cellSize
+        col      = int(math.floor(x / cellSize))
+        row      = int(math.floor(y / cellSize))
+        # distance from the point to the nearest side of its cell
+        edge     = min(x - col*cellSize, (col+1)*cellSize - x, y - row*cellSize, (row+1)*cellSize - y)
+
+        minCol, minRow, maxCol, maxRow = self._extent
+        firstRing = max(minCol - col, col - maxCol, minRow - row, row - maxRow, 0)
+        lastRing  = max(abs(col - minCol), abs(col - maxCol), abs(row - minRow), abs(row - maxRow))
+
+        seen = set()
+        heap = []
+        for ring in xrange(firstRing, lastRing+1):
+            for cell in self._iterRingCells(col, row, ring):
+                if cell not in self._cells: continue
+                for key in self._cells[cell]:
+                    if key in seen: continue
+                    seen.add(key)
+                    item, box, cells = self._items[key]
+                    dist = self._boxDistance(x, y, box) if distanceFunction is None else distanceFunction(item)
+                    heapq.heappush(heap, (dist, key, item))
+
+            # items not seen yet are outside the rings searched so far
+            bound = ring*cellSize + edge
+            while heap and heap[0][0] <= bound:
+                dist, key, item = heapq.heappop(heap)
+                yield (dist, item)
+
+        while heap:
+            dist, key, item = heapq.heappop(heap)
+            yield (dist, item)
+
+    def _iterRingCells(self, col, row, ring):
+        """
+        Iterates through the cells at Chebyshev distance *ring* from the cell (*col*, *row*)
+        that are within the extent of the grid.
+        """
+        minCol, minRow, maxCol, maxRow = self._extent
+        if ring == 0:
+            yield (col, row)
+            return
+
+        for ringRow in (row - ring, row + ring):
+            if ringRow < minRow or ringRow > maxRow: continue
+            for ringCol in xrange(max(col - ring, minCol), min(col + ring, maxCol)+1):
+                yield (ringCol, ringRow)
+        for ringCol in (col - ring, col + ring):
+            if ringCol < minCol or ringCol > maxCol: continue
+            for ringRow in xrange(max(row - ring + 1, minRow), min(row + ring - 1, maxRow)+1):
+                yield (ringCol, ringRow)
+
+    def getNearest(self, x, y, n=1, distanceFunction=None, filterFunction=None):
+        """
+        Returns a list of (distance, item) for the *n* items nearest to (*x*, *y*), sorted by distance.
+        If *filterFunction* is passed, items for which it returns False are skipped.
+        See :py:meth:`SpatialIndex.getWithinRadius` for *distanceFunction*.
+        """
+        results = []
+        if n <= 0: return results
+        for dist, item in self.iterNearest(x, y, distanceFunction):
+            if filterFunction is not None and not filterFunction(item): continue
+            results.append((dist, item))
+            if len(results) >= n: break
+        return results
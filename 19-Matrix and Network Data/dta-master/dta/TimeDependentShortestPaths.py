@@ -0,0 +1,334 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import heapq
+
+import numpy as np
+
+from .DtaError import DtaError
+from .MultiArray import MultiArray
+from .ShortestPathTree import ShortestPathTree
+
+class TimeDependentShortestPaths(object):
+    """
+    Time-dependent label setting shortest paths over the link graph of a :py:class:`Network`, using
+    the per-period movement costs set with :py:meth:`Movement.setTimeVaryingCosts`.
+
+    The analysis period from *startTimeInMin* to *endTimeInMin* is split into periods of *timeStepInMin*;
+    a movement entered during a period costs that period's cost (the first or last period is used
+    before or after the analysis period).  Such step costs can violate FIFO (first in first out) when
+    the cost drops by more than the time step from one period to the next, so a vehicle is allowed to
+    wait at the movement when that gets it out earlier:
+    the time out of a movement entered at time *t* in period *p* is ``min(t + cost[p], min over q > p of
+    (start of q + cost[q]))``.  This is non-decreasing in *t*, so the label setting search gives the
+    earliest arrival times.
+
+    Labels are clock times in minutes: the label of a link is the time the trip enters it.
+
+    :py:meth:`TimeDependentShortestPaths.getArrivalTimeProfiles` searches for several departure times at once,
+    with a vector of labels by link, which is how :py:meth:`TimeDependentShortestPaths.buildCentroidSkims` gets
+    the skims of all the departure times with one search by origin.
+    """
+
+    def __init__(self, network, startTimeInMin, endTimeInMin, timeStepInMin, movementCosts=None):
+        """
+        Constructor.
+
+         * *network* is the :py:class:`Network`; its :py:meth:`Network.toGraphSnapshot` is used
+         * *startTimeInMin*, *endTimeInMin* and *timeStepInMin* define the periods
+         * *movementCosts* is an optional array of costs in minutes, of shape (number of snapshot
+           movements, number of periods).  If None, the costs come from :py:meth:`Movement.getTimeVaryingCostAt`
+           for the movements that have time varying costs, and from the free flow travel time
+           of the incoming link for the others.
+
+        Prohibited movements are not used.
+        """
+        if endTimeInMin <= startTimeInMin or timeStepInMin <= 0:
+            raise DtaError("TimeDependentShortestPaths: invalid time periods %s-%s step %s" %
+                           (str(startTimeInMin), str(endTimeInMin), str(timeStepInMin)))
+
+        self._network       = network
+        self._snapshot      = network.toGraphSnapshot()
+        self._startTimeInMin = startTimeInMin
+        self._endTimeInMin  = endTimeInMin
+        self._timeStepInMin = timeStepInMin
+        self._numPeriods    = int(np.ceil((endTimeInMin - startTimeInMin) / float(timeStepInMin)))
+
+        if movementCosts is None:
+            movementCosts = self._getMovementCostsFromNetwork()
+        movementCosts = np.array(movementCosts, dtype=np.float64)
+        if movementCosts.shape != (self._snapshot.getNumMovements(), self._numPeriods):
+            raise DtaError("TimeDependentShortestPaths: movement costs have shape %s instead of %s" %
+                           (str(movementCosts.shape), str((self._snapshot.getNumMovements(), self._numPeriods))))
+        movementCosts[self._snapshot.movementProhibited, :] = np.inf
+
+        #: the (movements x periods) array of costs, in minutes
+        self.movementCosts = movementCosts
+
+        laterExit = self._getLaterExits(movementCosts)
+        self._laterExits    = laterExit
+
+        # flattened with a stride of the number of periods, for the search loop
+        self._costList      = movementCosts.ravel().tolist()
+        self._laterExitList = laterExit.ravel().tolist()
+        self._adjacency     = None
+
+    def _getLaterExits(self, costs):
+        """
+        Returns the array of the earliest exit times, by row of the (rows x periods) array of *costs*
+        and by period, when waiting until a later period: the suffix minimum of (period start + cost),
+        infinity for the last period.
+        """
+        periodStarts = self._startTimeInMin + self._timeStepInMin * np.arange(self._numPeriods)
+        laterExit    = np.minimum.accumulate((periodStarts + costs)[:, ::-1], axis=1)[:, ::-1]
+        laterExit    = np.hstack((laterExit[:, 1:], np.empty((len(costs), 1))))
+        laterExit[:, -1] = np.inf
+        return laterExit
+
+    def _getPeriods(self, times):
+        """
+        Returns the array of the periods of the array of *times* (the first or last period before or after
+        the analysis period, and the first one for infinite times).
+        """
+        times = np.where(np.isfinite(times), times, self._startTimeInMin)
+        periods = np.floor((times - self._startTimeInMin) / float(self._timeStepInMin)).astype(np.int64)
+        return np.clip(periods, 0, self._numPeriods - 1)
+
+    def _getExitTimes(self, entryTimes, costs, laterExits):
+        """
+        Returns the (rows x departure times) exit times of the elements entered at *entryTimes*, an array of
+        the same shape, whose costs and later exits by period are the rows of *costs* and *laterExits*;
+        infinity for infinite entry times.
+        """
+        periods   = self._getPeriods(entryTimes)
+        rows      = np.arange(len(costs))[:, np.newaxis]
+        exitTimes = np.minimum(entryTimes + costs[rows, periods], laterExits[rows, periods])
+        exitTimes[~np.isfinite(entryTimes)] = np.inf
+        return exitTimes
+
+    def _getMovementCostsFromNetwork(self):
+        """
+        Returns the (movements x periods) cost array from the :py:class:`Movement` time varying costs.
+        """
+        snapshot = self._snapshot
+        costs = np.repeat(snapshot.getMovementFFTTCosts()[:, np.newaxis], self._numPeriods, axis=1)
+        periodStarts = self._startTimeInMin + self._timeStepInMin * np.arange(self._numPeriods)
+
+        for link in self._network.iterLinks():
+            if link.isVirtualLink(): continue
+            for movement in link.iterOutgoingMovements():
+                movementCosts = movement.getTimeVaryingCosts()
+                if len(movementCosts) == 0: continue
+                costStart = movement.simStartTimeInMin
+                if costStart is None: costStart = self._startTimeInMin
+                periods = ((periodStarts - costStart) // movement.getTimeVaryingCostTimeStep()).astype(np.int64)
+                periods = np.clip(periods, 0, len(movementCosts) - 1)
+                index = snapshot.getMovementIndex(link.getId(), movement.getOutgoingLink().getId())
+                costs[index, :] = np.asarray(movementCosts, dtype=np.float64)[periods]
+        return costs
+
+    def getNumPeriods(self):
+        """
+        Returns the number of periods.
+        """
+        return self._numPeriods
+
+    def getDepartureTimes(self):
+        """
+        Returns the list of the start times of the periods, in minutes.
+        """
+        return [self._startTimeInMin + period * self._timeStepInMin for period in range(self._numPeriods)]
+
+    def getArrivalTimes(self, sourceLinks, departureTimeInMin):
+        """
+        Runs the time-dependent search for trips entering *sourceLinks* (a :py:class:`Link` or a list of them)
+        at *departureTimeInMin*.  Returns a :py:class:`ShortestPathTree` on links whose labels are the times
+        the links are entered (infinity if not reached).
+        """
+        if not isinstance(sourceLinks, (list, tuple)):
+            sourceLinks = [sourceLinks]
+        sourceIndices = [self._snapshot.getLinkIndex(link.getId()) for link in sourceLinks]
+        labels, predLinks = self._search(sourceIndices, departureTimeInMin)
+        return ShortestPathTree(self._network, self._snapshot, np.array(labels, dtype=np.float64),
+                                np.array(predLinks, dtype=np.int32), True, sourceIndices)
+
+    def getArrivalTimeProfiles(self, sourceLinks, departureTimes):
+        """
+        Runs the time-dependent search for trips entering *sourceLinks* (a :py:class:`Link` or a list of them)
+        at each of the *departureTimes*, all at once.  Returns the (links x departure times) array of the
+        times the links are entered (infinity if not reached), by :py:meth:`GraphSnapshot.getLinkIndex`;
+        its column for a departure time holds the labels :py:meth:`TimeDependentShortestPaths.getArrivalTimes`
+        would give.
+        """
+        if not isinstance(sourceLinks, (list, tuple)):
+            sourceLinks = [sourceLinks]
+        sourceIndices = [self._snapshot.getLinkIndex(link.getId()) for link in sourceLinks]
+        return self._searchProfiles(sourceIndices, departureTimes)
+
+    def _searchProfiles(self, sourceIndices, departureTimes):
+        """
+        Time-dependent label correcting from the link indices *sourceIndices* for all the *departureTimes*:
+        the label of a link is the array of its entry times by departure time, and a link is scanned again
+        whenever any of them improves, so each scan updates all the departure times with a few array operations.
+        As the exit times are non-decreasing in the entry time (FIFO), the departure times share most scans.
+        Returns the (links x departure times) array of labels.
+        """
+        pointer     = self._snapshot.linkOutPointer.tolist()
+        heads       = self._snapshot.movementOutgoingLink
+        costs       = self.movementCosts
+        laterExits  = self._laterExits
+        departures  = np.asarray(departureTimes, dtype=np.float64)
+
+        labels      = np.empty((len(pointer) - 1, len(departures)), dtype=np.float64)
+        labels.fill(np.inf)
+        # True for the links whose labels changed since they were last scanned
+        toScan      = [False] * (len(pointer) - 1)
+
+        heap = []
+        for sourceIndex in sourceIndices:
+            labels[sourceIndex] = np.minimum(labels[sourceIndex], departures)
+            toScan[sourceIndex] = True
+            heap.append((float(departures.min()), sourceIndex))
+        heapq.heapify(heap)
+
+        while heap:
+            key, pivot = heapq.heappop(heap)
+            if not toScan[pivot]: continue
+            toScan[pivot] = False
+            first, last = pointer[pivot], pointer[pivot+1]
+            if first == last: continue
+
+            # the (movements out of the pivot x departure times) entry times of the downstream links
+            label     = labels[pivot]
+            periods   = self._getPeriods(label)
+            downLinks = heads[first:last]
+            newLabels = np.minimum(label + costs[first:last, periods], laterExits[first:last, periods])
+            newLabels[:, ~np.isfinite(label)] = np.inf
+            improved  = newLabels < labels[downLinks]
+            for row in np.flatnonzero(improved.any(axis=1)).tolist():
+                downstream = int(downLinks[row])
+                rowImproved = improved[row]
+                labels[downstream, rowImproved] = newLabels[row, rowImproved]
+                toScan[downstream] = True
+                heapq.heappush(heap, (float(newLabels[row, rowImproved].min()), downstream))
+
+        return labels
+
+    def _search(self, sourceIndices, departureTimeInMin):
+        """
+        Time-dependent label setting from the link indices *sourceIndices*; returns (labels, predLinks) as lists.
+        """
+        if self._adjacency is None:
+            self._adjacency = self._snapshot._getLinkAdjacency()
+        adjacency   = self._adjacency
+        costs       = self._costList
+        laterExit   = self._laterExitList
+        numPeriods  = self._numPeriods
+        start       = self._startTimeInMin
+        step        = float(self._timeStepInMin)
+
+        numLinks    = len(adjacency)
+        labels      = [float('inf')] * numLinks
+        predLinks   = [-1] * numLinks
+        isSet       = [False] * numLinks
+
+        heap = []
+        for sourceIndex in sourceIndices:
+            labels[sourceIndex] = departureTimeInMin
+            heap.append((departureTimeInMin, sourceIndex))
+        heapq.heapify(heap)
+
+        while heap:
+            label, pivot = heapq.heappop(heap)
+            if isSet[pivot]: continue
+            isSet[pivot] = True
+
+            period = int((label - start) // step)
+            if period < 0: period = 0
+            elif period >= numPeriods: period = numPeriods - 1
+
+            for movementIndex, downstream in adjacency[pivot]:
+                if isSet[downstream]: continue
+                offset   = movementIndex * numPeriods + period
+                newLabel = label + costs[offset]
+                if laterExit[offset] < newLabel:
+                    newLabel = laterExit[offset]
+                if newLabel < labels[downstream]:
+                    labels[downstream]    = newLabel
+                    predLinks[downstream] = pivot
+                    heapq.heappush(heap, (newLabel, downstream))
+
+        return labels, predLinks
+
+    def buildCentroidSkims(self, departureTimes=None, linkCosts=None):
+        """
+        Runs the search from every :py:class:`Centroid` for all the *departureTimes* (by default the
+        start of every period) at once, with :py:meth:`TimeDependentShortestPaths.getArrivalTimeProfiles`,
+        and returns the travel times in minutes as a 3-dimensional :py:class:`MultiArray`
+        with elements departure time, origin centroid id and destination centroid id.
+        Unreachable pairs are infinity.
+
+        Trips start on the access links of the origin and end by traversing an egress link of the
+        destination (see :py:meth:`GraphSnapshot.getCentroidAccessLinks`), entered at its label.  Its cost
+        is taken from *linkCosts*, an array by link index (default :py:attr:`GraphSnapshot.linkFFTT`) or a
+        (links x periods) array of time-dependent costs, at the period the link is entered, with the same
+        waiting rule as the movements.
+        """
+        snapshot = self._snapshot
+        if departureTimes is None:
+            departureTimes = self.getDepartureTimes()
+        if linkCosts is None:
+            linkCosts = snapshot.linkFFTT
+        linkCosts = np.asarray(linkCosts, dtype=np.float64)
+        if linkCosts.ndim == 1:
+            linkCosts = np.repeat(linkCosts[:, np.newaxis], self._numPeriods, axis=1)
+        if linkCosts.shape != (snapshot.getNumLinks(), self._numPeriods):
+            raise DtaError("TimeDependentShortestPaths: link costs have shape %s instead of %s" %
+                           (str(linkCosts.shape), str((snapshot.getNumLinks(), self._numPeriods))))
+        departures = np.asarray(departureTimes, dtype=np.float64)
+
+        centroidIndices = snapshot.getCentroidIndices()
+        centroidIds     = [snapshot.getNodeId(index) for index in centroidIndices]
+        numCentroids    = len(centroidIds)
+
+        accessLinks   = [snapshot.getCentroidAccessLinks(index) for index in centroidIndices]
+        destLinks     = []
+        destPositions = []
+        for position, index in enumerate(centroidIndices):
+            egressLinks = snapshot.getCentroidAccessLinks(index, egress=True)
+            destLinks.extend(egressLinks)
+            destPositions.extend([position] * len(egressLinks))
+        destLinks     = np.array(destLinks, dtype=np.int32)
+        destPositions = np.array(destPositions, dtype=np.int32)
+        destCosts     = linkCosts[destLinks]
+        destLaterExits = self._getLaterExits(destCosts)
+
+        skims = np.empty((len(departures), numCentroids, numCentroids), dtype=np.float64)
+        skims.fill(np.inf)
+        for origin in range(numCentroids):
+            if accessLinks[origin] and len(destLinks):
+                labels = self._searchProfiles(accessLinks[origin], departures)
+                # (egress links x departure times) times out of the egress links, then the earliest by destination
+                arrivals = self._getExitTimes(labels[destLinks], destCosts, destLaterExits)
+                originArrivals = np.empty((numCentroids, len(departures)), dtype=np.float64)
+                originArrivals.fill(np.inf)
+                np.minimum.at(originArrivals, destPositions, arrivals)
+                skims[:, origin, :] = (originArrivals - departures).T
+            skims[:, origin, origin] = 0.0
+
+        return MultiArray('d', [list(departureTimes), centroidIds, centroidIds], numpyArray=skims)
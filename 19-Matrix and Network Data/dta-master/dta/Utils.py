@@ -25,6 +25,8 @@ import re
 import sys
 import datetime
 
+import numpy as np
+
 import dta
 import shapefile
 
@@ -504,6 +506,12 @@ class Time(datetime.time):
 
         datetime.time.__init__(hour, minute, second)
 
+    def __reduce__(self):
+        """
+        Pickles the time as its hour, minute and second, e.g. to pass it to other processes.
+        """
+        return (Time, (self.hour, self.minute, self.second))
+
     def __lt__(self, other):
         """
         Implementation of the less than < operator
@@ -577,34 +585,124 @@ class Time(datetime.time):
         """
         return self.hour * 60 + self.minute 
 
-def bucketRounding(matrix, decimalPosition):
+def bucketRounding(matrix, decimalPosition, preserveColumnSums=False):
     """
     This method applies bucket rounding to the input numpy matrix in place.
     The decimal position is identified by the the input integer decimalPosition
-    The matrix rounding algorithm will preserve row sums but will not preserve
-    column sums
-    """
-    numRows = matrix.shape[0]
-    numCols = matrix.shape[1]
+    The matrix rounding algorithm will preserve row sums: the bucket of each row is
+    its cumulative sum, so every value is rounded up or down so that the cumulative sums
+    along the row are the rounded cumulative sums of the input, and the row adds up to its
+    rounded total.  All the rows are rounded at once, and the matrix may have more than two
+    dimensions (e.g. time slices x origins x destinations), each 2-d slice being rounded the same way.
 
+    If *preserveColumnSums* is True, the column sums of each 2-d slice are preserved too, as far
+    as possible: the rounded column totals add up to the rounded row totals, and a value rounded up
+    in a column with too much is swapped with one rounded down in a column with too little in the
+    same row, until the columns add up or no such swaps are left.
+    """
     levelOfAccuracy = 1.0 / 10 ** decimalPosition
-    numRows = matrix.shape[0]
-    numCols = matrix.shape[1]
-    bucket = 0
-    for i in range(numRows):
-        for j in range(numCols):
-            value = matrix[i,j]
-            roundedValue = round(matrix[i,j], decimalPosition)
-            bucket += value - roundedValue
-            if bucket > levelOfAccuracy:
-                finalValue = roundedValue + levelOfAccuracy
-                bucket -= levelOfAccuracy
-            elif bucket < -levelOfAccuracy and roundedValue >= levelOfAccuracy:
-                finalValue = roundedValue - levelOfAccuracy
-                bucket += levelOfAccuracy
-            else:
-                finalValue = roundedValue
-            matrix[i,j] = finalValue
+    units    = np.asarray(matrix, dtype=np.float64) / levelOfAccuracy
+    cumUnits = np.floor(np.cumsum(units, axis=-1) + 0.5)
+    rounded  = np.diff(np.concatenate([np.zeros(cumUnits.shape[:-1] + (1,)), cumUnits], axis=-1), axis=-1)
+
+    if preserveColumnSums:
+        for index in np.ndindex(*rounded.shape[:-2]):
+            _preserveColumnSums(units[index], rounded[index])
+    matrix[...] = rounded * levelOfAccuracy
+
+def _groupRanks(groups):
+    """
+    Returns the array of the rank of each element of *groups* among the elements with the same value,
+    in their order in the array.
+    """
+    order = np.argsort(groups, kind="mergesort")
+    sortedGroups = groups[order]
+    ranks = np.empty(len(groups), dtype=np.int64)
+    ranks[order] = np.arange(len(groups)) - np.searchsorted(sortedGroups, sortedGroups)
+    return ranks
+
+def _firstFrom(eligible, starts):
+    """
+    Returns the array, by row of the 2-d boolean array *eligible*, of the first eligible column
+    at or after the column *starts* of the row (modulo the number of columns), wrapping around.
+    """
+    numCols = eligible.shape[1]
+    offsets = (np.arange(numCols)[np.newaxis, :] - (starts % max(numCols, 1))[:, np.newaxis]) % max(numCols, 1)
+    return np.where(eligible, numCols - offsets, 0).argmax(axis=1)
+
+def _moveColumnUnit(units, floors, rounded, excess):
+    """
+    Moves one unit from a column with excess to a column with deficit through a chain of swaps within
+    rows: the first row gives a unit from the excess column to another column, from which the next
+    row gives a unit, and so on, found with a breadth-first search over the columns.  Updates *rounded*
+    and *excess*, and returns False if there is no such chain.
+    """
+    canGive  = rounded > floors
+    canTake  = rounded < units
+    # column -> (row, previous column) of the swap that reaches it
+    reachedBy = {}
+    visited  = excess > 0
+    frontier = np.flatnonzero(visited)
+    while len(frontier):
+        giveRows = np.flatnonzero(canGive[:, frontier].any(axis=1))
+        newCols  = np.flatnonzero(canTake[giveRows].any(axis=0) & ~visited)
+        for col in newCols.tolist():
+            row = giveRows[np.flatnonzero(canTake[giveRows, col])[0]]
+            reachedBy[col] = (row, frontier[np.flatnonzero(canGive[row, frontier])[0]])
+        visited[newCols] = True
+
+        deficitCols = newCols[excess[newCols] < 0]
+        if len(deficitCols):
+            col = lastCol = int(deficitCols[0])
+            while col in reachedBy:
+                row, previous = reachedBy[col]
+                rounded[row, col]      += 1
+                rounded[row, previous] -= 1
+                col = int(previous)
+            excess[col]     -= 1
+            excess[lastCol] += 1
+            return True
+        frontier = newCols
+    return False
+
+def _preserveColumnSums(units, rounded):
+    """
+    Swaps values of the row-preserving rounding *rounded* of the 2-d *units* (both in units of the
+    level of accuracy) within rows, so the column sums come as close as possible to their rounded totals.
+    See :py:func:`bucketRounding`.
+    """
+    floors       = np.floor(units)
+    columnTotals = units.sum(axis=0)
+    # the column targets: the floor of each column total, plus one for the largest remainders
+    # until they add up to the total of the rounded rows
+    targets      = np.floor(columnTotals)
+    numUp        = int(min(max(rounded.sum() - targets.sum(), 0), len(targets)))
+    targets[np.argsort(targets - columnTotals, kind="mergesort")[:numUp]] += 1
+    excess       = rounded.sum(axis=0) - targets
+
+    while excess.any():
+        # each row gives a unit from a column with excess that it rounded up to a column with deficit
+        # that it rounded down; the rows start looking at different columns, to spread the swaps
+        excessCols  = np.flatnonzero(excess > 0)
+        deficitCols = np.flatnonzero(excess < 0)
+        canGive   = rounded[:, excessCols] > floors[:, excessCols]
+        canTake   = rounded[:, deficitCols] < units[:, deficitCols]
+        rows      = np.flatnonzero(canGive.any(axis=1) & canTake.any(axis=1))
+        giveCols  = excessCols[_firstFrom(canGive[rows], rows)]
+        takeCols  = deficitCols[_firstFrom(canTake[rows], rows)]
+        # no more units given or taken than a column's excess or deficit
+        keep      = _groupRanks(giveCols) < excess[giveCols]
+        rows, giveCols, takeCols = rows[keep], giveCols[keep], takeCols[keep]
+        keep      = _groupRanks(takeCols) < -excess[takeCols]
+        rows, giveCols, takeCols = rows[keep], giveCols[keep], takeCols[keep]
+        if len(rows) == 0:
+            if _moveColumnUnit(units, floors, rounded, excess): continue
+            dta.DtaLogger.debug("bucketRounding: %d column units could not be preserved" % np.abs(excess).sum())
+            break
+        rounded[rows, giveCols] -= 1
+        rounded[rows, takeCols] += 1
+        excess -= np.bincount(giveCols, minlength=len(excess))
+        excess += np.bincount(takeCols, minlength=len(excess))
 
 def getNumZeroEntries(matrix):
     """
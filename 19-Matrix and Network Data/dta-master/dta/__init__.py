@@ -37,23 +37,32 @@ from .Algorithms import ShortestPaths
 from .Centroid import Centroid
 from .Connector import Connector
 from .CorridorPlots import CountsVsVolumes
+from .CountValidation import CountValidation
 from .CubeNetwork import CubeNetwork
 from .Demand import Demand
 from .DtaError import DtaError
 from .DynameqNetwork import DynameqNetwork
 from .DynameqScenario import DynameqScenario
+from .GraphSnapshot import GraphSnapshot
 from .Link import Link
 from .Logger import DtaLogger, setupLogging
 from .Movement import Movement
 from .MultiArray import MultiArray
 from .Network import Network
 from .Node import Node
+from .ObsCountStore import ObsCountStore
 from .Phase import Phase
 from .PhaseMovement import PhaseMovement
 from .RoadLink import RoadLink
 from .RoadNode import RoadNode
 from .Path import Path
 from .Scenario import Scenario
+from .ShortestPathTree import ShortestPathTree
+from .SimResultStore import SimResultStore
+from .SimResultWarehouse import SimResultWarehouse
+from .SpatialIndex import SpatialIndex
+from .SparseDemandTable import SparseDemandTable
+from .TimeDependentShortestPaths import TimeDependentShortestPaths
 from .TimePlan import PlanCollectionInfo, TimePlan
 from .TPPlusTransitRoute import TPPlusTransitNode, TPPlusTransitRoute
 from .TransitLine import TransitLine, TransitSegment
@@ -67,12 +76,14 @@ from .VirtualNode import VirtualNode
 from .Algorithms import dfs 
 
 __all__ = ['DtaError', 'DtaLogger', 'setupLogging',
-           'Network', 'DynameqNetwork', 'CubeNetwork',
+           'Network', 'DynameqNetwork', 'CubeNetwork', 'GraphSnapshot',
            'Scenario', 'DynameqScenario', 'VehicleType', 'VehicleClassGroup',
            'Node', 'RoadNode', 'Centroid', 'VirtualNode',
            'Link', 'RoadLink', 'Connector', 'VirtualLink', 'DynameqDemand',
            'PlanCollectionInfo', 'TimePlan', 'PhaseMovement',
            'TPPlusTransitNode', 'TPPlusTransitRoute', 'TransitLine', 'TransitSegment',
            'Route', 'Phase', 'MultiArray',
-           'crossProduct', 'direction', 'lineSegmentsCross', 'onSegment', 'Time', 'CountsVsVolumes', 'ShortestPaths'
+           'crossProduct', 'direction', 'lineSegmentsCross', 'onSegment', 'Time', 'CountsVsVolumes', 'CountValidation', 'ShortestPaths', 'ShortestPathTree',
+           'TimeDependentShortestPaths', 'SpatialIndex', 'SimResultStore', 'ObsCountStore', 'SimResultWarehouse',
+           'SparseDemandTable'
 ]
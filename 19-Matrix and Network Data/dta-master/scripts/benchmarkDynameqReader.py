@@ -0,0 +1,194 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import getopt
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import dta
+
+USAGE = r"""
+
+ python benchmarkDynameqReader.py [-n grid_size] [-k]
+
+ e.g.
+
+ python benchmarkDynameqReader.py -n 150
+
+ Writes a synthetic Dynameq network of grid_size x grid_size road nodes (default 150) with two-way
+ road links, two shape points per link and all the movements, then reads it back and reports the
+ lines per second (read and processed) for each section of the base and advanced files, and the total
+ time of the single-pass dta.DynameqNetwork.read() against the previous reader, which rescanned the file
+ for each section, and against loading the network from its binary cache (dta.DynameqNetwork.CACHE_DIR).
+
+ The files are written to a temporary directory, which is removed unless -k is passed.
+
+"""
+
+PREFIX = "benchmark"
+
+def buildGridNetwork(scenario, gridSize, spacing=500.0):
+    """
+    Returns a :py:class:`dta.DynameqNetwork` with *gridSize* x *gridSize* road nodes, *spacing* feet apart,
+    a road link with two shape points in each direction between horizontally and vertically adjacent nodes,
+    and all the movements.
+    """
+    net = dta.DynameqNetwork(scenario)
+
+    for row in xrange(gridSize):
+        for col in xrange(gridSize):
+            net.addNode(dta.RoadNode(row*gridSize + col + 1, col*spacing, row*spacing,
+                                     dta.Node.GEOMETRY_TYPE_INTERSECTION,
+                                     dta.RoadNode.CONTROL_TYPE_UNSIGNALIZED,
+                                     dta.RoadNode.PRIORITY_TEMPLATE_NONE))
+
+    linkId = 1
+    for row in xrange(gridSize):
+        for col in xrange(gridSize):
+            nodeId = row*gridSize + col + 1
+            neighbors = []
+            if col < gridSize - 1: neighbors.append(nodeId + 1)
+            if row < gridSize - 1: neighbors.append(nodeId + gridSize)
+            for neighborId in neighbors:
+                for (aId, bId) in [(nodeId, neighborId), (neighborId, nodeId)]:
+                    nodeA = net.getNodeForId(aId)
+                    nodeB = net.getNodeForId(bId)
+                    link  = dta.RoadLink(linkId, nodeA, nodeB, None, 1, spacing/5280.0, 30, 1.0, 1.0, 1,
+                                         0, 0, "", linkId)
+                    for fraction in [0.33, 0.66]:
+                        link.addShapePoint(nodeA.getX() + fraction*(nodeB.getX() - nodeA.getX()),
+                                           nodeA.getY() + fraction*(nodeB.getY() - nodeA.getY()))
+                    net.addLink(link)
+                    linkId += 1
+
+    net.addAllMovements(scenario.getVehicleClassGroup(dta.VehicleClassGroup.CLASSDEFINITION_ALL))
+    return net
+
+def readLegacy(net, dir, file_prefix):
+    """
+    The previous base and advanced file processing of :py:meth:`dta.DynameqNetwork.read`, which rescans
+    the file for every section and parses every movement twice.  Kept here as the reference.
+    """
+    basefile = os.path.join(dir, dta.DynameqNetwork.BASE_FILE % file_prefix)
+    for fields in net._readSectionFromFile(basefile, "NODES", "CENTROIDS"):
+        net.addNode(net._parseNodeFromFields(fields))
+    for fields in net._readSectionFromFile(basefile, "CENTROIDS", "LINKS"):
+        net.addNode(net._parseCentroidFromFields(fields))
+    for fields in net._readSectionFromFile(basefile, "LINKS", "LANE_PERMS"):
+        net.addLink(net._parseLinkFromFields(fields))
+    for fields in net._readSectionFromFile(basefile, "LANE_PERMS", "LINK_EVENTS"):
+        net._addLanePermissionFromFields(fields)
+    for fields in net._readSectionFromFile(basefile, "LINK_EVENTS", "LANE_EVENTS"):
+        pass
+    for fields in net._readSectionFromFile(basefile, "LANE_EVENTS", "VIRTUAL_LINKS"):
+        pass
+    for fields in net._readSectionFromFile(basefile, "VIRTUAL_LINKS", "MOVEMENTS"):
+        net.addLink(net._parseVirtualLinkFromFields(fields))
+    for fields in net._readSectionFromFile(basefile, "MOVEMENTS", "MOVEMENT_EVENTS"):
+        mov = net._parseMovementFromFields(fields)
+        net.addMovement(net._parseMovementFromFields(fields))
+    for fields in net._readSectionFromFile(basefile, "MOVEMENT_EVENTS", "ENDOFFILE"):
+        pass
+
+    advancedfile = os.path.join(dir, dta.DynameqNetwork.ADVANCED_FILE % file_prefix)
+    for fields in net._readSectionFromFile(advancedfile, "SHIFTS", "VERTICES"):
+        net._addShiftFromFields(fields)
+    for fields in net._readSectionFromFile(advancedfile, "VERTICES", "ENDOFFILE"):
+        net._addShapePointsToLink(fields)
+
+def linesPerSecond(count, seconds):
+    """
+    Returns *count* / *seconds*, guarding against a zero time.
+    """
+    return count / max(seconds, 1e-9)
+
+if __name__ == "__main__":
+
+    optlist, args = getopt.getopt(sys.argv[1:], "n:k")
+    if len(args) != 0:
+        print USAGE
+        sys.exit(2)
+
+    GRID_SIZE   = 150
+    KEEP_FILES  = False
+    for (opt,arg) in optlist:
+        if opt == "-n": GRID_SIZE   = int(arg)
+        if opt == "-k": KEEP_FILES  = True
+
+    dta.VehicleType.LENGTH_UNITS= "feet"
+    dta.Node.COORDINATE_UNITS   = "feet"
+    dta.RoadLink.LENGTH_UNITS   = "miles"
+
+    dta.setupLogging("benchmarkDynameqReader.INFO.log", "benchmarkDynameqReader.DEBUG.log", logToConsole=True)
+
+    scenario = dta.DynameqScenario()
+    scenario.addVehicleClassGroup(dta.VehicleClassGroup(dta.VehicleClassGroup.CLASSDEFINITION_ALL,
+                                                        dta.VehicleClassGroup.CLASSDEFINITION_ALL, "#bebebe"))
+    scenario.addVehicleClassGroup(dta.VehicleClassGroup(dta.VehicleClassGroup.CLASSDEFINITION_PROHIBITED,
+                                                        dta.VehicleClassGroup.CLASSDEFINITION_PROHIBITED, "#ffff00"))
+
+    outputDir = tempfile.mkdtemp(prefix="benchmarkDynameqReader")
+    try:
+        startTime = time.time()
+        net = buildGridNetwork(scenario, GRID_SIZE)
+        net.write(outputDir, PREFIX)
+        dta.DtaLogger.info("Built and wrote a grid network with %d nodes, %d links and %d movements to %s in %.1f seconds" %
+                           (net.getNumNodes(), net.getNumLinks(), sum(1 for movement in net.iterMovements()),
+                            outputDir, time.time() - startTime))
+
+        # the sections of DynameqNetwork.read(), one file at a time
+        startTime = time.time()
+        newNet = dta.DynameqNetwork(scenario)
+        sectionStats = []
+        for filename, sectionNames, (handlers, finishers) in \
+            [(dta.DynameqNetwork.BASE_FILE, dta.DynameqNetwork.BASE_SECTIONS, newNet._getBaseSectionHandlers()),
+             (dta.DynameqNetwork.ADVANCED_FILE, dta.DynameqNetwork.ADVANCED_SECTIONS, newNet._getAdvancedSectionHandlers())]:
+            stats = newNet._readSections(os.path.join(outputDir, filename % PREFIX), sectionNames, handlers, finishers)
+            sectionStats.extend((sectionName, stats[sectionName]) for sectionName in sectionNames)
+        readTime = time.time() - startTime
+
+        for sectionName, (count, seconds) in sectionStats:
+            dta.DtaLogger.info("%-16s %9d lines  %12.0f lines/s" % (sectionName, count, linesPerSecond(count, seconds)))
+
+        startTime = time.time()
+        legacyNet = dta.DynameqNetwork(scenario)
+        readLegacy(legacyNet, outputDir, PREFIX)
+        legacyTime = time.time() - startTime
+
+        dta.DtaLogger.info("DynameqNetwork.read %.2f seconds, previous reader %.2f seconds, speedup %.1fx" %
+                           (readTime, legacyTime, legacyTime/max(readTime, 1e-9)))
+
+        # the first read with the cache writes it, the second loads it
+        dta.DynameqNetwork(scenario).read(outputDir, PREFIX, useCache=True)
+        startTime = time.time()
+        cachedNet = dta.DynameqNetwork(scenario)
+        cachedNet.read(outputDir, PREFIX, useCache=True)
+        cacheTime = time.time() - startTime
+        dta.DtaLogger.info("DynameqNetwork.read from the cache %.2f seconds, speedup %.1fx" %
+                           (cacheTime, readTime/max(cacheTime, 1e-9)))
+        if newNet.getNumLinks() != legacyNet.getNumLinks() or \
+           sum(1 for movement in newNet.iterMovements()) != sum(1 for movement in legacyNet.iterMovements()):
+            dta.DtaLogger.error("The readers read different networks")
+    finally:
+        if KEEP_FILES:
+            dta.DtaLogger.info("Kept the files in %s" % outputDir)
+        else:
+            shutil.rmtree(outputDir)
@@ -0,0 +1,190 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import getopt
+import random
+import sys
+import time
+from collections import deque
+
+import dta
+
+USAGE = r"""
+
+ python benchmarkShortestPaths.py [-n grid_size] [-q num_queries] [-s random_seed]
+
+ e.g.
+
+ python benchmarkShortestPaths.py -n 317 -q 3
+
+ Builds a synthetic grid network of grid_size x grid_size road nodes (default 317, or about 100k nodes)
+ connected by two-way road links, and times the heap-based
+ dta.ShortestPaths.labelSettingWithLabelsOnNodes() against the previous linear-scan implementation
+ for num_queries (default 3) random origin/destination pairs.  The point to point A* search of
+ dta.ShortestPaths.getAStarPathBetweenNodes() is timed on the same pairs.  The resulting path lengths
+ of the implementations are compared and any mismatch is reported.
+
+"""
+
+def buildGridNetwork(gridSize, spacing=500.0):
+    """
+    Returns a :py:class:`dta.Network` with *gridSize* x *gridSize* road nodes, *spacing* feet apart,
+    and a road link in each direction between horizontally and vertically adjacent nodes.
+    """
+    net = dta.Network(dta.Scenario())
+
+    for row in xrange(gridSize):
+        for col in xrange(gridSize):
+            net.addNode(dta.RoadNode(row*gridSize + col + 1, col*spacing, row*spacing,
+                                     dta.Node.GEOMETRY_TYPE_INTERSECTION,
+                                     dta.RoadNode.CONTROL_TYPE_UNSIGNALIZED,
+                                     dta.RoadNode.PRIORITY_TEMPLATE_NONE))
+
+    linkId = 1
+    for row in xrange(gridSize):
+        for col in xrange(gridSize):
+            nodeId = row*gridSize + col + 1
+            neighbors = []
+            if col < gridSize - 1: neighbors.append(nodeId + 1)
+            if row < gridSize - 1: neighbors.append(nodeId + gridSize)
+            for neighborId in neighbors:
+                for (aId, bId) in [(nodeId, neighborId), (neighborId, nodeId)]:
+                    net.addLink(dta.RoadLink(linkId, net.getNodeForId(aId), net.getNodeForId(bId),
+                                             None, 1, spacing/5280.0, 30, 1.0, 1.0, 1,
+                                             0, 0, "", linkId))
+                    linkId += 1
+    return net
+
+def labelSettingLinearScan(graph, sourceVertex, endVertex, includeVirtual=False, sourceLabel=0.0, maxLabel=sys.float_info.max):
+    """
+    The previous implementation of :py:meth:`dta.ShortestPaths.labelSettingWithLabelsOnNodes`, which
+    finds the next vertex to settle by scanning the whole frontier.  Kept here as the reference.
+    """
+    for vertex in graph.iterNodes():
+        vertex.label        = sys.float_info.max
+        vertex.alreadySet   = False
+        vertex.predVertex   = None
+
+    sourceVertex.label      = sourceLabel
+    verticesToExamine       = deque()
+    nextPivotVertex         = sourceVertex
+    labeledVertices         = set()
+
+    while True:
+        pivotVertex = nextPivotVertex
+        pivotVertex.alreadySet = True
+        labeledVertices.add(pivotVertex)
+
+        if endVertex and (pivotVertex == endVertex): break
+        if pivotVertex.label > maxLabel: break
+
+        for edge in pivotVertex.iterOutgoingLinks():
+            if not includeVirtual and edge.isVirtualLink(): continue
+            downstreamVertex = edge.getEndNode()
+            if not includeVirtual and downstreamVertex.isVirtualNode(): continue
+
+            newLabel = pivotVertex.label + edge.euclideanLength(includeShape=True)
+            if newLabel < downstreamVertex.label:
+                downstreamVertex.label = newLabel
+                downstreamVertex.predVertex = pivotVertex
+                if not downstreamVertex.alreadySet:
+                    verticesToExamine.appendleft(downstreamVertex)
+
+        mincost = 0
+        if len(verticesToExamine)==0:
+            return labeledVertices
+        for updateVertex in verticesToExamine:
+            if mincost==0:
+                mincost = updateVertex.label
+                mincostVertex = updateVertex
+            else:
+                if updateVertex.label<mincost:
+                    mincost = updateVertex.label
+                    mincostVertex = updateVertex
+        verticesToExamine.remove(mincostVertex)
+        nextPivotVertex = mincostVertex
+
+    return labeledVertices
+
+def timeQuery(spFunction, net, origin, destination):
+    """
+    Runs the shortest path *spFunction* and returns (seconds, destination label, number of labeled nodes)
+    """
+    startTime = time.clock()
+    labeled = spFunction(net, origin, destination)
+    return (time.clock() - startTime, destination.label, len(labeled))
+
+if __name__ == "__main__":
+
+    optlist, args = getopt.getopt(sys.argv[1:], "n:q:s:")
+    if len(args) != 0:
+        print USAGE
+        sys.exit(2)
+
+    GRID_SIZE   = 317
+    NUM_QUERIES = 3
+    RANDOM_SEED = 1
+    for (opt,arg) in optlist:
+        if opt == "-n": GRID_SIZE   = int(arg)
+        if opt == "-q": NUM_QUERIES = int(arg)
+        if opt == "-s": RANDOM_SEED = int(arg)
+
+    dta.VehicleType.LENGTH_UNITS= "feet"
+    dta.Node.COORDINATE_UNITS   = "feet"
+    dta.RoadLink.LENGTH_UNITS   = "miles"
+
+    dta.setupLogging("benchmarkShortestPaths.INFO.log", "benchmarkShortestPaths.DEBUG.log", logToConsole=True)
+
+    startTime = time.clock()
+    net = buildGridNetwork(GRID_SIZE)
+    dta.DtaLogger.info("Built a grid network with %d nodes and %d links in %.1f seconds" %
+                       (net.getNumNodes(), net.getNumLinks(), time.clock() - startTime))
+
+    random.seed(RANDOM_SEED)
+    nodeIds = sorted(node.getId() for node in net.iterNodes())
+
+    # build the snapshot up front so the A* timings are per query
+    net.toGraphSnapshot()
+
+    totals = {"heap":0.0, "linear scan":0.0, "A*":0.0}
+    for query in range(NUM_QUERIES):
+        origin      = net.getNodeForId(random.choice(nodeIds))
+        destination = net.getNodeForId(random.choice(nodeIds))
+
+        heapTime, heapLabel, heapCount = timeQuery(dta.ShortestPaths.labelSettingWithLabelsOnNodes, net, origin, destination)
+        scanTime, scanLabel, scanCount = timeQuery(labelSettingLinearScan, net, origin, destination)
+        totals["heap"]        += heapTime
+        totals["linear scan"] += scanTime
+
+        dta.DtaLogger.info("Query %d: %d -> %d  heap %.3fs (%d nodes set)  linear scan %.3fs (%d nodes set)  speedup %.1fx" %
+                           (query, origin.getId(), destination.getId(), heapTime, heapCount, scanTime, scanCount,
+                            scanTime/max(heapTime, 1e-9)))
+        if abs(heapLabel - scanLabel) > 1e-6:
+            dta.DtaLogger.error("Query %d: labels differ: heap %f linear scan %f" % (query, heapLabel, scanLabel))
+
+        startTime = time.clock()
+        path = dta.ShortestPaths.getAStarPathBetweenNodes(net, origin, destination, includeShape=True)
+        aStarTime = time.clock() - startTime
+        totals["A*"] += aStarTime
+        aStarLabel = sum(net.getLinkForNodeIdPair(nodeA.getId(), nodeB.getId()).euclideanLength(includeShape=True)
+                         for nodeA, nodeB in zip(path, path[1:]))
+        dta.DtaLogger.info("Query %d: A* %.3fs  speedup over heap %.1fx" % (query, aStarTime, heapTime/max(aStarTime, 1e-9)))
+        if abs(heapLabel - aStarLabel) > 1e-6:
+            dta.DtaLogger.error("Query %d: labels differ: heap %f A* %f" % (query, heapLabel, aStarLabel))
+
+    dta.DtaLogger.info("Total: heap %.3fs  linear scan %.3fs  A* %.3fs" % (totals["heap"], totals["linear scan"], totals["A*"]))
@@ -0,0 +1,132 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import getopt
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import dta
+
+USAGE = r"""
+
+ python benchmarkSparseDemand.py [-n num_zones] [-s num_slices] [-f density] [-w]
+
+ e.g.
+
+ python benchmarkSparseDemand.py -n 1000 -s 12 -f 0.02
+
+ Writes a synthetic Cube OD table for num_zones centroids (default 1000) with the given share of
+ non-zero OD pairs (default 0.02), then for the dense and the sparse dta.Demand tables reports the
+ memory used and the time to read the table into one time slice, split it into num_slices slices
+ (default 12, a divisor of 60) with dta.Demand.applyTimeOfDayFactors, total the trips and look up
+ random cells.
+ With -w, the time to write the split demand with dta.Demand.writeDynameqTable is reported too.
+
+ The dense table of the split demand takes 8 x num_slices x num_zones^2 bytes.
+
+"""
+
+def buildCentroidNetwork(scenario, numZones, spacing=1000.0):
+    """
+    Returns a :py:class:`dta.Network` with *numZones* centroids on a square grid, *spacing* feet apart.
+    """
+    net = dta.Network(scenario)
+    gridSize = int(np.ceil(np.sqrt(numZones)))
+    for zone in xrange(numZones):
+        net.addNode(dta.Centroid(zone + 1, (zone % gridSize) * spacing, (zone // gridSize) * spacing))
+    return net
+
+def writeCubeTable(fileName, numZones, density):
+    """
+    Writes a Cube OD table with ``O,D,AUTO`` records for *density* of the OD pairs of *numZones* zones.
+    """
+    numPairs = int(density * numZones * numZones)
+    pairs    = np.unique(np.random.randint(0, numZones * numZones, size=numPairs))
+    records  = np.column_stack([pairs // numZones + 1, pairs % numZones + 1, np.random.randint(1, 20, size=len(pairs))])
+    outputStream = open(fileName, "w")
+    outputStream.write("O,D,AUTO\n")
+    np.savetxt(outputStream, records, fmt="%d", delimiter=",")
+    outputStream.close()
+    return len(pairs)
+
+def timeIt(function, *args):
+    """
+    Returns (result of *function* (*args*), seconds).
+    """
+    startTime = time.time()
+    result = function(*args)
+    return result, time.time() - startTime
+
+if __name__ == "__main__":
+
+    optlist, args = getopt.getopt(sys.argv[1:], "n:s:f:w")
+    if len(args) != 0:
+        print USAGE
+        sys.exit(2)
+
+    NUM_ZONES   = 1000
+    NUM_SLICES  = 12
+    DENSITY     = 0.02
+    WRITE       = False
+    for (opt,arg) in optlist:
+        if opt == "-n": NUM_ZONES   = int(arg)
+        if opt == "-s": NUM_SLICES  = int(arg)
+        if opt == "-f": DENSITY     = float(arg)
+        if opt == "-w": WRITE       = True
+
+    dta.VehicleType.LENGTH_UNITS= "feet"
+    dta.Node.COORDINATE_UNITS   = "feet"
+    dta.RoadLink.LENGTH_UNITS   = "miles"
+
+    dta.setupLogging("benchmarkSparseDemand.INFO.log", "benchmarkSparseDemand.DEBUG.log", logToConsole=True)
+
+    net = buildCentroidNetwork(dta.DynameqScenario(), NUM_ZONES)
+    outputDir = tempfile.mkdtemp(prefix="benchmarkSparseDemand")
+    try:
+        cubeTable = os.path.join(outputDir, "demand.csv")
+        numPairs  = writeCubeTable(cubeTable, NUM_ZONES, DENSITY)
+        dta.DtaLogger.info("Wrote a Cube table of %d zones and %d OD pairs" % (NUM_ZONES, numPairs))
+
+        factors   = [1.0 / NUM_SLICES] * NUM_SLICES
+        lookups   = [(random.randint(1, NUM_ZONES), random.randint(1, NUM_ZONES)) for lookup in xrange(100000)]
+        for sparse in [False, True]:
+            demand, readTime = timeIt(dta.Demand.readCubeODTable, cubeTable, net, "AUTO", dta.Time(7, 0),
+                                      dta.Time(8, 0), dta.Time(1, 0), 1.0, sparse)
+            split, splitTime = timeIt(demand.applyTimeOfDayFactors, list(factors))
+            totalTrips, sumTime = timeIt(split.getTotalNumTrips)
+            timeLabel = split.endTime
+            lookupTime = timeIt(lambda: [split.getValue(timeLabel, origin, destination)
+                                         for origin, destination in lookups])[1]
+            dta.DtaLogger.info("%-6s %10.1f MB  read %6.2fs  split into %d slices %6.2fs  total %.0f trips %6.3fs  "
+                               "%d lookups %6.2fs" %
+                               ("sparse" if sparse else "dense", split.getNumBytes() / 1048576.0, readTime,
+                                NUM_SLICES, splitTime, totalTrips, sumTime, len(lookups), lookupTime))
+            if WRITE:
+                outputStream = open(os.path.join(outputDir, "demand.dqt"), "w")
+                writeTime = timeIt(split.writeDynameqTable, outputStream)[1]
+                outputStream.close()
+                dta.DtaLogger.info("%-6s write %6.2fs" % ("sparse" if sparse else "dense", writeTime))
+            del demand, split
+    finally:
+        shutil.rmtree(outputDir)
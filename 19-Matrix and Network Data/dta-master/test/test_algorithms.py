@@ -17,7 +17,9 @@ __license__     = """
 """
 
 import os
+import sys
 import nose 
+import numpy as np
 from itertools import izip
 
 import dta
@@ -29,7 +31,7 @@ from dta.DynameqNetwork import DynameqNetwork
 
 from dta.Utils import *
 
-from dta.Algorithms import dfs, hasPath, getConvexHull, \
+from dta.Algorithms import dfs, hasPath, getMetaGraph, getConvexHull, \
     getConvexHull2, getTightHull, getConvexHull3, pairwise, isPointInPolygon, getConvexHullGrahamScan, getContainingPolygon
 
 dta.VehicleType.LENGTH_UNITS= "feet"
@@ -44,7 +46,7 @@ def getTestNet():
     scenario = DynameqScenario(Time(0,0), Time(12,0))
     scenario.read(projectFolder, prefix) 
     net = DynameqNetwork(scenario) 
-    net.read(projectFolder, prefix) 
+    net.read(projectFolder, prefix, useCache=False) 
 
     return net 
 
@@ -67,6 +69,19 @@ class TestAlgorithms:
         #for node in sorted(net.iterNodes(), key=lambda n:n.getId()):
         #    print node.getId(), node.visited, node.pre, node.post
 
+    def test_metaGraph(self):
+
+        net = getTestNet()
+        metaGraph = getMetaGraph(net)
+        assert len(metaGraph) == len(set(node.metaNode for node in net.iterNodes()))
+        for metaNode, downstreamMetaNodes in metaGraph.iteritems():
+            assert all(downstream < metaNode for downstream in downstreamMetaNodes)
+
+        root = net.getNodeForId(9)
+        for node in [net.getNodeForId(26520), net.getNodeForId(66)]:
+            sameMetaNode = hasPath(net, root, node) and hasPath(net, node, root)
+            assert sameMetaNode == (root.metaNode == node.metaNode)
+
     def test_reverse(self):
 
         net = getTestNet()
@@ -215,3 +230,205 @@ class TestAlgorithms:
         
 
         
+
+    def test_labelSettingWithLabelsOnNodes(self):
+
+        net = getTestNet()
+        source = net.getNodeForId(26628)
+
+        # reference labels by repeated relaxation over the road links
+        reference = dict((node, sys.float_info.max) for node in net.iterNodes())
+        reference[source] = 0.0
+        changed = True
+        while changed:
+            changed = False
+            for link in net.iterLinks():
+                if link.isVirtualLink() or link.getEndNode().isVirtualNode(): continue
+                newLabel = reference[link.getStartNode()] + link.euclideanLength(includeShape=True)
+                if newLabel < reference[link.getEndNode()]:
+                    reference[link.getEndNode()] = newLabel
+                    changed = True
+
+        labeled = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, source, None)
+        for node in net.iterNodes():
+            assert abs(node.label - reference[node]) < 1e-6
+            assert (node in labeled) == (reference[node] < sys.float_info.max)
+            if node.predVertex:
+                link = net.getLinkForNodeIdPair(node.predVertex.getId(), node.getId())
+                assert abs(node.predVertex.label + link.euclideanLength(includeShape=True) - node.label) < 1e-6
+
+        # stops once the end vertex is set
+        dest = net.getNodeForId(24472)
+        labeled = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, source, dest)
+        assert abs(dest.label - reference[dest]) < 1e-6
+        assert max(node.label for node in labeled) == dest.label
+
+        # filtering every road link leaves only the source
+        labeled = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, source, None, filterRoadLinkEvalStr="roadlink.getFacilityType() >= 0")
+        assert labeled == set([source])
+
+    def test_shortestPathTrees(self):
+
+        net = getTestNet()
+        source1 = net.getNodeForId(26628)
+        source2 = net.getNodeForId(24472)
+
+        # two trees from the same network at once
+        tree1 = dta.ShortestPaths.labelCorrectingWithLabelsOnNodes(net, source1)
+        tree2 = dta.ShortestPaths.labelCorrectingWithLabelsOnNodes(net, source2)
+        assert tree1.getLabel(26628) == 0 and tree2.getLabel(24472) == 0
+        assert not hasattr(source1, "predVertex") or source1.predVertex is None
+
+        for tree, source in [(tree1, source1), (tree2, source2)]:
+            for node in net.iterNodes():
+                if not tree.isReachable(node.getId()): continue
+                path = tree.getPath(node.getId())
+                assert path[0] == source and path[-1] == node
+                links = tree.getLinkPath(node.getId())
+                assert len(links) == len(path) - 1
+                assert abs(sum(link.euclideanLength() for link in links) - tree.getLabel(node.getId())) < 1e-6
+
+        # on links, with length based movement costs
+        dta.ShortestPaths.initializeMovementCostsWithLength(net)
+        sourceLink = sorted([link for link in net.iterRoadLinks() if link.getNumOutgoingMovements() > 0],
+                            key=lambda link: link.getId())[0]
+        linkTree = dta.ShortestPaths.labelCorrectingWithLabelsOnLinks(net, sourceLink)
+        numReached = 0
+        for link in net.iterRoadLinks():
+            if link == sourceLink or not linkTree.isReachable(link.getId()): continue
+            numReached += 1
+            path = dta.ShortestPaths.getShortestPathBetweenLinks(net, sourceLink, link, tree=linkTree)
+            assert path[0] == sourceLink and path[-1] == link
+            for upLink, downLink in izip(path, path[1:]):
+                assert upLink.hasOutgoingMovement(downLink.getEndNode().getId())
+            assert abs(sum(l.getLength() for l in path[:-1]) - linkTree.getLabel(link.getId())) < 1e-6
+        assert numReached > 0
+
+    def test_buildCentroidSkim(self):
+
+        net = getTestNet()
+        skim = dta.ShortestPaths.buildCentroidSkim(net)
+        centroidIds = sorted(centroid.getId() for centroid in net.iterCentroids())
+        assert skim.getElementsOfDimention(0) == tuple(centroidIds)
+        assert skim.getElementsOfDimention(1) == tuple(centroidIds)
+
+        # same answer from a pool of worker processes
+        parallelSkim = dta.ShortestPaths.buildCentroidSkim(net, numProcesses=2)
+        assert (skim.getNumpyArray() == parallelSkim.getNumpyArray()).all()
+
+        # check one origin against the trees from each of its access links
+        snapshot = net.toGraphSnapshot()
+        movementCosts = snapshot.getMovementFFTTCosts()
+        movementCosts[snapshot.movementProhibited] = float('inf')
+        origin = centroidIds[0]
+        trees = [dta.ShortestPaths.labelCorrectingWithLabelsOnLinks(net, net.getLinkForId(snapshot.getLinkId(linkIndex)), movementCosts)
+                 for linkIndex in snapshot.getCentroidAccessLinks(snapshot.getNodeIndex(origin))]
+        for dest in centroidIds:
+            if dest == origin:
+                assert skim[origin, dest] == 0
+                continue
+            egressLinks = snapshot.getCentroidAccessLinks(snapshot.getNodeIndex(dest), egress=True)
+            expected = min([float('inf')] + [tree.getLabels()[linkIndex] + snapshot.linkFFTT[linkIndex]
+                                             for tree in trees for linkIndex in egressLinks])
+            assert abs(skim[origin, dest] - expected) < 1e-9 or skim[origin, dest] == expected
+
+    def test_timeDependentShortestPaths(self):
+
+        net = getTestNet()
+        staticSkim = dta.ShortestPaths.buildCentroidSkim(net)
+
+        # without time varying costs the skims are the free flow skim at every departure time
+        router = dta.TimeDependentShortestPaths(net, 0, 30, 15)
+        assert router.getDepartureTimes() == [0, 15]
+        skims = router.buildCentroidSkims()
+        assert skims.getNumpyArray().shape[0] == 2
+        for timeIndex in range(2):
+            assert np.allclose(skims.getNumpyArray()[timeIndex], staticSkim.getNumpyArray(), rtol=0, atol=1e-9)
+
+        # a movement that is much cheaper in the second period: waiting for it keeps FIFO
+        sourceLink = sorted([link for link in net.iterRoadLinks() if link.getNumOutgoingMovements() > 0],
+                            key=lambda link: link.getId())[0]
+        movement = list(sourceLink.iterOutgoingMovements())[0]
+        movement.setTimeVaryingCosts([10.0, 1.0], 5)
+        router = dta.TimeDependentShortestPaths(net, 0, 10, 5)
+        outLinkId = movement.getOutgoingLink().getId()
+        previousArrival = 0
+        for departure in [0, 2, 4, 5, 7]:
+            tree = router.getArrivalTimes(sourceLink, departure)
+            assert tree.getLabel(sourceLink.getId()) == departure
+            arrival = tree.getLabel(outLinkId)
+            assert arrival >= previousArrival
+            previousArrival = arrival
+        assert router.getArrivalTimes(sourceLink, 0).getLabel(outLinkId) <= 6.0
+        assert router.getArrivalTimes(sourceLink, 7).getLabel(outLinkId) <= 8.0
+
+        # the search for all the departure times at once gives the labels of the single departure searches
+        departures = [0, 2, 4, 5, 7, 12]
+        profiles = router.getArrivalTimeProfiles(sourceLink, departures)
+        for column, departure in enumerate(departures):
+            assert np.array_equal(profiles[:, column], router.getArrivalTimes(sourceLink, departure).getLabels())
+
+        # and the skims cost the egress links at the period they are entered
+        snapshot = net.toGraphSnapshot()
+        linkCosts = np.repeat(snapshot.linkFFTT[:, np.newaxis], 2, axis=1)
+        linkCosts[:, 1] += 3.0
+        skims = router.buildCentroidSkims(departures, linkCosts)
+        centroidIndices = snapshot.getCentroidIndices()
+        origin = snapshot.getNodeId(centroidIndices[0])
+        accessLinks = [net.getLinkForId(snapshot.getLinkId(linkIndex))
+                       for linkIndex in snapshot.getCentroidAccessLinks(centroidIndices[0])]
+        for departure in departures:
+            labels = np.min([router.getArrivalTimes(link, departure).getLabels() for link in accessLinks], axis=0)
+            for destIndex in centroidIndices[1:]:
+                dest = snapshot.getNodeId(destIndex)
+                expected = float('inf')
+                for linkIndex in snapshot.getCentroidAccessLinks(destIndex, egress=True):
+                    entry = labels[linkIndex]
+                    period = 0 if entry < 5 else 1
+                    exit = entry + linkCosts[linkIndex, period]
+                    if period == 0:
+                        exit = min(exit, 5 + linkCosts[linkIndex, 1])
+                    expected = min(expected, exit)
+                assert abs(skims[departure, origin, dest] - (expected - departure)) < 1e-9 or \
+                       skims[departure, origin, dest] == expected
+
+    def test_pointToPointPaths(self):
+
+        net = getTestNet()
+        source = net.getNodeForId(26628)
+
+        # A* gives paths as short as the full tree
+        tree = dta.ShortestPaths.labelCorrectingWithLabelsOnNodes(net, source)
+        numChecked = 0
+        for node in net.iterNodes():
+            if node == source or not tree.isReachable(node.getId()): continue
+            path = dta.ShortestPaths.getAStarPathBetweenNodes(net, source, node)
+            assert path[0] == source and path[-1] == node
+            length = sum(net.getLinkForNodeIdPair(nodeA.getId(), nodeB.getId()).euclideanLength()
+                         for nodeA, nodeB in izip(path, path[1:]))
+            assert abs(length - tree.getLabel(node.getId())) < 1e-6
+            numChecked += 1
+        assert numChecked > 100
+
+        unreachable = [node for node in net.iterRoadNodes() if not tree.isReachable(node.getId())]
+        if unreachable:
+            nose.tools.assert_raises(DtaError, dta.ShortestPaths.getAStarPathBetweenNodes, net, source, unreachable[0])
+
+        # bidirectional search on the links matches the tree on links
+        snapshot = net.toGraphSnapshot()
+        sourceLink = sorted([link for link in net.iterRoadLinks() if link.getNumOutgoingMovements() > 0],
+                            key=lambda link: link.getId())[0]
+        linkTree = dta.ShortestPaths.labelCorrectingWithLabelsOnLinks(net, sourceLink, snapshot.getMovementLengthCosts())
+        numChecked = 0
+        for link in net.iterRoadLinks():
+            if link == sourceLink: continue
+            if not linkTree.isReachable(link.getId()):
+                nose.tools.assert_raises(DtaError, dta.ShortestPaths.getBidirectionalPathBetweenLinks, net, sourceLink, link)
+                continue
+            path = dta.ShortestPaths.getBidirectionalPathBetweenLinks(net, sourceLink, link)
+            assert path[0] == sourceLink and path[-1] == link
+            for upLink, downLink in izip(path, path[1:]):
+                assert upLink.hasOutgoingMovement(downLink.getEndNode().getId())
+            assert abs(sum(l.getLength() for l in path[:-1]) - linkTree.getLabel(link.getId())) < 1e-6
+            numChecked += 1
+        assert numChecked > 0
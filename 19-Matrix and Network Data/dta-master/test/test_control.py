@@ -57,7 +57,7 @@ def getGearySubNet():
     scenario = DynameqScenario(Time(0,0), Time(12,0))
     scenario.read(projectFolder, prefix) 
     net = DynameqNetwork(scenario) 
-    net.read(projectFolder, prefix) 
+    net.read(projectFolder, prefix, useCache=False) 
     return net 
 
 
@@ -39,7 +39,7 @@ def getGearySubNet():
     scenario = dta.DynameqScenario(dta.Time(0,0), dta.Time(12,0))
     scenario.read(projectFolder, prefix) 
     net = dta.DynameqNetwork(scenario) 
-    net.read(projectFolder, prefix)
+    net.read(projectFolder, prefix, useCache=False)
 
     simStartTimeInMin = 0
     simEndTimeInMin = 60
@@ -20,6 +20,8 @@ import dta
 import os
 import pdb
 import random
+import shutil
+import tempfile
 
 import nose.tools 
 import numpy as np
@@ -49,7 +51,7 @@ def getTestNet():
     dta.RoadLink.LENGTH_UNITS   = "miles"
     
     net = DynameqNetwork(scenario) 
-    net.read(projectFolder, prefix) 
+    net.read(projectFolder, prefix, useCache=False) 
     return net 
 
 
@@ -86,6 +88,20 @@ class TestDemand:
         assert not demand.getValue(Time(0, 15), 56, 8) == 4000
         assert demand.getValue(Time(0, 15), 56, 8) == 4001
 
+    def test_removeInvalidODPairs(self):
+
+        net = getTestNet()
+        demand = Demand(net, "Default", Time(8, 30), Time(9, 30), Time(0, 15))
+        demand._demandTable.fill(1)
+        demand.removeInvalidODPairs()
+
+        for originId in demand._centroidIds:
+            origin = net.getNodeForId(originId)
+            for destinationId in demand._centroidIds:
+                hasPath = dta.Algorithms.hasPath(net, origin, net.getNodeForId(destinationId))
+                for timePeriod in demand.iterTimePeriods():
+                    assert demand.getValue(timePeriod, originId, destinationId) == (1 if hasPath else 0)
+
     def test_plotHistogram(self):
         
         fileName = os.path.join(os.path.dirname(__file__), '..', 'testdata', 
@@ -133,6 +149,106 @@ class TestDemand:
         assert demand.getValue(Time(8, 0), 2, 6) == 1000
         assert demand.getValue(Time(8, 0), 6, 2) == 4000
 
+    def test_readCubeODTable(self):
+
+        net = getTestNet()
+        centroidIds = sorted(centroid.getId() for centroid in net.iterCentroids())
+        origin, destination, other = centroidIds[:3]
+        closest, dist = dta.Algorithms.getClosestCentroid(net, net.getNodeForId(other))
+
+        records = [(origin, destination, 100), (origin, destination, 20), (destination, origin, 0),
+                   (other, other, 40), (origin, 999999, 50)]
+        fileName = os.path.join(tempfile.mkdtemp(), "cubeDemand.csv")
+        try:
+            cubeFile = open(fileName, "w")
+            cubeFile.write("O,D,AUTO,TRUCK\n")
+            cubeFile.write("".join("%d,%d,%d,1\n" % record for record in records))
+            cubeFile.close()
+            demand = Demand.readCubeODTable(fileName, net, "AUTO", Time(7, 0), Time(8, 0), Time(0, 15), 0.5)
+        finally:
+            shutil.rmtree(os.path.dirname(fileName))
+
+        for timePeriod in demand.iterTimePeriods():
+            assert demand.getValue(timePeriod, origin, destination) == 60
+            assert demand.getValue(timePeriod, destination, origin) == 0
+            assert demand.getValue(timePeriod, other, closest.getId()) == 10
+            assert demand.getValue(timePeriod, closest.getId(), other) == 10
+        nose.tools.assert_almost_equal(demand.getTotalNumTrips(), 0.5 * (100 + 20 + 40))
+
+    def test_sparseDemand(self):
+
+        net = getTestNet()
+        centroidIds = sorted(centroid.getId() for centroid in net.iterCentroids())
+        dense  = Demand(net, "AUTO", Time(7, 0), Time(8, 0), Time(0, 30), sparse=False)
+        sparse = Demand(net, "AUTO", Time(7, 0), Time(8, 0), Time(0, 30), sparse=True)
+        assert not dense.isSparse() and sparse.isSparse()
+        for demand in [dense, sparse]:
+            for k, (origin, destination) in enumerate(zip(centroidIds, centroidIds[::-1])):
+                demand.setValue(Time(7, 30 if k % 2 else 0) + Time(0, 30), origin, destination, k + 1)
+            demand.setValue(Time(8, 0), centroidIds[0], centroidIds[-1], 0)
+        assert sparse.getValue(Time(8, 0), centroidIds[1], centroidIds[-2]) == 2
+        assert sparse.getValue(Time(8, 0), centroidIds[0], centroidIds[1]) == 0
+        assert sparse == dense
+        assert sparse.getTotalNumTrips() == dense.getTotalNumTrips()
+        assert sparse.getNumBytes() < dense.getNumBytes()
+        assert sparse.getMultiArray() == dense.getMultiArray()
+        hour = dense.getMultiArray().groupBy("time", dict((timeLabel, "AM") for timeLabel in dense._timeLabels))
+        assert hour.sumOver("time") == dense.getMultiArray().sumOver("time")
+
+        # written and read back either way
+        folder = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(folder, "demand.dqt")
+            outputStream = open(fileName, "w")
+            Demand.writeDynameqDemandHeader(outputStream, sparse.startTime, sparse.endTime, sparse.vehClassName)
+            sparse.writeDynameqTable(outputStream)
+            outputStream.close()
+            assert Demand.readDynameqTable(net, fileName, sparse=True) == dense
+            assert Demand.readDynameqTable(net, fileName, sparse=False) == sparse
+            assert not Demand.readDynameqTable(net, fileName).isSparse()
+        finally:
+            shutil.rmtree(folder)
+
+        # one slice split by time of day factors
+        for demand in [dense, sparse]:
+            demand.setSparse(not demand.isSparse())
+        dense, sparse = sparse, dense
+        oneSlice = Demand(net, "AUTO", Time(7, 0), Time(8, 0), Time(1, 0), sparse=True)
+        oneSlice.setValue(Time(8, 0), centroidIds[0], centroidIds[1], 100)
+        factored = oneSlice.applyTimeOfDayFactors([0.25, 0.75])
+        assert factored.isSparse()
+        assert factored.getValue(Time(7, 30), centroidIds[0], centroidIds[1]) == 50
+        assert factored.getValue(Time(8, 0), centroidIds[0], centroidIds[1]) == 150
+
+        sparse.removeInvalidODPairs()
+        dense.removeInvalidODPairs()
+        assert sparse == dense
+
+    def test_writeDynameqTables(self):
+
+        net = getTestNet()
+        centroidIds = sorted(centroid.getId() for centroid in net.iterCentroids())
+        demands = []
+        for sparse, vehClassName in [(False, "AUTO"), (True, "TRUCK")]:
+            demand = Demand(net, vehClassName, Time(7, 0), Time(8, 0), Time(0, 15), sparse=sparse)
+            for k, origin in enumerate(centroidIds):
+                demand.setValue(Time(7, 15 * (k % 4 + 1)) if k % 4 < 3 else Time(8, 0),
+                                origin, centroidIds[(k * 7) % len(centroidIds)], k + 0.25)
+            demands.append(demand)
+
+        folder = tempfile.mkdtemp()
+        try:
+            fileNames = [os.path.join(folder, "%s.dqt" % demand.vehClassName) for demand in demands]
+            Demand.writeDynameqTables(zip(demands, fileNames), numProcesses=2)
+            for demand, fileName in zip(demands, fileNames):
+                assert Demand.readDynameqTable(net, fileName) == demand
+                lines = open(fileName).read().splitlines()
+                firstRow = lines[lines.index("SLICE") + 3].split("\t")
+                assert firstRow[0] == str(centroidIds[0])
+                assert firstRow[1:] == ["0.25" if centroidId == centroidIds[0] else "0.00" for centroidId in centroidIds]
+        finally:
+            shutil.rmtree(folder)
+
     def NOtest_applyTimeOfDayFactors(self):
 
         fileName = os.path.join(os.path.dirname(__file__), '..', 'testdata', 
@@ -160,7 +276,7 @@ class TestDemand:
         scenario.read(projectFolder, prefix)
         
         net = DynameqNetwork(scenario)
-        net.read(projectFolder, prefix) 
+        net.read(projectFolder, prefix, useCache=False) 
 
         file1 = "/Users/michalis/Documents/sfcta/05252012/car_notoll_matx.dqt"
         demand1 = Demand.readDynameqTable(net, file1)
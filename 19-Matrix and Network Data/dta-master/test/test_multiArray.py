@@ -0,0 +1,196 @@
+__copyright__   = "Copyright 2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+
+import nose.tools
+import numpy as np
+
+from dta.MultiArray import MultiArray
+
+def getAlphaToBeta():
+    """Zones 11 and 12 split zone 1, zone 2 is zone 21"""
+    return np.array([(11, 1, 0.25), (12, 1, 0.75), (21, 2, 1.0)],
+                    dtype=[("alpha", np.int64), ("beta", np.int64), ("percentage", np.float64)])
+
+class TestMultiArray:
+
+    def test_expand(self):
+
+        ma = MultiArray("d", [[1, 2], [1, 2]], np.array([[4.0, 8.0], [12.0, 16.0]]))
+        expanded = ma.expand(getAlphaToBeta())
+        nose.tools.assert_equal(expanded.getElementsOfAllDimentions(), ((11, 12, 21), (11, 12, 21)))
+        shares = np.array([0.25, 0.75, 1.0])
+        betas = [0, 0, 1]
+        expected = np.outer(shares, shares) * ma.getNumpyArray()[np.ix_(betas, betas)]
+        assert np.allclose(expanded.getNumpyArray(), expected)
+
+        # only the destinations of a time x origin x destination cube
+        cube = MultiArray("d", [["7:00", "7:15"], [1, 2], [1, 2]], np.arange(8.0).reshape(2, 2, 2))
+        expanded = cube.expand(getAlphaToBeta(), dims=[2])
+        nose.tools.assert_equal(expanded.getShape(), (2, 2, 3))
+        assert np.allclose(expanded.getNumpyArray()[:, :, 1], 0.75 * cube.getNumpyArray()[:, :, 0])
+        nose.tools.assert_almost_equal(expanded.getSum(), cube.getSum())
+
+        nose.tools.assert_raises(ValueError, cube.expand, getAlphaToBeta(), [0])
+
+    def test_collapse(self):
+
+        cube = MultiArray("d", [["7:00", "7:15"], [11, 12, 21], [11, 12, 21]],
+                          np.random.rand(2, 3, 3))
+        collapsed = cube.collapse(getAlphaToBeta())
+        nose.tools.assert_equal(collapsed.getElementsOfAllDimentions(), (("7:00", "7:15"), (1, 2), (1, 2)))
+        data = cube.getNumpyArray()
+        assert np.allclose(collapsed.getNumpyArray()[:, 0, 0], data[:, :2, :2].sum(axis=(1, 2)))
+        assert np.allclose(collapsed.getNumpyArray()[:, 0, 1], data[:, :2, 2].sum(axis=1))
+        nose.tools.assert_almost_equal(collapsed.getSum(), cube.getSum())
+
+        # an alpha in two betas is split in proportion to its percentages
+        alphaToBeta = np.array([(11, 1, 1.0), (12, 1, 0.5), (12, 2, 1.5)],
+                               dtype=[("alpha", np.int64), ("beta", np.int64), ("percentage", np.float64)])
+        vector = MultiArray("d", [[11, 12]], np.array([2.0, 4.0]))
+        assert np.allclose(vector.collapse(alphaToBeta).getNumpyArray(), [3.0, 3.0])
+
+        # collapsing the expansion gives the original array back
+        ma = MultiArray("d", [[1, 2], [1, 2]], np.array([[4.0, 8.0], [12.0, 16.0]]))
+        assert np.allclose(ma.expand(getAlphaToBeta()).collapse(getAlphaToBeta()).getNumpyArray(),
+                           ma.getNumpyArray())
+
+    def test_listIndexing(self):
+
+        cube = MultiArray("d", [["7:00", "7:15"], [1, 2, 3], [1, 2, 3]], np.arange(18.0).reshape(2, 3, 3))
+        nose.tools.assert_equal(cube["7:15", 2, 3], 14.0)
+
+        sub = cube[["7:15"], [3, 1], :]
+        nose.tools.assert_equal(sub.getElementsOfAllDimentions(), (("7:15",), (3, 1), (1, 2, 3)))
+        assert np.array_equal(sub.getNumpyArray(), cube.getNumpyArray()[1:, [2, 0], :])
+
+        mask = np.array([True, False, True])
+        assert np.array_equal(cube["7:00", mask, 2].getNumpyArray(), [1.0, 7.0])
+        nose.tools.assert_raises(IndexError, cube.__getitem__, ("7:00", [1, 4], 2))
+
+        cube["7:00", [1, 2], [2, 3]] = np.array([[-1.0, -2.0], [-3.0, -4.0]])
+        assert np.array_equal(cube.getNumpyArray()[0, :2, 1:], [[-1.0, -2.0], [-3.0, -4.0]])
+
+    def test_batchAccess(self):
+
+        cube = MultiArray("d", [["7:00", "7:15"], [10, 20, 30], [10, 20, 30]])
+        labels = (["7:00", "7:15", "7:00"], [10, 30, 10], [20, 20, 20])
+        cube.setMany(labels, [1.0, 2.0, 3.0])
+        assert np.array_equal(cube.getMany(labels), [3.0, 2.0, 3.0])
+
+        cube.addMany(labels, [1.0, 1.0, 1.0])
+        assert np.array_equal(cube.getMany(labels), [5.0, 3.0, 5.0])
+        nose.tools.assert_equal(cube.getSum(), 8.0)
+        nose.tools.assert_raises(IndexError, cube.getMany, (["7:00"], [10], [40]))
+
+    def test_mapped(self):
+
+        cube = MultiArray("d", [["7:00", "7:15", "7:30"], [1, 2], [1, 2, 3]], np.random.rand(3, 2, 3))
+        outputDir = tempfile.mkdtemp(prefix="test_multiArray")
+        chunkBytes = MultiArray.CHUNK_BYTES
+        try:
+            fileName = os.path.join(outputDir, "cube.npy")
+            cube.writeMapped(fileName)
+
+            mapped = MultiArray.openMapped(fileName)
+            assert mapped.isMapped()
+            assert not cube.isMapped()
+            assert mapped == cube
+            # slices are views of the file
+            assert isinstance(mapped["7:15", :, :].getNumpyArray(), np.memmap)
+
+            # reductions by chunks of one time slice
+            MultiArray.CHUNK_BYTES = 1
+            nose.tools.assert_almost_equal(mapped.getSum(), cube.getSum())
+            for dim in range(3):
+                assert np.allclose(mapped.eliminateDimention(dim).getNumpyArray(), cube.getNumpyArray().sum(dim))
+
+            # copy-on-write changes stay in memory, and a pickle only holds the file name
+            copied = MultiArray.openMapped(fileName, mode="c")
+            copied.multiplyInPlace(2.0)
+            nose.tools.assert_almost_equal(copied.getSum(), 2 * cube.getSum())
+            nose.tools.assert_almost_equal(MultiArray.openMapped(fileName).getSum(), cube.getSum())
+            pickled = pickle.dumps(mapped)
+            assert len(pickled) < len(pickle.dumps(cube))
+            unpickled = pickle.loads(pickled)
+            assert unpickled.isMapped()
+            assert unpickled == cube
+            # but a copy-on-write array keeps its changes
+            unpickled = pickle.loads(pickle.dumps(copied))
+            assert not unpickled.isMapped()
+            assert unpickled == copied
+            nose.tools.assert_almost_equal(unpickled.getSum(), 2 * cube.getSum())
+            
+            # an empty first dimention has no chunks
+            empty = MultiArray("d", [[], [1, 2]])
+            empty.writeMapped(os.path.join(outputDir, "empty.npy"))
+            empty = MultiArray.openMapped(os.path.join(outputDir, "empty.npy"))
+            assert np.array_equal(empty.sumOver(0).getNumpyArray(), [0.0, 0.0])
+            nose.tools.assert_equal(empty.sumOver(1).getShape(), (0,))
+            nose.tools.assert_equal(empty.getSum(), 0.0)
+
+            nose.tools.assert_raises(ValueError, MultiArray.openMapped, fileName, "w+")
+        finally:
+            MultiArray.CHUNK_BYTES = chunkBytes
+            shutil.rmtree(outputDir)
+
+    def test_groupBy(self):
+
+        cube = MultiArray("d", [["7:00", "7:15", "7:30", "7:45"], [1, 2, 3], [1, 2, 3]],
+                          np.random.rand(4, 3, 3), dimNames=["time", "origin", "destination"])
+        data = cube.getNumpyArray()
+
+        byOrigin = cube.sumOver("destination")
+        nose.tools.assert_equal(byOrigin.getDimNames(), ["time", "origin"])
+        assert np.allclose(byOrigin.getNumpyArray(), data.sum(2))
+        assert np.allclose(cube.meanOver("time").getNumpyArray(), data.mean(0))
+        assert np.allclose(cube.maxOver(1).getNumpyArray(), data.max(1))
+        assert np.allclose(cube.minOver("time").getNumpyArray(), data.min(0))
+        nose.tools.assert_almost_equal(cube.sumOver("time").sumOver("origin").sumOver("destination"), cube.getSum())
+        nose.tools.assert_raises(ValueError, cube.sumOver, "class")
+
+        # adjacent peak periods
+        periods = cube.groupBy("time", {"7:00":"AM1", "7:15":"AM1", "7:30":"AM2", "7:45":"AM2"})
+        nose.tools.assert_equal(periods.getElementsOfDimention(0), ("AM1", "AM2"))
+        assert np.allclose(periods.getNumpyArray(), data.reshape(2, 2, 3, 3).sum(1))
+
+        # districts of scattered zones, zone 2 left out
+        districts = cube.groupBy("destination", {1:"B", 3:"A"}, how="max")
+        nose.tools.assert_equal(districts.getElementsOfAllDimentions()[2], ("A", "B"))
+        assert np.allclose(districts.getNumpyArray(), data[:, :, [2, 0]])
+        means = cube.groupBy("origin", {1:10, 2:20, 3:10}, how="mean")
+        assert np.allclose(means.getNumpyArray()[:, 0, :], data[:, [0, 2], :].mean(1))
+        nose.tools.assert_equal(means.getDimNames(), cube.getDimNames())
+
+        # scattered groups of every dimention, reduced by chunks of one time slice
+        chunkBytes = MultiArray.CHUNK_BYTES
+        MultiArray.CHUNK_BYTES = 1
+        try:
+            for how, reduction in [("sum", np.sum), ("max", np.max), ("mean", np.mean)]:
+                offPeak = cube.groupBy("time", {"7:00":"OFF", "7:15":"AM", "7:30":"AM", "7:45":"OFF"}, how=how)
+                assert np.allclose(offPeak.getNumpyArray()[0], reduction(data[1:3], axis=0))
+                assert np.allclose(offPeak.getNumpyArray()[1], reduction(data[[0, 3]], axis=0))
+                districts = cube.groupBy("destination", {1:"B", 2:"A", 3:"B"}, how=how)
+                assert np.allclose(districts.getNumpyArray()[:, :, 0], data[:, :, 1])
+                assert np.allclose(districts.getNumpyArray()[:, :, 1], reduction(data[:, :, [0, 2]], axis=2))
+        finally:
+            MultiArray.CHUNK_BYTES = chunkBytes
@@ -22,9 +22,12 @@ import math
 import difflib 
 import os
 import shutil
+import tempfile
 
 from itertools import izip 
 
+import numpy as np
+
 import dta
 from dta.Scenario import Scenario
 from dta.DynameqScenario import DynameqScenario 
@@ -41,6 +44,10 @@ from dta.Connector import Connector
 from dta.VehicleClassGroup import VehicleClassGroup
 from dta.DtaError import DtaError 
 from dta.DynameqNetwork import DynameqNetwork 
+from dta.SimResultStore import SimResultStore
+from dta.SimResultWarehouse import SimResultWarehouse
+from dta.CountValidation import CountValidation
+from dta.Algorithms import hasPath
 from dta.Utils import lineSegmentsCross
 from dta.Utils import Time
 
@@ -68,7 +75,7 @@ def getGearySubNet():
     scenario = DynameqScenario(Time(0,0), Time(12,0))
     scenario.read(projectFolder, prefix) 
     net = DynameqNetwork(scenario) 
-    net.read(projectFolder, prefix) 
+    net.read(projectFolder, prefix, useCache=False) 
     return net
 
 def getCubeSubarea():
@@ -79,7 +86,7 @@ def getCubeSubarea():
     scenario = DynameqScenario(Time(0,0), Time(12,0))
     scenario.read(projectFolder, prefix) 
     net = DynameqNetwork(scenario) 
-    net.read(projectFolder, prefix) 
+    net.read(projectFolder, prefix, useCache=False) 
 
     return net 
 
@@ -91,7 +98,7 @@ def getDowntownSF():
     scenario = DynameqScenario(Time(0,0), Time(12,0))
     scenario.read(projectFolder, prefix) 
     net = DynameqNetwork(scenario) 
-    net.read(projectFolder, prefix) 
+    net.read(projectFolder, prefix, useCache=False) 
 
     return net
 
@@ -103,7 +110,7 @@ def getCubeSubarea():
     scenario = DynameqScenario(Time(0,0), Time(12,0))
     scenario.read(projectFolder, prefix) 
     net = DynameqNetwork(scenario) 
-    net.read(projectFolder, prefix) 
+    net.read(projectFolder, prefix, useCache=False) 
 
     return net 
 
@@ -265,6 +272,34 @@ class TestNetwork(object):
         assert net.getNumCentroids() == 0
         assert net.getNumVirtualNodes() == 0
 
+    def test_typedRegistries(self):
+
+        net = getSimpleNet()
+        centroid = Centroid(9, 0, 200)
+        net.addNode(centroid)
+        net.addLink(simpleConnectorFactory(15, centroid, net.getNodeForId(5)))
+        net.addLink(simpleConnectorFactory(16, net.getNodeForId(5), centroid))
+        assert net.getNumCentroids() == 1 and net.getNumConnectors() == 2 and net.getNumRoadLinks() == 14
+        assert [node.getId() for node in net.iterCentroids()] == [9]
+
+        net.insertVirtualNodeBetweenCentroidsAndRoadNodes()
+        assert net.getNumVirtualNodes() == 1 and net.getNumVirtualLinks() == 2
+        assert net.getNumRoadNodes() == 8 and net.getNumConnectors() == 2
+
+        net.renameNode(7, 107)
+        net.renameLink(12, 112)
+        assert sorted(node.getId() for node in net.iterRoadNodes()) == [1, 2, 3, 4, 5, 6, 8, 107]
+        assert 112 in [link.getId() for link in net.iterRoadLinks()]
+
+        net.removeNode(net.getNodeForId(107))
+        assert net.getNumRoadNodes() == 7 and net.getNumRoadLinks() == 12
+        for nodes, isType in [(net.iterRoadNodes(), "isRoadNode"), (net.iterCentroids(), "isCentroid"),
+                              (net.iterVirtualNodes(), "isVirtualNode")]:
+            assert all(getattr(node, isType)() for node in nodes)
+        assert all(link.isConnector() for link in net.iterConnectors())
+        assert net.getNumRoadNodes() + net.getNumCentroids() + net.getNumVirtualNodes() == net.getNumNodes()
+        assert net.getNumRoadLinks() + net.getNumConnectors() + net.getNumVirtualLinks() == net.getNumLinks()
+
     def test_2hasMethods(self):
 
         net = getSimpleNet()
@@ -712,7 +747,7 @@ class TestNetwork(object):
         scenario = getTestScenario() 
         
         net = DynameqNetwork(scenario) 
-        net.read("test", "test") 
+        net.read("test", "test", useCache=False) 
 
 
     def test_readScenario(self):
@@ -748,7 +783,7 @@ class TestNetwork(object):
         net.write(os.path.join(mainFolder, 'dynameqNetwork_gearySubset_copy'), 'smallTestNet')
 
         net2 = DynameqNetwork(net.getScenario()) 
-        net2.read(os.path.join(mainFolder, 'dynameqNetwork_gearySubset_copy'), "smallTestNet") 
+        net2.read(os.path.join(mainFolder, 'dynameqNetwork_gearySubset_copy'), "smallTestNet", useCache=False) 
 
         after = (net2.getNumNodes(), net2.getNumRoadNodes(), net2.getNumCentroids(), net2.getNumVirtualNodes(),
                   net2.getNumLinks(), net2.getNumRoadLinks(), net2.getNumConnectors(), net2.getNumVirtualLinks())
@@ -774,6 +809,361 @@ class TestNetwork(object):
 
 
               
+    def test_readDynameqNetworkCache(self):
+
+        projectFolder = os.path.join(mainFolder, 'dynameqNetwork_gearySubset')
+        cacheFolder = os.path.join(mainFolder, 'dynameqNetwork_gearySubset_cache')
+        shutil.copytree(projectFolder, cacheFolder, ignore=shutil.ignore_patterns(DynameqNetwork.CACHE_DIR % '*'))
+        try:
+            scenario = getTestScenario()
+            textNet = DynameqNetwork(scenario)
+            textNet.read(cacheFolder, 'smallTestNet', useCache=False)
+            assert not os.path.exists(os.path.join(cacheFolder, DynameqNetwork.CACHE_DIR % 'smallTestNet'))
+
+            # the first read writes the cache, the second one loads it
+            DynameqNetwork(scenario).read(cacheFolder, 'smallTestNet', useCache=True)
+            assert os.path.exists(os.path.join(cacheFolder, DynameqNetwork.CACHE_DIR % 'smallTestNet'))
+            cacheNet = DynameqNetwork(scenario)
+            assert cacheNet._readCache(cacheFolder, 'smallTestNet')
+            
+            assert cacheNet.getMaxNodeId() == textNet.getMaxNodeId()
+            assert cacheNet.getMaxLinkId() == textNet.getMaxLinkId()
+            # the typed registries
+            for getNum in ["getNumRoadNodes", "getNumCentroids", "getNumVirtualNodes",
+                           "getNumRoadLinks", "getNumConnectors", "getNumVirtualLinks"]:
+                assert getattr(cacheNet, getNum)() == getattr(textNet, getNum)()
+            assert sorted(cacheNet._centroids.keys()) == sorted(textNet._centroids.keys())
+            assert sorted(cacheNet._connectors.keys()) == sorted(textNet._connectors.keys())
+            assert sorted(cacheNet._virtualLinks.keys()) == sorted(textNet._virtualLinks.keys())
+            for node in textNet.iterNodes():
+                cacheNode = cacheNet.getNodeForId(node.getId())
+                assert type(cacheNode) == type(node)
+                assert (cacheNode.getX(), cacheNode.getY(), cacheNode._label, cacheNode._level) == \
+                       (node.getX(), node.getY(), node._label, node._level)
+                assert [link.getId() for link in cacheNode.iterOutgoingLinks()] == \
+                       [link.getId() for link in node.iterOutgoingLinks()]
+                assert [link.getId() for link in cacheNode.iterIncomingLinks()] == \
+                       [link.getId() for link in node.iterIncomingLinks()]
+            
+            for link in textNet.iterLinks():
+                cacheLink = cacheNet.getLinkForId(link.getId())
+                assert type(cacheLink) == type(link)
+                assert cacheLink.getStartNode().getId() == link.getStartNode().getId()
+                assert cacheLink.getEndNode().getId() == link.getEndNode().getId()
+                if not isinstance(link, RoadLink): continue
+                assert cacheLink.getShapePoints() == link.getShapePoints()
+                assert cacheLink.getShifts() == link.getShifts()
+                assert (cacheLink.getLength(), cacheLink.getFreeFlowSpeedInMPH(), cacheLink.getNumLanes(), cacheLink._label) == \
+                       (link.getLength(), link.getFreeFlowSpeedInMPH(), link.getNumLanes(), link._label)
+                assert dict((laneId, group.name) for laneId, group in cacheLink._lanePermissions.iteritems()) == \
+                       dict((laneId, group.name) for laneId, group in link._lanePermissions.iteritems())
+                assert [mov.getIncomingLink().getId() for mov in cacheLink.iterIncomingMovements()] == \
+                       [mov.getIncomingLink().getId() for mov in link.iterIncomingMovements()]
+            
+            movements = [(mov.getIncomingLink().getId(), mov.getOutgoingLink().getId(), mov._freeflowSpeed,
+                          mov.getVehicleClassGroup().name, mov._numLanes, mov._followupTime) for mov in textNet.iterMovements()]
+            assert movements == [(mov.getIncomingLink().getId(), mov.getOutgoingLink().getId(), mov._freeflowSpeed,
+                                  mov.getVehicleClassGroup().name, mov._numLanes, mov._followupTime) for mov in cacheNet.iterMovements()]
+            
+            # changing a network file makes the cache stale
+            advancedFile = open(os.path.join(cacheFolder, DynameqNetwork.ADVANCED_FILE % 'smallTestNet'), "a")
+            advancedFile.write("* changed\n")
+            advancedFile.close()
+            assert not DynameqNetwork(scenario)._readCache(cacheFolder, 'smallTestNet')
+        finally:
+            shutil.rmtree(cacheFolder)
+        
+    def test_simResults(self):
+        
+        net = getGearySubNet()
+        simResults = net.initializeSimResults(0, 60, 15)
+        numMovements = sum(1 for mov in net.iterMovements())
+        assert simResults.getNumTimeSteps() == 4
+        assert simResults.getNumRows() == sum(1 for link in net.iterLinks() if isinstance(link, RoadLink)) + numMovements
+        # one float32 per row, time step and result, plus the parent rows
+        assert simResults.getNumBytes() == simResults.getNumRows() * (3 * 4 * 4 + 4)
+        
+        for index, mov in enumerate(net.iterMovements()):
+            for start in range(0, 60, 15):
+                volume = (index + start) % 7
+                mov.setSimOutVolume(start, start + 15, volume)
+                mov.setSimInVolume(start, start + 15, volume + 1)
+                mov.setSimTTInMin(start, start + 15, 0.5 + volume if volume else 0)
+        
+        linkIds, outVolumes = net.getLinkSimOutVolumes(0, 30)
+        linkIds, inVolumes  = net.getLinkSimInVolumes(15, 60)
+        linkIds, linkTTs    = net.getLinkSimTTsInMin(0, 30)
+        for linkId, outVolume, inVolume, linkTT in izip(linkIds, outVolumes, inVolumes, linkTTs):
+            link = net.getLinkForId(linkId)
+            assert outVolume == link.getSimOutVolume(0, 30)
+            assert inVolume == link.getSimInVolume(15, 60)
+            nose.tools.assert_almost_equal(linkTT, link.getSimTTInMin(0, 30))
+        
+        nose.tools.assert_raises(DtaError, net.getLinkSimOutVolumes, 0, 20)
+        nose.tools.assert_raises(DtaError, net.getLinkSimOutVolumes, 0, 75)
+        
+    def test_simResultPrefixSums(self):
+        
+        blockRows = SimResultStore.PREFIX_SUM_BLOCK_ROWS
+        SimResultStore.PREFIX_SUM_BLOCK_ROWS = 4
+        try:
+            simResults = SimResultStore(0, 60, 15)
+            simResults.addRows([-1] * 10)
+            volumes = np.arange(40, dtype=np.float32).reshape((10, 4))
+            simResults.setBlock(np.arange(10), 0, outVolumes=volumes, inVolumes=2 * volumes, meanTTs=volumes)
+            
+            # a single row query builds one kind of prefix sums for its block only
+            assert simResults.getOutVolume(5, 15, 60) == volumes[5, 1:].sum()
+            assert simResults._prefixSums.keys() == [1]
+            assert simResults._prefixSums[1].keys() == ["outVolume"]
+            
+            # and the rows set afterwards are updated
+            simResults.setBlock([5, 9], 1, outVolumes=[[100], [100]], inVolumes=[[100], [100]], meanTTs=[[1], [1]])
+            assert simResults.getOutVolume(5, 0, 60) == volumes[5].sum() - volumes[5, 1] + 100
+            assert simResults.getInVolume(9, 0, 60) == 2 * volumes[9].sum() - 2 * volumes[9, 1] + 100
+            simResults.addRow()
+            assert simResults.getOutVolume(10, 0, 60) == 0
+            
+            outVolumes, inVolumes, meanTTs = simResults.getWindowResults([(0, 30), (15, 60)])
+            for row in range(11):
+                assert outVolumes[row, 1] == simResults.getOutVolume(row, 15, 60)
+                assert inVolumes[row, 0] == simResults.getInVolume(row, 0, 30)
+                volume, meanTT = simResults.getMeanTT(row, 15, 60)
+                if meanTT is None: assert np.isnan(meanTTs[row, 1])
+                else: nose.tools.assert_almost_equal(meanTTs[row, 1], meanTT)
+        finally:
+            SimResultStore.PREFIX_SUM_BLOCK_ROWS = blockRows
+        
+    def test_simResultWindows(self):
+        
+        net = getGearySubNet()
+        net.initializeSimResults(0, 60, 15)
+        movements = [mov for mov in net.iterMovements()]
+        for index, mov in enumerate(movements):
+            for start in range(0, 60, 15):
+                volume = (index + start) % 5
+                mov.setSimOutVolume(start, start + 15, volume)
+                mov.setSimInVolume(start, start + 15, volume + 2)
+                mov.setSimTTInMin(start, start + 15, 1.0 + start / 15 if volume else 0)
+        
+        windows = [(0, 15), (0, 60), (15, 45), (45, 60)]
+        linkIds, outVolumes, inVolumes, linkTTs = net.getLinkSimResultsByWindow(windows)
+        assert outVolumes.shape == (len(linkIds), len(windows))
+        for window, (start, end) in enumerate(windows):
+            assert (outVolumes[:, window] == net.getLinkSimOutVolumes(start, end)[1]).all()
+            assert (inVolumes[:, window] == net.getLinkSimInVolumes(start, end)[1]).all()
+            assert np.allclose(linkTTs[:, window], net.getLinkSimTTsInMin(start, end)[1])
+        
+        # the prefix sums follow the results set after they're built
+        mov = movements[0]
+        mov.setSimOutVolume(15, 30, 100)
+        mov.setSimTTInMin(15, 30, 3.0)
+        assert mov.getSimOutVolume(15, 30) == 100
+        nose.tools.assert_almost_equal(mov.getSimTTInMin(15, 30), 3.0)
+        linkPosition = list(linkIds).index(mov.getIncomingLink().getId())
+        linkIds, outVolumes, inVolumes, linkTTs = net.getLinkSimResultsByWindow(windows)
+        assert outVolumes[linkPosition, 1] == mov.getIncomingLink().getSimOutVolume(0, 60)
+        
+        # a volume without a travel time
+        mov.setSimOutVolume(0, 15, 5)
+        nose.tools.assert_raises(DtaError, net.getLinkSimResultsByWindow, windows)
+        nose.tools.assert_raises(DtaError, mov.getSimTTInMin, 0, 60)
+        nose.tools.assert_raises(DtaError, net.getLinkSimResultsByWindow, [(0, 20)])
+        
+    def test_readSimResults(self):
+        
+        net = getGearySubNet()
+        movements = [mov for mov in net.iterMovements()][:3]
+        header = ["* header line %d" % line for line in range(9)]
+        def movementLine(mov, values):
+            return " ".join(str(value) for value in [mov.getAtNode().getId(), mov.getStartNodeId(),
+                                                     mov.getEndNodeId()] + values)
+        def writeResults(flows, times):
+            for fileName, results in [(DynameqNetwork.MOVEMENT_FLOW_OUT, flows), (DynameqNetwork.MOVEMENT_TIME_OUT, times),
+                                      (DynameqNetwork.MOVEMENT_FLOW_IN, [[2 * flow for flow in values] for values in flows])]:
+                resultFile = open(os.path.join(resultFolder, fileName), "w")
+                resultFile.write("\n".join(header + [movementLine(mov, values) for mov, values in izip(movements, results)] +
+                                            ["1 2 3" + " 0" * 4]) + "\n")
+                resultFile.close()
+        
+        resultFolder = tempfile.mkdtemp()
+        try:
+            net._dir = resultFolder
+            # flows in vehicles per hour and travel times in seconds, with a negative travel time ignored
+            writeResults([[40, 0, 80, 4], [0, 0, 0, 0], [120, 120, 40, 0]],
+                         [[30, 0, 60, -1], [0, 0, 0, 0], [90, 30, 120, 0]])
+            net.readSimResults(0, 60, 15)
+            
+            assert movements[0].getSimOutVolume(0, 60) == 30
+            assert movements[0].getSimInVolume(0, 60) == 60
+            nose.tools.assert_almost_equal(movements[0].getSimTTInMin(0, 60), (10 * 0.5 + 20 * 1.0) / 30)
+            assert movements[1].getSimOutVolume(0, 60) == 0
+            assert movements[2].getSimOutVolume(15, 45) == 40
+            nose.tools.assert_almost_equal(movements[2].getSimTTInMin(0, 15), 1.5)
+            
+            # a flow without a travel time
+            writeResults([[40, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]],
+                         [[0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]])
+            nose.tools.assert_raises(DtaError, net.readSimResults, 0, 60, 15)
+        finally:
+            shutil.rmtree(resultFolder)
+        
+    def test_simResultWarehouse(self):
+        
+        net = getGearySubNet()
+        simResults = net.initializeSimResults(0, 60, 15)
+        rows = np.array(sorted(net.getSimResultMovementRows().values()))
+        warehouseFolder = tempfile.mkdtemp()
+        try:
+            warehouse = SimResultWarehouse(os.path.join(warehouseFolder, "runs"))
+            for run, scale in enumerate([1.0, 2.0, 3.0]):
+                volumes = scale * np.ones((len(rows), 4))
+                simResults.setBlock(rows, 0, outVolumes=volumes, inVolumes=volumes, meanTTs=volumes)
+                assert warehouse.addRun("iteration%d" % run, net)
+            assert not warehouse.addRun("iteration0", net)
+            
+            # reopened, the runs are memory mapped
+            warehouse = SimResultWarehouse(os.path.join(warehouseFolder, "runs"))
+            assert warehouse.getRunNames() == ["iteration0", "iteration1", "iteration2"]
+            assert isinstance(warehouse.getRun("iteration1")._outVolume, np.memmap)
+            
+            linkIds, linkVolumes = net.getLinkSimOutVolumes(0, 30)
+            assert (warehouse.getLinkIds() == linkIds).all()
+            assert (warehouse.getLinkResults(0, 30, runNames=["iteration2"])[0] == linkVolumes).all()
+            assert (warehouse.getLinkDifferences("iteration0", "iteration2", 0, 30) == 2 * linkVolumes / 3).all()
+            
+            linkIds, linkTTs = net.getLinkSimTTsInMin(0, 60)
+            assert (warehouse.getLinkPercentiles(0, 60, [0, 50, 100], SimResultWarehouse.MEASURE_TT)[2] == linkTTs).all()
+            nose.tools.assert_almost_equal(warehouse.getConvergenceGaps(0, 60)[0], 1.0)
+            nose.tools.assert_almost_equal(warehouse.getConvergenceGaps(0, 60)[1], 0.5)
+            
+            # a run of another network doesn't fit
+            otherNet = getSimpleNet()
+            addAllMovements(otherNet)
+            otherNet.initializeSimResults(0, 60, 15)
+            nose.tools.assert_raises(DtaError, warehouse.addRun, "other", otherNet)
+            nose.tools.assert_raises(DtaError, SimResultWarehouse, os.path.join(warehouseFolder, "runs"), 0, 120, 15)
+            
+            # a new warehouse given the simulation times ingests Dynameq results right away
+            resultFolder = os.path.join(warehouseFolder, "results")
+            os.makedirs(resultFolder)
+            (atNodeId, fromNodeId, toNodeId), row = net.getSimResultMovementRows().items()[0]
+            for fileName in [DynameqNetwork.MOVEMENT_FLOW_OUT, DynameqNetwork.MOVEMENT_TIME_OUT, DynameqNetwork.MOVEMENT_FLOW_IN]:
+                resultFile = open(os.path.join(resultFolder, fileName), "w")
+                resultFile.write("\n".join(["* header line %d" % line for line in range(9)] +
+                                           ["%d %d %d 40 40 40 40" % (atNodeId, fromNodeId, toNodeId)]) + "\n")
+                resultFile.close()
+            
+            warehouse = SimResultWarehouse(os.path.join(warehouseFolder, "dynameqRuns"), 0, 60, 15)
+            assert SimResultWarehouse(os.path.join(warehouseFolder, "dynameqRuns"))._times == (0, 60, 15)
+            assert warehouse.ingestDynameqRun("run0", net, resultFolder)
+            assert not warehouse.ingestDynameqRun("run0", net, resultFolder)
+            assert warehouse.getRun("run0").getOutVolumes(0, 60)[row] == 40
+            nose.tools.assert_raises(DtaError, SimResultWarehouse(os.path.join(warehouseFolder, "fresh")).ingestDynameqRun,
+                                     "run0", net, resultFolder)
+        finally:
+            shutil.rmtree(warehouseFolder)
+        
+    def test_countValidation(self):
+        
+        net = getGearySubNet()
+        net.initializeSimResults(0, 60, 15)
+        movements = [mov for mov in net.iterMovements()][:4]
+        for mov, volume, count in izip(movements, [100, 50, 0, 30], [100, 80, 0, 20]):
+            mov.setSimOutVolume(0, 15, volume)
+            mov.setSimTTInMin(0, 15, 1.0 if volume else 0)
+            mov.setObsCount(0, 15, count)
+        link = movements[0].getIncomingLink()
+        link.setObsCount(0, 15, 200)
+        link.setObsCount(15, 30, 0)
+        
+        validation = CountValidation(net, [(0, 15), (15, 30), (0, 30)])
+        assert len(validation.getLocations()) == 5
+        assert validation.getLocations()[0] == (CountValidation.LOCATION_LINK, link.getId(), link.getFacilityType())
+        assert validation.getNumObservations() == 6
+        
+        geh = validation.getGEH()
+        linkVolume = link.getSimOutVolume(0, 15)
+        nose.tools.assert_almost_equal(geh[0, 0], math.sqrt(2 * (4 * linkVolume - 800) ** 2 / (4 * linkVolume + 800)))
+        assert geh[0, 1] == 0
+        assert math.isnan(geh[0, 2])
+        
+        statistics = validation.getStatistics()
+        assert statistics["numObservations"] == 6
+        assert statistics["totalCount"] == 400
+        rmse = math.sqrt(sum((volume - count) ** 2 for volume, count in
+                             [(linkVolume, 200), (0, 0), (100, 100), (50, 80), (0, 0), (30, 20)]) / 6.0)
+        nose.tools.assert_almost_equal(statistics["percentRMSE"], 100 * rmse / (400 / 6.0))
+        assert 0 <= statistics["rSquared"] <= 1
+        
+        byFacilityType = validation.getStatisticsByFacilityType()
+        assert sum(values["numObservations"] for values in byFacilityType.itervalues()) == 6
+        assert sum(values["totalVolume"] for values in byFacilityType.itervalues()) == statistics["totalVolume"]
+        
+        # a counted movement added after the simulation results were set up has no row to validate against
+        ilink = movements[0].getIncomingLink()
+        newNode = simpleRoadNodeFactory(net.getMaxNodeId() + 1, ilink.getEndNode().getX() + 100, ilink.getEndNode().getY())
+        net.addNode(newNode)
+        olink = simpleRoadLinkFactory(net.getMaxLinkId() + 1, ilink.getEndNode(), newNode)
+        net.addLink(olink)
+        newMov = Movement.simpleMovementFactory(ilink, olink, movements[0].getVehicleClassGroup())
+        net.addMovement(newMov)
+        assert (newMov.getAtNode().getId(), newMov.getStartNodeId(), newMov.getEndNodeId()) not in net.getSimResultMovementRows()
+        newMov.simStartTimeInMin, newMov.simEndTimeInMin, newMov.simTimeStepInMin = 0, 60, 15
+        newMov.setObsCount(0, 15, 10)
+        nose.tools.assert_raises(DtaError, CountValidation, net, [(0, 15)])
+        
+    def test_readObsCounts(self):
+        
+        net = getGearySubNet()
+        net.initializeSimResults(0, 60, 5)
+        mov = [mov for mov in net.iterMovements()][0]
+        link = mov.getIncomingLink()
+        times = " ".join("0:%02d" % minute for minute in range(0, 60, 5))
+        
+        countFolder = tempfile.mkdtemp()
+        try:
+            movementCountFile = os.path.join(countFolder, "movementCounts.dat")
+            countFile = open(movementCountFile, "w")
+            countFile.write("* movement counts at %s\n" % times)
+            countFile.write("%d %d %d %s\n" % (mov.getAtNode().getId(), mov.getStartNodeId(), mov.getEndNodeId(),
+                                                " ".join(str(count) for count in [1, 2, 3, 4, 5, 6, -1, 8, 9, 10, 11, 12])))
+            countFile.close()
+            net.readObsMovementCounts(movementCountFile)
+            
+            linkCountFile = os.path.join(countFolder, "linkCounts.dat")
+            countFile = open(linkCountFile, "w")
+            countFile.write("* from to %s\n" % times)
+            countFile.write("%d %d %s\n" % (link.getStartNodeId(), link.getEndNodeId(), " ".join(["10"] * 12)))
+            countFile.close()
+            net.readObsLinkCounts(linkCountFile)
+        finally:
+            shutil.rmtree(countFolder)
+        
+        assert mov.hasCountInfo()
+        assert mov.getObsCount(0, 5) == 1
+        assert mov.getObsCount(0, 15) == 6
+        assert mov.getObsCount(15, 30) == 15
+        assert mov.getObsCount(10, 25) == 12
+        # a window with a missing bin has no count
+        assert mov.getObsCount(30, 45) is None
+        assert mov.getObsCount(0, 60) is None
+        assert mov.getObsCount(45, 60) == 33
+        # counts set explicitly take precedence
+        mov.setObsCount(0, 15, 7)
+        assert mov.getObsCount(0, 15) == 7
+        
+        assert link.getObsCount(0, 60) == 120
+        assert link.getObsCount(15, 45) == 60
+        
+        obsCounts, row = mov._obsCountRows[0]
+        starts, counts = obsCounts.aggregate(15)
+        assert starts == [0, 15, 30, 45]
+        assert counts[row, 0] == 6 and math.isnan(counts[row, 2])
+        starts, counts = obsCounts.aggregate(20, 10)
+        assert starts == [10, 30]
+        assert counts[row, 0] == 18
+        
     def test_mycopy(self):
 
         net1 = getSimpleNet() 
@@ -835,7 +1225,7 @@ class TestNetwork(object):
         scenario.read(projectFolder, prefix)
 
         net = DynameqNetwork(scenario) 
-        net.read(projectFolder, prefix) 
+        net.read(projectFolder, prefix, useCache=False) 
 
         net.write("test", "crossHair")
 
@@ -1145,3 +1535,121 @@ class TestNetwork(object):
         nose.tools.assert_raises(DtaError, net.findNodeForRoadLabels, ['HYDE', 'WASHINGTON'], 1.0)
 
           
+
+    def test_graphSnapshot(self):
+
+        net = getSimpleNet()
+        snapshot = net.toGraphSnapshot()
+        assert snapshot.getNumNodes() == 8
+        assert snapshot.getNumLinks() == 14
+        assert snapshot.getNumMovements() == 0
+        assert net.toGraphSnapshot() is snapshot
+
+        n1 = snapshot.getNodeIndex(1)
+        n7 = snapshot.getNodeIndex(7)
+        labels, predLinks = snapshot.labelSettingOnNodes(n1, snapshot.linkEuclideanLength)
+        assert labels[n7] == 300
+        assert snapshot.getLinkId(predLinks[n7]) == 12
+        assert snapshot.hasPath(n1, n7)
+        assert snapshot.getReachableNodes(n1).all()
+        assert len(set(snapshot.getWeaklyConnectedComponents())) == 1
+
+        # removing a link invalidates the snapshot
+        net.removeLink(net.getLinkForNodeIdPair(4, 7))
+        snapshot = net.toGraphSnapshot()
+        assert snapshot.getNumLinks() == 13
+        assert not snapshot.hasPath(snapshot.getNodeIndex(1), snapshot.getNodeIndex(7))
+
+        # movements added directly to the links need an explicit invalidation
+        addAllMovements(net)
+        assert net.toGraphSnapshot() is snapshot
+        net.invalidateGraphSnapshot()
+        snapshot = net.toGraphSnapshot()
+        assert snapshot.getNumMovements() == sum(link.getNumOutgoingMovements() for link in net.iterLinks())
+
+        l15 = snapshot.getLinkIndex(net.getLinkForNodeIdPair(1, 5).getId())
+        l46 = snapshot.getLinkIndex(net.getLinkForNodeIdPair(4, 6).getId())
+        labels, predLinks = snapshot.labelSettingOnLinks(l15, snapshot.getMovementFFTTCosts())
+        assert snapshot.getLinkId(predLinks[l46]) == net.getLinkForNodeIdPair(5, 4).getId()
+        assert abs(labels[l46] - snapshot.linkFFTT[l15] - snapshot.linkFFTT[predLinks[l46]]) < 1e-9
+        
+        # prohibiting movements through the network rebuilds the snapshot
+        for mov in net.getLinkForNodeIdPair(1, 5).iterOutgoingMovements():
+            net.prohibitMovement(mov)
+        snapshot = net.toGraphSnapshot()
+        assert snapshot.movementProhibited.sum() == sum(1 for mov in net.iterMovements() if mov.isProhibitedToAllVehicleClassGroups())
+        movementCosts = snapshot.getMovementFFTTCosts()
+        movementCosts[snapshot.movementProhibited] = np.inf
+        labels, predLinks = snapshot.labelSettingOnLinks(l15, movementCosts)
+        assert labels[l46] == np.inf
+        # the node graph doesn't have movements
+        assert hasPath(net, net.getNodeForId(1), net.getNodeForId(6))
+
+    def test_stronglyConnectedComponents(self):
+
+        net = getSimpleNet()
+        snapshot = net.toGraphSnapshot()
+        assert len(set(snapshot.getStronglyConnectedComponents())) == 1
+
+        # without its only incoming link, node 7 is a component of its own
+        net.removeLink(net.getLinkForNodeIdPair(4, 7))
+        snapshot = net.toGraphSnapshot()
+        component = snapshot.getStronglyConnectedComponents()
+        assert len(set(component)) == 2
+        assert component[snapshot.getNodeIndex(7)] != component[snapshot.getNodeIndex(1)]
+        for start, end in zip(component[snapshot.linkStartNode], component[snapshot.linkEndNode]):
+            assert start >= end
+
+        net = getGearySubNet()
+        snapshot = net.toGraphSnapshot()
+        component = snapshot.getStronglyConnectedComponents()
+        centroidIndices, reachable = snapshot.getCentroidReachability()
+        assert reachable.shape == (len(centroidIndices), len(centroidIndices))
+        for origin, originIndex in enumerate(centroidIndices):
+            reached = snapshot.getReachableNodes(originIndex)
+            assert (reachable[origin] == reached[centroidIndices]).all()
+            for destination, destIndex in enumerate(centroidIndices):
+                if component[originIndex] == component[destIndex]:
+                    assert reachable[origin, destination] and reachable[destination, origin]
+
+    def test_spatialIndex(self):
+
+        net = getGearySubNet()
+        xs = [node.getX() for node in net.iterRoadNodes()]
+        ys = [node.getY() for node in net.iterRoadNodes()]
+        points = [(min(xs) + (max(xs) - min(xs)) * fx, min(ys) + (max(ys) - min(ys)) * fy)
+                  for fx in [-0.2, 0.1, 0.37, 0.5, 0.83, 1.3] for fy in [0.05, 0.5, 0.71, 1.1]]
+
+        def checkAgainstScan():
+            for (x, y) in points:
+                nodeDists = sorted(math.sqrt((node.getX()-x)**2 + (node.getY()-y)**2) for node in net.iterRoadNodes())
+                (dist, node) = net.findNodeNearestCoords(x, y)
+                assert abs(dist - nodeDists[0]) < 1e-6
+                assert [d for (d, n) in net.findNNodesNearestCoords(x, y, 5)] == nodeDists[:5]
+                radius = nodeDists[10]
+                assert len(net.findNodesWithinRadius(x, y, radius)) == len([d for d in nodeDists if d <= radius])
+
+                linkDists = sorted(roadlink.getDistanceFromPoint(x, y)[0] for roadlink in net.iterRoadLinks())
+                (roadlink, dist, t) = net.findNRoadLinksNearestCoords(x, y)
+                assert abs(dist - linkDists[0]) < 1e-6
+                nearest = net.findNRoadLinksNearestCoords(x, y, n=4)
+                assert [abs(d - expected) < 1e-6 for ((l, d, t), expected) in izip(nearest, linkDists[:4])] == [True]*4
+                radius = linkDists[6]
+                assert len(net.findRoadLinksWithinRadius(x, y, radius)) == len([d for d in linkDists if d <= radius])
+
+        checkAgainstScan()
+
+        # the indices are kept current as the network changes
+        roadlink = sorted(net.iterRoadLinks(), key=lambda link: link.getId())[0]
+        midNode = net.splitLink(roadlink)
+        assert midNode.getId() in net.getNodeSpatialIndex()
+        assert roadlink.getId() not in net.getLinkSpatialIndex()
+        assert len(net.getLinkSpatialIndex()) == net.getNumRoadLinks()
+        (dist, node) = net.findNodeNearestCoords(midNode.getX(), midNode.getY())
+        assert node == midNode and dist == 0
+        checkAgainstScan()
+
+        net.removeNode(midNode)
+        assert midNode.getId() not in net.getNodeSpatialIndex()
+        assert len(net.getLinkSpatialIndex()) == net.getNumRoadLinks()
+        checkAgainstScan()
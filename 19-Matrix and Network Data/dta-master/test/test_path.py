@@ -48,7 +48,7 @@ def test_paths(projectFolder, prefix, path_list):
     scenario = dta.DynameqScenario(Time(0,0), Time(12,0))
     scenario.read(projectFolder, prefix) 
     net = dta.DynameqNetwork(scenario) 
-    net.read(projectFolder, prefix)
+    net.read(projectFolder, prefix, useCache=False)
     
     TEST_PATHS = {"geary":[],
                   "downtown":[{"name" : "Mission St from 8th St to 1st St",
@@ -19,6 +19,8 @@ __license__     = """
 import datetime
 import os
 
+import numpy as np
+
 from dta.DynameqScenario import DynameqScenario 
 from dta.DynameqNetwork import DynameqNetwork 
 from dta.Utils import Time
@@ -34,7 +36,7 @@ def getTestNet():
     scenario = DynameqScenario(datetime.datetime(2010,1,1,0,0,0), datetime.datetime(2010,1,1,4,0,0))
     scenario.read(projectFolder, prefix) 
     net = DynameqNetwork(scenario) 
-    net.read(projectFolder, prefix)     
+    net.read(projectFolder, prefix, useCache=False)     
     return net 
 
 class TestUtils:
@@ -78,6 +80,29 @@ class TestUtils:
 
         assert polylinesCross(line1, line4)
 
+    def test_bucketRounding(self):
+
+        random = np.random.RandomState(0)
+        demand = random.exponential(0.4, size=(3, 40, 50)) * (random.random_sample((3, 40, 50)) < 0.5)
+
+        rounded = demand.copy()
+        bucketRounding(rounded, 1)
+        units = np.round(rounded * 10)
+        assert np.allclose(rounded * 10, units)
+        assert ((units == np.floor(demand * 10)) | (units == np.ceil(demand * 10))).all()
+        assert (units.sum(axis=2) == np.floor((demand * 10).sum(axis=2) + 0.5)).all()
+        # each slice is rounded as a 2-d matrix
+        slice = demand[1].copy()
+        bucketRounding(slice, 1)
+        assert (slice == rounded[1]).all()
+
+        # the column sums are within one unit of the column totals too
+        rounded = demand.copy()
+        bucketRounding(rounded, 0, preserveColumnSums=True)
+        assert ((rounded == np.floor(demand)) | (rounded == np.ceil(demand))).all()
+        assert (rounded.sum(axis=2) == np.floor(demand.sum(axis=2) + 0.5)).all()
+        assert (np.abs(rounded.sum(axis=1) - demand.sum(axis=1)) < 1).all()
+
 class TestTime:
 
     def test_cmp(self):
@@ -121,7 +146,3 @@ class TestTime:
 
         assert t1 % Time(0, 15) == 0
         assert not t1 % Time(0, 16) == 0
-
-        
-
-        